@@ -20,14 +20,15 @@
 #  • MODERNISATION (Style Angular) : Animations d'entrée, UX du glisser-déposer améliorée avec un placeholder.
 # ──────────────────────────────────────────────────────────────────────────────
 
-from flask import Blueprint, render_template_string, redirect, url_for, session, flash
+from flask import Blueprint, redirect, url_for, session, flash
+from template_cache import render_template_string
 from datetime import datetime
 import theme
 import utils
 import login
+import storage
 import os
 from pathlib import Path
-from openpyxl import Workbook
 import json
 
 # Assurez-vous d'importer vos blueprints pour Radiologie, Pharmacie et Comptabilité
@@ -39,19 +40,12 @@ import json
 
 accueil_bp = Blueprint('accueil', __name__)
 
-# Définition du chemin du fichier factures.xlsx ici pour être utilisé par la fonction d'initialisation
-# Ce chemin dépendra du répertoire de données dynamique de l'utilisateur, donc il sera ajusté
-# une fois que utils.EXCEL_FOLDER aura été défini.
-FACTURES_EXCEL_FILE_PATH: Path = None # Sera initialisé dynamiquement
-
 def initialize_factures_excel_file_if_not_exists():
     """
     Initialise le fichier factures.xlsx avec les colonnes nécessaires
     si il n'existe pas déjà.
     Cette fonction utilise utils.EXCEL_FOLDER qui doit être configuré au préalable.
     """
-    global FACTURES_EXCEL_FILE_PATH # Déclare l'utilisation de la variable globale
-
     if utils.EXCEL_FOLDER is None:
         print("ERROR: utils.EXCEL_FOLDER n'est pas défini. Impossible d'initialiser factures.xlsx.")
         return
@@ -59,13 +53,10 @@ def initialize_factures_excel_file_if_not_exists():
     # S'assurer que FACTURES_EXCEL_FILE_PATH pointe vers le bon emplacement
     FACTURES_EXCEL_FILE_PATH = Path(utils.EXCEL_FOLDER) / "factures.xlsx"
 
-    if not FACTURES_EXCEL_FILE_PATH.exists():
+    if not storage.exists(FACTURES_EXCEL_FILE_PATH):
         print(f"DEBUG: Le fichier des factures {FACTURES_EXCEL_FILE_PATH.name} n'existe pas. Initialisation...")
-        wb = Workbook()
-        sheet = wb.active
-        sheet.title = "Factures"
         # Définir les en-têtes de colonne. Adaptez-les précisément à ce que vous attendez.
-        sheet.append([
+        colonnes = [
             "Numero",
             "DateFacture",
             "ID_Patient",
@@ -77,9 +68,9 @@ def initialize_factures_excel_file_if_not_exists():
             "StatutPaiement",
             "DatePaiement"
             # Ajoutez toutes les autres colonnes que vos factures sont censées avoir
-        ])
+        ]
         try:
-            wb.save(FACTURES_EXCEL_FILE_PATH)
+            storage.create(FACTURES_EXCEL_FILE_PATH, {"Factures": colonnes})
             print(f"DEBUG: Fichier {FACTURES_EXCEL_FILE_PATH.name} initialisé avec les colonnes nécessaires.")
         except Exception as e:
             print(f"ERREUR: Impossible de sauvegarder le fichier {FACTURES_EXCEL_FILE_PATH.name} lors de l'initialisation: {e}")
@@ -587,7 +578,7 @@ def accueil():
     if 'email' not in session:
         return redirect(url_for('login.login'))
 
-    current_user_data = login.load_users().get(session.get('email'))
+    current_user_data = login.get_user(session.get('email'))
 
     if not current_user_data:
         session.clear()
@@ -618,8 +609,7 @@ def accueil():
     user_email = session.get('email')
     
     if user_email:
-        all_users_data = login.load_users()
-        user_info = all_users_data.get(user_email)
+        user_info = login.get_user(user_email)
         if user_info:
             logged_in_full_name = f"{user_info.get('prenom', '')} {user_info.get('nom', '')}".strip()
             if not logged_in_full_name:
@@ -1,12 +1,13 @@
 # activation.py – gestion licences & activation (TARIFS MIS À JOUR EURO)
 from __future__ import annotations
 import os, json, uuid, hashlib, socket, requests, calendar
-from datetime import date, timedelta
+from datetime import date, datetime, time, timedelta
 from typing import Optional, Dict
 from flask import (
-    request, render_template_string, redirect, url_for,
+    request, redirect, url_for,
     flash, session, Blueprint, current_app
 )
+from template_cache import render_template_string
 
 # ─────────────────────────────────────────────────────────────
 # 1. Imports internes
@@ -63,16 +64,15 @@ def _user() -> Optional[dict]:
     email = session.get("email")
     if not email:
         return None
-    return login._user() if hasattr(login, '_user') else login.load_users().get(email)
+    return login._user() if hasattr(login, '_user') else login.get_user(email)
 
 
 def _save_user(u: dict):
     email = session.get("email")
     if not email:
         return
-    users = login.load_users()
-    users[email] = u
-    login.save_users(users)
+    with login.tenant_users(u.get("owner", email)) as users:
+        users[email] = u
         
 def _ensure_placeholder(u: dict):
     if "activation" not in u:
@@ -94,6 +94,67 @@ def _add_month(d: date) -> date:
     except ValueError:
         return (d.replace(day=1, year=nxt_yr, month=nxt_mo) - timedelta(days=1))
 
+def _license_end(activation_record: Dict) -> Optional[date]:
+    """Dernier jour de validité du plan (None = illimité ou plan inconnu)."""
+    plan = activation_record["plan"].lower()
+    act_date = date.fromisoformat(activation_record["activation_date"])
+    if plan.startswith("essai"):
+        return act_date + timedelta(days=TRIAL_DAYS)
+    if "1_mois" in plan:
+        return _add_month(act_date)
+    if "1_an" in plan:
+        try:
+            return act_date.replace(year=act_date.year + 1)
+        except ValueError:
+            return act_date + timedelta(days=365)
+    return None
+
+def _check_admin_activation_record(admin_email: str, activation_record: Dict) -> bool:
+    plan = activation_record["plan"].lower()
+    today = date.today()
+    current_code = activation_record.get("activation_code")
+
+    if not (plan.startswith("essai") and current_code == "0000-0000-0000-0000"):
+        # GÉNÉRATION DE LA CLÉ ATTENDUE (AVEC EMAIL ADMIN)
+        act_date = date.fromisoformat(activation_record["activation_date"])
+        exp_code = generate_activation_key_for_user(admin_email, plan, act_date)
+        if current_code != exp_code:
+            return False
+
+    end = _license_end(activation_record)
+    if end is not None:
+        return today <= end
+    return "illimite" in plan
+
+# Verdicts mis en cache par administrateur : (enregistrement, verdict, expiration).
+# Un verdict positif expire à minuit après le dernier jour du plan ; un verdict
+# négatif ne peut changer qu'avec l'enregistrement d'activation, comparé à chaque
+# appel (invalidation implicite) ou purgé par invalidate_license_cache().
+_license_cache: Dict[str, tuple] = {}
+
+def invalidate_license_cache(admin_email: Optional[str] = None):
+    """Oublie le verdict d'un administrateur (ou de tous si admin_email est None)."""
+    if admin_email is None:
+        _license_cache.clear()
+    else:
+        _license_cache.pop(admin_email, None)
+
+def _license_verdict(admin_email: str, activation_record: Dict) -> bool:
+    cached = _license_cache.get(admin_email)
+    if cached is not None:
+        record, verdict, expires_at = cached
+        if record == activation_record and (expires_at is None or datetime.now() < expires_at):
+            return verdict
+
+    verdict = _check_admin_activation_record(admin_email, activation_record)
+    expires_at = None
+    if verdict:
+        end = _license_end(activation_record)
+        if end is not None:
+            expires_at = datetime.combine(end + timedelta(days=1), time.min)
+    _license_cache[admin_email] = (dict(activation_record), verdict, expires_at)
+    return verdict
+
 def check_activation() -> bool:
     u = _user()
     if not u:
@@ -102,65 +163,36 @@ def check_activation() -> bool:
     # Tous les comptes dépendent de la licence de l'administrateur
     admin_owner_email = u.get("owner", u.get("email"))
     
-    all_users = login.load_users()
-    admin_owner_user = all_users.get(admin_owner_email)
+    admin_owner_user = login.get_user(admin_owner_email)
 
     if not admin_owner_user or "activation" not in admin_owner_user:
         return False
     
     admin_act = admin_owner_user["activation"]
-    
-    def _check_admin_activation_record(admin_email: str, activation_record: Dict) -> bool:
-        plan = activation_record["plan"].lower()
-        act_date = date.fromisoformat(activation_record["activation_date"])
-        today = date.today()
-        current_code = activation_record.get("activation_code")
-        
-        if plan.startswith("essai") and current_code == "0000-0000-0000-0000":
-            return today <= act_date + timedelta(days=TRIAL_DAYS)
-        
-        # GÉNÉRATION DE LA CLÉ ATTENDUE (AVEC EMAIL ADMIN)
-        exp_code = generate_activation_key_for_user(admin_email, plan, act_date)
-        
-        if current_code != exp_code:
-            return False
-
-        if plan.startswith("essai"):
-            return today <= act_date + timedelta(days=TRIAL_DAYS)
-        if "1_mois" in plan:
-            return today <= _add_month(act_date)
-        if "1_an" in plan:
-            try:
-                lim = act_date.replace(year=act_date.year + 1)
-            except ValueError:
-                lim = act_date + timedelta(days=365)
-            return today <= lim
-        if "illimite" in plan:
-            return True
-        return False
 
     if u.get("role") == "admin":
         _ensure_placeholder(u)
 
-    return _check_admin_activation_record(admin_owner_email, admin_act)
+    return _license_verdict(admin_owner_email, admin_act)
 
 
-def update_activation(plan: str, code: str):
-    u = _user()
-    if not u: return
-    # Mise à jour sur l'enregistrement de l'admin
-    admin_email = u.get("owner", u.get("email"))
-    
-    users = login.load_users()
-    admin_user = users.get(admin_email)
+def update_activation(plan: str, code: str, admin_email: Optional[str] = None):
+    if admin_email is None:
+        u = _user()
+        if not u: return
+        # Mise à jour sur l'enregistrement de l'admin
+        admin_email = u.get("owner", u.get("email"))
     
-    if admin_user:
-        admin_user["activation"] = {
-            "plan": plan,
-            "activation_date": date.today().isoformat(),
-            "activation_code": code
-        }
-        login.save_users(users)
+    with login.tenant_users(admin_email) as users:
+        admin_user = users.get(admin_email)
+        
+        if admin_user:
+            admin_user["activation"] = {
+                "plan": plan,
+                "activation_date": date.today().isoformat(),
+                "activation_code": code
+            }
+    invalidate_license_cache(admin_email)
 
 update_activation_after_payment = update_activation
 
@@ -16,7 +16,8 @@
 # 0. Importations et Initialisation
 # ──────────────────────────────────────────────────────────────────────────────
 
-from flask import Blueprint, render_template_string, request, redirect, url_for, flash, session, jsonify, current_app, send_file
+from flask import Blueprint, request, redirect, url_for, flash, session, jsonify, current_app, send_file
+from template_cache import render_template_string
 from datetime import datetime, date, timedelta
 from functools import wraps
 import json
@@ -107,7 +108,7 @@ def get_current_plan_info() -> str:
         "1 an":     "1 an",
         "illimité": "Illimité",
     }
-    user = login.load_users().get(session.get("email"))
+    user = login.get_user(session.get("email"))
     plan_raw = (user.get("activation", {}).get("plan", "").lower() if user else "")
     return mapping.get(plan_raw, plan_raw.capitalize() or "Inconnu")
 
@@ -122,11 +123,11 @@ def generate_qr_code_data_uri(data: str) -> str:
 
 def get_admin_dashboard_context():
     admin_email = session['email']
-    full_users = login.load_users()
+    full_users = login.users_of_owner(admin_email) # Comptes de ce cabinet uniquement (index par propriétaire)
     config = utils.load_config() # Charger la config existante depuis config.json
 
     # ---> NOUVELLE LOGIQUE CORRIGÉE : Pré-remplissage des valeurs par défaut <---
-    admin_user_data = full_users.get(admin_email)
+    admin_user_data = login.get_user(admin_email)
 
     # Vérifier et pré-remplir si les valeurs de config sont vides ou inexistantes
     if admin_user_data:
@@ -194,7 +195,7 @@ def get_admin_dashboard_context():
 
     # Build the list of doctors for the dropdown
     doctors = [u for u in users_for_table if u['role'] == 'medecin' and u['active']]
-    main_admin = full_users.get(admin_email)
+    main_admin = login.get_user(admin_email)
 
     admin_email_in_doctors_list = any(d['email'] == admin_email for d in doctors)
 
@@ -247,7 +248,7 @@ def get_admin_dashboard_context():
 # 3. User Management Functions
 # ──────────────────────────────────────────────────────────────────────────────
 def get_user_details(user_email: str) -> dict:
-    u = login.load_users().get(user_email)
+    u = login.get_user(user_email)
     if not u or u.get('owner') != session.get('email'):
         return {}
     return {
@@ -269,125 +270,118 @@ def create_new_user(form_data: dict) -> tuple[bool, str]:
     phone, linked_doctor = form_data.get('phone', '').strip(), form_data.get('linked_doctor', '').strip()
     allowed_pages = form_data.getlist('allowed_pages[]')
 
-    users = login.load_users()
-    users_owned_by_admin = [u for u in users.values() if u.get('owner') == admin_email]
+    with login.tenant_users(admin_email) as users:
+        users_owned_by_admin = [u for u in users.values() if u.get('owner') == admin_email]
 
-    # On compte toujours pour l'info, mais on ne s'en sert plus pour bloquer
-    current_non_admin_count = sum(1 for u in users_owned_by_admin if u.get('email') != admin_email and u.get('role') != 'admin')
+        # On compte toujours pour l'info, mais on ne s'en sert plus pour bloquer
+        current_non_admin_count = sum(1 for u in users_owned_by_admin if u.get('email') != admin_email and u.get('role') != 'admin')
 
-    # --- MODIFICATION : BLOCAGE SUPPRIMÉ ---
-    # L'ancienne vérification (if ... >= GLOBAL_USER_LIMIT) est supprimée ici.
-    # ---------------------------------------
+        # --- MODIFICATION : BLOCAGE SUPPRIMÉ ---
+        # L'ancienne vérification (if ... >= GLOBAL_USER_LIMIT) est supprimée ici.
+        # ---------------------------------------
 
-    # --- LOGIQUE DE CRÉATION D'EMAIL BASÉE SUR L'ADMIN PRINCIPAL ---
-    admin_email_prefix = admin_email.split('@')[0]
+        # --- LOGIQUE DE CRÉATION D'EMAIL BASÉE SUR L'ADMIN PRINCIPAL ---
+        admin_email_prefix = admin_email.split('@')[0]
 
-    # Structure de l'email pour les rôles secondaires (non-admin)
-    if role != 'admin':
-        key = f"{prenom.lower()}.{nom.lower()}@{admin_email_prefix}.eml.com"
-    else:
-        key = f"{prenom.lower()}.{nom.lower()}@{admin_email_prefix}.eml-admin.com"
-
-    # Vérification d'unicité de l'email
-    if not login._is_email_globally_unique(key):
-        return False, f"L'e-mail généré '{key}' existe déjà. Veuillez utiliser des noms et prénoms différents."
-
-    # --- CONSTRUCTION DES DONNÉES UTILISATEUR ---
-    user_data = {
-        'nom': nom, 'prenom': prenom, 'role': role,
-        'password': login.hash_password(password),
-        'active': True, 'owner': admin_email, 'phone': phone,
-        'allowed_pages': allowed_pages
-    }
-
-    # Gestion des permissions spécifiques et de la liaison
-    if role != 'admin' and 'accueil' not in user_data['allowed_pages']:
-        user_data['allowed_pages'].append('accueil')
+        # Structure de l'email pour les rôles secondaires (non-admin)
+        if role != 'admin':
+            key = f"{prenom.lower()}.{nom.lower()}@{admin_email_prefix}.eml.com"
+        else:
+            key = f"{prenom.lower()}.{nom.lower()}@{admin_email_prefix}.eml-admin.com"
+
+        # Vérification d'unicité de l'email
+        if not login._is_email_globally_unique(key):
+            return False, f"L'e-mail généré '{key}' existe déjà. Veuillez utiliser des noms et prénoms différents."
+
+        # --- CONSTRUCTION DES DONNÉES UTILISATEUR ---
+        user_data = {
+            'nom': nom, 'prenom': prenom, 'role': role,
+            'password': login.hash_password(password),
+            'active': True, 'owner': admin_email, 'phone': phone,
+            'allowed_pages': allowed_pages
+        }
 
-    if role == 'admin':
-        user_data['allowed_pages'] = login.ALL_BLUEPRINTS
+        # Gestion des permissions spécifiques et de la liaison
+        if role != 'admin' and 'accueil' not in user_data['allowed_pages']:
+            user_data['allowed_pages'].append('accueil')
 
-    if role == 'assistante':
-        user_data['linked_doctor'] = linked_doctor
-    else:
-        user_data.pop('linked_doctor', None)
-
-    # Sauvegarde du nouvel utilisateur
-    users[key] = user_data
-    login.save_users(users)
-
-    # Logique de l'assistante temporaire (MODIFIÉE POUR ÊTRE ILLIMITÉE)
-    if role == 'medecin':
-        existing_assistants = [u for u in users.values() if u.get('role') == 'assistante' and u.get('linked_doctor') == key]
-        # On retire la condition "and current_non_admin_count < GLOBAL_USER_LIMIT"
-        if not existing_assistants: 
-            temp_assistant_email = f"assist.{prenom.lower()}.{nom.lower()}@{admin_email_prefix}.eml.com"
-            if login._is_email_globally_unique(temp_assistant_email):
-                users[temp_assistant_email] = {
-                    'nom': 'Temporaire', 'prenom': 'Assistante', 'role': 'assistante',
-                    'password': login.hash_password('password'), 'active': True, 'owner': admin_email, 'phone': '',
-                    'linked_doctor': key, 'allowed_pages': ['rdv', 'routes', 'facturation', 'patient_rdv', 'accueil']
-                }
-                login.save_users(users)
-                flash(f"Assistante temporaire ({temp_assistant_email}) créée pour {prenom} {nom}.", "info")
+        if role == 'admin':
+            user_data['allowed_pages'] = login.ALL_BLUEPRINTS
 
-    return True, "Compte créé avec succès !"
+        if role == 'assistante':
+            user_data['linked_doctor'] = linked_doctor
+        else:
+            user_data.pop('linked_doctor', None)
+
+        # Sauvegarde du nouvel utilisateur
+        users[key] = user_data
+
+        # Logique de l'assistante temporaire (MODIFIÉE POUR ÊTRE ILLIMITÉE)
+        if role == 'medecin':
+            existing_assistants = [u for u in users.values() if u.get('role') == 'assistante' and u.get('linked_doctor') == key]
+            # On retire la condition "and current_non_admin_count < GLOBAL_USER_LIMIT"
+            if not existing_assistants: 
+                temp_assistant_email = f"assist.{prenom.lower()}.{nom.lower()}@{admin_email_prefix}.eml.com"
+                if login._is_email_globally_unique(temp_assistant_email):
+                    users[temp_assistant_email] = {
+                        'nom': 'Temporaire', 'prenom': 'Assistante', 'role': 'assistante',
+                        'password': login.hash_password('password'), 'active': True, 'owner': admin_email, 'phone': '',
+                        'linked_doctor': key, 'allowed_pages': ['rdv', 'routes', 'facturation', 'patient_rdv', 'accueil']
+                    }
+                    flash(f"Assistante temporaire ({temp_assistant_email}) créée pour {prenom} {nom}.", "info")
+
+        return True, "Compte créé avec succès !"
 
 def update_existing_user(form_data: dict) -> tuple[bool, str]:
     old_email = form_data['email']
     new_email = form_data.get('new_email', old_email).strip().lower()
     new_password, confirm_password = form_data.get('new_password', '').strip(), form_data.get('confirm_password', '').strip()
     allowed_pages = form_data.getlist('allowed_pages[]')
-    users = login.load_users()
-
-    if old_email not in users or users[old_email].get('owner') != session.get('email'):
-        return False, "Action non autorisée."
-
-    user = users.pop(old_email)
-    if new_email != old_email and not login._is_email_globally_unique(new_email):
-        users[old_email] = user
-        login.save_users(users)
-        return False, f"Le nouvel e-mail '{new_email}' est déjà utilisé."
-
-    user.update({
-        'nom': form_data['nom'].strip(), 'prenom': form_data['prenom'].strip(), 'role': form_data['role'].strip(),
-        'phone': form_data.get('phone', '').strip(), 'allowed_pages': allowed_pages
-    })
-
-    if user['role'] != 'admin' and 'accueil' not in user['allowed_pages']:
-        user['allowed_pages'].append('accueil')
-    if user['role'] == 'admin':
-        user['allowed_pages'] = login.ALL_BLUEPRINTS
-    if user['role'] == 'assistante':
-        user['linked_doctor'] = form_data.get('linked_doctor', '').strip()
-    else:
-        user.pop('linked_doctor', None)
-    if new_password:
-        if new_password != confirm_password:
-            users[old_email] = user # Remettre l'utilisateur avec l'ancien email en cas d'erreur
-            login.save_users(users)
-            return False, "Les mots de passe ne correspondent pas."
-        user['password'] = login.hash_password(new_password)
-
-    users[new_email] = user
-    login.save_users(users)
-    return True, "Données utilisateur mises à jour."
+    with login.tenant_users(session.get('email')) as users:
+
+        if old_email not in users or users[old_email].get('owner') != session.get('email'):
+            return False, "Action non autorisée."
+
+        user = users.pop(old_email)
+        if new_email != old_email and not login._is_email_globally_unique(new_email):
+            users[old_email] = user
+            return False, f"Le nouvel e-mail '{new_email}' est déjà utilisé."
+
+        user.update({
+            'nom': form_data['nom'].strip(), 'prenom': form_data['prenom'].strip(), 'role': form_data['role'].strip(),
+            'phone': form_data.get('phone', '').strip(), 'allowed_pages': allowed_pages
+        })
+
+        if user['role'] != 'admin' and 'accueil' not in user['allowed_pages']:
+            user['allowed_pages'].append('accueil')
+        if user['role'] == 'admin':
+            user['allowed_pages'] = login.ALL_BLUEPRINTS
+        if user['role'] == 'assistante':
+            user['linked_doctor'] = form_data.get('linked_doctor', '').strip()
+        else:
+            user.pop('linked_doctor', None)
+        if new_password:
+            if new_password != confirm_password:
+                users[old_email] = user # Remettre l'utilisateur avec l'ancien email en cas d'erreur
+                return False, "Les mots de passe ne correspondent pas."
+            user['password'] = login.hash_password(new_password)
+
+        users[new_email] = user
+        return True, "Données utilisateur mises à jour."
 
 def toggle_user_active_status(user_email: str) -> tuple[bool, str]:
-    users = login.load_users()
-    if user_email in users and users[user_email].get('owner') == session.get('email'):
-        users[user_email]['active'] = not users[user_email].get('active', True)
-        login.save_users(users)
-        return True, f"Statut de l'utilisateur {user_email} mis à jour."
-    return False, "Utilisateur introuvable ou action non autorisée."
+    with login.tenant_users(session.get('email')) as users:
+        if user_email in users and users[user_email].get('owner') == session.get('email'):
+            users[user_email]['active'] = not users[user_email].get('active', True)
+            return True, f"Statut de l'utilisateur {user_email} mis à jour."
+        return False, "Utilisateur introuvable ou action non autorisée."
 
 def delete_existing_user(user_email: str) -> tuple[bool, str]:
-    users = login.load_users()
-    if user_email in users and users[user_email].get('owner') == session.get('email'):
-        users.pop(user_email)
-        login.save_users(users)
-        return True, f"Utilisateur {user_email} supprimé."
-    return False, "Utilisateur introuvable ou action non autorisée."
+    with login.tenant_users(session.get('email')) as users:
+        if user_email in users and users[user_email].get('owner') == session.get('email'):
+            users.pop(user_email)
+            return True, f"Utilisateur {user_email} supprimé."
+        return False, "Utilisateur introuvable ou action non autorisée."
 
 # ──────────────────────────────────────────────────────────────────────────────
 # 4. Data Backup and Restoration Functions (ZIP)
@@ -26,6 +26,7 @@ from apscheduler.schedulers.background import BackgroundScheduler
 from ia_assitant import ia_assitant_bp
 from ia_assistant_synapse import ia_assistant_synapse_bp
 import activation, theme, utils, pwa, login, accueil, administrateur, rdv, facturation, statistique, developpeur, routes, patient_rdv, biologie, radiologie, pharmacie, comptabilite, gestion_patient, guide
+import template_cache, templates, timing, metrics
 from firebase import FirebaseManager
 
 mail = Mail()
@@ -47,8 +48,11 @@ def create_app():
     app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
     
     # Initialisation des extensions Flask
+    # (le chronométrage en premier : ses hooks encadrent toute la requête, gardien compris)
+    timing.init_app(app)
     mail.init_app(app)
     theme.init_theme(app)
+    template_cache.init_app(app)
 
     # Processeurs de contexte pour injecter des variables dans tous les templates
     @app.context_processor
@@ -131,16 +135,35 @@ def create_app():
 
         # Vérifications de la validité du compte et de la licence
         utils.set_dynamic_base_dir(session['admin_email'])
-        current_user = activation._user()
+        with timing.phase("auth"):
+            current_user = activation._user()
+            license_ok = bool(current_user) and current_user.get("active", True) and activation.check_activation()
         if not current_user or not current_user.get("active", True):
             session.clear()
             flash("Votre compte a été désactivé ou n'existe plus.", "warning")
             return redirect(url_for("login.login"))
-        if not activation.check_activation():
+        if not license_ok:
             flash("Votre licence est invalide ou a expiré. Veuillez activer le produit.", "warning")
             return redirect(url_for("activation.activation"))
+
+    # Le contexte tenant est lié à la requête : on le délie en fin de requête
+    # pour qu'un thread réutilisé ne serve jamais les chemins d'un autre cabinet.
+    @app.teardown_request
+    def release_tenant_context(exc):
+        utils.clear_tenant()
     
     routes.register_routes(app)
+
+    # Précompilation des pages principales (servies ensuite depuis le cache Jinja)
+    template_cache.preload(
+        app,
+        templates.main_template, accueil.acceuil_template, rdv.rdv_template,
+        facturation.facturation_template, pharmacie.pharmacie_template,
+        comptabilite.comptabilite_template, biologie.biologie_template,
+        radiologie.radiologie_template, gestion_patient.gestion_patient_template,
+        patient_rdv.patient_rdv_template, administrateur.administrateur_template,
+        guide.guide_template, developpeur.DASH_HTML,
+    )
     
     print("✅ Application Flask démarrée.")
     return app
@@ -164,7 +187,8 @@ if app.firebase_manager:
 else:
      print("ℹ️ ID de projet Firebase non trouvé (Sauvegardes locales uniquement).")
 
-# Tâche de sauvegarde planifiée
+# Tâche de sauvegarde planifiée (durée et issue suivies dans metrics)
+@metrics.job("daily_backup")
 def daily_backup_task():
     print(f"🚀 [BACKUP] Démarrage de la sauvegarde à {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}...")
     data_root_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "MEDICALINK_DATA")
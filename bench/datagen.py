@@ -0,0 +1,299 @@
+# datagen.py
+# ---------------------------------------------------------------------------
+#  Générateur de données synthétiques de cabinet (un ou plusieurs tenants)
+# ---------------------------------------------------------------------------
+#  Écrit, pour chaque tenant, l'arborescence habituelle
+#  MEDICALINK_DATA/<admin>/Excel/ avec les classeurs de l'application :
+#  info_Base_patient.xlsx, ConsultationData.xlsx, DonneesRDV.xlsx,
+#  factures.xlsx, Comptabilite.xlsx (5 feuilles), Pharmacie.xlsx,
+#  Biologie.xlsx et Radiologie.xlsx, avec les colonnes écrites par les
+#  modules correspondants.
+#
+#  --rows fixe le nombre de consultations ; les autres volumes en découlent
+#  (patients = rows / 4, RDV = rows / 2, ...). Les valeurs sont tirées de façon
+#  vectorisée (numpy) : 1M de lignes se génèrent en quelques secondes.
+#
+#  --format xlsx  : vrais classeurs, importés en base au premier accès
+#                   (comme chez un cabinet existant) ; lent au-delà de ~100k
+#                   lignes (openpyxl), limité à 1 048 575 lignes par feuille.
+#  --format sqlite : écriture directe dans database.db via storage, pour les
+#                   gros volumes.
+#
+#  Exemple :
+#      python bench/datagen.py --root /tmp/emk_bench --tenants 3 --rows 100000
+# ---------------------------------------------------------------------------
+
+import argparse
+import os
+import sys
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import storage  # noqa: E402
+import utils  # noqa: E402
+
+XLSX_MAX_ROWS = 1_048_575
+
+NOMS = ["Benali", "Martin", "El Amrani", "Bernard", "Alaoui", "Dubois", "Tazi", "Moreau", "Idrissi",
+        "Laurent", "Bennani", "Simon", "Chraibi", "Michel", "Fassi", "Lefebvre", "Berrada", "Garcia"]
+PRENOMS = ["Youssef", "Marie", "Fatima", "Jean", "Mohamed", "Sophie", "Khadija", "Pierre", "Amine",
+           "Camille", "Salma", "Lucas", "Omar", "Chloé", "Imane", "Hugo", "Nadia", "Léa"]
+ANTECEDENTS = ["", "", "", "HTA", "Diabète type 2", "Asthme", "Allergie pénicilline", "Cardiopathie"]
+DIAGNOSTICS = ["Rhinopharyngite", "Angine", "Gastro-entérite", "Lombalgie", "Bronchite", "Contrôle",
+               "HTA", "Otite", "Sinusite", "Migraine"]
+MEDICAMENTS = ["Paracétamol 1g", "Amoxicilline 1g", "Ibuprofène 400mg", "Oméprazole 20mg", "Spasfon",
+               "Doliprane 500mg", "Augmentin 1g", "Ventoline"]
+ANALYSES = ["NFS", "Glycémie à jeun", "Bilan lipidique", "CRP", "TSH", "Créatinine", "HbA1c"]
+RADIOLOGIES = ["Radio thorax", "Échographie abdominale", "Scanner cérébral", "IRM lombaire", "Radio genou"]
+ACTES = ["Consultation", "Contrôle", "Échographie", "ECG", "Vaccination", "Paiement"]
+MODES = ["Espèces", "Carte", "Chèque", "Virement"]
+CATEGORIES = ["Loyer", "Salaires", "Fournitures médicales", "Électricité & Eau", "Téléphone & Internet",
+              "Assurances", "Frais bancaires", "Autres"]
+ASSUREURS = ["CNSS", "CNOPS", "AXA", "Saham", "Wafa Assurance"]
+STATUTS_TP = ["Réglé", "Partiellement réglé", "En attente"]
+DOCUMENTS = ["Déclaration TVA", "Bilan Comptable Annuel", "Déclaration CNSS", "Facture Fournisseur"]
+PRODUITS = ["Paracétamol", "Amoxicilline", "Ibuprofène", "Compresses", "Seringues 5ml", "Gants nitrile",
+            "Bétadine", "Sérum physiologique", "Oméprazole", "Pansements"]
+TYPES_PRODUIT = ["Médicament", "Consommable", "Matériel"]
+
+
+def _pick(rng, values, n):
+    return np.asarray(values, dtype=object)[rng.integers(0, len(values), n)]
+
+
+def _days(rng, n, start, end, fmt="%Y-%m-%d"):
+    """n dates uniformes entre start et end, au format texte des classeurs."""
+    span = (end - start).days + 1
+    days = pd.to_datetime(start) + pd.to_timedelta(rng.integers(0, span, n), unit="D")
+    return days.strftime(fmt).to_numpy(dtype=object)
+
+
+def _times(rng, n):
+    minutes = 8 * 60 + 15 * rng.integers(0, 40, n)
+    return np.char.add(np.char.add(np.char.zfill((minutes // 60).astype(str), 2), ":"),
+                       np.char.zfill((minutes % 60).astype(str), 2)).astype(object)
+
+
+def _amounts(rng, n, low, high):
+    return np.round(rng.uniform(low, high, n), 2)
+
+
+def _phones(rng, n):
+    return np.char.add("06", np.char.zfill(rng.integers(0, 10**8, n).astype(str), 8)).astype(object)
+
+
+def patients(rng, n: int, today: date) -> pd.DataFrame:
+    ids = np.arange(1, n + 1).astype(str).astype(object)
+    naissance = _days(rng, n, date(1940, 1, 1), date(2022, 12, 31))
+    ages = today.year - pd.to_datetime(naissance).year
+    nom, prenom = _pick(rng, NOMS, n), _pick(rng, PRENOMS, n)
+    return pd.DataFrame({
+        "ID": ids, "Nom": nom, "Prenom": prenom, "DateNaissance": naissance,
+        "Sexe": _pick(rng, ["Homme", "Femme"], n),
+        "Âge": np.char.add(ages.to_numpy().astype(str), " ans").astype(object),
+        "Antécédents": _pick(rng, ANTECEDENTS, n), "Téléphone": _phones(rng, n),
+        "Email": np.char.add(np.char.add(prenom.astype(str), ids.astype(str)), "@example.com").astype(object),
+    })
+
+
+def consultations(rng, n: int, base: pd.DataFrame, start: date, end: date, medecins: list) -> pd.DataFrame:
+    p = base.iloc[rng.integers(0, len(base), n)].reset_index(drop=True)
+    return pd.DataFrame({
+        "consultation_date": _days(rng, n, start, end),
+        "patient_id": p["ID"], "patient_name": p["Nom"] + " " + p["Prenom"],
+        "nom": p["Nom"], "prenom": p["Prenom"], "date_of_birth": p["DateNaissance"],
+        "gender": p["Sexe"], "age": p["Âge"], "patient_phone": p["Téléphone"],
+        "antecedents": p["Antécédents"],
+        "clinical_signs": _pick(rng, ["Fièvre", "Toux", "Douleur", "RAS"], n),
+        "bp": _pick(rng, ["12/8", "13/8", "14/9", "11/7"], n),
+        "temperature": np.round(rng.normal(37.2, 0.6, n), 1).astype(str).astype(object),
+        "heart_rate": rng.integers(55, 110, n).astype(str).astype(object),
+        "respiratory_rate": rng.integers(12, 22, n).astype(str).astype(object),
+        "diagnosis": _pick(rng, DIAGNOSTICS, n), "medications": _pick(rng, MEDICAMENTS, n),
+        "analyses": _pick(rng, [""] * 3 + ANALYSES, n), "radiologies": _pick(rng, [""] * 6 + RADIOLOGIES, n),
+        "certificate_category": "", "certificate_content": "", "rest_duration": "",
+        "doctor_comment": "", "consultation_id": np.arange(1, n + 1).astype(str).astype(object),
+        "Medecin_Email": _pick(rng, medecins, n),
+    })
+
+
+def rendez_vous(rng, n: int, base: pd.DataFrame, start: date, end: date, medecins: list) -> pd.DataFrame:
+    p = base.iloc[rng.integers(0, len(base), n)].reset_index(drop=True)
+    return pd.DataFrame({
+        "Num Ordre": rng.integers(1, 40, n).astype(str).astype(object),
+        "ID": p["ID"], "Nom": p["Nom"], "Prenom": p["Prenom"], "DateNaissance": p["DateNaissance"],
+        "Sexe": p["Sexe"], "Âge": p["Âge"], "Antécédents": p["Antécédents"], "Téléphone": p["Téléphone"],
+        "Date": _days(rng, n, start, end), "Heure": _times(rng, n),
+        "Medecin_Email": _pick(rng, medecins, n),
+    })
+
+
+def factures(rng, n: int, base: pd.DataFrame, start: date, end: date) -> pd.DataFrame:
+    p = base.iloc[rng.integers(0, len(base), n)].reset_index(drop=True)
+    ht = np.round(rng.uniform(150, 1500, n), 2)
+    tva = np.round(ht * 0.2, 2)
+    return pd.DataFrame({
+        "Numero": np.char.add("F", np.char.zfill(np.arange(1, n + 1).astype(str), 7)).astype(object),
+        "Patient": p["Nom"] + " " + p["Prenom"], "Téléphone": p["Téléphone"],
+        "Date": _days(rng, n, start, end),
+        "Services": np.char.add(_pick(rng, ACTES, n).astype(str), "(").astype(object) + ht.astype(str) + ")",
+        "Sous-total": ht, "TVA": tva,
+        "Total": np.round(ht + tva, 2),
+        "Statut_Paiement": _pick(rng, ["Payée", "Impayée", "Partielle"], n),
+        "Patient_ID": p["ID"], "PDF_Filename": "",
+    })
+
+
+def comptabilite(rng, n: int, base: pd.DataFrame, start: date, end: date) -> dict:
+    p = base.iloc[rng.integers(0, len(base), n)].reset_index(drop=True)
+    recettes = pd.DataFrame({
+        "Date": _days(rng, n, start, end), "Type_Acte": _pick(rng, ACTES, n), "Patient_ID": p["ID"],
+        "Patient_Nom": p["Nom"], "Patient_Prenom": p["Prenom"], "Montant": _amounts(rng, n, 100, 1200),
+        "Mode_Paiement": _pick(rng, MODES, n), "Description": "", "ID_Facture_Liee": "",
+    })
+    nd = max(1, n // 10)
+    depenses = pd.DataFrame({
+        "Date": _days(rng, nd, start, end), "Categorie": _pick(rng, CATEGORIES, nd),
+        "Description": "", "Montant": _amounts(rng, nd, 50, 8000), "Justificatif_Fichier": "",
+    })
+    months = pd.period_range(start, end, freq="M").strftime("%Y-%m")
+    employes = max(2, min(50, n // 2000))
+    ns = len(months) * employes
+    net = np.round(rng.uniform(3000, 15000, ns), 2)
+    charges = np.round(net * 0.25, 2)
+    salaires = pd.DataFrame({
+        "Mois_Annee": np.repeat(months.to_numpy(dtype=object), employes),
+        "Nom_Employe": _pick(rng, NOMS, ns), "Prenom_Employe": _pick(rng, PRENOMS, ns),
+        "Salaire_Net": net, "Charges_Sociales": charges,
+        "Total_Brut": np.round(net + charges, 2), "Fiche_Paie_PDF": "",
+    })
+    nt = max(1, n // 5)
+    q = base.iloc[rng.integers(0, len(base), nt)].reset_index(drop=True)
+    attendu = np.round(rng.uniform(100, 1000, nt), 2)
+    tiers = pd.DataFrame({
+        "Date": _days(rng, nt, start, end), "Assureur": _pick(rng, ASSUREURS, nt), "Patient_ID": q["ID"],
+        "Patient_Nom": q["Nom"], "Patient_Prenom": q["Prenom"],
+        "Montant_Attendu": attendu,
+        "Montant_Recu": np.round(attendu * rng.choice([0, 0.5, 1], nt), 2),
+        "Date_Reglement": _days(rng, nt, start, end), "ID_Facture_Liee": "",
+        "Statut": _pick(rng, STATUTS_TP, nt),
+    })
+    nf = max(1, n // 100)
+    documents = pd.DataFrame({
+        "Date": _days(rng, nf, start, end), "Type_Document": _pick(rng, DOCUMENTS, nf),
+        "Description": "", "Fichier_PDF": "",
+    })
+    return {"Recettes": recettes, "Depenses": depenses, "Salaires": salaires,
+            "TiersPayants": tiers, "DocumentsFiscaux": documents}
+
+
+def pharmacie(rng, n: int, start: date, end: date) -> dict:
+    ni = max(10, min(5000, n // 10))
+    codes = np.char.add("PRD", np.char.zfill(np.arange(1, ni + 1).astype(str), 5)).astype(object)
+    noms = np.char.add(np.char.add(_pick(rng, PRODUITS, ni).astype(str), " "),
+                       np.arange(1, ni + 1).astype(str)).astype(object)
+    achat = np.round(rng.uniform(2, 300, ni), 2)
+    inventaire = pd.DataFrame({
+        "Code_Produit": codes, "Nom": noms, "Type": _pick(rng, TYPES_PRODUIT, ni), "Usage": "",
+        "Quantité": rng.integers(0, 500, ni),
+        "Prix_Achat": achat,
+        "Prix_Vente": np.round(achat * 1.3, 2),
+        "Fournisseur": _pick(rng, ["Sothema", "Cooper", "Pharma 5", "Sanofi"], ni),
+        "Date_Expiration": _days(rng, ni, start, date(end.year + 3, 12, 31)),
+        "Seuil_Alerte": rng.integers(5, 50, ni),
+        "Date_Enregistrement": _days(rng, ni, start, end),
+    })
+    nm = max(1, n // 2)
+    produit = rng.integers(0, ni, nm)
+    mouvements = pd.DataFrame({
+        "Date": np.char.add(np.char.add(_days(rng, nm, start, end).astype(str), " "), _times(rng, nm).astype(str)).astype(object),
+        "Code_Produit": codes[produit], "Nom_Produit": noms[produit],
+        "Type_Mouvement": _pick(rng, ["Entrée", "Sortie"], nm),
+        "Quantité_Mouvement": rng.integers(1, 50, nm),
+        "Nom_Responsable": _pick(rng, NOMS, nm), "Prenom_Responsable": _pick(rng, PRENOMS, nm),
+        "Telephone_Responsable": _phones(rng, nm),
+    })
+    return {"Inventaire": inventaire, "Mouvements": mouvements}
+
+
+def examens(rng, n: int, base: pd.DataFrame, start: date, end: date, column: str, values: list) -> pd.DataFrame:
+    p = base.iloc[rng.integers(0, len(base), n)].reset_index(drop=True)
+    return pd.DataFrame({
+        "Date": _days(rng, n, start, end), "ID_Patient": p["ID"], "NOM": p["Nom"], "PRENOM": p["Prenom"],
+        column: _pick(rng, values, n), "CONCLUSION": _pick(rng, ["Normal", "À contrôler", "Pathologique"], n),
+        "PDF_File": "",
+    })
+
+
+def tenant_workbooks(rows: int, seed: int = 0, medecins=None, years: int = 2) -> dict:
+    """{nom du classeur: {feuille: DataFrame}} pour un tenant de `rows` consultations."""
+    rng = np.random.default_rng(seed)
+    today = date.today()
+    start, end = date(today.year - years + 1, 1, 1), today
+    medecins = medecins or ["medecin1@example.com", "medecin2@example.com"]
+    base = patients(rng, max(10, rows // 4), today)
+    return {
+        "info_Base_patient.xlsx": {"Sheet1": base},
+        "ConsultationData.xlsx": {"Sheet1": consultations(rng, rows, base, start, end, medecins)},
+        "DonneesRDV.xlsx": {"RDV": rendez_vous(rng, max(1, rows // 2), base, start, end, medecins)},
+        "factures.xlsx": {"Factures": factures(rng, max(1, rows // 2), base, start, end)},
+        "Comptabilite.xlsx": comptabilite(rng, max(1, rows // 2), base, start, end),
+        "Pharmacie.xlsx": pharmacie(rng, rows, start, end),
+        "Biologie.xlsx": {"Sheet1": examens(rng, max(1, rows // 5), base, start, end, "ANALYSE", ANALYSES)},
+        "Radiologie.xlsx": {"Sheet1": examens(rng, max(1, rows // 10), base, start, end, "RADIOLOGIE", RADIOLOGIES)},
+    }
+
+
+def write_tenant(excel_folder: str, workbooks: dict, fmt: str = "xlsx"):
+    """Écrit les classeurs dans le dossier Excel d'un tenant (fichiers .xlsx ou base SQLite)."""
+    os.makedirs(excel_folder, exist_ok=True)
+    for name, sheets in workbooks.items():
+        path = os.path.join(excel_folder, name)
+        if fmt == "sqlite" and storage.is_managed(path):
+            storage.write_sheets(path, sheets)
+            continue
+        with pd.ExcelWriter(path, engine="openpyxl") as writer:
+            for sheet, df in sheets.items():
+                if len(df) > XLSX_MAX_ROWS:
+                    print(f"AVERTISSEMENT: {name}/{sheet} tronqué à {XLSX_MAX_ROWS} lignes (limite Excel)")
+                    df = df.iloc[:XLSX_MAX_ROWS]
+                df.to_excel(writer, sheet_name=sheet, index=False)
+
+
+def tenant_email(index: int) -> str:
+    return f"bench{index + 1}@example.com"
+
+
+def generate(root: str, tenants: int, rows: int, fmt: str = "xlsx", seed: int = 0) -> list:
+    """Génère `tenants` tenants sous root/MEDICALINK_DATA ; retourne leurs e-mails administrateur."""
+    utils.application_path = root
+    emails = []
+    for i in range(tenants):
+        email = tenant_email(i)
+        excel_folder = os.path.join(utils.tenant_base_dir(email), "Excel")
+        t0 = time.perf_counter()
+        workbooks = tenant_workbooks(rows, seed=seed + i, medecins=[email, f"medecin{i + 1}@example.com"])
+        write_tenant(excel_folder, workbooks, fmt)
+        total = sum(len(df) for sheets in workbooks.values() for df in sheets.values())
+        print(f"{email}: {total} lignes écrites ({fmt}) en {time.perf_counter() - t0:.1f}s -> {excel_folder}")
+        emails.append(email)
+    return emails
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Génère des tenants EasyMedicaLink synthétiques.")
+    parser.add_argument("--root", required=True, help="dossier racine (contiendra MEDICALINK_DATA/)")
+    parser.add_argument("--tenants", type=int, default=1)
+    parser.add_argument("--rows", type=int, default=1000, help="consultations par tenant (1000 à 1000000)")
+    parser.add_argument("--format", choices=["xlsx", "sqlite"], default="xlsx")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    generate(args.root, args.tenants, args.rows, args.format, args.seed)
+
+
+if __name__ == "__main__":
+    main()
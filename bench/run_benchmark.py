@@ -0,0 +1,192 @@
+# run_benchmark.py
+# ---------------------------------------------------------------------------
+#  Banc de mesure des pages principales (client de test Flask)
+# ---------------------------------------------------------------------------
+#  Génère (ou réutilise) des tenants synthétiques avec bench/datagen.py,
+#  démarre l'application réelle (app.create_app, mêmes blueprints, même
+#  before_request) et appelle les routes en tant qu'administrateur de chaque
+#  tenant, à tour de rôle. Pour chaque route :
+#    - latence du premier appel par tenant (froid : import Excel -> SQLite,
+#      caches vides) ;
+#    - percentiles p50 / p90 / p95 / p99 et maximum des appels suivants ;
+#    - mémoire : RSS du processus après la route et, avec --trace-memory,
+#      pic d'allocations Python pendant un appel (tracemalloc, qui ralentit
+#      les mesures de latence : à utiliser dans une passe séparée).
+#  Les sorties console de l'application sont écartées pendant les mesures.
+#
+#  Exemples :
+#      python bench/run_benchmark.py --rows 10000 --tenants 2 --requests 30
+#      python bench/run_benchmark.py --root /tmp/emk_bench --json resultats.json
+# ---------------------------------------------------------------------------
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+    import resource
+
+import datagen  # noqa: E402
+
+ROUTES = ["/consultation", "/rdv/", "/statistique/", "/facturation/", "/pharmacie/",
+          "/comptabilite/", "/gestion_patient/"]
+PERCENTILES = (50, 90, 95, 99)
+
+
+def _rss_mb() -> float:
+    """RSS actuel (psutil) ou, à défaut, RSS maximal atteint par le processus."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2**20
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _tenant_emails(root: str) -> list:
+    data = os.path.join(root, "MEDICALINK_DATA")
+    if not os.path.isdir(data):
+        return []
+    return sorted(name.replace("_at_", "@").replace("_dot_", ".") for name in os.listdir(data)
+                  if os.path.isdir(os.path.join(data, name, "Excel")))
+
+
+def _start_app(root: str, emails: list):
+    """Application réelle sur `root`, avec un compte administrateur actif par tenant."""
+    import utils
+    utils.application_path = root
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        import app as appmod
+        import login
+        login.USERS_FILE = None
+        login._set_login_paths()
+        login.save_users({email: {
+            "email": email, "password": login.hash_password("bench"), "role": "admin", "active": True,
+            "nom": "Bench", "prenom": f"Admin {i + 1}", "clinic": f"Cabinet {i + 1}",
+            "activation": {"plan": "essai_7j", "activation_date": date.today().isoformat(),
+                           "activation_code": "0000-0000-0000-0000"},
+        } for i, email in enumerate(emails)})
+    application = appmod.app
+    application.config["TESTING"] = True
+    return application
+
+
+def _client(application, email: str):
+    client = application.test_client()
+    with client.session_transaction() as session:
+        session["email"] = email
+        session["admin_email"] = email
+        session["role"] = "admin"
+    return client
+
+
+def _call(client, route: str, trace_memory: bool) -> tuple:
+    """(latence en ms, code HTTP, pic d'allocations en Mo ou None)."""
+    if trace_memory:
+        tracemalloc.start()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        t0 = time.perf_counter()
+        try:
+            status = client.get(route).status_code
+        except Exception as e:
+            status = f"{type(e).__name__}: {e}"
+        elapsed = (time.perf_counter() - t0) * 1000
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return elapsed, status, peak
+
+
+def run(application, emails: list, routes: list, requests: int, trace_memory: bool = False) -> dict:
+    clients = {email: _client(application, email) for email in emails}
+    results = {}
+    for route in routes:
+        cold, warm, errors, peaks = [], [], {}, []     # errors : réponses autres que 200, par statut
+        for email, client in clients.items():
+            elapsed, status, peak = _call(client, route, trace_memory)
+            cold.append(elapsed)
+            if status != 200:
+                errors[str(status)] = errors.get(str(status), 0) + 1
+        for i in range(requests):
+            client = clients[emails[i % len(emails)]]   # tenants à tour de rôle
+            elapsed, status, peak = _call(client, route, trace_memory)
+            warm.append(elapsed)
+            if peak is not None:
+                peaks.append(peak)
+            if status != 200:
+                errors[str(status)] = errors.get(str(status), 0) + 1
+        stats = {"cold_ms": round(max(cold), 1), "requests": len(warm),
+                 "mean_ms": round(float(np.mean(warm)), 1) if warm else None,
+                 "max_ms": round(max(warm), 1) if warm else None,
+                 "rss_mb": round(_rss_mb(), 1), "errors": errors}
+        for p in PERCENTILES:
+            stats[f"p{p}_ms"] = round(float(np.percentile(warm, p)), 1) if warm else None
+        if peaks:
+            stats["alloc_peak_mb"] = round(max(peaks), 1)
+        results[route] = stats
+        print(_format_row(route, stats), flush=True)
+    return results
+
+
+def _format_header() -> str:
+    cols = ["froid"] + [f"p{p}" for p in PERCENTILES] + ["max", "RSS Mo", "alloc Mo", "hors 200"]
+    return f"{'route':<20}" + "".join(f"{c:>10}" for c in cols)
+
+
+def _format_row(route: str, stats: dict) -> str:
+    values = [stats["cold_ms"]] + [stats[f"p{p}_ms"] for p in PERCENTILES] + [stats["max_ms"], stats["rss_mb"]]
+    cells = "".join(f"{'-' if v is None else v:>10}" for v in values)
+    cells += f"{stats.get('alloc_peak_mb', '-'):>10}"
+    errors = ", ".join(f"{code} x{n}" for code, n in stats["errors"].items()) or "-"
+    return f"{route:<20}{cells}  {errors}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mesure la latence et la mémoire des pages principales.")
+    parser.add_argument("--root", help="racine de données existante (sinon générée dans un dossier temporaire)")
+    parser.add_argument("--tenants", type=int, default=2, help="tenants à générer (sans --root)")
+    parser.add_argument("--rows", type=int, default=1000, help="consultations par tenant généré")
+    parser.add_argument("--format", choices=["xlsx", "sqlite"], default="xlsx")
+    parser.add_argument("--requests", type=int, default=20, help="appels mesurés par route (hors appel froid)")
+    parser.add_argument("--routes", nargs="+", default=ROUTES)
+    parser.add_argument("--trace-memory", action="store_true", help="pic d'allocations par appel (tracemalloc)")
+    parser.add_argument("--json", help="fichier où écrire les résultats")
+    args = parser.parse_args(argv)
+
+    root = args.root
+    if root is None or not _tenant_emails(root):
+        root = root or tempfile.mkdtemp(prefix="emk_bench_")
+        datagen.generate(root, args.tenants, args.rows, args.format)
+    emails = _tenant_emails(root)
+
+    rss_start = _rss_mb()
+    t0 = time.perf_counter()
+    application = _start_app(root, emails)
+    print(f"Application démarrée en {time.perf_counter() - t0:.1f}s ; {len(emails)} tenant(s) sous {root}")
+    print(_format_header() + "   (latences en ms)")
+    results = run(application, emails, args.routes, args.requests, args.trace_memory)
+    summary = {"root": root, "tenants": emails, "rows": args.rows if not args.root else None,
+               "rss_start_mb": round(rss_start, 1), "rss_end_mb": round(_rss_mb(), 1),
+               "memory_source": "psutil" if psutil is not None else "ru_maxrss", "routes": results}
+    print(f"RSS : {summary['rss_start_mb']} Mo -> {summary['rss_end_mb']} Mo ({summary['memory_source']})")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        print(f"Résultats écrits dans {args.json}")
+
+
+if __name__ == "__main__":
+    main()
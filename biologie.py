@@ -1,10 +1,12 @@
 
 # biologie.py
 # Module pour la gestion des analyses biologiques
-from flask import Blueprint, render_template_string, session, redirect, url_for, flash, request, jsonify, send_from_directory, send_file
+from flask import Blueprint, session, redirect, url_for, flash, request, jsonify, send_from_directory, send_file
+from template_cache import render_template_string
 from datetime import datetime
 import utils
 import theme
+import storage
 import pandas as pd
 import os
 import io
@@ -767,9 +769,9 @@ def home_biologie():
     
     biologie_data_path = os.path.join(utils.EXCEL_FOLDER, 'Biologie.xlsx')
 
-    if os.path.exists(biologie_data_path):
+    if storage.exists(biologie_data_path):
         try:
-            df_biologie = pd.read_excel(biologie_data_path, dtype=str).fillna('')
+            df_biologie = storage.read_excel(biologie_data_path, dtype=str).fillna('')
             
             # Convert DataFrame to list of dictionaries for Jinja2 template
             analyses_history = df_biologie.to_dict(orient='records')
@@ -796,8 +798,7 @@ def home_biologie():
         admin_email_from_session = session.get('admin_email', 'default_admin@example.com')
         utils.set_dynamic_base_dir(admin_email_from_session)
         
-        all_users_data = login.load_users()
-        user_info = all_users_data.get(user_email)
+        user_info = login.get_user(user_email)
         if user_info:
             logged_in_full_name = f"{user_info.get('prenom', '')} {user_info.get('nom', '')}".strip()
             if not logged_in_full_name:
@@ -836,9 +837,9 @@ def get_patient_details():
     # Initialize an empty list to hold the analyses
     patient_analyses = []
 
-    if utils.CONSULT_FILE_PATH and os.path.exists(utils.CONSULT_FILE_PATH):
+    if utils.CONSULT_FILE_PATH and storage.exists(utils.CONSULT_FILE_PATH):
         try:
-            df_consult = pd.read_excel(utils.CONSULT_FILE_PATH, dtype=str).fillna('')
+            df_consult = storage.read_excel(utils.CONSULT_FILE_PATH, dtype=str).fillna('')
             if 'patient_id' in df_consult.columns:
                 patient_consultations = df_consult[df_consult['patient_id'] == patient_id]
                 if not patient_consultations.empty and 'analyses' in patient_consultations.columns:
@@ -903,10 +904,7 @@ def save_analyse():
             pdf_filename = None
 
     try:
-        if os.path.exists(biologie_data_path):
-            df_biologie = pd.read_excel(biologie_data_path, dtype=str).fillna('')
-        else:
-            df_biologie = pd.DataFrame(columns=['Date', 'ID_Patient', 'NOM', 'PRENOM', 'ANALYSE', 'CONCLUSION', 'PDF_File'])
+        new_rows = []
 
         # Iterate over the lists of analyses and conclusions to save in Biologie.xlsx
         for i in range(len(nom_analyses)):
@@ -923,15 +921,16 @@ def save_analyse():
                 'CONCLUSION': biologist_conclusion,
                 'PDF_File': pdf_filename if pdf_filename else '' # PDF is associated with the whole form submission, not per analysis line for now
             }
-            df_biologie = pd.concat([df_biologie, pd.DataFrame([new_row])], ignore_index=True)
+            new_rows.append(new_row)
 
-        df_biologie.to_excel(biologie_data_path, index=False)
+        # Append-only: Biologie.xlsx is no longer re-read and rewritten on each save
+        storage.append_rows(biologie_data_path, pd.DataFrame(new_rows, columns=['Date', 'ID_Patient', 'NOM', 'PRENOM', 'ANALYSE', 'CONCLUSION', 'PDF_File']))
         flash("Analyse(s) enregistrée(s) avec succès dans Biologie.xlsx.", "success")
 
         # --- Update ConsultationData.xlsx with analysis comments ---
-        if utils.CONSULT_FILE_PATH and os.path.exists(utils.CONSULT_FILE_PATH):
+        if utils.CONSULT_FILE_PATH and storage.exists(utils.CONSULT_FILE_PATH):
             try:
-                df_consult = pd.read_excel(utils.CONSULT_FILE_PATH, dtype=str).fillna('')
+                df_consult = storage.read_excel(utils.CONSULT_FILE_PATH, dtype=str).fillna('')
 
                 # Find all consultations for the patient
                 # We assume that the last entry for a given patient_id is the latest consultation.
@@ -976,7 +975,8 @@ def save_analyse():
                     df_consult.loc[last_consultation_index, 'doctor_comment'] = updated_doctor_comment
 
                     # Save the updated DataFrame back to the Excel file
-                    df_consult.to_excel(utils.CONSULT_FILE_PATH, index=False)
+                    storage.to_excel(df_consult, utils.CONSULT_FILE_PATH)
+                    utils.invalidate_patient_directory()
                     flash(f"La colonne 'Commentaire du docteur' de la dernière consultation pour le patient {patient_id} a été mise à jour avec les analyses dans ConsultationData.xlsx.", "info")
                 else:
                     print(f"Aucune consultation trouvée pour le patient {patient_id} dans ConsultationData.xlsx pour mettre à jour les commentaires.")
@@ -1012,9 +1012,9 @@ def export_biologie_history():
 
     biologie_data_path = os.path.join(utils.EXCEL_FOLDER, 'Biologie.xlsx')
 
-    if os.path.exists(biologie_data_path):
+    if storage.exists(biologie_data_path):
         try:
-            df_biologie = pd.read_excel(biologie_data_path, dtype=str).fillna('')
+            df_biologie = storage.read_excel(biologie_data_path, dtype=str).fillna('')
             output = io.BytesIO()
             writer = pd.ExcelWriter(output, engine='xlsxwriter')
             df_biologie.to_excel(writer, sheet_name='Historique Analyses Biologiques', index=False)
@@ -4,10 +4,14 @@
 # un aperçu des stocks médicaux, et le suivi des tiers payants et documents fiscaux.
 # Interactions avec facturation.py et pharmacie.py.
 
-from flask import Blueprint, render_template_string, session, redirect, url_for, flash, request, jsonify, send_file
+from flask import Blueprint, session, redirect, url_for, flash, request, jsonify, send_file
+from template_cache import render_template_string
 from datetime import datetime, date, timedelta
 import utils
 import theme
+import storage
+import timing
+import date_parser
 import pandas as pd
 import os
 import io
@@ -43,8 +47,9 @@ except ImportError:
 comptabilite_bp = Blueprint('comptabilite', __name__, url_prefix='/comptabilite')
 
 # --- Constantes et Chemins ---
-# Fichier Excel principal pour la comptabilité
-COMPTABILITE_EXCEL_FILE: str = "" # Sera défini dynamiquement
+# Fichier Excel principal pour la comptabilité (résolu depuis le tenant de la requête)
+def _comptabilite_excel_file() -> str:
+    return os.path.join(utils.EXCEL_FOLDER, 'Comptabilite.xlsx')
 
 # Noms des feuilles Excel attendues dans Comptabilite.xlsx
 ALL_COMPTA_SHEETS = ['Recettes', 'Depenses', 'Salaires', 'TiersPayants', 'DocumentsFiscaux']
@@ -69,17 +74,35 @@ DEFAULT_FISCAL_DOCUMENT_TYPES = [
 
 
 # --- Fonctions utilitaires pour charger/sauvegarder les feuilles Excel ---
-def _load_sheet_data(file_path, sheet_name, default_columns, numeric_cols=[]):
+def _load_workbook_sheets(file_path, row_ids=False):
+    """
+    Lit toutes les feuilles du classeur en une fois (storage.read_workbooks), pour les
+    passer à _load_sheet_data(sheets=...). None si le classeur n'existe pas.
+    """
+    if not storage.exists(file_path):
+        return None
+    return storage.read_workbooks([file_path], dtype=str, row_ids=row_ids)[file_path]
+
+def _load_sheet_data(file_path, sheet_name, default_columns, numeric_cols=[], row_ids=False, sheets=None):
     """
     Charge les données d'une feuille spécifique d'un fichier Excel.
     Initialise la feuille avec les colonnes par défaut si elle n'existe pas ou est vide.
+    Avec row_ids=True, chaque ligne porte son identifiant stable (storage.ROW_ID_COLUMN).
+    `sheets` : feuilles déjà lues par _load_workbook_sheets (le classeur n'est pas relu).
     """
     # Assurez-vous que le répertoire existe
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
 
-    if os.path.exists(file_path):
+    if sheets is not None or storage.exists(file_path):
         try:
-            df = pd.read_excel(file_path, sheet_name=sheet_name, dtype=str).fillna('')
+            if sheets is None:
+                df = storage.read_excel(file_path, sheet_name=sheet_name, dtype=str, row_ids=row_ids).fillna('')
+            elif isinstance(sheets, Exception):
+                raise sheets
+            elif sheet_name in sheets:
+                df = sheets[sheet_name].fillna('')
+            else:
+                raise ValueError(f"Worksheet named '{sheet_name}' not found")
             # S'assurer que toutes les colonnes attendues sont présentes, les ajouter si elles manquent
             for col in default_columns:
                 if col not in df.columns:
@@ -108,95 +131,129 @@ def _load_sheet_data(file_path, sheet_name, default_columns, numeric_cols=[]):
 
 def _save_sheet_data(df_to_save, file_path, sheet_name, all_sheet_names):
     """
-    Sauvegarde un DataFrame dans une feuille spécifique d'un fichier Excel,
+    Sauvegarde un DataFrame dans une feuille spécifique du jeu de données,
     en préservant les autres feuilles.
     """
     try:
-        existing_sheets_data = {}
-        if os.path.exists(file_path):
-            existing_sheets_data = pd.read_excel(file_path, sheet_name=None, dtype=str)
-        
-        existing_sheets_data[sheet_name] = df_to_save
-
-        with pd.ExcelWriter(file_path, engine='xlsxwriter') as writer:
-            for s_name in all_sheet_names:
-                if s_name in existing_sheets_data and not existing_sheets_data[s_name].empty:
-                    existing_sheets_data[s_name].to_excel(writer, sheet_name=s_name, index=False)
-                else: # Si une feuille est vide ou n'existe pas encore, la créer avec les colonnes par défaut
-                    if s_name == 'Recettes':
-                        pd.DataFrame(columns=['Date', 'Type_Acte', 'Patient_ID', 'Patient_Nom', 'Patient_Prenom', 'Montant', 'Mode_Paiement', 'Description', 'ID_Facture_Liee']).to_excel(writer, sheet_name=s_name, index=False)
-                    elif s_name == 'Depenses':
-                        pd.DataFrame(columns=['Date', 'Categorie', 'Description', 'Montant', 'Justificatif_Fichier']).to_excel(writer, sheet_name=s_name, index=False)
-                    elif s_name == 'Salaires':
-                        pd.DataFrame(columns=['Mois_Annee', 'Nom_Employe', 'Prenom_Employe', 'Salaire_Net', 'Charges_Sociales', 'Total_Brut', 'Fiche_Paie_PDF']).to_excel(writer, sheet_name=s_name, index=False)
-                    elif s_name == 'TiersPayants':
-                        pd.DataFrame(columns=['Date', 'Assureur', 'Patient_ID', 'Patient_Nom', 'Patient_Prenom', 'Montant_Attendu', 'Montant_Recu', 'Date_Reglement', 'ID_Facture_Liee', 'Statut']).to_excel(writer, sheet_name=s_name, index=False)
-                    elif s_name == 'DocumentsFiscaux':
-                        pd.DataFrame(columns=['Date', 'Type_Document', 'Description', 'Fichier_PDF']).to_excel(writer, sheet_name=s_name, index=False)
+        storage.to_excel(df_to_save, file_path, sheet_name=sheet_name)
         return True
     except Exception as e:
         print(f"Erreur lors de la sauvegarde de la feuille '{sheet_name}' vers {file_path}: {e}")
         flash(f"Erreur lors de la sauvegarde des données de {sheet_name}: {e}", "danger")
         return False
 
+def _append_sheet_row(row, file_path, sheet_name):
+    """
+    Ajoute une ligne à une feuille sans la réécrire (journal d'ajout) : les
+    identifiants des lignes existantes restent valides.
+    """
+    try:
+        storage.append_rows(file_path, [row], sheet_name=sheet_name)
+        return True
+    except Exception as e:
+        print(f"Erreur lors de l'ajout dans la feuille '{sheet_name}' de {file_path}: {e}")
+        flash(f"Erreur lors de la sauvegarde des données de {sheet_name}: {e}", "danger")
+        return False
+
+def _delete_sheet_row(row_id, file_path, sheet_name):
+    """
+    Supprime une seule ligne par son identifiant stable. Retourne la ligne
+    supprimée (dict), ou None si elle n'existe plus.
+    """
+    try:
+        rows = storage.delete_rows(file_path, [row_id], sheet_name=sheet_name, dtype=str)
+    except Exception as e:
+        print(f"Erreur lors de la suppression dans la feuille '{sheet_name}' de {file_path}: {e}")
+        flash(f"Erreur lors de la suppression des données de {sheet_name}: {e}", "danger")
+        return None
+    if rows.empty:
+        return None
+    return rows.fillna('').iloc[0].to_dict()
+
 # --- Initialisation dynamique du chemin des fichiers Excel ---
 @comptabilite_bp.before_request
 def set_compta_paths():
-    global COMPTABILITE_EXCEL_FILE
     if utils.EXCEL_FOLDER is None:
         # Fallback si le répertoire n'est pas encore défini (ex: accès direct à la route)
         admin_email = session.get('admin_email', 'default_admin@example.com')
         utils.set_dynamic_base_dir(admin_email)
-    
-    COMPTABILITE_EXCEL_FILE = os.path.join(utils.EXCEL_FOLDER, 'Comptabilite.xlsx')
-    print(f"DEBUG: Chemin Comptabilite.xlsx défini à : {COMPTABILITE_EXCEL_FILE}")
 
 
 # --- Fonctions pour les opérations CRUD (Recettes, Dépenses, Salaires, TiersPayants, Docs Fiscaux) ---
 
 # Recettes
-def load_recettes():
+def load_recettes(row_ids=False, sheets=None):
     cols = ['Date', 'Type_Acte', 'Patient_ID', 'Patient_Nom', 'Patient_Prenom', 'Montant', 'Mode_Paiement', 'Description', 'ID_Facture_Liee']
     numeric_cols = ['Montant']
-    return _load_sheet_data(COMPTABILITE_EXCEL_FILE, 'Recettes', cols, numeric_cols)
+    return _load_sheet_data(_comptabilite_excel_file(), 'Recettes', cols, numeric_cols, row_ids=row_ids, sheets=sheets)
 
 def save_recettes(df):
-    return _save_sheet_data(df, COMPTABILITE_EXCEL_FILE, 'Recettes', ALL_COMPTA_SHEETS)
+    return _save_sheet_data(df, _comptabilite_excel_file(), 'Recettes', ALL_COMPTA_SHEETS)
+
+def append_recette(row):
+    return _append_sheet_row(row, _comptabilite_excel_file(), 'Recettes')
+
+def delete_recette_row(row_id):
+    return _delete_sheet_row(row_id, _comptabilite_excel_file(), 'Recettes')
 
 # Dépenses
-def load_depenses():
+def load_depenses(row_ids=False, sheets=None):
     cols = ['Date', 'Categorie', 'Description', 'Montant', 'Justificatif_Fichier']
     numeric_cols = ['Montant']
-    return _load_sheet_data(COMPTABILITE_EXCEL_FILE, 'Depenses', cols, numeric_cols)
+    return _load_sheet_data(_comptabilite_excel_file(), 'Depenses', cols, numeric_cols, row_ids=row_ids, sheets=sheets)
 
 def save_depenses(df):
-    return _save_sheet_data(df, COMPTABILITE_EXCEL_FILE, 'Depenses', ALL_COMPTA_SHEETS)
+    return _save_sheet_data(df, _comptabilite_excel_file(), 'Depenses', ALL_COMPTA_SHEETS)
+
+def append_depense(row):
+    return _append_sheet_row(row, _comptabilite_excel_file(), 'Depenses')
+
+def delete_depense_row(row_id):
+    return _delete_sheet_row(row_id, _comptabilite_excel_file(), 'Depenses')
 
 # Salaires
-def load_salaires():
+def load_salaires(row_ids=False, sheets=None):
     cols = ['Mois_Annee', 'Nom_Employe', 'Prenom_Employe', 'Salaire_Net', 'Charges_Sociales', 'Total_Brut', 'Fiche_Paie_PDF']
     numeric_cols = ['Salaire_Net', 'Charges_Sociales', 'Total_Brut']
-    return _load_sheet_data(COMPTABILITE_EXCEL_FILE, 'Salaires', cols, numeric_cols)
+    return _load_sheet_data(_comptabilite_excel_file(), 'Salaires', cols, numeric_cols, row_ids=row_ids, sheets=sheets)
 
 def save_salaires(df):
-    return _save_sheet_data(df, COMPTABILITE_EXCEL_FILE, 'Salaires', ALL_COMPTA_SHEETS)
+    return _save_sheet_data(df, _comptabilite_excel_file(), 'Salaires', ALL_COMPTA_SHEETS)
+
+def append_salaire(row):
+    return _append_sheet_row(row, _comptabilite_excel_file(), 'Salaires')
+
+def delete_salaire_row(row_id):
+    return _delete_sheet_row(row_id, _comptabilite_excel_file(), 'Salaires')
 
 # Tiers Payants
-def load_tiers_payants():
+def load_tiers_payants(row_ids=False, sheets=None):
     cols = ['Date', 'Assureur', 'Patient_ID', 'Patient_Nom', 'Patient_Prenom', 'Montant_Attendu', 'Montant_Recu', 'Date_Reglement', 'ID_Facture_Liee', 'Statut']
     numeric_cols = ['Montant_Attendu', 'Montant_Recu']
-    return _load_sheet_data(COMPTABILITE_EXCEL_FILE, 'TiersPayants', cols, numeric_cols)
+    return _load_sheet_data(_comptabilite_excel_file(), 'TiersPayants', cols, numeric_cols, row_ids=row_ids, sheets=sheets)
 
 def save_tiers_payants(df):
-    return _save_sheet_data(df, COMPTABILITE_EXCEL_FILE, 'TiersPayants', ALL_COMPTA_SHEETS)
+    return _save_sheet_data(df, _comptabilite_excel_file(), 'TiersPayants', ALL_COMPTA_SHEETS)
+
+def append_tiers_payant(row):
+    return _append_sheet_row(row, _comptabilite_excel_file(), 'TiersPayants')
+
+def delete_tiers_payant_row(row_id):
+    return _delete_sheet_row(row_id, _comptabilite_excel_file(), 'TiersPayants')
 
 # Documents Fiscaux
-def load_documents_fiscaux():
+def load_documents_fiscaux(row_ids=False, sheets=None):
     cols = ['Date', 'Type_Document', 'Description', 'Fichier_PDF']
-    return _load_sheet_data(COMPTABILITE_EXCEL_FILE, 'DocumentsFiscaux', cols)
+    return _load_sheet_data(_comptabilite_excel_file(), 'DocumentsFiscaux', cols, row_ids=row_ids, sheets=sheets)
 
 def save_documents_fiscaux(df):
-    return _save_sheet_data(df, COMPTABILITE_EXCEL_FILE, 'DocumentsFiscaux', ALL_COMPTA_SHEETS)
+    return _save_sheet_data(df, _comptabilite_excel_file(), 'DocumentsFiscaux', ALL_COMPTA_SHEETS)
+
+def append_document_fiscal(row):
+    return _append_sheet_row(row, _comptabilite_excel_file(), 'DocumentsFiscaux')
+
+def delete_document_fiscal_row(row_id):
+    return _delete_sheet_row(row_id, _comptabilite_excel_file(), 'DocumentsFiscaux')
 
 
 # --- Classes pour la génération de PDF (Fiche de Paie) ---
@@ -410,20 +467,23 @@ def home_comptabilite():
             start_dt, end_dt = None, None
 
     # --- Initialisation des données pour les onglets ---
-    recettes_df = load_recettes()
-    depenses_df = load_depenses()
-    salaires_df = load_salaires()
-    tiers_payants_df = load_tiers_payants()
-    documents_fiscaux_df = load_documents_fiscaux()
+    # Identifiants stables : les liens de suppression visent une ligne, pas une position.
+    # Comptabilite.xlsx est lu une seule fois pour toutes ses feuilles.
+    compta_sheets = _load_workbook_sheets(_comptabilite_excel_file(), row_ids=True)
+    recettes_df = load_recettes(row_ids=True, sheets=compta_sheets)
+    depenses_df = load_depenses(row_ids=True, sheets=compta_sheets)
+    salaires_df = load_salaires(row_ids=True, sheets=compta_sheets)
+    tiers_payants_df = load_tiers_payants(row_ids=True, sheets=compta_sheets)
+    documents_fiscaux_df = load_documents_fiscaux(row_ids=True, sheets=compta_sheets)
 
     # Ajout des colonnes de date parsées
     if not recettes_df.empty and 'Date' in recettes_df.columns:
-        recettes_df['Date_Parsed'] = pd.to_datetime(recettes_df['Date'], errors='coerce')
+        recettes_df['Date_Parsed'] = date_parser.parse_dates(recettes_df['Date'], ("Comptabilite.xlsx/Recettes", "Date"))
     else:
         recettes_df['Date_Parsed'] = pd.Series(dtype='datetime64[ns]')
 
     if not depenses_df.empty and 'Date' in depenses_df.columns:
-        depenses_df['Date_Parsed'] = pd.to_datetime(depenses_df['Date'], errors='coerce')
+        depenses_df['Date_Parsed'] = date_parser.parse_dates(depenses_df['Date'], ("Comptabilite.xlsx/Depenses", "Date"))
     else:
         depenses_df['Date_Parsed'] = pd.Series(dtype='datetime64[ns]')
 
@@ -433,7 +493,7 @@ def home_comptabilite():
         salaires_df['Mois_Annee_Parsed'] = pd.Series(dtype='datetime64[ns]')
 
     if not tiers_payants_df.empty and 'Date_Reglement' in tiers_payants_df.columns:
-        tiers_payants_df['Date_Parsed'] = pd.to_datetime(tiers_payants_df['Date_Reglement'], errors='coerce')
+        tiers_payants_df['Date_Parsed'] = date_parser.parse_dates(tiers_payants_df['Date_Reglement'], ("Comptabilite.xlsx/TiersPayants", "Date_Reglement"))
     else:
         tiers_payants_df['Date_Parsed'] = pd.Series(dtype='datetime64[ns]')
 
@@ -550,8 +610,7 @@ def home_comptabilite():
     if user_email:
         admin_email_from_session = session.get('admin_email', 'default_admin@example.com')
         utils.set_dynamic_base_dir(admin_email_from_session)
-        all_users_data = login.load_users()
-        user_info = all_users_data.get(user_email)
+        user_info = login.get_user(user_email)
         if user_info:
             logged_in_full_name = f"{user_info.get('prenom', '')} {user_info.get('nom', '')}".strip() or None
 
@@ -598,24 +657,19 @@ def add_recette():
         'Description': f['description_recette'],
         'ID_Facture_Liee': f['id_facture_liee'] or ''
     }
-    df = load_recettes()
-    df = pd.concat([df, pd.DataFrame([new_recette])], ignore_index=True)
-    if save_recettes(df):
+    if append_recette(new_recette):
         flash("Recette ajoutée avec succès.", "success")
     else:
         flash("Erreur lors de l'ajout de la recette.", "danger")
     return redirect(url_for('comptabilite.home_comptabilite', _anchor="recettes-tab"))
 
-@comptabilite_bp.route('/delete_recette/<int:index>')
-def delete_recette(index):
+@comptabilite_bp.route('/delete_recette/<int:row_id>')
+def delete_recette(row_id):
     if 'email' not in session: return redirect(url_for('login.login'))
-    df = load_recettes()
-    if 0 <= index < len(df):
-        df = df.drop(df.index[index]).reset_index(drop=True)
-        if save_recettes(df):
-            flash("Recette supprimée avec succès.", "success")
-        else:
-            flash("Erreur lors de la suppression de la recette.", "danger")
+    if delete_recette_row(row_id) is not None:
+        flash("Recette supprimée avec succès.", "success")
+    else:
+        flash("Recette introuvable : elle a peut-être déjà été supprimée.", "warning")
     return redirect(url_for('comptabilite.home_comptabilite', _anchor="recettes-tab"))
 
 # Factures - Mettre à jour le statut de paiement - REMOVED ROUTE
@@ -674,32 +728,27 @@ def add_depense():
         'Montant': float(f['montant_depense']),
         'Justificatif_Fichier': justificatif_filename
     }
-    df = load_depenses()
-    df = pd.concat([df, pd.DataFrame([new_depense])], ignore_index=True)
-    if save_depenses(df):
+    if append_depense(new_depense):
         flash("Dépense ajoutée avec succès.", "success")
     else:
         flash("Erreur lors de l'ajout de la dépense.", "danger")
     return redirect(url_for('comptabilite.home_comptabilite', _anchor="depenses-tab"))
 
-@comptabilite_bp.route('/delete_depense/<int:index>')
-def delete_depense(index):
+@comptabilite_bp.route('/delete_depense/<int:row_id>')
+def delete_depense(row_id):
     if 'email' not in session: return redirect(url_for('login.login'))
-    df = load_depenses()
-    if 0 <= index < len(df):
+    depense = delete_depense_row(row_id)
+    if depense is not None:
         # Supprimer le fichier justificatif si existant
-        justificatif_filename = df.loc[index, 'Justificatif_Fichier']
+        justificatif_filename = depense.get('Justificatif_Fichier', '')
         if justificatif_filename:
             file_path = os.path.join(utils.PDF_FOLDER, 'Justificatifs_Depenses', justificatif_filename)
             if os.path.exists(file_path):
                 os.remove(file_path)
                 print(f"Justificatif {justificatif_filename} supprimé.")
-        
-        df = df.drop(df.index[index]).reset_index(drop=True)
-        if save_depenses(df):
-            flash("Dépense supprimée avec succès.", "success")
-        else:
-            flash("Erreur lors de la suppression de la dépense.", "danger")
+        flash("Dépense supprimée avec succès.", "success")
+    else:
+        flash("Dépense introuvable : elle a peut-être déjà été supprimée.", "warning")
     return redirect(url_for('comptabilite.home_comptabilite', _anchor="depenses-tab"))
 
 @comptabilite_bp.route('/download_justificatif/<filename>')
@@ -726,75 +775,72 @@ def add_salaire():
         'Total_Brut': total_brut,
         'Fiche_Paie_PDF': '' # Sera rempli après génération PDF
     }
-    df = load_salaires()
-    df = pd.concat([df, pd.DataFrame([new_salaire])], ignore_index=True)
-    if save_salaires(df):
+    if append_salaire(new_salaire):
         flash("Salaire ajouté avec succès.", "success")
     else:
         flash("Erreur lors de l'ajout du salaire.", "danger")
     return redirect(url_for('comptabilite.home_comptabilite', _anchor="salaires-tab"))
 
-@comptabilite_bp.route('/delete_salaire/<int:index>')
-def delete_salaire(index):
+@comptabilite_bp.route('/delete_salaire/<int:row_id>')
+def delete_salaire(row_id):
     if 'email' not in session: return redirect(url_for('login.login'))
-    df = load_salaires()
-    if 0 <= index < len(df):
+    salaire = delete_salaire_row(row_id)
+    if salaire is not None:
         # Supprimer le fichier PDF de la fiche de paie si existant
-        fiche_paie_filename = df.loc[index, 'Fiche_Paie_PDF']
+        fiche_paie_filename = salaire.get('Fiche_Paie_PDF', '')
         if fiche_paie_filename:
             file_path = os.path.join(utils.PDF_FOLDER, 'Fiches_Paie', fiche_paie_filename)
             if os.path.exists(file_path):
                 os.remove(file_path)
                 print(f"Fiche de paie {fiche_paie_filename} supprimée.")
-        
-        df = df.drop(df.index[index]).reset_index(drop=True)
-        if save_salaires(df):
-            flash("Salaire supprimé avec succès.", "success")
-        else:
-            flash("Erreur lors de la suppression du salaire.", "danger")
+        flash("Salaire supprimé avec succès.", "success")
+    else:
+        flash("Salaire introuvable : il a peut-être déjà été supprimé.", "warning")
     return redirect(url_for('comptabilite.home_comptabilite', _anchor="salaires-tab"))
 
-@comptabilite_bp.route('/generate_payslip/<int:index>')
-def generate_payslip(index):
+@comptabilite_bp.route('/generate_payslip/<int:row_id>')
+def generate_payslip(row_id):
     if 'email' not in session: return redirect(url_for('login.login'))
-    df = load_salaires()
-    if not (0 <= index < len(df)):
+    salaire_entry = None
+    if storage.exists(_comptabilite_excel_file()):
+        salaire_entry = storage.read_row(_comptabilite_excel_file(), row_id, sheet_name='Salaires', dtype=str)
+    if salaire_entry is None:
         flash("Fiche de paie introuvable.", "danger")
         return redirect(url_for('comptabilite.home_comptabilite', _anchor="salaires-tab"))
-
-    salaire_entry = df.iloc[index]
+    salaire_entry = {k: ('' if pd.isna(v) else v) for k, v in salaire_entry.items()}
     
     # Récupérer la devise et les informations de l'entreprise de la config générale
     config = utils.load_config()
     currency = config.get('currency', 'MAD')
 
     # Passer toutes les données nécessaires à la classe PDFInvoice
-    pdf = PayslipPDF(
-        app_config={
-            'nom_clinique': config.get('nom_clinique', 'EasyMedicaLink'),
-            'cabinet': config.get('cabinet', 'Cabinet Médical'),
-            'location': config.get('location', 'Adresse non définie'),
-            'phone': config.get('phone', 'N/A'), # Assurez-vous que le numéro de téléphone est dans votre config
-            'email': session.get('admin_email', 'contact@clinique.com') # Utiliser l'email de session pour l'exemple
-        },
-        emp_data={
-            'Nom_Employe': salaire_entry['Nom_Employe'],
-            'Prenom_Employe': salaire_entry['Prenom_Employe'],
-            'Mois_Annee': salaire_entry['Mois_Annee'],
-            'Salaire_Net': float(salaire_entry['Salaire_Net']),
-            'Charges_Sociales': float(salaire_entry['Charges_Sociales']),
-            'Total_Brut': float(salaire_entry['Total_Brut'])
-        },
-        currency=currency
-    )
-    pdf.chapter_body()
-    
-    pdf_dir = os.path.join(utils.PDF_FOLDER, 'Fiches_Paie')
-    os.makedirs(pdf_dir, exist_ok=True)
-    
-    filename = f"Fiche_Paie_{salaire_entry['Prenom_Employe']}_{salaire_entry['Nom_Employe']}_{salaire_entry['Mois_Annee'].replace('/', '-')}.pdf"
-    file_path = os.path.join(pdf_dir, filename)
-    pdf.output(file_path)
+    with timing.phase("pdf"):
+        pdf = PayslipPDF(
+            app_config={
+                'nom_clinique': config.get('nom_clinique', 'EasyMedicaLink'),
+                'cabinet': config.get('cabinet', 'Cabinet Médical'),
+                'location': config.get('location', 'Adresse non définie'),
+                'phone': config.get('phone', 'N/A'), # Assurez-vous que le numéro de téléphone est dans votre config
+                'email': session.get('admin_email', 'contact@clinique.com') # Utiliser l'email de session pour l'exemple
+            },
+            emp_data={
+                'Nom_Employe': salaire_entry['Nom_Employe'],
+                'Prenom_Employe': salaire_entry['Prenom_Employe'],
+                'Mois_Annee': salaire_entry['Mois_Annee'],
+                'Salaire_Net': float(salaire_entry['Salaire_Net']),
+                'Charges_Sociales': float(salaire_entry['Charges_Sociales']),
+                'Total_Brut': float(salaire_entry['Total_Brut'])
+            },
+            currency=currency
+        )
+        pdf.chapter_body()
+
+        pdf_dir = os.path.join(utils.PDF_FOLDER, 'Fiches_Paie')
+        os.makedirs(pdf_dir, exist_ok=True)
+
+        filename = f"Fiche_Paie_{salaire_entry['Prenom_Employe']}_{salaire_entry['Nom_Employe']}_{salaire_entry['Mois_Annee'].replace('/', '-')}.pdf"
+        file_path = os.path.join(pdf_dir, filename)
+        pdf.output(file_path)
 
     # Fusionner avec l'arrière-plan si un PDF est configuré
     if utils.background_file and utils.background_file.lower().endswith('.pdf'):
@@ -805,9 +851,9 @@ def generate_payslip(index):
             flash(f"Avertissement: Impossible de fusionner l'arrière-plan PDF. {e}", "warning")
 
 
-    # Mettre à jour le chemin du PDF dans le DataFrame des salaires
-    df.loc[index, 'Fiche_Paie_PDF'] = filename
-    save_salaires(df)
+    # Mettre à jour le chemin du PDF sur cette seule ligne des salaires
+    storage.update_rows(_comptabilite_excel_file(), {storage.ROW_ID_COLUMN: row_id},
+                        {'Fiche_Paie_PDF': filename}, sheet_name='Salaires')
 
     return send_file(file_path, as_attachment=True, download_name=filename)
 
@@ -830,7 +876,8 @@ def import_salaires_excel():
     if file and file.filename.endswith(('.xlsx', '.xls')):
         try:
             # Read the uploaded Excel file into a DataFrame
-            imported_df = pd.read_excel(file, dtype=str).fillna('')
+            with timing.phase("excel"):
+                imported_df = pd.read_excel(file, dtype=str).fillna('')
             
             # Define expected columns for salaries sheet
             expected_cols = ['Mois_Annee', 'Nom_Employe', 'Prenom_Employe', 'Salaire_Net', 'Charges_Sociales', 'Total_Brut'] # Fiche_Paie_PDF is generated, not imported
@@ -912,24 +959,19 @@ def add_tiers_payant():
         'ID_Facture_Liee': f['id_facture_liee_tp'] or '',
         'Statut': f['statut_tp']
     }
-    df = load_tiers_payants()
-    df = pd.concat([df, pd.DataFrame([new_tp])], ignore_index=True)
-    if save_tiers_payants(df):
+    if append_tiers_payant(new_tp):
         flash("Règlement Tiers Payant ajouté avec succès.", "success")
     else:
         flash("Erreur lors de l'ajout du règlement Tiers Payant.", "danger")
     return redirect(url_for('comptabilite.home_comptabilite', _anchor="tiers-payants-tab"))
 
-@comptabilite_bp.route('/delete_tiers_payant/<int:index>')
-def delete_tiers_payant(index):
+@comptabilite_bp.route('/delete_tiers_payant/<int:row_id>')
+def delete_tiers_payant(row_id):
     if 'email' not in session: return redirect(url_for('login.login'))
-    df = load_tiers_payants()
-    if 0 <= index < len(df):
-        df = df.drop(df.index[index]).reset_index(drop=True)
-        if save_tiers_payants(df):
-            flash("Règlement Tiers Payant supprimé avec succès.", "success")
-        else:
-            flash("Erreur lors de la suppression du règlement Tiers Payant.", "danger")
+    if delete_tiers_payant_row(row_id) is not None:
+        flash("Règlement Tiers Payant supprimé avec succès.", "success")
+    else:
+        flash("Règlement Tiers Payant introuvable : il a peut-être déjà été supprimé.", "warning")
     return redirect(url_for('comptabilite.home_comptabilite', _anchor="tiers-payants-tab"))
 
 
@@ -960,32 +1002,27 @@ def add_document_fiscal():
         'Description': f['description_doc_fiscal'],
         'Fichier_PDF': document_filename
     }
-    df = load_documents_fiscaux()
-    df = pd.concat([df, pd.DataFrame([new_doc])], ignore_index=True)
-    if save_documents_fiscaux(df):
+    if append_document_fiscal(new_doc):
         flash("Document fiscal ajouté avec succès.", "success")
     else:
         flash("Erreur lors de l'ajout du document fiscal.", "danger")
     return redirect(url_for('comptabilite.home_comptabilite', _anchor="documents-fiscaux-tab"))
 
-@comptabilite_bp.route('/delete_document_fiscal/<int:index>')
-def delete_document_fiscal(index):
+@comptabilite_bp.route('/delete_document_fiscal/<int:row_id>')
+def delete_document_fiscal(row_id):
     if 'email' not in session: return redirect(url_for('login.login'))
-    df = load_documents_fiscaux()
-    if 0 <= index < len(df):
+    doc = delete_document_fiscal_row(row_id)
+    if doc is not None:
         # Supprimer le fichier PDF si existant
-        doc_filename = df.loc[index, 'Fichier_PDF']
+        doc_filename = doc.get('Fichier_PDF', '')
         if doc_filename:
             file_path = os.path.join(utils.PDF_FOLDER, 'Documents_Fiscaux', doc_filename)
             if os.path.exists(file_path):
                 os.remove(file_path)
                 print(f"Document fiscal {doc_filename} supprimé.")
-        
-        df = df.drop(df.index[index]).reset_index(drop=True)
-        if save_documents_fiscaux(df):
-            flash("Document fiscal supprimé avec succès.", "success")
-        else:
-            flash("Erreur lors de la suppression du document fiscal.", "danger")
+        flash("Document fiscal supprimé avec succès.", "success")
+    else:
+        flash("Document fiscal introuvable : il a peut-être déjà été supprimé.", "warning")
     return redirect(url_for('comptabilite.home_comptabilite', _anchor="documents-fiscaux-tab"))
 
 @comptabilite_bp.route('/download_document_fiscal/<filename>')
@@ -1014,29 +1051,30 @@ def generate_compta_report():
     writer = pd.ExcelWriter(output, engine='xlsxwriter')
 
     if report_type == 'revenu_depense':
-        recettes_df = load_recettes()
-        depenses_df = load_depenses()
-        salaires_df = load_salaires()
-        tiers_payants_df = load_tiers_payants() # Load tiers payants for the report
+        compta_sheets = _load_workbook_sheets(_comptabilite_excel_file())
+        recettes_df = load_recettes(sheets=compta_sheets)
+        depenses_df = load_depenses(sheets=compta_sheets)
+        salaires_df = load_salaires(sheets=compta_sheets)
+        tiers_payants_df = load_tiers_payants(sheets=compta_sheets) # Load tiers payants for the report
 
         # Ensure Date_Parsed/Mois_Annee_Parsed exist immediately after loading original DFs
         if not recettes_df.empty and 'Date' in recettes_df.columns:
-            recettes_df['Date_Parsed'] = pd.to_datetime(recettes_df['Date'], errors='coerce')
+            recettes_df['Date_Parsed'] = date_parser.parse_dates(recettes_df['Date'], ("Comptabilite.xlsx/Recettes", "Date"))
         else:
             recettes_df['Date_Parsed'] = pd.Series(dtype='datetime64[ns]')
 
         if not depenses_df.empty and 'Date' in depenses_df.columns:
-            depenses_df['Date_Parsed'] = pd.to_datetime(depenses_df['Date'], errors='coerce')
+            depenses_df['Date_Parsed'] = date_parser.parse_dates(depenses_df['Date'], ("Comptabilite.xlsx/Depenses", "Date"))
         else:
             depenses_df['Date_Parsed'] = pd.Series(dtype='datetime64[ns]')
 
         if not salaires_df.empty and 'Mois_Annee' in salaires_df.columns:
-            salaires_df['Mois_Annee_Parsed'] = pd.to_datetime(salaires_df['Mois_Annee'], errors='coerce')
+            salaires_df['Mois_Annee_Parsed'] = date_parser.parse_dates(salaires_df['Mois_Annee'], ("Comptabilite.xlsx/Salaires", "Mois_Annee"))
         else:
             salaires_df['Mois_Annee_Parsed'] = pd.Series(dtype='datetime64[ns]')
 
         if not tiers_payants_df.empty and 'Date_Reglement' in tiers_payants_df.columns:
-            tiers_payants_df['Date_Parsed'] = pd.to_datetime(tiers_payants_df['Date_Reglement'], errors='coerce')
+            tiers_payants_df['Date_Parsed'] = date_parser.parse_dates(tiers_payants_df['Date_Reglement'], ("Comptabilite.xlsx/TiersPayants", "Date_Reglement"))
         else:
             tiers_payants_df['Date_Parsed'] = pd.Series(dtype='datetime64[ns]')
 
@@ -1829,7 +1867,7 @@ comptabilite_template = """
                                                 <td>{{ recette.Mode_Paiement }}</td>
                                                 <td>{{ recette.ID_Facture_Liee }}</td>
                                                 <td>
-                                                    <a href="{{ url_for('comptabilite.delete_recette', index=loop.index0) }}" class="btn btn-sm btn-danger"><i class="fas fa-trash"></i></a>
+                                                    <a href="{{ url_for('comptabilite.delete_recette', row_id=recette['_row_id']) }}" class="btn btn-sm btn-danger"><i class="fas fa-trash"></i></a>
                                                 </td>
                                             </tr>
                                             {% endfor %}
@@ -1958,7 +1996,7 @@ comptabilite_template = """
                                                     {% else %} N/A {% endif %}
                                                 </td>
                                                 <td>
-                                                    <a href="{{ url_for('comptabilite.delete_depense', index=loop.index0) }}" class="btn btn-sm btn-danger"><i class="fas fa-trash"></i></a>
+                                                    <a href="{{ url_for('comptabilite.delete_depense', row_id=depense['_row_id']) }}" class="btn btn-sm btn-danger"><i class="fas fa-trash"></i></a>
                                                 </td>
                                             </tr>
                                             {% endfor %}
@@ -2080,10 +2118,10 @@ comptabilite_template = """
                                                 <td>{{ "%.2f"|format(salaire.Charges_Sociales) }} {{ currency }}</td>
                                                 <td>{{ "%.2f"|format(salaire.Total_Brut) }} {{ currency }}</td>
                                                 <td>
-                                                    <a href="{{ url_for('comptabilite.generate_payslip', index=loop.index0) }}" class="btn btn-sm btn-info"><i class="fas fa-file-pdf"></i></a>
+                                                    <a href="{{ url_for('comptabilite.generate_payslip', row_id=salaire['_row_id']) }}" class="btn btn-sm btn-info"><i class="fas fa-file-pdf"></i></a>
                                                 </td>
                                                 <td>
-                                                    <a href="{{ url_for('comptabilite.delete_salaire', index=loop.index0) }}" class="btn btn-sm btn-danger"><i class="fas fa-trash"></i></a>
+                                                    <a href="{{ url_for('comptabilite.delete_salaire', row_id=salaire['_row_id']) }}" class="btn btn-sm btn-danger"><i class="fas fa-trash"></i></a>
                                                 </td>
                                             </tr>
                                             {% endfor %}
@@ -2251,7 +2289,7 @@ comptabilite_template = """
                                                     </span>
                                                 </td>
                                                 <td>
-                                                    <a href="{{ url_for('comptabilite.delete_tiers_payant', index=loop.index0) }}" class="btn btn-sm btn-danger"><i class="fas fa-trash"></i></a>
+                                                    <a href="{{ url_for('comptabilite.delete_tiers_payant', row_id=tp['_row_id']) }}" class="btn btn-sm btn-danger"><i class="fas fa-trash"></i></a>
                                                 </td>
                                             </tr>
                                             {% endfor %}
@@ -2315,7 +2353,7 @@ comptabilite_template = """
                                                     {% else %} N/A {% endif %}
                                                 </td>
                                                 <td>
-                                                    <a href="{{ url_for('comptabilite.delete_document_fiscal', index=loop.index0) }}" class="btn btn-sm btn-danger"><i class="fas fa-trash"></i></a>
+                                                    <a href="{{ url_for('comptabilite.delete_document_fiscal', row_id=doc['_row_id']) }}" class="btn btn-sm btn-danger"><i class="fas fa-trash"></i></a>
                                                 </td>
                                             </tr>
                                             {% endfor %}
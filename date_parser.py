@@ -0,0 +1,123 @@
+# date_parser.py
+# ---------------------------------------------------------------------------
+#  Conversion vectorisée des colonnes de dates saisies en texte
+# ---------------------------------------------------------------------------
+#  Les classeurs mélangent les saisies ('2024-05-01', '01/05/2024 10:30',
+#  '2024-05'…). L'ancienne conversion essayait les formats un par un sur toute
+#  la colonne à chaque affichage. Ici :
+#    - seules les valeurs distinctes sont converties (une date revient sur
+#      beaucoup de lignes), puis le résultat est redistribué ;
+#    - les formats présents dans une colonne sont détectés une fois sur un
+#      échantillon, puis mémorisés par (classeur, colonne) : les affichages
+#      suivants font un seul appel pd.to_datetime par format utilisé ;
+#    - les valeurs qu'aucun format mémorisé ne reconnaît repassent par la liste
+#      complète puis par l'inférence dayfirst, comme avant, et les formats
+#      découverts sont ajoutés à la mémoire.
+#  Le résultat est celui de l'ancienne boucle : chaque valeur est lue avec le
+#  format de DATE_FORMATS qui l'accepte (la lecture étant exacte, un texte
+#  n'est accepté que par un seul format), l'inférence n'intervenant qu'ensuite.
+# ---------------------------------------------------------------------------
+
+import threading
+import warnings
+from typing import Hashable, Optional
+
+import pandas as pd
+
+# Formats reconnus, par ordre de priorité
+DATE_FORMATS = (
+    '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d',
+    '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y',
+    '%d-%m-%Y %H:%M:%S', '%d-%m-%Y %H:%M', '%d-%m-%Y',
+    '%Y/%m/%d %H:%M:%S', '%Y/%m/%d %H:%M', '%Y/%m/%d',
+    '%Y-%m',            # mois seul (salaires)
+    '%m/%Y',
+)
+
+# Nombre de valeurs distinctes examinées pour détecter les formats d'une colonne
+SAMPLE_SIZE = 200
+
+_formats: dict = {}         # (classeur, colonne) -> formats détectés, par ordre de priorité
+_formats_lock = threading.Lock()
+
+
+def _by_priority(formats) -> tuple:
+    return tuple(f for f in DATE_FORMATS if f in set(formats))
+
+
+def _convert(values: pd.Series, fmt: str) -> pd.Series:
+    return pd.to_datetime(values, format=fmt, errors='coerce')
+
+
+def _detect(values: pd.Series) -> tuple:
+    """Formats qui sont le premier à accepter au moins une valeur de l'échantillon."""
+    remaining = values.iloc[:SAMPLE_SIZE]
+    found = []
+    for fmt in DATE_FORMATS:
+        if remaining.empty:
+            break
+        parsed = _convert(remaining, fmt)
+        if parsed.notna().any():
+            found.append(fmt)
+            remaining = remaining[parsed.isna()]
+    return tuple(found)
+
+
+def parse_dates(values: pd.Series, cache_key: Optional[Hashable] = None) -> pd.Series:
+    """
+    Convertit une colonne de dates texte en datetime64 (NaT si non reconnue), même index.
+    `cache_key` (classeur, colonne) mémorise les formats détectés pour les appels suivants.
+    """
+    strings = values.astype(str).str.strip()
+    codes, uniques = pd.factorize(strings, use_na_sentinel=False)
+    uniques = pd.Series(uniques, dtype=object)
+
+    formats = _formats.get(cache_key) if cache_key is not None else None
+    if formats is None:
+        formats = _detect(uniques)
+    parsed = pd.Series(pd.NaT, index=uniques.index, dtype="datetime64[ns]")
+    for fmt in formats:
+        todo = parsed.isna()
+        if not todo.any():
+            break
+        parsed[todo] = _convert(uniques[todo], fmt)
+
+    # Valeurs hors des formats détectés : liste complète, puis inférence
+    todo = parsed.isna()
+    if todo.any():
+        discovered = []
+        for fmt in DATE_FORMATS:
+            if fmt in formats:
+                continue
+            todo = parsed.isna()
+            if not todo.any():
+                break
+            converted = _convert(uniques[todo], fmt)
+            if converted.notna().any():
+                parsed[todo] = converted
+                discovered.append(fmt)
+        todo = parsed.isna()
+        if todo.any():
+            with warnings.catch_warnings():
+                # Saisies libres : pandas avertit qu'il analyse valeur par valeur
+                warnings.simplefilter("ignore", UserWarning)
+                parsed[todo] = pd.to_datetime(uniques[todo], errors='coerce', dayfirst=True)
+        formats = _by_priority(formats + tuple(discovered))
+
+    if cache_key is not None and _formats.get(cache_key) != formats:
+        with _formats_lock:
+            _formats[cache_key] = formats
+
+    result = parsed.take(codes) if len(codes) else parsed.iloc[:0]
+    result.index = values.index
+    return result
+
+
+def known_formats(cache_key: Hashable) -> Optional[tuple]:
+    """Formats mémorisés pour cette colonne (None si elle n'a pas encore été convertie)."""
+    return _formats.get(cache_key)
+
+
+def clear_cache():
+    with _formats_lock:
+        _formats.clear()
@@ -4,12 +4,15 @@ from pathlib import Path
 import json
 import os
 import shutil
+import threading
+import time
 import zipfile
 import tempfile
 from flask import (
-    Blueprint, render_template_string, request,
+    Blueprint, request,
     redirect, url_for, flash, session, jsonify, send_file, current_app
 )
+from template_cache import render_template_string
 from typing import Optional, Dict, Any # Importez Dict et Any
 import qrcode
 import io
@@ -26,6 +29,11 @@ except ImportError:
 import login as login_mod
 import activation
 import utils
+import metrics
+import schema
+import stats_rollup
+import storage
+import timing
 from activation import get_hardware_id, create_paypal_order, capture_paypal_order
 
 # ───────── 2. Paramètres ─────────
@@ -342,6 +350,7 @@ def change_admin_plan():
         "plan": new_plan, "activation_date": ref_date.isoformat(), "activation_code": new_key
     })
     login_mod.save_users(users)
+    activation.invalidate_license_cache(admin_email)
     flash(f"Plan pour {admin_email} mis à jour. Nouvelle clé : {new_key}", "success")
     return redirect(url_for(".dashboard"))
 
@@ -383,6 +392,7 @@ def batch_change_plan():
     
     if updated_count > 0:
         login_mod.save_users(users)
+        activation.invalidate_license_cache()
         flash(f"{updated_count} compte(s) admin mis à jour vers le plan '{new_plan}'.", "success")
     else:
         flash("Aucun compte admin trouvé à mettre à jour.", "info")
@@ -431,6 +441,7 @@ def selective_batch_change_plan():
     
     if updated_count > 0:
         login_mod.save_users(users)
+        activation.invalidate_license_cache()
         flash(f"{updated_count} compte(s) admin sélectionnés ont été mis à jour vers le plan '{new_plan}'.", "success")
     else:
         flash("Aucun des comptes sélectionnés n'a pu être mis à jour (non trouvés ou pas admin).", "warning")
@@ -765,6 +776,31 @@ def firebase_upload_blob():
 
     return redirect(url_for('.firebase_browser', path=destination_path))
 
+@developpeur_bp.route('/metrics')
+def metrics_json():
+    """
+    Mesures du processus courant (JSON) : latences par blueprint / endpoint / tenant,
+    lectures et écritures de classeurs, caches, PDF (phase « pdf ») et tâches de fond.
+    """
+    if not session.get("is_developpeur"):
+        return jsonify({"error": "Accès développeur requis."}), 403
+    response = jsonify({
+        "process": {
+            "pid": os.getpid(),
+            "uptime_s": round(time.time() - metrics.STARTED_AT, 1),
+            "threads": threading.active_count(),
+        },
+        "caches": {
+            "dataframes": storage.cache_stats(),
+            "stats_snapshots": stats_rollup.cache_stats(),
+            **{f"schema_{name}": stats for name, stats in schema.cache_stats().items()},
+        },
+        "recent": timing.histograms(),
+        **metrics.snapshot(),
+    })
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
 # ───────── 5. Templates (HTML condensé) ─────────
 
 LOGIN_HTML = """
@@ -777,7 +813,7 @@ DASH_HTML = """
 <!doctype html><html lang='fr'>
 <head><meta charset='utf-8'><title>Développeur | Dashboard</title><meta name="viewport" content="width=device-width, initial-scale=1, shrink-to-fit=no"><link href='https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css' rel='stylesheet'><link href='https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.5.0/css/all.min.css' rel='stylesheet'><link href='https://cdn.datatables.net/1.13.1/css/dataTables.bootstrap5.min.css' rel='stylesheet'><script src="https://cdn.jsdelivr.net/npm/sweetalert2@11"></script><style>:root{--grad1:#4b6cb7;--grad2:#182848;}body{background:#f5f7fb;}.navbar{background:linear-gradient(90deg,var(--grad1),var(--grad2));}.card-header{background:linear-gradient(45deg,var(--grad1),var(--grad2));color:#fff;font-weight:600;}.section-icon{margin-right:.45rem;}.table thead{background:#e9ecef}.btn-grad{background:linear-gradient(90deg,var(--grad1),var(--grad2));border:none;color:#fff;}.no-pointer-events {pointer-events: none;}.mono{font-family: monospace; font-size: 0.9em; color: #E83E8C;}</style></head>
 <body>
-<nav class='navbar navbar-dark shadow'><div class='container-fluid'><span class='navbar-brand d-flex align-items-center gap-2'><i class='fas fa-code'></i> Mode Développeur <span class='fw-light'>EASYMEDICALINK</span></span><a href='{{ url_for("developpeur_bp.dev_logout") }}' class='btn btn-sm btn-outline-light rounded-pill'><i class='fas fa-sign-out-alt'></i> Quitter</a></div></nav>
+<nav class='navbar navbar-dark shadow'><div class='container-fluid'><span class='navbar-brand d-flex align-items-center gap-2'><i class='fas fa-code'></i> Mode Développeur <span class='fw-light'>EASYMEDICALINK</span></span><span class='d-flex gap-2'><a href='{{ url_for("developpeur_bp.metrics_json") }}' target='_blank' class='btn btn-sm btn-outline-light rounded-pill'><i class='fas fa-chart-line'></i> Métriques</a><a href='{{ url_for("developpeur_bp.dev_logout") }}' class='btn btn-sm btn-outline-light rounded-pill'><i class='fas fa-sign-out-alt'></i> Quitter</a></span></div></nav>
 <div class='container my-4'>
   {% with m=get_flashed_messages(with_categories=true) %}{% if m %}{% for c,msg in m %}<div class='alert alert-{{c}} alert-dismissible fade show shadow-sm' role='alert'><i class='fas fa-info-circle me-2'></i>{{msg}}<button type='button' class='btn-close' data-bs-dismiss='alert'></button></div>{% endfor %}{% endif %}{% endwith %}
 
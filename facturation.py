@@ -6,14 +6,17 @@ import json
 import pandas as pd
 import qrcode
 from flask import (
-    Blueprint, request, render_template_string, redirect, url_for,
+    Blueprint, request, redirect, url_for,
     flash, send_file, current_app, jsonify, session
 )
+from template_cache import render_template_string
 from fpdf import FPDF
 from fpdf.enums import XPos, YPos
 from PIL import Image
 import utils # Assumant que utils contient get_base_dir() ou un chemin direct vers excel_dir
 import theme
+import storage
+import timing
 from rdv import load_patients # This load_patients will now implicitly use dynamic paths from utils
 from routes import LISTS_FILE
 from utils import merge_with_background_pdf # Import added
@@ -79,11 +82,9 @@ def update_recettes_excel(data):
 
     all_sheets_data = {}
 
-    if os.path.exists(excel_file_path):
+    if storage.exists(excel_file_path):
         try:
-            xls = pd.ExcelFile(excel_file_path)
-            for sheet in xls.sheet_names:
-                all_sheets_data[sheet] = pd.read_excel(xls, sheet_name=sheet)
+            all_sheets_data = storage.read_excel(excel_file_path, sheet_name=None)
         except Exception as e:
             flash(f"Erreur lors de la lecture du fichier Excel: {e}. Un nouveau fichier pourrait être créé.", "warning")
             all_sheets_data = {}
@@ -137,9 +138,7 @@ def update_recettes_excel(data):
 
     # Écrire toutes les DataFrames dans le fichier Excel
     try:
-        with pd.ExcelWriter(excel_file_path, engine='openpyxl') as writer:
-            for sheet, df in all_sheets_data.items():
-                df.to_excel(writer, sheet_name=sheet, index=False)
+        storage.write_sheets(excel_file_path, all_sheets_data)
         flash("Les données de recettes ont été mises à jour avec succès dans Comptabilite.xlsx", "success")
         return True
     except Exception as e:
@@ -436,7 +435,7 @@ def get_invoice_details(invoice_number):
                 # Load patients info to find ID
                 info_path = os.path.join(utils.EXCEL_FOLDER, 'info_Base_patient.xlsx')
                 if os.path.exists(info_path):
-                    df_pat = pd.read_excel(info_path, dtype=str)
+                    df_pat = storage.read_excel(info_path, dtype=str)
                     matching_patient = df_pat[
                         (df_pat['Nom'] + ' ' + df_pat['Prenom']).str.strip() == patient_full_name.strip()
                     ]
@@ -549,13 +548,13 @@ def record_payment():
                 # Mise à jour du statut de la facture dans factures.xlsx si liée
                 if invoice_number and payment_status == 'Payé': # Only update if checkbox is checked
                     factures_path = os.path.join(utils.EXCEL_FOLDER, 'factures.xlsx')
-                    if os.path.exists(factures_path):
-                        df_fact = pd.read_excel(factures_path, dtype={'Numero': str})
+                    if storage.exists(factures_path):
+                        df_fact = storage.read_excel(factures_path, dtype={'Numero': str})
                         # Trouver la facture par son numéro
                         idx = df_fact[df_fact['Numero'] == invoice_number].index
                         if not idx.empty:
                             df_fact.loc[idx, 'Statut_Paiement'] = 'Payée'
-                            df_fact.to_excel(factures_path, index=False)
+                            storage.to_excel(df_fact, factures_path)
                             flash(f"Statut de la facture '{invoice_number}' mis à jour à 'Payée'.", "info")
 
                         else:
@@ -632,9 +631,9 @@ def generate_receipt(invoice_number):
     sheet_name_recettes = 'Recettes'
     payment_data = None
 
-    if os.path.exists(excel_file_path):
+    if storage.exists(excel_file_path):
         try:
-            df_recettes = pd.read_excel(excel_file_path, sheet_name=sheet_name_recettes, dtype={'ID_Facture_Liee': str}).fillna("")
+            df_recettes = storage.read_excel(excel_file_path, sheet_name=sheet_name_recettes, dtype={'ID_Facture_Liee': str}).fillna("")
             # Trouver le premier paiement lié à ce numéro de facture
             matching_payments = df_recettes[df_recettes['ID_Facture_Liee'] == invoice_number]
             if not matching_payments.empty:
@@ -661,18 +660,19 @@ def generate_receipt(invoice_number):
     # Générer un numéro de reçu unique basé sur le numéro de facture
     receipt_num = f"REC-{invoice_number}"
 
-    receipt_pdf = PDFReceipt(
-        app=current_app,
-        payment_data=payment_data,
-        invoice_details=invoice_details,
-        config=config,
-        receipt_number=receipt_num # Passer le numéro de reçu
-    )
-    receipt_pdf.add_receipt_details() # Cette méthode existe déjà et remplit les détails
-    
-    receipt_filename = f"Recu_Paiement_{invoice_number}.pdf" # Nom de fichier cohérent
-    receipt_output_path = os.path.join(utils.PDF_FOLDER, receipt_filename)
-    receipt_pdf.output(receipt_output_path)
+    with timing.phase("pdf"):
+        receipt_pdf = PDFReceipt(
+            app=current_app,
+            payment_data=payment_data,
+            invoice_details=invoice_details,
+            config=config,
+            receipt_number=receipt_num # Passer le numéro de reçu
+        )
+        receipt_pdf.add_receipt_details() # Cette méthode existe déjà et remplit les détails
+
+        receipt_filename = f"Recu_Paiement_{invoice_number}.pdf" # Nom de fichier cohérent
+        receipt_output_path = os.path.join(utils.PDF_FOLDER, receipt_filename)
+        receipt_pdf.output(receipt_output_path)
     
     merge_with_background_pdf(receipt_output_path) # Appliquer l'arrière-plan
 
@@ -707,7 +707,7 @@ def new_patient():
         if not (id_ and nom and prenom):
             flash('Veuillez remplir ID, Nom et Prénom', 'danger')
             return redirect(url_for('facturation.new_patient'))
-        df = pd.read_excel(excel_path)
+        df = storage.read_excel(excel_path)
         df = pd.concat([df, pd.DataFrame([{'ID': id_, 'Nom': nom, 'Prenom': prenom, 'Téléphone': tel}])], ignore_index=True)
         df.to_excel(excel_path, index=False)
         flash('Patient ajouté ✔', 'success')
@@ -779,20 +779,19 @@ def delete_invoice(invoice_number):
 
     try:
         # Delete from factures.xlsx
-        if os.path.exists(factures_path):
-            df = pd.read_excel(factures_path, dtype={'Numero': str})
+        if storage.exists(factures_path):
+            df = storage.read_excel(factures_path, dtype={'Numero': str})
             df_filtered = df[df['Numero'] != invoice_number]
             if len(df_filtered) < len(df):
-                df_filtered.to_excel(factures_path, index=False)
+                storage.to_excel(df_filtered, factures_path)
             else:
                 return jsonify(success=False, error="Facture non trouvée dans l'Excel."), 404
         else:
             return jsonify(success=False, error="Fichier Excel des factures introuvable."), 404
 
         # Delete associated data from Comptabilite.xlsx (Recettes sheet)
-        if os.path.exists(comptabilite_path):
-            xls = pd.ExcelFile(comptabilite_path)
-            all_sheets_data = {sheet: pd.read_excel(xls, sheet_name=sheet) for sheet in xls.sheet_names}
+        if storage.exists(comptabilite_path):
+            all_sheets_data = storage.read_excel(comptabilite_path, sheet_name=None)
             
             sheet_name_recettes = 'Recettes'
             if sheet_name_recettes in all_sheets_data:
@@ -806,9 +805,7 @@ def delete_invoice(invoice_number):
                     df_recettes_filtered = df_recettes[df_recettes['ID_Facture_Liee'] != invoice_number]
                     all_sheets_data[sheet_name_recettes] = df_recettes_filtered
                     
-                    with pd.ExcelWriter(comptabilite_path, engine='openpyxl') as writer:
-                        for sheet, df in all_sheets_data.items():
-                            df.to_excel(writer, sheet_name=sheet, index=False)
+                    storage.to_excel(df_recettes_filtered, comptabilite_path, sheet_name=sheet_name_recettes)
                     
                     # Delete the actual proof file if it exists
                     if proof_filename_to_delete and os.path.exists(os.path.join(proofs_folder, proof_filename_to_delete)):
@@ -857,8 +854,7 @@ def home_facturation():
         admin_email_from_session = session.get('admin_email', 'default_admin@example.com')
         utils.set_dynamic_base_dir(admin_email_from_session)
         
-        all_users_data = login.load_users()
-        user_info = all_users_data.get(user_email)
+        user_info = login.get_user(user_email)
         if user_info:
             logged_in_full_name = f"{user_info.get('prenom', '')} {user_info.get('nom', '')}".strip()
             if not logged_in_full_name:
@@ -881,7 +877,7 @@ def home_facturation():
 
     # ---------- 1. Available services/acts ---------------------------
     # LISTS_FILE est statique, donc son chemin n'est pas affecté
-    df_lists = pd.read_excel(LISTS_FILE, sheet_name=1)
+    df_lists = storage.read_excel(LISTS_FILE, sheet_name=1)
     cols     = list(df_lists.columns)
     services_by_category = {}
     for cat in ['Consultation', 'Analyses', 'Radiologies', 'Autre_Acte']:
@@ -900,7 +896,7 @@ def home_facturation():
     last_patient  = {}
 
     if os.path.exists(info_path):
-        df_pat        = pd.read_excel(info_path, dtype=str)
+        df_pat        = storage.read_excel(info_path, dtype=str)
         patients_info = df_pat.to_dict(orient='records')
         last_patient  = df_pat.iloc[-1].to_dict() if not df_pat.empty else {}
 
@@ -992,24 +988,25 @@ def home_facturation():
             utils.save_config(config)
 
             # 3-H. PDF Creation
-            pdf = PDFInvoice(
-                app      = current_app,
-                numero   = numero,
-                patient  = patient_name,
-                phone    = phone,
-                date_str = date_str,
-                services = services,
-                currency = selected_currency,
-                vat       = config.get('vat', 20),
-                patient_id = pid # Passe l'ID du patient au PDF
-            )
-            pdf.add_invoice_details()
-            pdf.add_invoice_table()
-
-            # Utilise utils.PDF_FOLDER qui est maintenant dynamique
-            output_file_name = f"Facture_{numero}.pdf"
-            output_path = os.path.join(utils.PDF_FOLDER, output_file_name)
-            pdf.output(output_path)
+            with timing.phase("pdf"):
+                pdf = PDFInvoice(
+                    app      = current_app,
+                    numero   = numero,
+                    patient  = patient_name,
+                    phone    = phone,
+                    date_str = date_str,
+                    services = services,
+                    currency = selected_currency,
+                    vat       = config.get('vat', 20),
+                    patient_id = pid # Passe l'ID du patient au PDF
+                )
+                pdf.add_invoice_details()
+                pdf.add_invoice_table()
+
+                # Utilise utils.PDF_FOLDER qui est maintenant dynamique
+                output_file_name = f"Facture_{numero}.pdf"
+                output_path = os.path.join(utils.PDF_FOLDER, output_file_name)
+                pdf.output(output_path)
 
             # 3-I. Background merge
             merge_with_background_pdf(output_path)
@@ -1017,8 +1014,8 @@ def home_facturation():
             # 3-J. Excel Save
             # Utilise utils.EXCEL_FOLDER qui est maintenant dynamique
             factures_path = os.path.join(utils.EXCEL_FOLDER, 'factures.xlsx')
-            if os.path.exists(factures_path):
-                df_fact = pd.read_excel(factures_path, dtype={'Numero': str})
+            if storage.exists(factures_path):
+                df_fact = storage.read_excel(factures_path, dtype={'Numero': str})
             else:
                 df_fact = pd.DataFrame(columns=[
                     'Numero', 'Patient', 'Téléphone', 'Date',
@@ -1040,7 +1037,7 @@ def home_facturation():
                     'PDF_Filename': output_file_name # Enregistre le nom du fichier PDF
                 }])
             ], ignore_index=True)
-            df_fact.to_excel(factures_path, index=False)
+            storage.to_excel(df_fact, factures_path)
 
             # Prepare the invoice details to send back to the client
             response_invoice_details = {
@@ -1151,7 +1148,7 @@ def add_service():
     price = data.get('price', '').strip()
     if not (cat and name and price):
         return jsonify(success=False, error="Données incomplètes"), 400
-    xls = pd.read_excel(LISTS_FILE, sheet_name=None)
+    xls = storage.read_excel(LISTS_FILE, sheet_name=None)
     sheet_name = list(xls.keys())[1]
     df = xls[sheet_name]
     col = next((c for c in df.columns if c.strip().lower() == cat.lower()), None)
@@ -1204,17 +1201,17 @@ def load_invoices():
     comptabilite_path = os.path.join(utils.EXCEL_FOLDER, 'Comptabilite.xlsx')
 
     df_fact = pd.DataFrame()
-    if os.path.exists(factures_path):
-        df_fact = pd.read_excel(factures_path, dtype={'Numero': str}).fillna("")
+    if storage.exists(factures_path):
+        df_fact = storage.read_excel(factures_path, dtype={'Numero': str}).fillna("")
         if 'Date' in df_fact.columns:
             df_fact['Date'] = pd.to_datetime(df_fact['Date'], errors='coerce').dt.strftime('%Y-%m-%d') # Format date for consistency
         if 'PDF_Filename' not in df_fact.columns:
             df_fact['PDF_Filename'] = df_fact['Numero'].apply(lambda x: f"Facture_{x}.pdf")
     
     df_recettes = pd.DataFrame()
-    if os.path.exists(comptabilite_path):
+    if storage.exists(comptabilite_path):
         try:
-            df_recettes = pd.read_excel(comptabilite_path, sheet_name='Recettes', dtype={'ID_Facture_Liee': str}).fillna("")
+            df_recettes = storage.read_excel(comptabilite_path, sheet_name='Recettes', dtype={'ID_Facture_Liee': str}).fillna("")
             # Sélectionner uniquement les colonnes nécessaires de df_recettes
             df_recettes = df_recettes[['ID_Facture_Liee', 'Preuve_Paiement_Fichier']]
             # Renommer 'ID_Facture_Liee' pour la fusion
@@ -1247,9 +1244,9 @@ def load_invoices_df():
         return pd.DataFrame() # Retourne un DataFrame vide
 
     factures_path = os.path.join(utils.EXCEL_FOLDER, 'factures.xlsx')
-    if os.path.exists(factures_path):
+    if storage.exists(factures_path):
         # Assurez-vous que 'Numero' est de type string lors du chargement
-        df = pd.read_excel(factures_path, dtype={'Numero': str}).fillna("")
+        df = storage.read_excel(factures_path, dtype={'Numero': str}).fillna("")
         return df
     return pd.DataFrame()
 
@@ -1289,7 +1286,7 @@ def load_services():
     if not os.path.exists(path):
         return []
 
-    df = pd.read_excel(path, dtype=str)
+    df = storage.read_excel(path, dtype=str)
     df = df.fillna("")
     return df.to_dict("records")
 
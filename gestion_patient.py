@@ -6,7 +6,8 @@
 # Permet de générer des badges PDF personnalisés pour chaque patient.
 # ──────────────────────────────────────────────────────────────────────────────
 
-from flask import Blueprint, render_template_string, request, redirect, url_for, flash, session, send_file, jsonify, get_flashed_messages
+from flask import Blueprint, request, redirect, url_for, flash, session, send_file, jsonify, get_flashed_messages
+from template_cache import render_template_string
 from datetime import datetime, date
 import pandas as pd
 import os
@@ -17,11 +18,22 @@ import qrcode
 from PIL import Image
 from PyPDF2 import PdfReader, PdfWriter # Maintenu pour la concaténation de pages FPDF
 import base64
+import bisect
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
 
 # Imports internes
 import utils
 import theme
+import storage
+import timing
 import login
+import logs
+
+log = logs.get_logger(__name__)
 
 # Création du Blueprint pour les routes de gestion des patients
 gestion_patient_bp = Blueprint('gestion_patient', __name__, url_prefix='/gestion_patient')
@@ -52,7 +64,7 @@ def load_patients_df() -> pd.DataFrame:
         return df
 
     try:
-        df = pd.read_excel(utils.PATIENT_BASE_FILE, dtype=str).fillna('')
+        df = storage.read_excel(utils.PATIENT_BASE_FILE, dtype=str).fillna('')
         print(f"DEBUG: Fichier {utils.PATIENT_BASE_FILE} chargé avec succès.")
         print(f"DEBUG: Colonnes du DataFrame chargé: {df.columns.tolist()}")
 
@@ -86,12 +98,165 @@ def save_patients_df(df: pd.DataFrame):
 
         df.to_excel(utils.PATIENT_BASE_FILE, index=False)
         print(f"DEBUG: Fichier {utils.PATIENT_BASE_FILE} sauvegardé avec succès.")
+        invalidate_patient_index(utils.PATIENT_BASE_FILE)
         return True
     except Exception as e:
         print(f"ERREUR: Erreur lors de la sauvegarde de {utils.PATIENT_BASE_FILE}: {e}")
         flash(f"Erreur lors de la sauvegarde des données patients: {e}", "danger")
         return False
 
+# --------------------------------------------------------------------------
+# Index de recherche des patients (liste paginée côté serveur)
+# --------------------------------------------------------------------------
+# La liste n'est plus injectée en entier dans la page : DataTables interroge
+# /gestion_patient/api/patients fenêtre par fenêtre. L'index est construit une
+# fois par version du classeur (mtime, taille) et partagé entre les requêtes.
+
+PATIENT_COLUMNS = ["ID", "Nom", "Prenom", "DateNaissance", "Sexe", "Âge", "Antécédents", "Téléphone", "Email"]
+# Champs couverts par la recherche
+SEARCH_COLUMNS = ("ID", "Nom", "Prenom", "Téléphone")
+MAX_PAGE_LENGTH = 500           # taille maximale d'une fenêtre demandée
+MAX_INDEXED_FILES = 16          # nombre de classeurs (tenants) gardés en mémoire
+
+def _normalize(value) -> str:
+    """Minuscules sans accents, pour la recherche et le tri."""
+    text = unicodedata.normalize("NFKD", str(value or "")).casefold()
+    return "".join(c for c in text if not unicodedata.combining(c)).strip()
+
+def _digits(value) -> str:
+    return re.sub(r"\D", "", str(value or ""))
+
+def _phone_digits(word: str) -> str:
+    """Chiffres d'un mot saisi comme un numéro (06.12.., +212-6..), sinon ''."""
+    if re.fullmatch(r"[\d\s.+\-/()]+", word) and re.search(r"\d", word):
+        return _digits(word)
+    return ""
+
+def _sort_key(value):
+    """Les valeurs numériques (ID, âge) se trient par valeur, le reste alphabétiquement."""
+    text = str(value or "").strip()
+    try:
+        return (0, float(text.replace(",", ".")), "")
+    except ValueError:
+        return (1, 0.0, _normalize(text))
+
+class _PatientIndex:
+    """Lignes patients + index triés de jetons pour la recherche par préfixe."""
+
+    def __init__(self, df: pd.DataFrame):
+        for col in PATIENT_COLUMNS:
+            if col not in df.columns:
+                df[col] = ''
+        self.rows = df[PATIENT_COLUMNS].astype(str).to_dict(orient='records')
+        tokens = []
+        self._haystacks = []
+        for pos, row in enumerate(self.rows):
+            words = set()
+            for col in SEARCH_COLUMNS:
+                normalized = _normalize(row[col])
+                words.add(normalized)
+                words.update(w for w in re.split(r"[\s\-']+", normalized) if w)
+            phone = _digits(row["Téléphone"])
+            if phone:
+                words.add(phone)
+            tokens.extend((w, pos) for w in words if w)
+            self._haystacks.append(" | ".join(_normalize(row[col]) for col in SEARCH_COLUMNS) + " | " + phone)
+        tokens.sort()
+        self._tokens = tokens
+        self._token_keys = [t for t, _pos in tokens]
+        self._orders = {}
+        self._lock = threading.Lock()
+
+    def _prefix_matches(self, word: str) -> set:
+        matches = set()
+        i = bisect.bisect_left(self._token_keys, word)
+        while i < len(self._tokens) and self._token_keys[i].startswith(word):
+            matches.add(self._tokens[i][1])
+            i += 1
+        return matches
+
+    def search(self, term: str, mode: str = "prefix") -> Optional[set]:
+        """Positions des lignes correspondant à tous les mots de `term` (None = pas de filtre)."""
+        words = [w for w in _normalize(term).split() if w]
+        if not words:
+            return None
+        result = None
+        for word in words:
+            # Un numéro saisi avec séparateurs (06.12...) est aussi cherché en chiffres seuls
+            digits = _phone_digits(word)
+            if mode == "contains":
+                matches = {pos for pos, hay in enumerate(self._haystacks)
+                           if word in hay or (digits and digits in hay)}
+            else:
+                matches = self._prefix_matches(word)
+                if digits and digits != word:
+                    matches |= self._prefix_matches(digits)
+            result = matches if result is None else result & matches
+            if not result:
+                return set()
+        return result
+
+    def order(self, column: str) -> list:
+        """Positions triées par `column` (calculées une fois par colonne)."""
+        with self._lock:
+            order = self._orders.get(column)
+            if order is None:
+                order = sorted(range(len(self.rows)), key=lambda pos: _sort_key(self.rows[pos][column]))
+                self._orders[column] = order
+            return order
+
+    def page(self, term: str = "", mode: str = "prefix", sort_column: str = "Nom",
+             descending: bool = False, start: int = 0, length: int = 25):
+        """Retourne (nombre filtré, lignes de la fenêtre demandée)."""
+        matches = self.search(term, mode)
+        order = self.order(sort_column)
+        if descending:
+            order = order[::-1]
+        if matches is not None:
+            order = [pos for pos in order if pos in matches]
+        window = order[start:start + length] if length >= 0 else order[start:]
+        return len(order), [self.rows[pos] for pos in window]
+
+_patient_indexes = OrderedDict()   # chemin -> ((mtime_ns, taille), _PatientIndex)
+_patient_indexes_lock = threading.Lock()
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def get_patient_index() -> Optional[_PatientIndex]:
+    """Index des patients du tenant courant, reconstruit seulement si le classeur a changé."""
+    path = utils.PATIENT_BASE_FILE
+    if path is None:
+        return None
+    key = os.path.abspath(path)
+    signature = _file_signature(path)
+    with _patient_indexes_lock:
+        entry = _patient_indexes.get(key)
+        if entry is not None and signature is not None and entry[0] == signature:
+            _patient_indexes.move_to_end(key)
+            return entry[1]
+    index = _PatientIndex(load_patients_df())
+    signature = _file_signature(path)  # le chargement peut avoir créé le fichier
+    with _patient_indexes_lock:
+        _patient_indexes[key] = (signature, index)
+        _patient_indexes.move_to_end(key)
+        while len(_patient_indexes) > MAX_INDEXED_FILES:
+            _patient_indexes.popitem(last=False)
+    log.debug("Index patients reconstruit pour %s (%s patients).", path, len(index.rows))
+    return index
+
+def invalidate_patient_index(path=None):
+    """Oublie l'index d'un classeur (ou de tous) après une écriture."""
+    with _patient_indexes_lock:
+        if path is None:
+            _patient_indexes.clear()
+        else:
+            _patient_indexes.pop(os.path.abspath(path), None)
+
 # --------------------------------------------------------------------------
 # Fonctions de génération de badge PDF
 # --------------------------------------------------------------------------
@@ -356,8 +521,7 @@ def home_gestion_patient():
     host_address = f"http://{utils.LOCAL_IP}:3000"
     current_date = datetime.now().strftime("%Y-%m-%d")
 
-    patients_df = load_patients_df()
-    patients_list = patients_df.to_dict(orient='records')
+    # La liste des patients est chargée par fenêtres via api_patients (DataTables serverSide)
 
     # Passer les messages flash au template pour que JavaScript puisse les lire
     flashed_messages = get_flashed_messages(with_categories=True)
@@ -367,8 +531,7 @@ def home_gestion_patient():
     user_email = session.get('email')
     
     if user_email:
-        all_users_data = login.load_users()
-        user_info = all_users_data.get(user_email)
+        user_info = login.get_user(user_email)
         if user_info:
             logged_in_full_name = f"{user_info.get('prenom', '')} {user_info.get('nom', '')}".strip()
             if not logged_in_full_name:
@@ -382,7 +545,6 @@ def home_gestion_patient():
         theme_names=list(theme.THEMES.keys()),
         host_address=host_address,
         current_date=current_date,
-        patients=patients_list,
         flashed_messages=flashed_messages, # Passer les messages flash ici
         # --- PASSER LA NOUVELLE VARIABLE AU TEMPLATE ---
         logged_in_doctor_name=logged_in_full_name # Utilise le même nom de variable que dans main_template pour cohérence
@@ -408,6 +570,7 @@ def add_patient():
         flash("Veuillez remplir tous les champs obligatoires (ID, Nom, Prénom, Date de Naissance, Sexe, Téléphone).", "warning")
         return redirect(url_for('gestion_patient.home_gestion_patient'))
 
+    directory_before = utils.patient_directory_version()  # avant la lecture-modification-écriture
     patients_df = load_patients_df()
 
     if patient_id in patients_df['ID'].values:
@@ -442,7 +605,7 @@ def add_patient():
     patients_df = pd.concat([patients_df, pd.DataFrame([new_patient])], ignore_index=True)
     if save_patients_df(patients_df):
         flash("Patient ajouté avec succès!", "success_and_redirect_to_list") # Catégorie spécifique
-        utils.load_patient_data()
+        utils.update_patient_directory([new_patient], directory_before)
     return redirect(url_for('gestion_patient.home_gestion_patient'))
 
 @gestion_patient_bp.route('/edit_patient', methods=['POST'])
@@ -465,6 +628,7 @@ def edit_patient():
         flash("Veuillez remplir tous les champs obligatoires (ID, Nom, Prénom, Date de Naissance, Sexe, Téléphone).", "warning")
         return redirect(url_for('gestion_patient.home_gestion_patient'))
 
+    directory_before = utils.patient_directory_version()  # avant la lecture-modification-écriture
     patients_df = load_patients_df()
 
     if patient_id != original_patient_id and patient_id in patients_df['ID'].values:
@@ -501,7 +665,11 @@ def edit_patient():
 
     if save_patients_df(patients_df):
         flash("Patient mis à jour avec succès!", "success_and_redirect_to_list") # Catégorie spécifique
-        utils.load_patient_data()
+        if patient_id == original_patient_id:
+            utils.update_patient_directory(patients_df.loc[idx], directory_before)
+        else:
+            # L'ancien ID peut disparaître de l'annuaire : reconstruction au prochain accès
+            utils.invalidate_patient_directory()
     return redirect(url_for('gestion_patient.home_gestion_patient'))
 
 @gestion_patient_bp.route('/delete_patient/<patient_id>', methods=['POST'])
@@ -517,7 +685,7 @@ def delete_patient(patient_id):
     if len(patients_df) < original_rows_count:
         if save_patients_df(patients_df):
             flash("Patient supprimé avec succès!", "success_and_redirect_to_list") # Catégorie spécifique
-            utils.load_patient_data()
+            utils.invalidate_patient_directory()
             return jsonify(success=True)
         else:
             return jsonify(success=False, message="Erreur lors de la suppression du patient."), 500
@@ -536,6 +704,45 @@ def get_patient_details(patient_id):
         return jsonify(patient_data[0])
     return jsonify(error="Patient non trouvé"), 404
 
+@gestion_patient_bp.route('/api/patients', methods=['GET'])
+def api_patients():
+    """
+    Liste paginée des patients au format DataTables (serverSide) :
+    draw, start, length, search[value], order[0][column|dir], columns[i][data].
+    Paramètre optionnel `mode` : 'prefix' (défaut, via l'index) ou 'contains'.
+    """
+    if 'email' not in session:
+        return jsonify(error="Non autorisé"), 401
+
+    if utils.EXCEL_FOLDER is None and 'admin_email' in session:
+        utils.set_dynamic_base_dir(session['admin_email'])
+
+    args = request.args
+    draw = args.get('draw', 0, type=int)
+    start = max(args.get('start', 0, type=int), 0)
+    length = args.get('length', 25, type=int)
+    if length < 0 or length > MAX_PAGE_LENGTH:
+        length = MAX_PAGE_LENGTH
+    term = args.get('search[value]', args.get('q', ''))
+    mode = args.get('mode', 'prefix')
+    if mode not in ('prefix', 'contains'):
+        mode = 'prefix'
+
+    sort_column = 'Nom'
+    order_col = args.get('order[0][column]', type=int)
+    if order_col is not None:
+        requested = args.get(f'columns[{order_col}][data]', '')
+        if requested in PATIENT_COLUMNS:
+            sort_column = requested
+    descending = args.get('order[0][dir]', 'asc') == 'desc'
+
+    index = get_patient_index()
+    if index is None:
+        return jsonify(draw=draw, recordsTotal=0, recordsFiltered=0, data=[])
+
+    filtered, rows = index.page(term, mode, sort_column, descending, start, length)
+    return jsonify(draw=draw, recordsTotal=len(index.rows), recordsFiltered=filtered, data=rows)
+
 @gestion_patient_bp.route('/generate_badge/<patient_id>')
 def generate_badge(patient_id):
     if 'email' not in session:
@@ -572,23 +779,23 @@ def generate_badge(patient_id):
     logged_in_full_name = None
     user_email = session.get('email')
     if user_email:
-        all_users_data = login.load_users()
-        user_info = all_users_data.get(user_email)
+        user_info = login.get_user(user_email)
         if user_info:
             logged_in_full_name = f"{user_info.get('prenom', '')} {user_info.get('nom', '')}".strip()
             if not logged_in_full_name:
                 logged_in_full_name = None
 
 
-    temp_pdf_instance = PatientBadgePDF(config, {}, "", logged_in_full_name) # Passer logged_in_full_name
-    rdv_link_qr_data_uri = temp_pdf_instance.generate_qr_code_data_uri(patient_appointment_link)
+    with timing.phase("pdf"):
+        temp_pdf_instance = PatientBadgePDF(config, {}, "", logged_in_full_name) # Passer logged_in_full_name
+        rdv_link_qr_data_uri = temp_pdf_instance.generate_qr_code_data_uri(patient_appointment_link)
 
-    pdf = PatientBadgePDF(config, patient_data, rdv_link_qr_data_uri, logged_in_full_name) # PASSER logged_in_full_name ICI
-    pdf.print_badge()
+        pdf = PatientBadgePDF(config, patient_data, rdv_link_qr_data_uri, logged_in_full_name) # PASSER logged_in_full_name ICI
+        pdf.print_badge()
 
-    response = io.BytesIO()
-    pdf.output(response, 'S')
-    response.seek(0)
+        response = io.BytesIO()
+        pdf.output(response, 'S')
+        response.seek(0)
 
     badge_filename = f"Badge_Patient_{patient_data.get('Nom', '')}_{patient_data.get('Prenom', '')}_{patient_data.get('ID', '')}.pdf"
 
@@ -613,8 +820,7 @@ def generate_all_badges():
     logged_in_full_name = None
     user_email = session.get('email')
     if user_email:
-        all_users_data = login.load_users()
-        user_info = all_users_data.get(user_email)
+        user_info = login.get_user(user_email)
         if user_info:
             logged_in_full_name = f"{user_info.get('prenom', '')} {user_info.get('nom', '')}".strip()
             if not logged_in_full_name:
@@ -624,27 +830,28 @@ def generate_all_badges():
 
     pdf_writer = PdfWriter()
 
-    temp_pdf_instance = PatientBadgePDF(config, {}, "", logged_in_full_name) # Passer logged_in_full_name
-    rdv_link_qr_data_uri = temp_pdf_instance.generate_qr_code_data_uri(patient_appointment_link)
+    with timing.phase("pdf"):
+        temp_pdf_instance = PatientBadgePDF(config, {}, "", logged_in_full_name) # Passer logged_in_full_name
+        rdv_link_qr_data_uri = temp_pdf_instance.generate_qr_code_data_uri(patient_appointment_link)
 
-    for _, patient_data in patients_df.iterrows():
-        config['rdv_base_url'] = patient_appointment_link
-        pdf = PatientBadgePDF(config, patient_data.to_dict(), rdv_link_qr_data_uri, logged_in_full_name) # PASSER logged_in_full_name ICI
-        pdf.print_badge()
+        for _, patient_data in patients_df.iterrows():
+            config['rdv_base_url'] = patient_appointment_link
+            pdf = PatientBadgePDF(config, patient_data.to_dict(), rdv_link_qr_data_uri, logged_in_full_name) # PASSER logged_in_full_name ICI
+            pdf.print_badge()
 
-        individual_badge_buffer = io.BytesIO()
-        pdf.output(individual_badge_buffer, 'S')
-        individual_badge_buffer.seek(0)
+            individual_badge_buffer = io.BytesIO()
+            pdf.output(individual_badge_buffer, 'S')
+            individual_badge_buffer.seek(0)
 
-        individual_pdf_reader = PdfReader(individual_badge_buffer)
+            individual_pdf_reader = PdfReader(individual_badge_buffer)
 
-        for page_num in range(len(individual_pdf_reader.pages)):
-            page = individual_pdf_reader.pages[page_num]
-            pdf_writer.add_page(page)
+            for page_num in range(len(individual_pdf_reader.pages)):
+                page = individual_pdf_reader.pages[page_num]
+                pdf_writer.add_page(page)
 
-    final_output_buffer = io.BytesIO()
-    pdf_writer.write(final_output_buffer)
-    final_output_buffer.seek(0)
+        final_output_buffer = io.BytesIO()
+        pdf_writer.write(final_output_buffer)
+        final_output_buffer.seek(0)
 
     all_badges_filename = f"Tous_Badges_Patients_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf"
 
@@ -689,9 +896,9 @@ def transfer_to_consultation():
     ]
 
     df_consult = pd.DataFrame()
-    if os.path.exists(consultation_file_path):
+    if storage.exists(consultation_file_path):
         try:
-            df_consult = pd.read_excel(consultation_file_path, dtype=str).fillna('')
+            df_consult = storage.read_excel(consultation_file_path, dtype=str).fillna('')
             # Assurer que toutes les colonnes requises existent dans le DataFrame existant
             for col in consultation_columns:
                 if col not in df_consult.columns:
@@ -737,10 +944,12 @@ def transfer_to_consultation():
 
     # Assurez-vous que l'ordre des colonnes est respecté lors de la concaténation
     new_consult_df = pd.DataFrame([new_consult_data], columns=consultation_columns)
-    df_consult = pd.concat([df_consult, new_consult_df], ignore_index=True)
 
     try:
-        df_consult.to_excel(consultation_file_path, index=False)
+        # Ajout journalisé : la feuille des consultations n'est pas réécrite
+        directory_before = utils.patient_directory_version()
+        storage.append_rows(consultation_file_path, new_consult_df)
+        utils.update_patient_directory(new_consult_df, directory_before)
         return jsonify(success=True, message="Consultation créée avec succès dans ConsultationData.xlsx."), 200
     except Exception as e:
         return jsonify(success=False, message=f"Erreur lors de l'enregistrement de la consultation : {e}"), 500
@@ -1447,13 +1656,17 @@ gestion_patient_template = """
                     });
                 });
 
-                const patientsData = {{ patients | tojson | safe }};
-
                 if ($.fn.DataTable.isDataTable('#patientsTable')) {
                     $('#patientsTable').DataTable().destroy();
                 }
                 $('#patientsTable').DataTable({
-                    data: patientsData,
+                    serverSide: true,
+                    processing: true,
+                    searchDelay: 300,
+                    ajax: {
+                        url: "{{ url_for('gestion_patient.api_patients') }}",
+                        type: 'GET'
+                    },
                     columns: [
                         { data: 'ID', title: 'ID' },
                         { data: 'Nom', title: 'Nom' },
@@ -1467,6 +1680,8 @@ gestion_patient_template = """
                         {
                             data: null,
                             title: 'Actions',
+                            orderable: false,
+                            searchable: false,
                             render: function (data, type, row) {
                                 // Utiliser un conteneur div avec des classes flexbox pour une disposition cohérente
                                 const editBtn = `<button class="btn btn-sm btn-warning edit-patient-btn"
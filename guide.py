@@ -1,5 +1,6 @@
 # guide.py
-from flask import Blueprint, render_template_string, session, redirect, url_for, request # Import request
+from flask import Blueprint, session, redirect, url_for, request # Import request
+from template_cache import render_template_string
 import utils
 import theme
 import login
@@ -1287,8 +1288,7 @@ def guide_home():
         temp_admin_email_for_utils_init = admin_email_from_session if admin_email_from_session else "default_admin@example.com"
         utils.set_dynamic_base_dir(temp_admin_email_for_utils_init)
         
-        all_users_data = login.load_users()
-        user_info = all_users_data.get(user_email)
+        user_info = login.get_user(user_email)
         if user_info:
             logged_in_full_name = f"{user_info.get('prenom', '')} {user_info.get('nom', '')}".strip()
             if not logged_in_full_name:
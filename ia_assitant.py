@@ -10,12 +10,14 @@ import threading
 from werkzeug.utils import secure_filename
 
 from flask import (
-    Blueprint, render_template_string, session, redirect,
+    Blueprint, session, redirect,
     url_for, flash, request, jsonify, Response
 )
+from template_cache import render_template_string
 
 # --- Imports des modules locaux ---
 import utils
+import timing
 import login
 import theme  # On garde l'import, mais on gère l'absence de pwa_head manuellement
 
@@ -63,19 +65,17 @@ model = configure_genai()
 # ==============================================================================
 # 2. GESTION DES DONNÉES JSON
 # ==============================================================================
-JSON_CONVERSATIONS_DIR = None
 json_lock = threading.Lock()
 
-def _initialize_json_storage():
-    global JSON_CONVERSATIONS_DIR
-    if utils.DYNAMIC_BASE_DIR:
-        JSON_CONVERSATIONS_DIR = os.path.join(utils.DYNAMIC_BASE_DIR, "IA_Conversations")
-        os.makedirs(JSON_CONVERSATIONS_DIR, exist_ok=True)
+def _json_conversations_dir() -> str:
+    # Dossier du tenant de la requête courante (résolu à chaque appel)
+    conversations_dir = os.path.join(utils.DYNAMIC_BASE_DIR, "IA_Conversations")
+    os.makedirs(conversations_dir, exist_ok=True)
+    return conversations_dir
 
 def _get_user_conversations_path(user_email: str) -> str:
-    if not JSON_CONVERSATIONS_DIR: _initialize_json_storage()
     email_hash = hashlib.sha1(user_email.encode()).hexdigest()
-    return os.path.join(JSON_CONVERSATIONS_DIR, f"{email_hash}.json")
+    return os.path.join(_json_conversations_dir(), f"{email_hash}.json")
 
 def load_user_conversations(user_email: str) -> list:
     filepath = _get_user_conversations_path(user_email)
@@ -520,8 +520,7 @@ def home_ia_assitant():
     
     config = utils.load_config()
     user_email = session.get('email')
-    all_users = login.load_users()
-    user_info = all_users.get(user_email, {})
+    user_info = login.get_user(user_email) or {}
     logged_in_full_name = f"{user_info.get('prenom', '')} {user_info.get('nom', '')}".strip()
     
     if not logged_in_full_name:
@@ -592,7 +591,6 @@ def chat_stream():
     if 'email' not in session: return jsonify({"error": "Non autorisé"}), 401
     if not model: return jsonify({"error": "L'IA n'est pas disponible (Clé API invalide ou librairie obsolète)."}), 500
 
-    _initialize_json_storage()
     user_email = session['email']
     conversations = load_user_conversations(user_email)
 
@@ -634,7 +632,8 @@ def chat_stream():
             
             if secure_name.endswith(('.xlsx', '.xls')):
                 try:
-                    df = pd.read_excel(temp_path)
+                    with timing.phase("excel"):
+                        df = pd.read_excel(temp_path)
                     prompt_parts.append(f"Analyse du fichier Excel '{secure_name}':\n{df.to_string()}")
                 except Exception as e:
                     prompt_parts.append(f"Impossible de lire le fichier Excel {secure_name}: {e}")
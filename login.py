@@ -7,6 +7,7 @@
 # ──────────────────────────────────────────────────────────────────────────────
 
 import os
+import copy
 import json
 import hmac
 import hashlib
@@ -14,25 +15,38 @@ import ctypes
 import platform
 import socket
 import secrets
+import tempfile
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta, date
 from pathlib import Path
 from typing import Optional, Dict, Any
 
+try:
+    import fcntl
+    msvcrt = None
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 from flask import (
     Blueprint,
     request,
-    render_template_string,
     redirect,
     url_for,
     flash,
     session,
     current_app
 )
+from template_cache import render_template_string
 from flask_mail import Message
 
 import utils
+import logs
 from activation import TRIAL_DAYS
 
+log = logs.get_logger(__name__)
+
 # ──────────────────────────────────────────────────────────────────────────────
 # Configuration et Constantes
 # ──────────────────────────────────────────────────────────────────────────────
@@ -88,19 +102,265 @@ def _load_data_from_file(file_path: Optional[Path]) -> Dict[str, Any]:
     except Exception:
         return {}
 
-def _save_data_to_file(data: Dict[str, Any], file_path: Optional[Path]):
+def _save_data_to_file(data: Dict[str, Any], file_path: Optional[Path]) -> bool:
     _set_login_paths()
-    if not file_path: return
+    if not file_path: return False
     try:
         payload = json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
         signature = _sign(payload).encode()
-        file_path.write_bytes(payload + b"\n---SIGNATURE---\n" + signature)
     except Exception:
-        pass
+        log.error("Sérialisation impossible pour %s", file_path, exc_info=True)
+        return False
+    # Écriture atomique : un lecteur concurrent ne voit jamais un fichier tronqué.
+    # Nom temporaire unique : deux écritures simultanées ne partagent pas le même fichier.
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(prefix=file_path.name + ".", suffix=".tmp", dir=file_path.parent)
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload + b"\n---SIGNATURE---\n" + signature)
+        os.replace(tmp_path, file_path)
+        return True
+    except Exception:
+        log.error("Écriture de %s impossible", file_path, exc_info=True)
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
 
-def load_users() -> Dict[str, Any]: return _load_data_from_file(USERS_FILE)
-def save_users(users: Dict[str, Any]): _save_data_to_file(users, USERS_FILE)
-def _is_email_globally_unique(email_to_check: str) -> bool: return email_to_check not in load_users()
+@contextmanager
+def _file_lock(file_path: Path):
+    """
+    Verrou exclusif entre processus (workers gunicorn) pour `file_path`, pris sur le
+    fichier compagnon `<nom>.lock` (fcntl sous Linux/macOS, msvcrt sous Windows).
+    Non réentrant : ne jamais le reprendre pour le même fichier pendant qu'on le détient.
+    """
+    lock_path = file_path.with_name(file_path.name + ".lock")
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a+b") as handle:
+        if fcntl:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        else:
+            handle.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError: # LK_LOCK abandonne après ~10 s : on réessaie
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Annuaire utilisateurs : un fichier signé par cabinet + index global
+# ──────────────────────────────────────────────────────────────────────────────
+# Chaque administrateur a ses comptes dans MEDICALINK_DATA/<admin>/.users.json ;
+# MEDICALINK_DATA/.users_index.json associe chaque e-mail à son cabinet (login).
+# Lectures, écritures et vérifications HMAC ne portent que sur un cabinet.
+# Chaque lecture-modification-écriture se fait sous le verrou de fichier
+# (_file_lock) du cabinet ou de l'index, après relecture depuis le disque :
+# plusieurs workers peuvent écrire sans perdre les mises à jour des autres.
+def _index_file() -> Optional[Path]:
+    _set_login_paths()
+    return USERS_FILE.with_name(".users_index.json") if USERS_FILE else None
+
+def _stat_signature(file_path: Optional[Path]):
+    try:
+        st = file_path.stat()
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+    except (OSError, AttributeError):
+        return None
+
+def _owner_of(email: str, data: Dict[str, Any]) -> str:
+    return data.get("owner", email) if isinstance(data, dict) else email
+
+
+class _UserShard:
+    """Comptes d'un cabinet, relus (HMAC + JSON) uniquement quand le fichier change."""
+
+    def __init__(self, owner: str):
+        self.owner = owner
+        self.path = Path(utils.tenant_base_dir(owner)) / ".users.json"
+        self.lock = threading.RLock()
+        self._signature = None
+        self.users: Dict[str, Any] = {}
+        self.by_role: Dict[str, set] = {}
+
+    def _install(self, users: Dict[str, Any], signature):
+        by_role: Dict[str, set] = {}
+        for email, data in users.items():
+            if isinstance(data, dict):
+                by_role.setdefault(data.get("role", "admin"), set()).add(email)
+        self.users, self.by_role = users, by_role
+        self._signature = signature
+
+    def refresh(self) -> "_UserShard":
+        signature = _stat_signature(self.path)
+        if signature is not None and signature == self._signature:
+            return self
+        with self.lock:
+            signature = _stat_signature(self.path)
+            if signature is None or signature != self._signature:
+                self._install(_load_data_from_file(self.path), signature)
+        return self
+
+    @contextmanager
+    def locked(self):
+        """Verrous du cabinet (threads et processus), comptes relus depuis le disque."""
+        with self.lock, _file_lock(self.path):
+            self._install(_load_data_from_file(self.path), _stat_signature(self.path))
+            yield self
+
+    def write(self, users: Dict[str, Any]) -> bool:
+        """À appeler sous locked()."""
+        with self.lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            if _save_data_to_file(users, self.path):
+                self._install(json.loads(json.dumps(users, ensure_ascii=False)), _stat_signature(self.path))
+                return True
+            self._signature = None # Forcer une relecture depuis le disque
+            return False
+
+
+class _UserDirectory:
+    """
+    Index global e-mail -> cabinet et fichiers signés par cabinet, gardés en
+    mémoire. Les écritures d'un cabinet sont sérialisées par ses verrous
+    (_UserShard.locked) ; celles de l'index par _locked_index, toujours pris
+    après ceux d'un cabinet (jamais l'inverse).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._migration_lock = threading.Lock()
+        self._signature = None
+        self.index: Dict[str, str] = {}
+        self._shards: Dict[str, _UserShard] = {}
+
+    def _migrate_legacy(self, index_path: Path):
+        """Découpe l'ancien .users.json global en fichiers par cabinet (une seule fois)."""
+        if index_path.exists() or not USERS_FILE or not USERS_FILE.exists():
+            return
+        with _file_lock(USERS_FILE):
+            if index_path.exists() or not USERS_FILE.exists():
+                return # Migré entre-temps par un autre worker
+            legacy = _load_data_from_file(USERS_FILE)
+            if legacy:
+                self._save_all(legacy)
+            USERS_FILE.replace(USERS_FILE.with_name(".users.legacy.json"))
+        log.info("%s comptes migrés de .users.json vers les fichiers par cabinet.", len(legacy))
+
+    def refresh(self) -> "_UserDirectory":
+        index_path = _index_file()
+        signature = _stat_signature(index_path)
+        if signature is not None and signature == self._signature:
+            return self
+        if signature is None and index_path is not None:
+            with self._migration_lock:
+                self._migrate_legacy(index_path)
+        with self._lock:
+            signature = _stat_signature(index_path)
+            if signature is None or signature != self._signature:
+                self.index = _load_data_from_file(index_path)
+                self._signature = signature
+        return self
+
+    def shard(self, owner: str) -> _UserShard:
+        shard = self._shards.get(owner)
+        if shard is None:
+            with self._lock:
+                shard = self._shards.setdefault(owner, _UserShard(owner))
+        return shard.refresh()
+
+    @contextmanager
+    def _locked_index(self):
+        """Verrous de l'index (threads et processus), index relu depuis le disque."""
+        index_path = _index_file()
+        with self._lock, _file_lock(index_path):
+            self.index, self._signature = _load_data_from_file(index_path), _stat_signature(index_path)
+            yield
+
+    def _write_index(self, index: Dict[str, str]):
+        """À appeler sous _locked_index()."""
+        index_path = _index_file()
+        if _save_data_to_file(index, index_path):
+            self.index, self._signature = index, _stat_signature(index_path)
+        else:
+            self._signature = None
+
+    def _sync_index(self, owner: str, users: Dict[str, Any]):
+        with self._locked_index():
+            index = {e: o for e, o in self.index.items() if o != owner}
+            index.update({e: owner for e in users})
+            if index != self.index:
+                self._write_index(index)
+
+    # --- Lectures -------------------------------------------------------------
+    def get(self, email: Optional[str]) -> Optional[dict]:
+        owner = self.refresh().index.get(email)
+        if owner is None:
+            return None
+        user = self.shard(owner).users.get(email)
+        return copy.deepcopy(user) if user is not None else None
+
+    def of_owner(self, owner_email: str, role: Optional[str] = None) -> Dict[str, Any]:
+        shard = self.refresh().shard(owner_email)
+        emails = list(shard.users) if role is None else [e for e in shard.users if e in shard.by_role.get(role, ())]
+        return {e: copy.deepcopy(shard.users[e]) for e in emails if _owner_of(e, shard.users[e]) == owner_email}
+
+    def __contains__(self, email: str) -> bool:
+        return email in self.refresh().index
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Copie modifiable de tous les comptes de tous les cabinets (console développeur)."""
+        users: Dict[str, Any] = {}
+        for owner in sorted(set(self.refresh().index.values())):
+            users.update(copy.deepcopy(self.shard(owner).users))
+        return users
+
+    # --- Écritures ------------------------------------------------------------
+    @contextmanager
+    def edit(self, owner: str):
+        """Lecture-modification-écriture des comptes d'un cabinet, sous son verrou."""
+        shard = self.refresh().shard(owner)
+        with shard.locked():
+            users = copy.deepcopy(shard.users)
+            yield users
+            if users != shard.users and shard.write(users):
+                self._sync_index(owner, users)
+
+    def _save_all(self, users: Dict[str, Any]):
+        grouped: Dict[str, Dict[str, Any]] = {}
+        for email, data in users.items():
+            grouped.setdefault(_owner_of(email, data), {})[email] = data
+        for owner in set(grouped) | set(self.index.values()):
+            shard_users = grouped.get(owner, {})
+            with self.shard(owner).locked() as shard:
+                if shard_users != shard.users:
+                    shard.write(shard_users)
+        index = {e: _owner_of(e, d) for e, d in users.items()}
+        with self._locked_index():
+            if index != self.index or not _index_file().exists():
+                self._write_index(index)
+
+    def save(self, users: Dict[str, Any]):
+        """Sauvegarde d'un instantané complet : seuls les cabinets modifiés sont réécrits."""
+        self.refresh()
+        self._save_all(users)
+
+_directory = _UserDirectory()
+
+def load_users() -> Dict[str, Any]: return _directory.snapshot()
+def save_users(users: Dict[str, Any]): _directory.save(users)
+def get_user(email: Optional[str]) -> Optional[dict]: return _directory.get(email)
+def users_of_owner(owner_email: str, role: Optional[str] = None) -> Dict[str, Any]: return _directory.of_owner(owner_email, role)
+def tenant_users(owner_email: str): return _directory.edit(owner_email)
+def tenant_of(email: Optional[str]) -> Optional[str]: return _directory.refresh().index.get(email)
+def _is_email_globally_unique(email_to_check: str) -> bool: return email_to_check not in _directory
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Logique Interne
@@ -108,7 +368,7 @@ def _is_email_globally_unique(email_to_check: str) -> bool: return email_to_chec
 def _user() -> Optional[dict]:
     email = session.get("email")
     if not email: return None
-    return load_users().get(email)
+    return get_user(email)
 
 def lan_ip() -> str:
     ip = socket.gethostbyname(socket.gethostname())
@@ -120,7 +380,7 @@ def lan_ip() -> str:
     return ip
 
 def _find_user_in_centralized_users_file(target_email: str, target_password_hash: str) -> Optional[Dict]:
-    user = load_users().get(target_email)
+    user = get_user(target_email)
     if user and user.get("password") == target_password_hash:
         return {
             "user_data": user, 
@@ -538,25 +798,24 @@ def register():
              flash("Nom et prénom requis.", "danger")
              return redirect(url_for('login.register'))
 
-        users = load_users()
-        users[email] = {
-            "password": hash_password(pwd),
-            "role": "admin",
-            "nom": nom,
-            "prenom": prenom,
-            "clinic": f["clinic"],
-            "clinic_creation_date": f["clinic_creation_date"],
-            "account_creation_date": date.today().isoformat(),
-            "address": f["address"],
-            "phone": phone,
-            "active": True,
-            "owner": email,
-            "allowed_pages": ALL_BLUEPRINTS,
-            "account_limits": {"global_max_users": 3, "current_users": 0},
-            "activation": {"plan": f"essai_{TRIAL_DAYS}jours", "activation_date": date.today().isoformat(), "activation_code": "0000-0000-0000-0000"}
-        }
-        
-        save_users(users)
+        with tenant_users(email) as users:
+            users[email] = {
+                "password": hash_password(pwd),
+                "role": "admin",
+                "nom": nom,
+                "prenom": prenom,
+                "clinic": f["clinic"],
+                "clinic_creation_date": f["clinic_creation_date"],
+                "account_creation_date": date.today().isoformat(),
+                "address": f["address"],
+                "phone": phone,
+                "active": True,
+                "owner": email,
+                "allowed_pages": ALL_BLUEPRINTS,
+                "account_limits": {"global_max_users": 3, "current_users": 0},
+                "activation": {"plan": f"essai_{TRIAL_DAYS}jours", "activation_date": date.today().isoformat(), "activation_code": "0000-0000-0000-0000"}
+            }
+
         flash("Compte créé avec succès ! Connectez-vous.", "success")
         return redirect(url_for('login.login'))
 
@@ -638,11 +897,11 @@ def change_password():
         if pwd != confirm:
             flash('Les mots de passe ne correspondent pas.', 'warning')
         else:
-            users = load_users()
             email = session['email']
-            if email in users:
-                users[email]['password'] = hash_password(pwd)
-                save_users(users)
+            owner = tenant_of(email)
+            if owner:
+                with tenant_users(owner) as users:
+                    users[email]['password'] = hash_password(pwd)
                 flash('Mot de passe mis à jour avec succès.', 'success')
                 return redirect(url_for('accueil.accueil'))
             else:
@@ -672,13 +931,13 @@ def forgot_password():
     _set_login_paths()
     if request.method == 'POST':
         email = request.form.get('email', '').lower().strip()
-        users = load_users()
+        owner = tenant_of(email)
         
-        if email in users:
+        if owner:
             token = generate_reset_token()
-            users[email]['reset_token'] = token
-            users[email]['reset_expiry'] = (datetime.now() + timedelta(hours=1)).isoformat()
-            save_users(users)
+            with tenant_users(owner) as users:
+                users[email]['reset_token'] = token
+                users[email]['reset_expiry'] = (datetime.now() + timedelta(hours=1)).isoformat()
             
             try:
                 mail = current_app.extensions.get('mail')
@@ -0,0 +1,154 @@
+# logs.py
+# ---------------------------------------------------------------------------
+#  Journalisation à niveaux, par module, avec échantillonnage
+# ---------------------------------------------------------------------------
+#  Remplace les print("DEBUG: …") des chemins chauds : chaque module obtient
+#  un logger (get_logger(__name__)) rattaché à "easymedicalink".
+#
+#  Réglages (variables d'environnement, ou configure() / set_level()) :
+#    EASYMEDICALINK_LOG_LEVEL    niveau global (INFO par défaut : DEBUG coupé)
+#    EASYMEDICALINK_LOG_MODULES  niveaux par module, ex. "statistique=DEBUG,routes=WARNING"
+#    EASYMEDICALINK_LOG_RATE     au plus N messages par ligne de code et par
+#                                période, ex. "20/60" (défaut) ; "0" désactive
+#    EASYMEDICALINK_LOG_FORMAT   "text" (défaut) ou "json" (une ligne JSON par message)
+#
+#  Les arguments sont formatés seulement si le message est émis :
+#  log.debug("%s lignes", len(df)) ne coûte qu'un test de niveau quand DEBUG
+#  est coupé. Un calcul fait uniquement pour le journal (somme, aperçu
+#  .tolist()…) se place sous `if log.isEnabledFor(logging.DEBUG):`.
+#
+#  Échantillonnage : au-delà de N messages par période pour une même ligne
+#  de code, les suivants sont écartés ; le premier message de la période
+#  suivante indique combien l'ont été. Les erreurs ne sont jamais écartées.
+# ---------------------------------------------------------------------------
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+ROOT = "easymedicalink"
+
+LEVEL = os.environ.get("EASYMEDICALINK_LOG_LEVEL", "INFO").upper()
+MODULE_LEVELS = os.environ.get("EASYMEDICALINK_LOG_MODULES", "")
+RATE = os.environ.get("EASYMEDICALINK_LOG_RATE", "20/60")
+FORMAT = os.environ.get("EASYMEDICALINK_LOG_FORMAT", "text").lower()
+
+
+class RateLimitFilter(logging.Filter):
+    """Au plus `burst` messages par ligne de code et par période de `period` secondes."""
+
+    def __init__(self, burst: int, period: float):
+        super().__init__()
+        self.burst = burst
+        self.period = period
+        self._sites: dict = {}      # (fichier, ligne) -> [début de période, émis, écartés]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.ERROR:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None:
+                site = self._sites[key] = [now, 0, 0]
+            if now - site[0] >= self.period:
+                if site[2]:
+                    record.suppressed = site[2]
+                site[0], site[1], site[2] = now, 0, 0
+            if site[1] >= self.burst:
+                site[2] += 1
+                return False
+            site[1] += 1
+        return True
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """Écrit sur le sys.stdout courant, comme print (redirections comprises)."""
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s.%(funcName)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        return f"{text} [{suppressed} message(s) similaire(s) écarté(s)]" if suppressed else text
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "module": record.name[len(ROOT) + 1:] or ROOT,
+            "function": record.funcName,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _parse_rate(rate: str):
+    """'N/secondes' -> (N, secondes) ; None si désactivé."""
+    if not rate or rate == "0":
+        return None
+    burst, _, period = rate.partition("/")
+    return int(burst), float(period or 60)
+
+
+def _parse_modules(spec: str) -> dict:
+    levels = {}
+    for item in spec.split(","):
+        module, _, level = item.partition("=")
+        if module.strip() and level.strip():
+            levels[module.strip()] = level.strip().upper()
+    return levels
+
+
+_root = logging.getLogger(ROOT)
+
+
+def configure(level: str = LEVEL, modules: str = MODULE_LEVELS, rate: str = RATE, fmt: str = FORMAT):
+    """(Re)configure le logger de l'application : niveaux, échantillonnage et format."""
+    for handler in list(_root.handlers):
+        _root.removeHandler(handler)
+    handler = _StdoutHandler()
+    handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    parsed_rate = _parse_rate(rate)
+    if parsed_rate:
+        handler.addFilter(RateLimitFilter(*parsed_rate))
+    _root.addHandler(handler)
+    _root.setLevel(level)
+    _root.propagate = False     # pas de double sortie via la configuration racine
+    for module, module_level in _parse_modules(modules).items():
+        set_level(module, module_level)
+
+
+def set_level(module: str, level: str):
+    """Niveau propre à un module ("statistique", "routes"…), à chaud."""
+    logging.getLogger(f"{ROOT}.{module}").setLevel(level.upper())
+
+
+def get_logger(module: str) -> logging.Logger:
+    """Logger du module (passer __name__)."""
+    return logging.getLogger(f"{ROOT}.{module}")
+
+
+configure()
@@ -0,0 +1,155 @@
+# metrics.py
+# ---------------------------------------------------------------------------
+#  Compteurs et histogrammes en mémoire du processus (sans service externe)
+# ---------------------------------------------------------------------------
+#  Alimentés par :
+#    - timing      latence de chaque requête (par blueprint, endpoint, tenant)
+#                  et durée de chaque phase (lecture Excel, rendu, PDF…) ;
+#    - storage     lectures / écritures de classeurs et octets, par tenant et
+#                  par requête ;
+#    - les tâches  sauvegarde planifiée, compaction du journal, préchargement
+#                  des statistiques (voir job()).
+#  Les valeurs sont cumulées depuis le démarrage du processus (chaque worker
+#  gunicorn a les siennes) et exposées par developpeur.metrics (/developpeur/metrics).
+#  Les histogrammes ont des classes fixes : leur coût ne dépend pas du trafic.
+# ---------------------------------------------------------------------------
+
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+# Bornes supérieures des classes des histogrammes
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+JOB_BUCKETS_MS = (100, 1000, 10000, 60000, 300000, 1800000)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100)
+BYTES_BUCKETS = (2**16, 2**18, 2**20, 2**22, 2**24, 2**26, 2**28)
+
+STARTED_AT = time.time()
+
+_lock = threading.Lock()
+_counters: dict = {}        # (nom, labels) -> valeur
+_histograms: dict = {}      # (nom, labels) -> Histogram
+
+
+class Histogram:
+    """Répartition par classes fixes, avec nombre, somme et maximum des observations."""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)     # dernière classe : au-delà de la dernière borne
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def as_dict(self) -> dict:
+        labels = [f"<={b}" for b in self.buckets] + [f">{self.buckets[-1]}"]
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 2),
+            "mean": round(self.sum / self.count, 2) if self.count else 0.0,
+            "max": round(self.max, 2),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels):
+    """Incrémente le compteur `name` pour ces labels."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name: str, value: float, buckets: tuple = LATENCY_BUCKETS_MS, **labels):
+    """Ajoute une observation à l'histogramme `name` (classes fixées à la création)."""
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+
+# ---------------------------------------------------------------------------
+# Entrées / sorties des classeurs
+# ---------------------------------------------------------------------------
+def record_io(kind: str, nbytes: int, tenant: str):
+    """
+    Une lecture (`kind`='read') ou une écriture ('write') de classeur de `nbytes` octets
+    (taille en mémoire des données) pour le dossier tenant `tenant`.
+    """
+    inc(f"workbook_{kind}s_total", tenant=tenant)
+    inc(f"workbook_{kind}_bytes_total", nbytes, tenant=tenant)
+    if has_request_context():
+        # Les threads de storage.read_workbooks partagent le `g` de la requête
+        with _lock:
+            io = g.setdefault("_io", {})
+            count, total = io.get(kind, (0, 0))
+            io[kind] = (count + 1, total + nbytes)
+
+
+def observe_request(measured: dict, status: int, tenant: str):
+    """Fin de requête : latence (ms, phases de timing) et entrées / sorties de la requête."""
+    endpoint = request.endpoint or "<aucun>"
+    blueprint = request.blueprint or "<app>"
+    observe("request_ms", measured["total"], blueprint=blueprint, endpoint=endpoint)
+    observe("blueprint_request_ms", measured["total"], blueprint=blueprint)
+    observe("tenant_request_ms", measured["total"], tenant=tenant)
+    inc("responses_total", status=str(status))
+    io = g.get("_io", {})
+    for kind in ("read", "write"):
+        count, nbytes = io.get(kind, (0, 0))
+        observe(f"workbook_{kind}s_per_request", count, COUNT_BUCKETS, endpoint=endpoint)
+        observe(f"workbook_{kind}_bytes_per_request", nbytes, BYTES_BUCKETS, endpoint=endpoint)
+
+
+# ---------------------------------------------------------------------------
+# Tâches planifiées et threads de fond
+# ---------------------------------------------------------------------------
+@contextmanager
+def job(name: str):
+    """Mesure une exécution de tâche (bloc ou décorateur) : durée et issue (ok / erreur)."""
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except Exception:
+        outcome = "erreur"
+        raise
+    finally:
+        observe("job_ms", (time.perf_counter() - start) * 1000, JOB_BUCKETS_MS, job=name)
+        inc("job_runs_total", job=name, outcome=outcome)
+
+
+# ---------------------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------------------
+def snapshot() -> dict:
+    """{"counters": {nom: [{labels, value}]}, "histograms": {nom: [{labels, count, sum, …}]}}."""
+    with _lock:
+        counters = list(_counters.items())
+        histograms = [(key, histogram.as_dict()) for key, histogram in _histograms.items()]
+    result = {"counters": {}, "histograms": {}}
+    for (name, labels), value in sorted(counters):
+        result["counters"].setdefault(name, []).append({"labels": dict(labels), "value": value})
+    for (name, labels), data in sorted(histograms, key=lambda item: item[0]):
+        result["histograms"].setdefault(name, []).append({"labels": dict(labels), **data})
+    return result
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
@@ -1,78 +1,78 @@
 # patient_rdv.py
 
-from flask import Blueprint, request, render_template_string, jsonify, session, redirect, url_for, flash
+from flask import Blueprint, request, jsonify, session, redirect, url_for, flash
+from template_cache import render_template_string
 from datetime import datetime, date, timedelta
 import pandas as pd
 import utils
 import theme
+import storage
+import slot_index
 import os
 import re
 import json
+import bisect
+import heapq
+import threading
 from openpyxl import Workbook
 from typing import Optional
 from pathlib import Path
 import login # NOUVEAU: Import login module to get doctors list
 
-# Ces variables seront définies dynamiquement une fois set_patient_rdv_dirs est appelée
-EXCEL_DIR: Optional[Path] = None
-EXCEL_FILE: Optional[Path] = None
-BASE_PATIENT_FILE: Optional[Path] = None
-DISABLED_PERIODS_FILE: Optional[Path] = None # Nouveau chemin pour le fichier de périodes désactivées
-
-
 # ------------------------------------------------------------------
 # CONFIGURATION DES RÉPERTOIRES pour patient_rdv
 # ------------------------------------------------------------------
+# Les chemins sont résolus à chaque appel depuis le tenant lié à la requête
+# (utils.current_tenant()) au lieu d'être copiés dans des globales du module,
+# partagées entre requêtes concurrentes de cabinets différents.
+def _excel_dir() -> Optional[Path]:
+    return Path(utils.EXCEL_FOLDER) if utils.EXCEL_FOLDER else None
+
+def _excel_file() -> Optional[Path]:
+    excel_dir = _excel_dir()
+    return excel_dir / "DonneesRDV.xlsx" if excel_dir else None
+
+def _base_patient_file() -> Optional[Path]:
+    excel_dir = _excel_dir()
+    return excel_dir / "info_Base_patient.xlsx" if excel_dir else None
+
+def _disabled_periods_file() -> Optional[Path]:
+    return Path(utils.CONFIG_FOLDER) / "disabled_periods.json" if utils.CONFIG_FOLDER else None
+
 def set_patient_rdv_dirs():
     """
-    Définit les chemins de répertoires dynamiques.
+    Vérifie que les répertoires du tenant courant existent.
     Cette fonction se base sur utils.DYNAMIC_BASE_DIR qui doit être défini au préalable par la route.
     """
-    global EXCEL_DIR, EXCEL_FILE, BASE_PATIENT_FILE, DISABLED_PERIODS_FILE
-
     if utils.DYNAMIC_BASE_DIR is None:
         raise ValueError("utils.DYNAMIC_BASE_DIR n'est pas défini. Impossible d'initialiser les chemins.")
 
-    base_dir = Path(utils.DYNAMIC_BASE_DIR)
-    excel_folder = base_dir / "Excel"
-    config_folder = base_dir / "Config"
-
-    os.makedirs(excel_folder, exist_ok=True)
-    os.makedirs(config_folder, exist_ok=True)
-
-    EXCEL_DIR = excel_folder
-    EXCEL_FILE = EXCEL_DIR / "DonneesRDV.xlsx"
-    BASE_PATIENT_FILE = EXCEL_DIR / "info_Base_patient.xlsx"
-    DISABLED_PERIODS_FILE = config_folder / "disabled_periods.json"
-    print(f"DEBUG: Chemins RDV patient définis. EXCEL_DIR: {EXCEL_DIR}")
+    os.makedirs(utils.EXCEL_FOLDER, exist_ok=True)
+    os.makedirs(utils.CONFIG_FOLDER, exist_ok=True)
 
 
 # Fonctions d'aide pour la gestion des fichiers Excel (adaptées de rdv.py)
 def initialize_excel_file():
-    """Initialise le fichier DonneesRDV.xlsx avec les colonnes unifiées."""
-    if EXCEL_FILE is None:
+    """Initialise le jeu de données DonneesRDV (SQLite) avec les colonnes unifiées."""
+    if _excel_file() is None:
         print("ERREUR : EXCEL_FILE non défini. Impossible d'initialiser le fichier Excel.")
         return
-    wb = Workbook()
-    sheet = wb.active
-    sheet.title = "RDV"
     # Colonnes unifiées pour les rendez-vous
-    sheet.append([
+    storage.create(_excel_file(), {"RDV": [
         "Num Ordre", "ID", "Nom", "Prenom", "DateNaissance", "Sexe", "Âge",
         "Antécédents", "Téléphone", "Date", "Heure", "Statut", "Medecin_Email" # NOUVEAU: Ajout de Medecin_Email
-    ])
-    wb.save(EXCEL_FILE)
+    ]})
     print(f"DEBUG : Fichier DonneesRDV.xlsx initialisé avec les colonnes unifiées.")
 
 def load_df() -> pd.DataFrame:
     """Charge le DataFrame depuis DonneesRDV.xlsx, ajoutant les colonnes manquantes si nécessaire."""
-    if EXCEL_FILE is None:
+    if _excel_file() is None:
         print("ERREUR : EXCEL_FILE non défini. Impossible de charger le dataframe.")
         return pd.DataFrame() # Retourne un DataFrame vide pour éviter d'autres erreurs
 
-    if not EXCEL_FILE.exists():
+    if not storage.exists(_excel_file()):
         initialize_excel_file()
-    df = pd.read_excel(EXCEL_FILE, dtype=str).fillna('')
+    df = storage.read_excel(_excel_file(), dtype=str).fillna('')
     # Assurez-vous que toutes les colonnes attendues sont présentes
     expected_cols = [
         "Num Ordre", "ID", "Nom", "Prenom", "DateNaissance", "Sexe", "Âge",
@@ -85,14 +85,23 @@ def load_df() -> pd.DataFrame:
 
 def save_df(df: pd.DataFrame):
     """Sauvegarde le DataFrame dans DonneesRDV.xlsx."""
-    if EXCEL_FILE is None:
+    if _excel_file() is None:
         print("ERREUR : EXCEL_FILE non défini. Impossible de sauvegarder le dataframe.")
         return
-    df.to_excel(EXCEL_FILE, index=False)
+    storage.to_excel(df, _excel_file())
+    slot_index.on_sheet_saved(_excel_file(), df)
+
+def append_df(rows: pd.DataFrame):
+    """Ajoute des lignes à DonneesRDV sans réécrire la feuille (journal d'ajout)."""
+    if _excel_file() is None:
+        print("ERREUR : EXCEL_FILE non défini. Impossible d'ajouter les lignes.")
+        return
+    storage.append_rows(_excel_file(), rows)
+    slot_index.on_rows_appended(_excel_file(), rows)
 
 def initialize_base_patient_file():
     """Initialise le fichier info_Base_patient.xlsx avec les colonnes unifiées."""
-    if BASE_PATIENT_FILE is None:
+    if _base_patient_file() is None:
         print("ERREUR : BASE_PATIENT_FILE non défini. Impossible d'initialiser le fichier patient de base.")
         return
     wb = Workbook()
@@ -103,23 +112,24 @@ def initialize_base_patient_file():
         "ID", "Nom", "Prenom", "DateNaissance", "Sexe", "Âge",
         "Antécédents", "Téléphone"
     ])
-    wb.save(BASE_PATIENT_FILE)
+    wb.save(_base_patient_file())
     print(f"DEBUG : Fichier info_Base_patient.xlsx initialisé avec les colonnes unifiées.")
 
 def save_base_patient_df(df_new: pd.DataFrame):
     """Sauvegarde ou met à jour les données dans info_Base_patient.xlsx."""
-    if BASE_PATIENT_FILE is None:
+    if _base_patient_file() is None:
         print("ERREUR : BASE_PATIENT_FILE non défini. Impossible de sauvegarder le dataframe patient de base.")
         return
+    directory_before = utils.patient_directory_version()
 
-    if not BASE_PATIENT_FILE.exists():
+    if not _base_patient_file().exists():
         initialize_base_patient_file()
         df_existing = pd.DataFrame(columns=[
             "ID", "Nom", "Prenom", "DateNaissance", "Sexe", "Âge",
             "Antécédents", "Téléphone"
         ])
     else:
-        df_existing = pd.read_excel(BASE_PATIENT_FILE, dtype=str).fillna('')
+        df_existing = storage.read_excel(_base_patient_file(), dtype=str).fillna('')
 
     # Assurez-vous que df_new a les colonnes attendues pour info_Base_patient
     expected_cols = ["ID", "Nom", "Prenom", "DateNaissance", "Sexe", "Âge", "Antécédents", "Téléphone"]
@@ -134,20 +144,21 @@ def save_base_patient_df(df_new: pd.DataFrame):
     if "ID" in df_combined.columns:
         df_combined.drop_duplicates(subset=["ID"], keep="last", inplace=True)
 
-    df_combined.to_excel(BASE_PATIENT_FILE, index=False)
+    df_combined.to_excel(_base_patient_file(), index=False)
     print(f"DEBUG : Données sauvegardées dans info_Base_patient.xlsx. Total d'entrées : {len(df_combined)}")
+    utils.update_patient_directory(df_new_filtered, directory_before)
 
 
 def load_base_patients() -> dict:
     """Charge les patients depuis info_Base_patient.xlsx."""
-    if BASE_PATIENT_FILE is None:
+    if _base_patient_file() is None:
         print("ERREUR : BASE_PATIENT_FILE non défini. Impossible de charger les patients de base.")
         return {}
-    if not BASE_PATIENT_FILE.exists():
+    if not _base_patient_file().exists():
         initialize_base_patient_file()
 
     patients = {}
-    df = pd.read_excel(BASE_PATIENT_FILE, dtype=str).fillna('')
+    df = storage.read_excel(_base_patient_file(), dtype=str).fillna('')
     for _, row in df.iterrows():
         pid = str(row["ID"]).strip()
         if not pid:
@@ -196,37 +207,129 @@ def compute_age_str(dob: date) -> str:
 PHONE_RE = re.compile(r"^[+0]\d{6,14}$")
 
 # Fonctions pour gérer les périodes désactivées
-def load_disabled_periods() -> list:
-    """Charge les périodes désactivées depuis disabled_periods.json."""
-    if DISABLED_PERIODS_FILE is None:
+class DisabledPeriods(list):
+    """
+    Liste des périodes désactivées (telle que dans disabled_periods.json), compilée
+    en segments disjoints triés : chaque segment [début, fin] porte le motif de la
+    première période du fichier qui le couvre. reason() et blocked_days() sont en
+    O(log n) (+ nombre de segments renvoyés) au lieu d'un parcours de la liste.
+    L'index reflète la liste au moment de sa construction.
+    """
+
+    def __init__(self, periods=(), _segments=None):
+        super().__init__(periods)
+        self._starts, self._ends, self._reasons = _segments or self._compile(self)
+
+    def copy(self) -> "DisabledPeriods":
+        return DisabledPeriods((dict(p) for p in self), (self._starts, self._ends, self._reasons))
+
+    @staticmethod
+    def _compile(periods):
+        intervals = []  # (début, fin, rang dans le fichier, motif), dates en ordinaux
+        for rank, period in enumerate(periods):
+            try:
+                start = datetime.strptime(period['start_date'], "%Y-%m-%d").date().toordinal()
+                end = datetime.strptime(period['end_date'], "%Y-%m-%d").date().toordinal()
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"ERREUR : Période désactivée invalide ignorée ({period}): {e}")
+                continue
+            if start <= end:
+                intervals.append((start, end, rank, period.get('reason', 'Raison non spécifiée')))
+
+        # Balayage des bornes : le motif d'un segment est celui de la période active de plus petit rang
+        bounds = sorted({i[0] for i in intervals} | {i[1] + 1 for i in intervals})
+        by_start = sorted(intervals)
+        starts, ends, reasons = [], [], []
+        active, k = [], 0
+        for pos, bound in enumerate(bounds[:-1]):
+            while k < len(by_start) and by_start[k][0] == bound:
+                heapq.heappush(active, (by_start[k][2], by_start[k][1], by_start[k][3]))
+                k += 1
+            while active and active[0][1] < bound:
+                heapq.heappop(active)
+            if not active:
+                continue
+            reason, seg_end = active[0][2], bounds[pos + 1] - 1
+            if ends and ends[-1] == bound - 1 and reasons[-1] == reason:
+                ends[-1] = seg_end  # fusion avec le segment précédent
+            else:
+                starts.append(bound)
+                ends.append(seg_end)
+                reasons.append(reason)
+        return starts, ends, reasons
+
+    def reason(self, check_date) -> Optional[str]:
+        """Motif de blocage de la date (str AAAA-MM-JJ ou date), ou None."""
+        if isinstance(check_date, str):
+            check_date = datetime.strptime(check_date, "%Y-%m-%d").date()
+        day = check_date.toordinal()
+        i = bisect.bisect_right(self._starts, day) - 1
+        if i >= 0 and day <= self._ends[i]:
+            return self._reasons[i]
+        return None
+
+    def blocked_days(self, start, end) -> dict:
+        """{'AAAA-MM-JJ': motif} pour chaque jour bloqué entre start et end inclus."""
+        if isinstance(start, str):
+            start = datetime.strptime(start, "%Y-%m-%d").date()
+        if isinstance(end, str):
+            end = datetime.strptime(end, "%Y-%m-%d").date()
+        first, last = start.toordinal(), end.toordinal()
+        blocked = {}
+        i = max(bisect.bisect_right(self._starts, first) - 1, 0)
+        while i < len(self._starts) and self._starts[i] <= last:
+            for day in range(max(self._starts[i], first), min(self._ends[i], last) + 1):
+                blocked[date.fromordinal(day).isoformat()] = self._reasons[i]
+            i += 1
+        return blocked
+
+
+# Périodes compilées par fichier, rechargées seulement quand le fichier change
+_disabled_periods_cache = {}   # chemin -> ((mtime_ns, taille), DisabledPeriods)
+_disabled_periods_lock = threading.Lock()
+
+def load_disabled_periods() -> DisabledPeriods:
+    """Charge les périodes désactivées depuis disabled_periods.json (index mis en cache)."""
+    periods_file = _disabled_periods_file()
+    if periods_file is None:
         print("ERREUR : DISABLED_PERIODS_FILE non défini. Impossible de charger les périodes désactivées.")
-        return []
-    if DISABLED_PERIODS_FILE.exists():
+        return DisabledPeriods()
+    try:
+        st = os.stat(periods_file)
+    except OSError:
+        return DisabledPeriods()
+    key, signature = str(periods_file), (st.st_mtime_ns, st.st_size)
+    with _disabled_periods_lock:
+        cached = _disabled_periods_cache.get(key)
+    if cached is None or cached[0] != signature:
         try:
-            with open(DISABLED_PERIODS_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(periods_file, 'r', encoding='utf-8') as f:
+                periods = DisabledPeriods(json.load(f))
         except json.JSONDecodeError as e:
-            print(f"ERREUR : Erreur de décodage JSON pour {DISABLED_PERIODS_FILE}: {e}")
-            return []
-    return []
+            print(f"ERREUR : Erreur de décodage JSON pour {periods_file}: {e}")
+            return DisabledPeriods()
+        cached = (signature, periods)
+        with _disabled_periods_lock:
+            _disabled_periods_cache[key] = cached
+    # Copie : l'appelant peut modifier la liste (ajout/suppression) sans toucher au cache
+    return cached[1].copy()
 
 def save_disabled_periods(periods: list):
     """Sauvegarde les périodes désactivées dans disabled_periods.json."""
-    if DISABLED_PERIODS_FILE is None:
+    periods_file = _disabled_periods_file()
+    if periods_file is None:
         print("ERREUR : DISABLED_PERIODS_FILE non défini. Impossible de sauvegarder les périodes désactivées.")
         return
-    with open(DISABLED_PERIODS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(periods, f, ensure_ascii=False, indent=2)
+    with open(periods_file, 'w', encoding='utf-8') as f:
+        json.dump(list(periods), f, ensure_ascii=False, indent=2)
+    with _disabled_periods_lock:
+        _disabled_periods_cache.pop(str(periods_file), None)
 
 def get_disabled_period_reason(check_date: str, disabled_periods: list) -> Optional[str]:
     """Vérifie si une date est dans une période désactivée et retourne le motif."""
-    check_dt = datetime.strptime(check_date, "%Y-%m-%d").date()
-    for period in disabled_periods:
-        start_dt = datetime.strptime(period['start_date'], "%Y-%m-%d").date()
-        end_dt = datetime.strptime(period['end_date'], "%Y-%m-%d").date()
-        if start_dt <= check_dt <= end_dt:
-            return period.get('reason', 'Raison non spécifiée')
-    return None
+    if not isinstance(disabled_periods, DisabledPeriods):
+        disabled_periods = DisabledPeriods(disabled_periods)
+    return disabled_periods.reason(check_date)
 
 # ------------------------------------------------------------------
 # DÉCLARATION DU BLUEPRINT
@@ -289,7 +392,7 @@ def patient_rdv_home(admin_prefix):
         doctors.append({'email': full_email_for_admin, 'nom': nom_config, 'prenom': prenom_config})
 
     # 2. Ajouter les médecins ayant des comptes
-    all_users = login.load_users()
+    all_users = login.users_of_owner(full_email_for_admin, role='medecin')
     for email, user_data in all_users.items():
         # Filtrer les utilisateurs qui appartiennent à cet administrateur
         if user_data.get('role') == 'medecin' and user_data.get('owner') == full_email_for_admin:
@@ -375,7 +478,7 @@ def patient_rdv_home(admin_prefix):
         # --- DÉBUT DE LA CORRECTION D'ORDRE ---
 
         # 1. VÉRIFICATION DU CRÉNEAU HORAIRE (MAINTENANT EN PREMIER)
-        if ((df["Date"] == date_rdv) & (df["Heure"] == time_rdv) & (df["Medecin_Email"] == medecin_email)).any():
+        if slot_index.is_reserved(_excel_file(), date_rdv, medecin_email, time_rdv):
             return render_template_string(patient_rdv_template,
                 config=config, theme_vars=theme_vars, timeslots=all_available_timeslots,
                 iso_today=iso_today, reserved_slots=reserved_slots,
@@ -445,7 +548,7 @@ def patient_rdv_home(admin_prefix):
             )
 
         # Vérifier si un créneau horaire est déjà réservé (pour ce médecin)
-        if ((df["Date"] == date_rdv) & (df["Heure"] == time_rdv) & (df["Medecin_Email"] == medecin_email)).any():
+        if slot_index.is_reserved(_excel_file(), date_rdv, medecin_email, time_rdv):
             return render_template_string(patient_rdv_template,
                 config=config, theme_vars=theme_vars, timeslots=all_available_timeslots, # Utiliser all_available_timeslots
                 iso_today=iso_today, reserved_slots=reserved_slots,
@@ -491,9 +594,17 @@ def patient_rdv_home(admin_prefix):
         }
         # Créer un DataFrame à partir de la nouvelle ligne pour concaténation
         # S'assurer que les colonnes du nouveau DataFrame correspondent à celles de df
-        new_rdv_row_df = pd.DataFrame([new_rdv_row_data], columns=df.columns)
-        df = pd.concat([df, new_rdv_row_df], ignore_index=True)
-        save_df(df) # Sauvegarde le fichier DonneesRDV.xlsx
+        new_rdv_row = pd.DataFrame([new_rdv_row_data], columns=df.columns).iloc[0].to_dict()
+        # Réservation atomique (compare-and-set sur médecin, date, heure) : une autre
+        # réservation a pu prendre le créneau depuis les vérifications ci-dessus
+        if not slot_index.reserve(_excel_file(), new_rdv_row):
+            return render_template_string(patient_rdv_template,
+                config=config, theme_vars=theme_vars, timeslots=all_available_timeslots,
+                iso_today=iso_today, reserved_slots=reserved_slots,
+                message=f"Le créneau du {date_rdv} à {time_rdv} vient d'être réservé pour le médecin sélectionné. Veuillez choisir une autre heure ou date.", message_type="warning",
+                role=session.get('role'), disabled_periods=disabled_periods,
+                today_disabled_reason=today_disabled_reason, doctors=doctors
+            )
 
         # Supprimer la ligne suivante pour ne plus mettre à jour info_Base_patient.xlsx
         # patient_base_data = pd.DataFrame([{
@@ -540,9 +651,10 @@ def get_reserved_slots_patient(admin_prefix):
     if not date_param or not medecin_email_param:
         return jsonify({"error": "Date or doctor email parameter is required"}), 400
 
-    df = load_df() # Charge DonneesRDV.xlsx pour cet administrateur
-    # NOUVEAU: Filtrer les créneaux par médecin
-    reserved_slots = df[(df["Date"] == date_param) & (df["Medecin_Email"] == medecin_email_param)]["Heure"].tolist()
+    if not storage.exists(_excel_file()):
+        initialize_excel_file()
+    # Index (date, médecin) -> heures réservées : pas de relecture de DonneesRDV.xlsx
+    reserved_slots = slot_index.reserved_slots(_excel_file(), date_param, medecin_email_param)
 
     # AJOUT : Vérifier si la date est désactivée
     disabled_periods = load_disabled_periods()
@@ -557,11 +669,77 @@ def get_reserved_slots_patient(admin_prefix):
     )
 
 
+    grid_size = len(all_possible_slots)
+    full_mask = (1 << grid_size) - 1
+
     # Si la date est désactivée, tous les créneaux horaires sont considérés comme réservés
     if disabled_reason:
-        return jsonify({"reserved_slots": all_possible_slots, "date_disabled": True, "reason": disabled_reason, "all_possible_slots": all_possible_slots}) # Renvoyer all_possible_slots
-    
-    return jsonify({"reserved_slots": reserved_slots, "date_disabled": False, "reason": None, "all_possible_slots": all_possible_slots}) # Renvoyer all_possible_slots
+        return jsonify({"reserved_slots": all_possible_slots, "date_disabled": True, "reason": disabled_reason, "all_possible_slots": all_possible_slots, # Renvoyer all_possible_slots
+                        "busy_bitmap": slot_index.bitmap_string(full_mask, grid_size), "free_bitmap": slot_index.bitmap_string(0, grid_size)})
+
+    busy = slot_index.busy_bitmap(_excel_file(), date_param, medecin_email_param, all_possible_slots)
+    return jsonify({"reserved_slots": reserved_slots, "date_disabled": False, "reason": None, "all_possible_slots": all_possible_slots, # Renvoyer all_possible_slots
+                    "busy_bitmap": slot_index.bitmap_string(busy, grid_size), "free_bitmap": slot_index.bitmap_string(~busy & full_mask, grid_size)})
+
+
+@patient_rdv_bp.route("/month_availability", methods=["GET"])
+def month_availability_patient(admin_prefix):
+    """
+    Disponibilités d'un médecin sur un mois, en une requête :
+    ?medecin_email=...&month=AAAA-MM -> nombre de créneaux libres par jour,
+    en tenant compte des périodes désactivées, des jours passés et de la grille
+    rdv_start_time / rdv_end_time / rdv_interval_minutes de la configuration.
+    """
+    full_email_for_utils = f"{admin_prefix}@gmail.com"
+    utils.set_dynamic_base_dir(full_email_for_utils)
+    set_patient_rdv_dirs()
+    config = utils.load_config()
+
+    medecin_email_param = request.args.get("medecin_email", "").strip()
+    month_param = request.args.get("month", "").strip() or date.today().strftime("%Y-%m")
+    if not medecin_email_param:
+        return jsonify({"error": "Doctor email parameter is required"}), 400
+    try:
+        month_start = datetime.strptime(month_param, "%Y-%m").date()
+    except ValueError:
+        return jsonify({"error": "Month must be formatted as YYYY-MM"}), 400
+
+    all_possible_slots = utils.generate_time_slots(
+        config.get('rdv_start_time', '08:00'),
+        config.get('rdv_end_time', '17:45'),
+        config.get('rdv_interval_minutes', 15)
+    )
+    grid = set(all_possible_slots)
+
+    if not storage.exists(_excel_file()):
+        initialize_excel_file()
+    # Index (date, médecin) : une consultation par jour du mois, sans relire DonneesRDV
+    reserved_by_day = slot_index.month_reserved(_excel_file(), month_start.year, month_start.month, medecin_email_param)
+    blocked = load_disabled_periods().blocked_days(month_start, max(reserved_by_day, default=month_start.isoformat()))
+    today_iso = date.today().isoformat()
+
+    days = {}
+    for day, reserved in reserved_by_day.items():
+        reason = blocked.get(day)
+        taken = len(grid.intersection(reserved))
+        if reason or day < today_iso:
+            free = 0
+        else:
+            free = len(all_possible_slots) - taken
+        days[day] = {
+            "free": free,
+            "reserved": taken,
+            "date_disabled": bool(reason),
+            "reason": reason,
+            "past": day < today_iso,
+        }
+
+    return jsonify({
+        "month": month_start.strftime("%Y-%m"),
+        "medecin_email": medecin_email_param,
+        "slots_per_day": len(all_possible_slots),
+        "days": days
+    })
 
 
 @patient_rdv_bp.route("/manage_disabled_periods", methods=["GET", "POST"])
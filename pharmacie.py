@@ -1,10 +1,13 @@
 # pharmacie.py
 # Module pour la gestion du stock des produits pharmaceutiques et parapharmaceutiques
 # ──────────────────────────────────────────────────────────────────────────────
-from flask import Blueprint, render_template_string, session, redirect, url_for, flash, request, jsonify, send_file
+from flask import Blueprint, session, redirect, url_for, flash, request, jsonify, send_file
+from template_cache import render_template_string
 from datetime import datetime
 import utils
 import theme
+import storage
+import timing
 import pandas as pd
 import os
 import io
@@ -15,76 +18,62 @@ import login
 # Création du Blueprint pour les routes de pharmacie
 pharmacie_bp = Blueprint('pharmacie', __name__, url_prefix='/pharmacie')
 
-# Chemin du fichier Excel unique pour la pharmacie (sera défini dynamiquement)
-PHARMACIE_EXCEL_FILE: str = ""
+# Chemin du fichier Excel unique pour la pharmacie, résolu à chaque appel depuis
+# le tenant de la requête courante (pas de globale partagée entre requêtes).
+def _pharmacie_excel_file() -> str:
+    return os.path.join(utils.EXCEL_FOLDER, 'Pharmacie.xlsx')
 
-# Assurez-vous que PHARMACIE_EXCEL_FILE est correctement initialisé ici
-# après que utils.EXCEL_FOLDER ait été défini par utils.set_dynamic_base_dir.
+# S'assurer qu'un tenant est lié à la requête avant les routes de la pharmacie.
 @pharmacie_bp.before_request
 def set_pharmacie_excel_file_path():
-    global PHARMACIE_EXCEL_FILE
     if utils.EXCEL_FOLDER is None:
         # Fallback si le répertoire n'est pas encore défini (ex: accès direct à la route)
         admin_email = session.get('admin_email', 'default_admin@example.com')
         utils.set_dynamic_base_dir(admin_email)
-    PHARMACIE_EXCEL_FILE = os.path.join(utils.EXCEL_FOLDER, 'Pharmacie.xlsx')
 
 def initialize_pharmacie_excel_file_if_not_exists():
     """
-    Initialise le fichier Pharmacie.xlsx avec les feuilles Inventaire et Mouvements
-    et leurs en-têtes si le fichier n'existe pas ou si des feuilles sont manquantes.
+    Initialise le jeu de données Pharmacie (base SQLite du tenant) avec les feuilles
+    Inventaire et Mouvements et leurs en-têtes s'il n'existe pas ou si des feuilles sont manquantes.
     """
-    if not os.path.exists(PHARMACIE_EXCEL_FILE):
-        print(f"DEBUG: Le fichier Pharmacie.xlsx n'existe pas. Initialisation...")
-        try:
-            with pd.ExcelWriter(PHARMACIE_EXCEL_FILE, engine='xlsxwriter') as writer:
-                # Feuille Inventaire
-                pd.DataFrame(columns=['Code_Produit', 'Nom', 'Type', 'Usage', 'Quantité', 'Prix_Achat', 'Prix_Vente', 'Fournisseur', 'Date_Expiration', 'Seuil_Alerte', 'Date_Enregistrement']).to_excel(writer, sheet_name='Inventaire', index=False)
-                # Feuille Mouvements
-                pd.DataFrame(columns=['Date', 'Code_Produit', 'Nom_Produit', 'Type_Mouvement', 'Quantité_Mouvement', 'Nom_Responsable', 'Prenom_Responsable', 'Telephone_Responsable']).to_excel(writer, sheet_name='Mouvements', index=False)
-            print(f"DEBUG: Fichier {PHARMACIE_EXCEL_FILE} initialisé avec les feuilles Inventaire et Mouvements.")
-        except Exception as e:
-            print(f"ERREUR: Impossible de sauvegarder le fichier {PHARMACIE_EXCEL_FILE} lors de l'initialisation: {e}")
-            flash(f"Erreur lors de l'initialisation du fichier Pharmacie.xlsx : {e}", "danger")
-    else:
-        print(f"DEBUG: Le fichier Pharmacie.xlsx existe déjà. Vérification des feuilles...")
-        try:
-            xls = pd.ExcelFile(PHARMACIE_EXCEL_FILE)
-            sheets_to_create = []
-            if 'Inventaire' not in xls.sheet_names:
-                sheets_to_create.append('Inventaire')
-            if 'Mouvements' not in xls.sheet_names:
-                sheets_to_create.append('Mouvements')
-
-            if sheets_to_create:
-                print(f"DEBUG: Feuilles manquantes détectées: {sheets_to_create}. Recréation...")
-                # Charger les feuilles existantes
-                existing_dfs = {sheet_name: pd.read_excel(xls, sheet_name=sheet_name, dtype=str).fillna('') for sheet_name in xls.sheet_names}
-                
-                with pd.ExcelWriter(PHARMACIE_EXCEL_FILE, engine='xlsxwriter') as writer:
-                    for sheet_name in ALL_PHARMACIE_SHEETS:
-                        if sheet_name in existing_dfs:
-                            existing_dfs[sheet_name].to_excel(writer, sheet_name=sheet_name, index=False)
-                        else:
-                            if sheet_name == 'Inventaire':
-                                pd.DataFrame(columns=['Code_Produit', 'Nom', 'Type', 'Usage', 'Quantité', 'Prix_Achat', 'Prix_Vente', 'Fournisseur', 'Date_Expiration', 'Seuil_Alerte', 'Date_Enregistrement']).to_excel(writer, sheet_name=sheet_name, index=False)
-                            elif sheet_name == 'Mouvements':
-                                pd.DataFrame(columns=['Date', 'Code_Produit', 'Nom_Produit', 'Type_Mouvement', 'Quantité_Mouvement', 'Nom_Responsable', 'Prenom_Responsable', 'Telephone_Responsable']).to_excel(writer, sheet_name=sheet_name, index=False)
-                print(f"DEBUG: Fichier {PHARMACIE_EXCEL_FILE} mis à jour avec les feuilles manquantes.")
-        except Exception as e:
-            print(f"ERREUR: Erreur lors de la vérification/mise à jour de Pharmacie.xlsx: {e}")
-            flash(f"Erreur lors de la vérification du fichier Pharmacie.xlsx : {e}", "danger")
+    try:
+        storage.create(_pharmacie_excel_file(), {
+            # Feuille Inventaire
+            'Inventaire': ['Code_Produit', 'Nom', 'Type', 'Usage', 'Quantité', 'Prix_Achat', 'Prix_Vente', 'Fournisseur', 'Date_Expiration', 'Seuil_Alerte', 'Date_Enregistrement'],
+            # Feuille Mouvements
+            'Mouvements': ['Date', 'Code_Produit', 'Nom_Produit', 'Type_Mouvement', 'Quantité_Mouvement', 'Nom_Responsable', 'Prenom_Responsable', 'Telephone_Responsable'],
+        })
+    except Exception as e:
+        print(f"ERREUR: Erreur lors de la vérification/initialisation de Pharmacie.xlsx: {e}")
+        flash(f"Erreur lors de la vérification du fichier Pharmacie.xlsx : {e}", "danger")
 
 
 # Fonctions utilitaires pour charger et sauvegarder les données des feuilles Excel
-def _load_sheet_data(file_path, sheet_name, default_columns, numeric_cols=[]):
+def _load_workbook_sheets(file_path):
+    """
+    Lit toutes les feuilles du classeur en une fois (storage.read_workbooks), pour les
+    passer à _load_sheet_data(sheets=...). None si le classeur n'existe pas.
+    """
+    if not storage.exists(file_path):
+        return None
+    return storage.read_workbooks([file_path], dtype=str)[file_path]
+
+def _load_sheet_data(file_path, sheet_name, default_columns, numeric_cols=[], sheets=None):
     """
     Charge les données d'une feuille spécifique d'un fichier Excel.
     Initialise la feuille avec les colonnes par défaut si elle n'existe pas ou est vide.
+    `sheets` : feuilles déjà lues par _load_workbook_sheets (le classeur n'est pas relu).
     """
-    if os.path.exists(file_path):
+    if sheets is not None or storage.exists(file_path):
         try:
-            df = pd.read_excel(file_path, sheet_name=sheet_name, dtype=str).fillna('')
+            if sheets is None:
+                df = storage.read_excel(file_path, sheet_name=sheet_name, dtype=str).fillna('')
+            elif isinstance(sheets, Exception):
+                raise sheets
+            elif sheet_name in sheets:
+                df = sheets[sheet_name].fillna('')
+            else:
+                raise ValueError(f"Worksheet named '{sheet_name}' not found")
             # S'assurer que toutes les colonnes attendues sont présentes, les ajouter si elles manquent
             for col in default_columns:
                 if col not in df.columns:
@@ -106,35 +95,11 @@ def _load_sheet_data(file_path, sheet_name, default_columns, numeric_cols=[]):
 
 def _save_sheet_data(df_to_save, file_path, sheet_name, all_sheet_names):
     """
-    Sauvegarde un DataFrame dans une feuille spécifique d'un fichier Excel,
+    Sauvegarde un DataFrame dans une feuille spécifique du jeu de données,
     en préservant les autres feuilles.
     """
     try:
-        # Lire toutes les feuilles existantes si le fichier existe
-        existing_sheets_data = {}
-        if os.path.exists(file_path):
-            existing_sheets_data = pd.read_excel(file_path, sheet_name=None, dtype=str)
-        
-        # Mettre à jour le DataFrame de la feuille spécifique
-        existing_sheets_data[sheet_name] = df_to_save
-
-        # Écrire toutes les feuilles (mises à jour et non modifiées) dans le fichier
-        with pd.ExcelWriter(file_path, engine='xlsxwriter') as writer:
-            for s_name in all_sheet_names:
-                if s_name in existing_sheets_data:
-                    # Assurez-vous que le DataFrame de chaque feuille a les bonnes colonnes
-                    # si elles ont été lues avec dtype=str, sinon elles peuvent être vides
-                    if not existing_sheets_data[s_name].empty:
-                        existing_sheets_data[s_name].to_excel(writer, sheet_name=s_name, index=False)
-                    else: # Si le DataFrame est vide, créer une feuille vide avec les colonnes
-                         # Cela est important pour que les entêtes soient toujours présentes
-                        if s_name == 'Inventaire':
-                            pd.DataFrame(columns=['Code_Produit', 'Nom', 'Type', 'Usage', 'Quantité', 'Prix_Achat', 'Prix_Vente', 'Fournisseur', 'Date_Expiration', 'Seuil_Alerte', 'Date_Enregistrement']).to_excel(writer, sheet_name=s_name, index=False)
-                        elif s_name == 'Mouvements':
-                            pd.DataFrame(columns=['Date', 'Code_Produit', 'Nom_Produit', 'Type_Mouvement', 'Quantité_Mouvement', 'Nom_Responsable', 'Prenom_Responsable', 'Telephone_Responsable']).to_excel(writer, sheet_name=s_name, index=False)
-                elif s_name == sheet_name: # Cas où la feuille est nouvelle et est celle que nous sauvons
-                    df_to_save.to_excel(writer, sheet_name=s_name, index=False)
-
+        storage.to_excel(df_to_save, file_path, sheet_name=sheet_name)
         return True
     except Exception as e:
         print(f"Erreur lors de la sauvegarde de la feuille '{sheet_name}' vers {file_path}: {e}")
@@ -145,10 +110,10 @@ def _save_sheet_data(df_to_save, file_path, sheet_name, all_sheet_names):
 ALL_PHARMACIE_SHEETS = ['Inventaire', 'Mouvements']
 
 # Fonctions spécifiques pour le stock et les mouvements, utilisant les helpers
-def load_pharmacie_inventory(file_path):
+def load_pharmacie_inventory(file_path, sheets=None):
     columns = ['Code_Produit', 'Nom', 'Type', 'Usage', 'Quantité', 'Prix_Achat', 'Prix_Vente', 'Fournisseur', 'Date_Expiration', 'Seuil_Alerte', 'Date_Enregistrement']
     numeric_cols = ['Quantité', 'Prix_Achat', 'Prix_Vente', 'Seuil_Alerte']
-    df = _load_sheet_data(file_path, 'Inventaire', columns, numeric_cols)
+    df = _load_sheet_data(file_path, 'Inventaire', columns, numeric_cols, sheets=sheets)
     
     # Convertir les colonnes de date en objets datetime, en forçant les erreurs
     df['Date_Expiration'] = pd.to_datetime(df['Date_Expiration'], errors='coerce')
@@ -159,10 +124,10 @@ def load_pharmacie_inventory(file_path):
 def save_pharmacie_inventory(df, file_path):
     return _save_sheet_data(df, file_path, 'Inventaire', ALL_PHARMACIE_SHEETS)
 
-def load_pharmacie_movements(file_path):
+def load_pharmacie_movements(file_path, sheets=None):
     columns = ['Date', 'Code_Produit', 'Nom_Produit', 'Type_Mouvement', 'Quantité_Mouvement', 'Nom_Responsable', 'Prenom_Responsable', 'Telephone_Responsable']
     numeric_cols = ['Quantité_Mouvement']
-    df = _load_sheet_data(file_path, 'Mouvements', columns, numeric_cols)
+    df = _load_sheet_data(file_path, 'Mouvements', columns, numeric_cols, sheets=sheets)
     
     # Convertir la colonne 'Date' en objets datetime, en gérant divers formats et en forçant les erreurs
     df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
@@ -176,13 +141,13 @@ def save_pharmacie_movements(df, file_path):
 _ALL_COMPTA_SHEETS = ['Recettes', 'Depenses', 'Salaires', 'TiersPayants', 'DocumentsFiscaux']
 
 def _load_comptabilite_sheet_data(file_path, sheet_name, default_columns, numeric_cols=[]):
-    if not os.path.exists(file_path):
+    if not storage.exists(file_path):
         empty_df = pd.DataFrame(columns=default_columns)
         for col in numeric_cols:
             empty_df[col] = 0.0
         return empty_df
     try:
-        df = pd.read_excel(file_path, sheet_name=sheet_name, dtype=str).fillna('')
+        df = storage.read_excel(file_path, sheet_name=sheet_name, dtype=str).fillna('')
         for col in default_columns:
             if col not in df.columns:
                 df[col] = ''
@@ -201,27 +166,7 @@ def _load_comptabilite_sheet_data(file_path, sheet_name, default_columns, numeri
 
 def _save_comptabilite_sheet_data(df_to_save, file_path, sheet_name_to_update, all_sheet_names):
     try:
-        existing_sheets_data = {}
-        if os.path.exists(file_path):
-            existing_sheets_data = pd.read_excel(file_path, sheet_name=None, dtype=str)
-        
-        existing_sheets_data[sheet_name_to_update] = df_to_save
-
-        with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
-            for s_name in all_sheet_names:
-                if s_name in existing_sheets_data and not existing_sheets_data[s_name].empty:
-                    existing_sheets_data[s_name].to_excel(writer, sheet_name=s_name, index=False)
-                else:
-                    if s_name == 'Recettes':
-                        pd.DataFrame(columns=['Date', 'Type_Acte', 'Patient_ID', 'Patient_Nom', 'Patient_Prenom', 'Montant', 'Mode_Paiement', 'Description', 'ID_Facture_Liee']).to_excel(writer, sheet_name=s_name, index=False)
-                    elif s_name == 'Depenses':
-                        pd.DataFrame(columns=['Date', 'Categorie', 'Description', 'Montant', 'Justificatif_Fichier']).to_excel(writer, sheet_name=s_name, index=False)
-                    elif s_name == 'Salaires':
-                        pd.DataFrame(columns=['Mois_Annee', 'Nom_Employe', 'Prenom_Employe', 'Salaire_Net', 'Charges_Sociales', 'Total_Brut', 'Fiche_Paie_PDF']).to_excel(writer, sheet_name=s_name, index=False)
-                    elif s_name == 'TiersPayants':
-                        pd.DataFrame(columns=['Date', 'Assureur', 'Patient_ID', 'Patient_Nom', 'Patient_Prenom', 'Montant_Attendu', 'Montant_Recu', 'Date_Reglement', 'ID_Facture_Liee', 'Statut']).to_excel(writer, sheet_name=s_name, index=False)
-                    elif s_name == 'DocumentsFiscaux':
-                        pd.DataFrame(columns=['Date', 'Type_Document', 'Description', 'Fichier_PDF']).to_excel(writer, sheet_name=s_name, index=False)
+        storage.to_excel(df_to_save, file_path, sheet_name=sheet_name_to_update)
         return True
     except Exception as e:
         print(f"Erreur lors de la sauvegarde de la feuille '{sheet_name_to_update}' vers {file_path}: {e}")
@@ -349,6 +294,7 @@ class PDF(FPDF):
             self.set_x(start_x_table)
             fill = not fill 
 
+@timing.timed("pdf")
 def generate_inventory_pdf(df, currency):
     pdf = PDF(orientation='L', unit='mm', format='A4')
     pdf.set_auto_page_break(auto=True, margin=15) 
@@ -406,6 +352,7 @@ def generate_inventory_pdf(df, currency):
     output.seek(0)
     return output
 
+@timing.timed("pdf")
 def generate_movements_pdf(df):
     pdf = PDF(orientation='L', unit='mm', format='A4')
     pdf.set_auto_page_break(auto=True, margin=15)
@@ -469,7 +416,6 @@ def home_pharmacie():
             return redirect(url_for('login.login'))
 
     initialize_pharmacie_excel_file_if_not_exists()
-    global PHARMACIE_EXCEL_FILE 
 
     config = utils.load_config()
     session['theme'] = config.get('theme', theme.DEFAULT_THEME)
@@ -477,8 +423,10 @@ def home_pharmacie():
     host_address = f"http://{utils.LOCAL_IP}:3000"
     current_date_str = datetime.now().strftime("%Y-%m-%d")
 
-    inventory_df = load_pharmacie_inventory(PHARMACIE_EXCEL_FILE)
-    movements_df = load_pharmacie_movements(PHARMACIE_EXCEL_FILE)
+    # Pharmacie.xlsx est lu une seule fois pour ses deux feuilles
+    pharmacie_sheets = _load_workbook_sheets(_pharmacie_excel_file())
+    inventory_df = load_pharmacie_inventory(_pharmacie_excel_file(), sheets=pharmacie_sheets)
+    movements_df = load_pharmacie_movements(_pharmacie_excel_file(), sheets=pharmacie_sheets)
     total_products = len(inventory_df)
 
     # --- LOGIQUE DE FILTRAGE (AVANT LA CONVERSION EN STRING) ---
@@ -509,7 +457,7 @@ def home_pharmacie():
     if user_email:
         admin_email_from_session = session.get('admin_email', 'default_admin@example.com')
         utils.set_dynamic_base_dir(admin_email_from_session)
-        user_info = login.load_users().get(user_email)
+        user_info = login.get_user(user_email)
         if user_info:
             logged_in_full_name = f"{user_info.get('prenom', '')} {user_info.get('nom', '')}".strip() or None
 
@@ -544,7 +492,6 @@ def add_or_update_product():
             flash("Erreur: Les répertoires de données dynamiques ne sont pas définis. Veuillez vous reconnecter.", "danger")
             return redirect(url_for('pharmacie.home_pharmacie'))
 
-    global PHARMACIE_EXCEL_FILE 
 
     original_product_code = request.form.get('original_product_code')
     code_produit = request.form.get('code_produit').strip()
@@ -559,7 +506,7 @@ def add_or_update_product():
     date_expiration = pd.to_datetime(date_expiration_str, errors='coerce')
     seuil_alerte = int(request.form.get('seuil_alerte'))
 
-    inventory_df = load_pharmacie_inventory(PHARMACIE_EXCEL_FILE)
+    inventory_df = load_pharmacie_inventory(_pharmacie_excel_file())
     is_new_entry = True
 
     if original_product_code:
@@ -598,7 +545,7 @@ def add_or_update_product():
         }
         inventory_df = pd.concat([inventory_df, pd.DataFrame([new_product_row])], ignore_index=True)
 
-    if save_pharmacie_inventory(inventory_df, PHARMACIE_EXCEL_FILE):
+    if save_pharmacie_inventory(inventory_df, _pharmacie_excel_file()):
         if is_new_entry:
             try:
                 depense_data = {
@@ -630,9 +577,8 @@ def delete_product():
         if 'email' in session: utils.set_dynamic_base_dir(session['email'])
         else: return jsonify(success=False, message="Erreur: Répertoires non définis. Reconnexion nécessaire."), 401
             
-    global PHARMACIE_EXCEL_FILE 
     product_code = request.form.get('product_code').strip()
-    inventory_df = load_pharmacie_inventory(PHARMACIE_EXCEL_FILE)
+    inventory_df = load_pharmacie_inventory(_pharmacie_excel_file())
 
     if product_code not in inventory_df['Code_Produit'].values:
         return jsonify(success=False, message=f"Produit avec le code '{product_code}' introuvable."), 404
@@ -640,7 +586,7 @@ def delete_product():
     product_name_to_delete = inventory_df[inventory_df['Code_Produit'] == product_code]['Nom'].iloc[0]
     inventory_df_filtered = inventory_df[inventory_df['Code_Produit'] != product_code].copy()
 
-    if save_pharmacie_inventory(inventory_df_filtered, PHARMACIE_EXCEL_FILE):
+    if save_pharmacie_inventory(inventory_df_filtered, _pharmacie_excel_file()):
         comptabilite_excel_file_path = os.path.join(utils.EXCEL_FOLDER, 'Comptabilite.xlsx')
         try:
             df_depenses = _load_comptabilite_sheet_data(comptabilite_excel_file_path, 'Depenses', _DEPENSES_COLUMNS, numeric_cols=['Montant'])
@@ -667,7 +613,6 @@ def record_movement():
             flash("Erreur: Les répertoires de données dynamiques ne sont pas définis. Veuillez vous reconnecter.", "danger")
             return redirect(url_for('login.login'))
             
-    global PHARMACIE_EXCEL_FILE 
     product_code = request.form.get('product_code').strip()
     movement_type = request.form.get('movement_type').strip()
     quantity_movement = int(request.form.get('quantity_movement'))
@@ -675,7 +620,7 @@ def record_movement():
     prenom_responsable = request.form.get('prenom_responsable', '').strip()
     telephone_responsable = request.form.get('telephone_responsable', '').strip()
 
-    inventory_df = load_pharmacie_inventory(PHARMACIE_EXCEL_FILE)
+    inventory_df = load_pharmacie_inventory(_pharmacie_excel_file())
     if product_code not in inventory_df['Code_Produit'].values:
         flash(f"Erreur: Produit avec le code '{product_code}' introuvable.", "danger")
         return redirect(url_for('pharmacie.home_pharmacie'))
@@ -697,15 +642,14 @@ def record_movement():
         flash("Type de mouvement invalide.", "danger")
         return redirect(url_for('pharmacie.home_pharmacie'))
 
-    if save_pharmacie_inventory(inventory_df, PHARMACIE_EXCEL_FILE):
-        movements_df = load_pharmacie_movements(PHARMACIE_EXCEL_FILE)
+    if save_pharmacie_inventory(inventory_df, _pharmacie_excel_file()):
         new_movement = {
             'Date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'Code_Produit': product_code, 'Nom_Produit': product_name,
             'Type_Mouvement': movement_type, 'Quantité_Mouvement': quantity_movement, 'Nom_Responsable': nom_responsable,
             'Prenom_Responsable': prenom_responsable, 'Telephone_Responsable': telephone_responsable
         }
-        movements_df = pd.concat([movements_df, pd.DataFrame([new_movement])], ignore_index=True)
-        save_pharmacie_movements(movements_df, PHARMACIE_EXCEL_FILE)
+        # L'historique des mouvements ne fait que croître : ajout journalisé, sans réécriture
+        storage.append_rows(_pharmacie_excel_file(), [new_movement], sheet_name='Mouvements')
         flash(flash_message, "success")
     return redirect(url_for('pharmacie.home_pharmacie'))
 
@@ -718,8 +662,7 @@ def export_inventory():
             flash("Erreur: Les répertoires de données dynamiques ne sont pas définis. Veuillez vous reconnecter.", "danger")
             return redirect(url_for('login.login'))
 
-    global PHARMACIE_EXCEL_FILE 
-    inventory_df = load_pharmacie_inventory(PHARMACIE_EXCEL_FILE)
+    inventory_df = load_pharmacie_inventory(_pharmacie_excel_file())
     output = io.BytesIO()
     with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
         inventory_df_for_excel = inventory_df.copy()
@@ -740,8 +683,7 @@ def export_movements_history():
             flash("Erreur: Les répertoires de données dynamiques ne sont pas définis. Veuillez vous reconnecter.", "danger")
             return redirect(url_for('login.login'))
     
-    global PHARMACIE_EXCEL_FILE 
-    movements_df = load_pharmacie_movements(PHARMACIE_EXCEL_FILE)
+    movements_df = load_pharmacie_movements(_pharmacie_excel_file())
     output = io.BytesIO()
     with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
         movements_df.to_excel(writer, sheet_name='Historique Mouvements Pharmacie', index=False)
@@ -757,8 +699,7 @@ def export_inventory_pdf():
             flash("Erreur: Les répertoires de données dynamiques ne sont pas définis. Veuillez vous reconnecter.", "danger")
             return redirect(url_for('login.login'))
 
-    global PHARMACIE_EXCEL_FILE 
-    inventory_df = load_pharmacie_inventory(PHARMACIE_EXCEL_FILE)
+    inventory_df = load_pharmacie_inventory(_pharmacie_excel_file())
     config = utils.load_config()
     currency = config.get('currency', 'MAD')
     pdf_output = generate_inventory_pdf(inventory_df, currency)
@@ -773,8 +714,7 @@ def export_movements_history_pdf():
             flash("Erreur: Les répertoires de données dynamiques ne sont pas définis. Veuillez vous reconnecter.", "danger")
             return redirect(url_for('login.login'))
 
-    global PHARMACIE_EXCEL_FILE 
-    movements_df = load_pharmacie_movements(PHARMACIE_EXCEL_FILE)
+    movements_df = load_pharmacie_movements(_pharmacie_excel_file())
     pdf_output = generate_movements_pdf(movements_df)
     return send_file(pdf_output, as_attachment=True, download_name='Historique_Mouvements_Pharmacie.pdf', mimetype='application/pdf')
 
@@ -1,10 +1,12 @@
 # radiologie.py
 # Module pour la gestion des analyses radiologiques
 
-from flask import Blueprint, render_template_string, session, redirect, url_for, flash, request, jsonify, send_from_directory, send_file
+from flask import Blueprint, session, redirect, url_for, flash, request, jsonify, send_from_directory, send_file
+from template_cache import render_template_string
 from datetime import datetime
 import utils
 import theme
+import storage
 import pandas as pd
 import os
 import io
@@ -717,9 +719,9 @@ def home_radiologie():
     
     radiologie_data_path = os.path.join(utils.EXCEL_FOLDER, 'Radiologie.xlsx')
 
-    if os.path.exists(radiologie_data_path):
+    if storage.exists(radiologie_data_path):
         try:
-            df_radiologie = pd.read_excel(radiologie_data_path, dtype=str).fillna('')
+            df_radiologie = storage.read_excel(radiologie_data_path, dtype=str).fillna('')
             
             # Convertir le DataFrame en liste de dictionnaires pour le template Jinja2
             radiologies_history = df_radiologie.to_dict(orient='records')
@@ -746,8 +748,7 @@ def home_radiologie():
         admin_email_from_session = session.get('admin_email', 'default_admin@example.com')
         utils.set_dynamic_base_dir(admin_email_from_session)
         
-        all_users_data = login.load_users()
-        user_info = all_users_data.get(user_email)
+        user_info = login.get_user(user_email)
         if user_info:
             logged_in_full_name = f"{user_info.get('prenom', '')} {user_info.get('nom', '')}".strip()
             if not logged_in_full_name:
@@ -786,9 +787,9 @@ def get_patient_details():
     # Initialiser une liste vide pour contenir les radiologies
     patient_radiologies = []
 
-    if utils.CONSULT_FILE_PATH and os.path.exists(utils.CONSULT_FILE_PATH):
+    if utils.CONSULT_FILE_PATH and storage.exists(utils.CONSULT_FILE_PATH):
         try:
-            df_consult = pd.read_excel(utils.CONSULT_FILE_PATH, dtype=str).fillna('')
+            df_consult = storage.read_excel(utils.CONSULT_FILE_PATH, dtype=str).fillna('')
             if 'patient_id' in df_consult.columns:
                 patient_consultations = df_consult[df_consult['patient_id'] == patient_id]
                 if not patient_consultations.empty and 'radiologies' in patient_consultations.columns:
@@ -854,10 +855,7 @@ def save_radiologie():
             pdf_filename = None
 
     try:
-        if os.path.exists(radiologie_data_path):
-            df_radiologie = pd.read_excel(radiologie_data_path, dtype=str).fillna('')
-        else:
-            df_radiologie = pd.DataFrame(columns=['Date', 'ID_Patient', 'NOM', 'PRENOM', 'RADIOLOGIE', 'CONCLUSION', 'PDF_File'])
+        new_rows = []
 
         # Itérer sur les listes de radiologies et de conclusions pour sauvegarder dans Radiologie.xlsx
         for i in range(len(nom_radiologies)):
@@ -874,15 +872,16 @@ def save_radiologie():
                 'CONCLUSION': radiologist_conclusion,
                 'PDF_File': pdf_filename if pdf_filename else '' # Le PDF est associé à l'ensemble du formulaire, pas par ligne de radiologie pour l'instant
             }
-            df_radiologie = pd.concat([df_radiologie, pd.DataFrame([new_row])], ignore_index=True)
+            new_rows.append(new_row)
 
-        df_radiologie.to_excel(radiologie_data_path, index=False)
+        # Ajout journalisé : Radiologie.xlsx n'est plus relu ni réécrit à chaque enregistrement
+        storage.append_rows(radiologie_data_path, pd.DataFrame(new_rows, columns=['Date', 'ID_Patient', 'NOM', 'PRENOM', 'RADIOLOGIE', 'CONCLUSION', 'PDF_File']))
         flash("Radiologie(s) enregistrée(s) avec succès dans Radiologie.xlsx.", "success")
 
         # --- Mettre à jour ConsultationData.xlsx avec les commentaires de radiologie ---
-        if utils.CONSULT_FILE_PATH and os.path.exists(utils.CONSULT_FILE_PATH):
+        if utils.CONSULT_FILE_PATH and storage.exists(utils.CONSULT_FILE_PATH):
             try:
-                df_consult = pd.read_excel(utils.CONSULT_FILE_PATH, dtype=str).fillna('')
+                df_consult = storage.read_excel(utils.CONSULT_FILE_PATH, dtype=str).fillna('')
 
                 # Trouver toutes les consultations pour le patient
                 # Nous supposons que la dernière entrée pour un patient_id donné est la dernière consultation.
@@ -927,7 +926,8 @@ def save_radiologie():
                     df_consult.loc[last_consultation_index, 'doctor_comment'] = updated_doctor_comment
 
                     # Sauvegarder le DataFrame mis à jour dans le fichier Excel
-                    df_consult.to_excel(utils.CONSULT_FILE_PATH, index=False)
+                    storage.to_excel(df_consult, utils.CONSULT_FILE_PATH)
+                    utils.invalidate_patient_directory()
                     flash(f"La colonne 'Commentaire du docteur' de la dernière consultation pour le patient {patient_id} a été mise à jour avec les radiologies dans ConsultationData.xlsx.", "info")
                 else:
                     print(f"Aucune consultation trouvée pour le patient {patient_id} dans ConsultationData.xlsx pour mettre à jour les commentaires.")
@@ -965,9 +965,9 @@ def export_radiologie_history():
 
     radiologie_data_path = os.path.join(utils.EXCEL_FOLDER, 'Radiologie.xlsx')
 
-    if os.path.exists(radiologie_data_path):
+    if storage.exists(radiologie_data_path):
         try:
-            df_radiologie = pd.read_excel(radiologie_data_path, dtype=str).fillna('')
+            df_radiologie = storage.read_excel(radiologie_data_path, dtype=str).fillna('')
             output = io.BytesIO()
             writer = pd.ExcelWriter(output, engine='xlsxwriter')
             df_radiologie.to_excel(writer, sheet_name='Historique Radiologies', index=False)
@@ -10,49 +10,61 @@ import pandas as pd
 from fpdf import FPDF
 from openpyxl import Workbook
 from flask import (
-    Blueprint, request, render_template_string,
+    Blueprint, request,
     redirect, url_for, session, jsonify, send_file
 )
+from template_cache import render_template_string
 import utils
 import theme
 import login
+import storage
+import timing
+import slot_index
+import logs
 
-# These variables will be dynamically defined once set_dynamic_base_dir is called
-EXCEL_DIR: Optional[Path] = None
-PDF_DIR: Optional[Path] = None
-EXCEL_FILE: Optional[Path] = None
-CONSULT_FILE: Optional[Path] = None
-BASE_PATIENT_FILE: Optional[Path] = None
+log = logs.get_logger(__name__)
 
 # ------------------------------------------------------------------
 # DIRECTORY CONFIGURATION
 # ------------------------------------------------------------------
-def set_rdv_dirs():
-    """Sets the dynamic directory paths for RDV blueprint."""
-    global EXCEL_DIR, PDF_DIR, EXCEL_FILE, CONSULT_FILE, BASE_PATIENT_FILE
+# Paths are resolved on every call from the tenant bound to the current
+# request (utils.current_tenant()), never cached in module globals that
+# concurrent requests from other tenants would overwrite.
+def _excel_dir() -> Optional[Path]:
+    return Path(utils.EXCEL_FOLDER) if utils.EXCEL_FOLDER else None
+
+def _pdf_dir() -> Optional[Path]:
+    return Path(utils.PDF_FOLDER) if utils.PDF_FOLDER else None
+
+def _excel_file() -> Optional[Path]:
+    excel_dir = _excel_dir()
+    return excel_dir / "DonneesRDV.xlsx" if excel_dir else None
+
+def _consult_file() -> Optional[Path]:
+    excel_dir = _excel_dir()
+    return excel_dir / "ConsultationData.xlsx" if excel_dir else None
 
+def _base_patient_file() -> Optional[Path]:
+    excel_dir = _excel_dir()
+    return excel_dir / "info_Base_patient.xlsx" if excel_dir else None
+
+def set_rdv_dirs():
+    """Makes sure the RDV directories of the current tenant exist."""
     # Ensure utils.EXCEL_FOLDER and utils.PDF_FOLDER are set by set_dynamic_base_dir
     if utils.EXCEL_FOLDER is None or utils.PDF_FOLDER is None:
-        print("ERROR: utils.EXCEL_FOLDER or utils.PDF_FOLDER not set. Cannot initialize RDV paths.")
+        log.error("utils.EXCEL_FOLDER or utils.PDF_FOLDER not set. Cannot initialize RDV paths.")
         return
 
-    EXCEL_DIR = Path(utils.EXCEL_FOLDER)
-    PDF_DIR   = Path(utils.PDF_FOLDER)
-    os.makedirs(EXCEL_DIR, exist_ok=True)
-    os.makedirs(PDF_DIR, exist_ok=True)
-
-    EXCEL_FILE        = EXCEL_DIR / "DonneesRDV.xlsx"
-    CONSULT_FILE      = EXCEL_DIR / "ConsultationData.xlsx"
-    BASE_PATIENT_FILE = EXCEL_DIR / "info_Base_patient.xlsx"
-    print(f"DEBUG: RDV paths set. EXCEL_DIR: {EXCEL_DIR}, PDF_DIR: {PDF_DIR}")
+    os.makedirs(utils.EXCEL_FOLDER, exist_ok=True)
+    os.makedirs(utils.PDF_FOLDER, exist_ok=True)
 
 def backup_info_base_patient():
-    # Ensure BASE_PATIENT_FILE and EXCEL_FOLDER are set
-    if BASE_PATIENT_FILE is None or utils.EXCEL_FOLDER is None:
-        print("ERROR: BASE_PATIENT_FILE or utils.EXCEL_FOLDER not set. Cannot backup patient file.")
+    # Ensure _base_patient_file() and EXCEL_FOLDER are set
+    if _base_patient_file() is None or utils.EXCEL_FOLDER is None:
+        log.error("BASE_PATIENT_FILE or utils.EXCEL_FOLDER not set. Cannot backup patient file.")
         return
 
-    source_file = str(BASE_PATIENT_FILE)
+    source_file = str(_base_patient_file())
     if os.path.exists(source_file):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         backup_file = os.path.join(
@@ -63,8 +75,8 @@ def backup_info_base_patient():
 
 def initialize_base_patient_file():
     """Initialises the info_Base_patient.xlsx file with unified columns."""
-    if BASE_PATIENT_FILE is None:
-        print("ERROR: BASE_PATIENT_FILE not set. Cannot initialize base patient file.")
+    if _base_patient_file() is None:
+        log.error("BASE_PATIENT_FILE not set. Cannot initialize base patient file.")
         return
 
     wb = Workbook()
@@ -74,23 +86,24 @@ def initialize_base_patient_file():
         "ID", "Nom", "Prenom", "DateNaissance", "Sexe", "Âge",
         "Antécédents", "Téléphone"
     ])
-    wb.save(BASE_PATIENT_FILE)
-    print(f"DEBUG: Fichier info_Base_patient.xlsx initialisé avec les colonnes unifiées.")
+    wb.save(_base_patient_file())
+    log.debug("Fichier info_Base_patient.xlsx initialisé avec les colonnes unifiées.")
 
 def save_base_patient_df(df_new: pd.DataFrame):
     """Saves or updates data in info_Base_patient.xlsx."""
-    if BASE_PATIENT_FILE is None:
-        print("ERROR: BASE_PATIENT_FILE not set. Cannot save base patient dataframe.")
+    if _base_patient_file() is None:
+        log.error("BASE_PATIENT_FILE not set. Cannot save base patient dataframe.")
         return
+    directory_before = utils.patient_directory_version()
 
-    if not BASE_PATIENT_FILE.exists():
+    if not _base_patient_file().exists():
         initialize_base_patient_file()
         df_existing = pd.DataFrame(columns=[
             "ID", "Nom", "Prenom", "DateNaissance", "Sexe", "Âge",
             "Antécédents", "Téléphone"
         ])
     else:
-        df_existing = pd.read_excel(BASE_PATIENT_FILE, dtype=str).fillna('')
+        df_existing = storage.read_excel(_base_patient_file(), dtype=str).fillna('')
 
     expected_cols = ["ID", "Nom", "Prenom", "DateNaissance", "Sexe", "Âge", "Antécédents", "Téléphone"]
     for col in expected_cols:
@@ -103,37 +116,37 @@ def save_base_patient_df(df_new: pd.DataFrame):
     if "ID" in df_combined.columns:
         df_combined.drop_duplicates(subset=["ID"], keep="last", inplace=True)
     
-    df_combined.to_excel(BASE_PATIENT_FILE, index=False)
-    print(f"DEBUG: Données sauvegardées dans info_Base_patient.xlsx. Total d'entrées: {len(df_combined)}")
+    df_combined.to_excel(_base_patient_file(), index=False)
+    log.debug("Données sauvegardées dans info_Base_patient.xlsx. Total d'entrées: %s", len(df_combined))
+    utils.update_patient_directory(df_new_filtered, directory_before)
 
 # ------------------------------------------------------------------
 # EXCEL HELPER (for DonneesRDV.xlsx)
 # ------------------------------------------------------------------
 def initialize_excel_file():
-    """Initialises the DonneesRDV.xlsx file with unified columns."""
-    if EXCEL_FILE is None:
-        print("ERROR: EXCEL_FILE not set. Cannot initialize excel file.")
+    """Initialises the DonneesRDV dataset (SQLite) with unified columns."""
+    if _excel_file() is None:
+        log.error("EXCEL_FILE not set. Cannot initialize excel file.")
         return
 
-    wb = Workbook()
-    sheet = wb.active
-    sheet.title = "RDV"
-    sheet.append([
+    storage.create(_excel_file(), {"RDV": [
         "Num Ordre", "ID", "Nom", "Prenom", "DateNaissance", "Sexe", "Âge",
         "Antécédents", "Téléphone", "Date", "Heure", "Medecin_Email"
-    ])
-    wb.save(EXCEL_FILE)
-    print(f"DEBUG: Fichier DonneesRDV.xlsx initialisé avec les colonnes unifiées.")
-
-def load_df() -> pd.DataFrame:
-    """Loads the DataFrame from DonneesRDV.xlsx, adding missing columns if any."""
-    if EXCEL_FILE is None:
-        print("ERROR: EXCEL_FILE not set. Cannot load dataframe.")
+    ]})
+    log.debug("Fichier DonneesRDV.xlsx initialisé avec les colonnes unifiées.")
+
+def load_df(row_ids: bool = False) -> pd.DataFrame:
+    """
+    Loads the DataFrame from DonneesRDV.xlsx, adding missing columns if any.
+    With row_ids=True, each row carries its stable identifier (storage.ROW_ID_COLUMN).
+    """
+    if _excel_file() is None:
+        log.error("EXCEL_FILE not set. Cannot load dataframe.")
         return pd.DataFrame()
 
-    if not EXCEL_FILE.exists():
+    if not storage.exists(_excel_file()):
         initialize_excel_file()
-    df = pd.read_excel(EXCEL_FILE, dtype=str).fillna('')
+    df = storage.read_excel(_excel_file(), dtype=str, row_ids=row_ids).fillna('')
     if 'Nom' not in df.columns:
         df.insert(loc=2, column='Nom', value='')
     if 'Prenom' not in df.columns:
@@ -152,12 +165,72 @@ def load_df() -> pd.DataFrame:
         df['Medecin_Email'] = ''
     return df
 
+def load_rdv(row_id: int) -> Optional[pd.Series]:
+    """Reads a single appointment by its stable identifier (None if it no longer exists)."""
+    if _excel_file() is None or not storage.exists(_excel_file()):
+        return None
+    row = storage.read_row(_excel_file(), row_id, dtype=str)
+    if row is None:
+        return None
+    row = pd.Series(row, dtype=object).fillna('')
+    for col in ("Nom", "Prenom", "DateNaissance", "Sexe", "Âge", "Antécédents", "Téléphone", "Medecin_Email"):
+        if col not in row:
+            row[col] = ''
+    return row
+
 def save_df(df: pd.DataFrame):
     """Saves the DataFrame to DonneesRDV.xlsx."""
-    if EXCEL_FILE is None:
-        print("ERROR: EXCEL_FILE not set. Cannot save dataframe.")
+    if _excel_file() is None:
+        log.error("EXCEL_FILE not set. Cannot save dataframe.")
+        return
+    storage.to_excel(df, _excel_file())
+    slot_index.on_sheet_saved(_excel_file(), df)
+
+def append_df(rows: pd.DataFrame):
+    """Ajoute des lignes à DonneesRDV sans réécrire la feuille (journal d'ajout)."""
+    if _excel_file() is None:
+        log.error("EXCEL_FILE not set. Cannot append rows.")
         return
-    df.to_excel(EXCEL_FILE, index=False)
+    storage.append_rows(_excel_file(), rows)
+    slot_index.on_rows_appended(_excel_file(), rows)
+
+def _slot_taken_response(date_rdv: str, time_rdv: str):
+    """Page d'alerte : créneau déjà réservé pour ce médecin."""
+    return render_template_string("""
+    <!DOCTYPE html><html><head>
+      <script src="https://cdn.jsdelivr.net/npm/sweetalert2@11"></script>
+    </head><body>
+      <script>
+        Swal.fire({
+          icon: 'warning',
+          title: 'Créneau déjà réservé',
+          text: 'Le rendez-vous du {{ date_rdv }} à {{ time_rdv }} pour le médecin sélectionné existe déjà.',
+          confirmButtonText: 'OK'
+        }).then(() => {
+          window.location.href = '{{ url_for("rdv.rdv_home") }}';
+        });
+      </script>
+    </body></html>
+    """, date_rdv=date_rdv, time_rdv=time_rdv)
+
+def _rdv_missing_response(title: str, text: str):
+    """Page d'alerte : le RDV visé n'existe pas (ou plus)."""
+    return render_template_string("""
+    <!DOCTYPE html><html><head>
+      <script src="https://cdn.jsdelivr.net/npm/sweetalert2@11"></script>
+    </head><body>
+      <script>
+        Swal.fire({
+          icon: 'warning',
+          title: {{ title|tojson }},
+          text: {{ text|tojson }},
+          confirmButtonText: 'OK'
+        }).then(() => {
+          window.location.href = '{{ url_for("rdv.rdv_home") }}';
+        });
+      </script>
+    </body></html>
+    """, title=title, text=text)
 
 def load_patients() -> dict:
     """Loads patients from DonneesRDV.xlsx for the datalist (patient_id)."""
@@ -205,43 +278,18 @@ rdv_bp = Blueprint("rdv", __name__, url_prefix="/rdv")
 # ------------------------------------------------------------------
 # TRANSFER TO CONSULTATION ROUTE
 # ------------------------------------------------------------------
-@rdv_bp.route("/consult/<int:index>", methods=["GET", "POST"])
-def consult_rdv(index):
+@rdv_bp.route("/consult/<int:row_id>", methods=["GET", "POST"])
+def consult_rdv(row_id):
     admin_email_from_session = session.get('admin_email', 'default_admin@example.com')
     utils.set_dynamic_base_dir(admin_email_from_session)
     set_rdv_dirs()
 
-    df_rdv = load_df()
-    if not (0 <= index < len(df_rdv)):
-        return render_template_string("""
-        <!DOCTYPE html><html><head>
-          <script src="https://cdn.jsdelivr.net/npm/sweetalert2@11"></script>
-        </head><body>
-          <script>
-            Swal.fire({
-              icon: 'warning',
-              title: 'Sélection invalide',
-              text: 'Le rendez-vous que vous tentez de consulter n\'existe pas.',
-              confirmButtonText: 'OK'
-            }).then(() => {
-              window.location.href = '{{ url_for("rdv.rdv_home") }}';
-            });
-          </script>
-        </body></html>
-        """)
-    rdv_row = df_rdv.iloc[index]
-
-    cols = [
-        "consultation_date", "patient_id", "patient_name", "nom", "prenom",
-        "date_of_birth", "gender", "age", "patient_phone", "antecedents",
-        "clinical_signs", "bp", "temperature", "heart_rate",
-        "respiratory_rate", "diagnosis", "medications", "analyses", "radiologies",
-        "certificate_category", "certificate_content", "rest_duration", "doctor_comment",
-        "consultation_id", "Medecin_Email"
-    ]
+    rdv_row = load_rdv(row_id)
+    if rdv_row is None:
+        return _rdv_missing_response('Sélection invalide', "Le rendez-vous que vous tentez de consulter n'existe pas.")
 
-    if CONSULT_FILE is None:
-        print("ERROR: CONSULT_FILE not set. Cannot access ConsultationData.xlsx.")
+    if _consult_file() is None:
+        log.error("CONSULT_FILE not set. Cannot access ConsultationData.xlsx.")
         return render_template_string("""
         <!DOCTYPE html><html><head>
           <script src="https://cdn.jsdelivr.net/npm/sweetalert2@11"></script>
@@ -259,14 +307,6 @@ def consult_rdv(index):
         </body></html>
         """)
 
-    if CONSULT_FILE.exists():
-        df_consult = pd.read_excel(CONSULT_FILE, dtype=str).fillna('')
-        for col in ["nom", "prenom", "Medecin_Email"]:
-            if col not in df_consult.columns:
-                df_consult[col] = ''
-    else:
-        df_consult = pd.DataFrame(columns=cols)
-
     form      = request.form
     med_list  = form.getlist("medications_list")
     anal_list = form.getlist("analyses_list")
@@ -307,12 +347,15 @@ def consult_rdv(index):
         "Medecin_Email":        medecin_email_from_rdv
     }
 
-    for col in new_row.keys():
-        if col not in df_consult.columns:
-            df_consult[col] = ''
+    # Le RDV est retiré en premier, par identifiant : un double envoi (ou une autre
+    # session) qui l'aurait déjà transféré ne crée pas une seconde consultation
+    if slot_index.release(_excel_file(), row_id) is None:
+        return _rdv_missing_response('Sélection invalide', "Le rendez-vous a déjà été transféré ou supprimé.")
 
-    df_consult = pd.concat([df_consult, pd.DataFrame([new_row])], ignore_index=True)
-    df_consult.to_excel(CONSULT_FILE, index=False)
+    # Ajout journalisé : ConsultationData n'est plus relue ni réécrite en entier
+    directory_before = utils.patient_directory_version()
+    storage.append_rows(_consult_file(), [new_row])
+    utils.update_patient_directory([new_row], directory_before)
 
     patient_base_data_from_rdv = pd.DataFrame([{
         "ID": rdv_row["ID"],
@@ -326,9 +369,6 @@ def consult_rdv(index):
     }])
     save_base_patient_df(patient_base_data_from_rdv)
 
-    df_rdv = df_rdv.drop(df_rdv.index[index]).reset_index(drop=True)
-    save_df(df_rdv)
-
     return render_template_string("""
     <!DOCTYPE html><html><head>
       <script src="https://cdn.jsdelivr.net/npm/sweetalert2@11"></script>
@@ -360,7 +400,7 @@ def rdv_home():
     theme_vars   = theme.current_theme()
     theme_names  = list(theme.THEMES.keys())
 
-    df       = load_df()
+    df       = load_df(row_ids=True)
     patients = load_base_patients()
 
     # Charger les médecins gérés par l'administrateur courant
@@ -377,7 +417,7 @@ def rdv_home():
         doctors.append({'email': admin_email_from_session, 'nom': nom_config, 'prenom': prenom_config})
 
     # 2. Ajouter les médecins ayant des comptes
-    all_users = login.load_users()
+    all_users = login.users_of_owner(admin_email_from_session, role='medecin')
     for email, user_data in all_users.items():
         # Vérifiez que l'utilisateur est un médecin et appartient à l'administrateur actuel
         if user_data.get('role') == 'medecin' and user_data.get('owner') == admin_email_from_session:
@@ -408,7 +448,7 @@ def rdv_home():
     current_date_for_slots = filt_date if filt_date else iso_today
 
     reserved_slots = df[df["Date"] == current_date_for_slots]["Heure"].tolist()
-    print(f"DEBUG: Créneaux réservés pour {current_date_for_slots} : {reserved_slots}")
+    log.debug("Créneaux réservés pour %s : %s", current_date_for_slots, reserved_slots)
 
     if request.method == "POST":
         f         = request.form
@@ -423,23 +463,8 @@ def rdv_home():
         time_rdv  = f.get("rdv_time", "").strip()
         medecin_email = f.get("medecin_select", "").strip()
 
-        if ((df["Date"] == date_rdv) & (df["Heure"] == time_rdv) & (df["Medecin_Email"] == medecin_email)).any():
-            return render_template_string("""
-            <!DOCTYPE html><html><head>
-              <script src="https://cdn.jsdelivr.net/npm/sweetalert2@11"></script>
-            </head><body>
-              <script>
-                Swal.fire({
-                  icon: 'warning',
-                  title: 'Créneau déjà réservé',
-                  text: 'Le rendez-vous du {{ date_rdv }} à {{ time_rdv }} pour le médecin sélectionné existe déjà.',
-                  confirmButtonText: 'OK'
-                }).then(() => {
-                  window.location.href = '{{ url_for("rdv.rdv_home") }}';
-                });
-              </script>
-            </body></html>
-            """, date_rdv=date_rdv, time_rdv=time_rdv)
+        if slot_index.is_reserved(_excel_file(), date_rdv, medecin_email, time_rdv):
+            return _slot_taken_response(date_rdv, time_rdv)
 
         # 2. NOUVELLE VÉRIFICATION (MISE À JOUR)
         # Un patient ne peut pas avoir 2 RDV le même jour AVEC LE MÊME MÉDECIN
@@ -560,12 +585,8 @@ def rdv_home():
             </body></html>
             """, pid=pid, patient_name_exist=patients[pid]['name'])
 
-        if pid in df["ID"].values:
-            idx_to_update = df[df["ID"] == pid].index
-            df.loc[idx_to_update, [
-                "Nom", "Prenom", "DateNaissance", "Sexe", "Âge", "Téléphone", "Antécédents"
-            ]] = [nom, prenom, dob_str, gender, age_text, phone, ant]
-        
+        patient_deja_planifie = pid in df["ID"].values
+
         num_ord = utils.calculate_order_number(
             time_rdv, rdv_start_time, rdv_interval_minutes
         )
@@ -583,11 +604,19 @@ def rdv_home():
             "Heure": time_rdv,
             "Medecin_Email": medecin_email
         }
-        new_rdv_row_df = pd.DataFrame([new_rdv_row_data], columns=df.columns)
+        new_rdv_row = pd.DataFrame([new_rdv_row_data], columns=df.columns).iloc[0].to_dict()
+
+        # Réservation atomique : un autre poste (ou la prise de RDV publique) a pu
+        # prendre ce créneau depuis la vérification ci-dessus
+        if not slot_index.reserve(_excel_file(), new_rdv_row):
+            return _slot_taken_response(date_rdv, time_rdv)
 
-        df = pd.concat([df, new_rdv_row_df], ignore_index=True)
-        df.drop_duplicates(subset=["ID","Date","Heure", "Medecin_Email"], keep="last", inplace=True)
-        save_df(df)
+        if patient_deja_planifie:
+            # Coordonnées du patient mises à jour en place sur ses autres RDV (sans réécrire la feuille)
+            storage.update_rows(_excel_file(), {"ID": pid}, {
+                "Nom": nom, "Prenom": prenom, "DateNaissance": dob_str, "Sexe": gender,
+                "Âge": age_text, "Téléphone": phone, "Antécédents": ant
+            })
 
         patient_base_data = pd.DataFrame([{
             "ID": pid,
@@ -621,22 +650,10 @@ def rdv_home():
     df_view   = df[df["Date"] == filt_date] if filt_date else df
     df_view   = df_view.sort_values("Num Ordre", key=lambda s: pd.to_numeric(s, errors="coerce"))
 
-    # MODIFICATION COMMENCE ICI pour rdv_home: Préparez les données pour le tableau principal
-    df_for_template = []
-    for original_df_index, row_series in df_view.iterrows():
-        row_dict = row_series.to_dict()
-        row_dict['original_df_index'] = original_df_index # Ajoutez l'index original
-        df_for_template.append(row_dict)
-    # MODIFICATION FINIT ICI pour rdv_home
-
-    # MODIFICATION COMMENCE ICI POUR today_rdv dans rdv_home
+    # Chaque ligne porte son identifiant stable (_row_id) pour les liens consulter/modifier/supprimer
+    df_for_template = df_view.to_dict(orient="records")
     temp_today_rdv_df = df[(df["Date"] == iso_today)].sort_values("Num Ordre", key=lambda s: pd.to_numeric(s, errors="coerce"))
-    today_rdv_for_template = []
-    for original_df_index_today, row_series_today in temp_today_rdv_df.iterrows():
-        row_dict_today = row_series_today.to_dict()
-        row_dict_today['original_df_index'] = original_df_index_today # Ajoutez l'index original
-        today_rdv_for_template.append(row_dict_today)
-    # MODIFICATION FINIT ICI POUR today_rdv dans rdv_home
+    today_rdv_for_template = temp_today_rdv_df.to_dict(orient="records")
 
     today     = datetime.now().strftime("%d/%m/%Y")
 
@@ -644,8 +661,7 @@ def rdv_home():
     user_email = session.get('email')
 
     if user_email:
-        all_users_data = login.load_users()
-        user_info = all_users_data.get(user_email)
+        user_info = login.get_user(user_email)
         if user_info:
             logged_in_full_name = f"{user_info.get('prenom', '')} {user_info.get('nom', '')}".strip()
             if not logged_in_full_name:
@@ -658,14 +674,14 @@ def rdv_home():
         theme_names=theme_names,
         patients=patients,
         doctors=doctors,
-        df=df_for_template, # Passez la nouvelle liste de dictionnaires avec l'index original
+        df=df_for_template,
         timeslots=all_available_timeslots,
         today=today,
         iso_today=iso_today,
         filt_date=filt_date,
         enumerate=enumerate,
         reserved_slots=reserved_slots,
-        today_rdv=today_rdv_for_template, # Passez la nouvelle liste de dictionnaires pour le RDV du jour
+        today_rdv=today_rdv_for_template,
         logged_in_doctor_name=logged_in_full_name
     )
 
@@ -715,7 +731,7 @@ def pdf_today():
         headers = ["ID", "Nom", "Prénom", "Âge", "Téléphone", "Antécédents", "Date", "Heure", "Médecin", "Num Ordre"]
         data = []
         admin_email = session.get('admin_email', 'default_admin@example.com')
-        all_users = login.load_users().items()
+        all_users = login.users_of_owner(admin_email, role='medecin').items()
         
         doctor_names_map = {
             u_email: f"{u_data.get('prenom', '').strip()} {u_data.get('nom', '').strip()}"
@@ -745,8 +761,8 @@ def pdf_today():
 
         today_str = today.strftime("%d-%m-%Y")
         
-        if PDF_DIR is None:
-            print("ERROR: PDF_DIR not set. Cannot save PDF.")
+        if _pdf_dir() is None:
+            log.error("PDF_DIR not set. Cannot save PDF.")
             return render_template_string("""
             <!DOCTYPE html><html><head>
               <script src="https://cdn.jsdelivr.net/npm/sweetalert2@11"></script>
@@ -764,47 +780,48 @@ def pdf_today():
             </body></html>
             """)
 
-        pdf_path = PDF_DIR / f"RDV_du_{today_str.replace('-', '')}.pdf"
-        
-        pdf = FPDF(orientation='L', unit='mm', format='A4')
+        pdf_path = _pdf_dir() / f"RDV_du_{today_str.replace('-', '')}.pdf"
         
-        try:
-            font_path = 'C:\\Windows\\Fonts\\arial.ttf'
-            if not os.path.exists(font_path):
-                print(f"WARNING: Arial font file not found at {font_path}. Attempting to use default FPDF fonts.")
+        with timing.phase("pdf"):
+            pdf = FPDF(orientation='L', unit='mm', format='A4')
+
+            try:
+                font_path = 'C:\\Windows\\Fonts\\arial.ttf'
+                if not os.path.exists(font_path):
+                    log.warning("Arial font file not found at %s. Attempting to use default FPDF fonts.", font_path)
+                    pdf.set_font("Helvetica", size=20)
+                else:
+                    pdf.add_font('Arial', '', font_path, uni=True)
+                    pdf.set_font("Arial", size=20)
+            except Exception as font_e:
+                log.warning("Could not load Arial font from specified path. Falling back to default. Error: %s", font_e)
                 pdf.set_font("Helvetica", size=20)
-            else:
-                pdf.add_font('Arial', '', font_path, uni=True)
-                pdf.set_font("Arial", size=20)
-        except Exception as font_e:
-            print(f"WARNING: Could not load Arial font from specified path. Falling back to default. Error: {font_e}")
-            pdf.set_font("Helvetica", size=20)
-
-        pdf.add_page()
-        pdf.set_font("Arial", size=20, style='B')
-        pdf.cell(0, 10, txt=f"RDV du {today.strftime('%d/%m/%Y')}", ln=True, align='C')
-        pdf.ln(5)
-
-        col_widths = calculate_pdf_column_widths(headers, data, pdf)
-
-        pdf.set_font("Arial", size=12, style='B')
-        for i, header in enumerate(headers):
-            pdf.cell(col_widths[i], 10, header, border=1, align='C')
-        pdf.ln()
-
-        pdf.set_font("Arial", size=12)
-        for row in data:
-            for i, item in enumerate(row):
-                text = str(item)
-                align = 'C' if headers[i] in ["ID", "Âge", "Téléphone", "Date", "Heure", "Num Ordre"] else 'L'
-                pdf.cell(col_widths[i], 8, text, border=1, align=align)
+
+            pdf.add_page()
+            pdf.set_font("Arial", size=20, style='B')
+            pdf.cell(0, 10, txt=f"RDV du {today.strftime('%d/%m/%Y')}", ln=True, align='C')
+            pdf.ln(5)
+
+            col_widths = calculate_pdf_column_widths(headers, data, pdf)
+
+            pdf.set_font("Arial", size=12, style='B')
+            for i, header in enumerate(headers):
+                pdf.cell(col_widths[i], 10, header, border=1, align='C')
             pdf.ln()
 
-        pdf.output(str(pdf_path), 'F')
+            pdf.set_font("Arial", size=12)
+            for row in data:
+                for i, item in enumerate(row):
+                    text = str(item)
+                    align = 'C' if headers[i] in ["ID", "Âge", "Téléphone", "Date", "Heure", "Num Ordre"] else 'L'
+                    pdf.cell(col_widths[i], 8, text, border=1, align=align)
+                pdf.ln()
+
+            pdf.output(str(pdf_path), 'F')
         return send_file(str(pdf_path), as_attachment=True, download_name=pdf_path.name)
 
     except Exception as e:
-        print(f"ERROR: Full PDF generation error: {e}")
+        log.error("Full PDF generation error: %s", e)
         return render_template_string("""
         <!DOCTYPE html><html><head>
           <script src="https://cdn.jsdelivr.net/npm/sweetalert2@11"></script>
@@ -848,8 +865,8 @@ def calculate_pdf_column_widths(headers, data, pdf: FPDF):
 # ------------------------------------------------------------------
 # MODIFY AN APPOINTMENT
 # ------------------------------------------------------------------
-@rdv_bp.route("/edit/<int:index>", methods=["GET", "POST"])
-def edit_rdv(index):
+@rdv_bp.route("/edit/<int:row_id>", methods=["GET", "POST"])
+def edit_rdv(row_id):
     admin_email_from_session = session.get('admin_email', 'default_admin@example.com')
     utils.set_dynamic_base_dir(admin_email_from_session)
     set_rdv_dirs()
@@ -873,7 +890,7 @@ def edit_rdv(index):
         doctors.append({'email': admin_email_from_session, 'nom': nom_config, 'prenom': prenom_config})
 
     # 2. Ajouter les médecins ayant des comptes
-    all_users = login.load_users()
+    all_users = login.users_of_owner(admin_email_from_session, role='medecin')
     for email, user_data in all_users.items():
         if user_data.get('role') == 'medecin' and user_data.get('owner') == admin_email_from_session:
             is_duplicate = False
@@ -896,30 +913,9 @@ def edit_rdv(index):
         rdv_start_time, rdv_end_time, rdv_interval_minutes
     )
 
-    df = load_df()
-    filt_date = request.args.get("date", "")
-    df_view   = df[df["Date"] == filt_date] if filt_date else df
-    df_view   = df_view.sort_values("Num Ordre", key=lambda s: pd.to_numeric(s, errors="coerce"))
-    today     = datetime.now().strftime("%d/%m/%Y")
-    iso_today = datetime.now().strftime("%Y-%m-%d")
-
-    if not (0 <= index < len(df)):
-        return render_template_string("""
-        <!DOCTYPE html><html><head>
-          <script src="https://cdn.jsdelivr.net/npm/sweetalert2@11"></script>
-        </head><body>
-          <script>
-            Swal.fire({
-              icon: 'warning',
-              title: 'RDV introuvable',
-              text: 'Le rendez-vous que vous tentez de modifier n\'existe pas.',
-              confirmButtonText: 'OK'
-            }).then(() => {
-              window.location.href = '{{ url_for("rdv.rdv_home") }}';
-            });
-          </script>
-        </body></html>
-        """)
+    edit_row = load_rdv(row_id)
+    if edit_row is None:
+        return _rdv_missing_response('RDV introuvable', "Le rendez-vous que vous tentez de modifier n'existe pas.")
 
     if request.method == "POST":
         f = request.form
@@ -940,11 +936,11 @@ def edit_rdv(index):
                   text: 'Veuillez remplir tous les champs du formulaire, y compris le médecin.',
                   confirmButtonText: 'OK'
                 }).then(() => {
-                  window.location.href = '{{ url_for("rdv.edit_rdv", index=index) }}';
+                  window.location.href = '{{ url_for("rdv.edit_rdv", row_id=row_id) }}';
                 });
               </script>
             </body></html>
-            """, index=index)
+            """, row_id=row_id)
 
         dob_date = datetime.strptime(f["patient_dob"], "%Y-%m-%d").date()
         age_text = compute_age_str(dob_date)
@@ -952,20 +948,26 @@ def edit_rdv(index):
             f["rdv_time"], rdv_start_time, rdv_interval_minutes
         )
 
-        df.at[index, "ID"]            = f["patient_id"]
-        df.at[index, "Nom"]           = f["patient_nom"]
-        df.at[index, "Prenom"]        = f["patient_prenom"]
-        df.at[index, "Sexe"]          = f["patient_gender"]
-        df.at[index, "DateNaissance"] = f["patient_dob"]
-        df.at[index, "Âge"]           = age_text
-        df.at[index, "Antécédents"]   = f["patient_ant"]
-        df.at[index, "Téléphone"]     = f["patient_phone"]
-        df.at[index, "Date"]          = f["rdv_date"]
-        df.at[index, "Heure"]         = f["rdv_time"]
-        df.at[index, "Num Ordre"]     = num_ord
-        df.at[index, "Medecin_Email"] = f["medecin_select"]
-
-        save_df(df)
+        # Mise à jour en place de cette ligne seulement : les RDV ajoutés entre-temps
+        # ne sont pas écrasés, et le nouveau créneau est réservé atomiquement
+        changed = slot_index.move(_excel_file(), edit_row.to_dict(), {
+            "ID":            f["patient_id"],
+            "Nom":           f["patient_nom"],
+            "Prenom":        f["patient_prenom"],
+            "Sexe":          f["patient_gender"],
+            "DateNaissance": f["patient_dob"],
+            "Âge":           age_text,
+            "Antécédents":   f["patient_ant"],
+            "Téléphone":     f["patient_phone"],
+            "Date":          f["rdv_date"],
+            "Heure":         f["rdv_time"],
+            "Num Ordre":     num_ord,
+            "Medecin_Email": f["medecin_select"],
+        })
+        if changed is None:
+            return _slot_taken_response(f["rdv_date"], f["rdv_time"])
+        if not changed:
+            return _rdv_missing_response('RDV introuvable', 'Le rendez-vous a été modifié ou supprimé entre-temps.')
         return render_template_string("""
         <!DOCTYPE html><html><head>
           <script src="https://cdn.jsdelivr.net/npm/sweetalert2@11"></script>
@@ -983,7 +985,13 @@ def edit_rdv(index):
         </body></html>
         """)
 
-    edit_row = df.iloc[index]
+    df = load_df(row_ids=True)
+    filt_date = request.args.get("date", "")
+    df_view   = df[df["Date"] == filt_date] if filt_date else df
+    df_view   = df_view.sort_values("Num Ordre", key=lambda s: pd.to_numeric(s, errors="coerce"))
+    today     = datetime.now().strftime("%d/%m/%Y")
+    iso_today = datetime.now().strftime("%Y-%m-%d")
+
     edit_date = edit_row["Date"]
     all_rdv = df.to_dict(orient="records")
     reserved_slots = [
@@ -991,22 +999,9 @@ def edit_rdv(index):
         if r["Date"] == edit_date and r["Heure"] != edit_row["Heure"] and r["Medecin_Email"] == edit_row["Medecin_Email"]
     ]
 
-    # MODIFICATION COMMENCE ICI pour edit_rdv: Préparez les données pour le tableau principal
-    df_for_edit_template = []
-    for original_df_index, row_series in df_view.iterrows():
-        row_dict = row_series.to_dict()
-        row_dict['original_df_index'] = original_df_index # Ajoutez l'index original
-        df_for_edit_template.append(row_dict)
-    # MODIFICATION FINIT ICI pour edit_rdv
-
-    # MODIFICATION COMMENCE ICI POUR today_rdv dans edit_rdv
+    df_for_edit_template = df_view.to_dict(orient="records")
     temp_today_rdv_df_edit = df[(df["Date"] == iso_today)].sort_values("Num Ordre", key=lambda s: pd.to_numeric(s, errors="coerce"))
-    today_rdv_for_edit_template = []
-    for original_df_index_today_edit, row_series_today_edit in temp_today_rdv_df_edit.iterrows():
-        row_dict_today_edit = row_series_today_edit.to_dict()
-        row_dict_today_edit['original_df_index'] = original_df_index_today_edit # Ajoutez l'index original
-        today_rdv_for_edit_template.append(row_dict_today_edit)
-    # MODIFICATION FINIT ICI POUR today_rdv dans edit_rdv
+    today_rdv_for_edit_template = temp_today_rdv_df_edit.to_dict(orient="records")
 
     return render_template_string(
         rdv_template,
@@ -1015,28 +1010,28 @@ def edit_rdv(index):
         theme_names=theme_names,
         patients=patients,
         doctors=doctors,
-        df=df_for_edit_template, # Utilisez la nouvelle liste de dictionnaires avec l'index original
+        df=df_for_edit_template,
         timeslots=all_available_timeslots,
         today=today,
         iso_today=iso_today,
         filt_date=filt_date,
         enumerate=enumerate,
-        edit_index=index,
+        edit_index=row_id,
         edit_row=edit_row,
         reserved_slots=reserved_slots,
-        today_rdv=today_rdv_for_edit_template # Utilisez la version corrigée de today_rdv
+        today_rdv=today_rdv_for_edit_template
     )
 
 # ------------------------------------------------------------------
 # LOAD PATIENT_INFO
 # ------------------------------------------------------------------
 def load_base_patient_df() -> pd.DataFrame:
-    if BASE_PATIENT_FILE is None:
-        print("ERROR: BASE_PATIENT_FILE not set. Cannot load base patient dataframe.")
+    if _base_patient_file() is None:
+        log.error("BASE_PATIENT_FILE not set. Cannot load base patient dataframe.")
         return pd.DataFrame()
-    if not BASE_PATIENT_FILE.exists():
+    if not _base_patient_file().exists():
         initialize_base_patient_file()
-    return pd.read_excel(BASE_PATIENT_FILE, dtype=str)
+    return storage.read_excel(_base_patient_file(), dtype=str)
 
 def load_base_patients() -> dict:
     patients = {}
@@ -1089,48 +1084,35 @@ def get_reserved_slots():
     if not date_param or not medecin_email_param:
         return jsonify({"error": "Date or doctor email parameter is missing"}), 400
 
-    df = load_df()
-    reserved_slots = df[(df["Date"] == date_param) & (df["Medecin_Email"] == medecin_email_param)]["Heure"].tolist()
-    
+    if not storage.exists(_excel_file()):
+        initialize_excel_file()
+    # Index (date, médecin) -> heures réservées : pas de relecture du classeur
+    reserved_slots = slot_index.reserved_slots(_excel_file(), date_param, medecin_email_param)
+
     all_possible_slots = utils.generate_time_slots(
         rdv_start_time, rdv_end_time, rdv_interval_minutes
     )
+    busy = slot_index.busy_bitmap(_excel_file(), date_param, medecin_email_param, all_possible_slots)
+    free = ~busy & ((1 << len(all_possible_slots)) - 1)
 
     return jsonify({
         "reserved_slots": reserved_slots,
-        "all_possible_slots": all_possible_slots
+        "all_possible_slots": all_possible_slots,
+        "busy_bitmap": slot_index.bitmap_string(busy, len(all_possible_slots)),
+        "free_bitmap": slot_index.bitmap_string(free, len(all_possible_slots))
     })
     
-@rdv_bp.route("/delete/<int:index>", methods=["POST"]) # MODIFIÉ: Ajout de methods=["POST"]
-def delete_rdv(index):
+@rdv_bp.route("/delete/<int:row_id>", methods=["POST"]) # MODIFIÉ: Ajout de methods=["POST"]
+def delete_rdv(row_id):
     # Assurez-vous que les répertoires dynamiques sont définis
     admin_email_from_session = session.get('admin_email', 'default_admin@example.com')
     utils.set_dynamic_base_dir(admin_email_from_session)
     set_rdv_dirs()
 
-    df = load_df()
-
-    if not (0 <= index < len(df)):
-        return render_template_string("""
-        <!DOCTYPE html><html><head>
-          <script src="https://cdn.jsdelivr.net/npm/sweetalert2@11"></script>
-        </head><body>
-          <script>
-            Swal.fire({
-              icon: 'warning',
-              title: 'RDV introuvable',
-              text: 'Le rendez-vous que vous tentez de supprimer n\'existe pas.',
-              confirmButtonText: 'OK'
-            }).then(() => {
-              window.location.href = '{{ url_for("rdv.rdv_home") }}';
-            });
-          </script>
-        </body></html>
-        """)
-
     try:
-        df = df.drop(df.index[index]).reset_index(drop=True)
-        save_df(df)
+        # Suppression de cette seule ligne, par identifiant stable
+        if slot_index.release(_excel_file(), row_id) is None:
+            return _rdv_missing_response('RDV introuvable', "Le rendez-vous que vous tentez de supprimer n'existe pas.")
         return render_template_string("""
         <!DOCTYPE html><html><head>
           <script src="https://cdn.jsdelivr.net/npm/sweetalert2@11"></script>
@@ -1148,7 +1130,7 @@ def delete_rdv(index):
         </body></html>
         """)
     except Exception as e:
-        print(f"ERROR: Erreur lors de la suppression du RDV à l'index {index}: {e}")
+        log.error("Erreur lors de la suppression du RDV %s: %s", row_id, e)
         return render_template_string("""
         <!DOCTYPE html><html><head>
           <script src="https://cdn.jsdelivr.net/npm/sweetalert2@11"></script>
@@ -1926,7 +1908,7 @@ rdv_template = r"""
             <div class="calendar-slot">
               <span class="time">{{ r["Heure"] }}</span>
               <span class="patient-info">{{ r["Nom"] }} {{ r["Prenom"] }} - {{ r["Medecin_Email"] }}</span>
-              <a href="{{ url_for('rdv.consult_rdv', index=r.original_df_index) }}" {# C'EST LE CHANGEMENT CLÉ #}
+              <a href="{{ url_for('rdv.consult_rdv', row_id=r['_row_id']) }}"
                  class="btn btn-sm btn-success btn-consult" title="Passer à la consultation" data-bs-toggle="tooltip">
                 <i class="fas fa-stethoscope" style="color: #FFFFFF;"></i>Consultation
               </a>
@@ -1952,7 +1934,7 @@ rdv_template = r"""
               </tr>
             </thead>
             <tbody>
-              {# IMPORTANT: Ici, la boucle utilise 'r' et non 'idx, r' car 'df' est maintenant une liste de dictionnaires avec 'original_df_index' #}
+              {# 'df' est une liste de dictionnaires ; r['_row_id'] est l'identifiant stable du RDV #}
               {% for r in df %}
               <tr>
                 {# Utilisez loop.index0 pour le numéro de ligne affiché si vous voulez un index séquentiel #}
@@ -1960,16 +1942,16 @@ rdv_template = r"""
                 <td>{{ r["Âge"] }}</td><td>{{ r["Téléphone"] }}</td><td>{{ r["Antécédents"] }}</td>
                 <td>{{ r["Date"] }}</td><td>{{ r["Heure"] }}</td><td>{{ r["Medecin_Email"] }}</td>
                 <td>{{ r["Num Ordre"] }}</td><td class="text-center">
-                  <a href="{{ url_for('rdv.consult_rdv', index=r.original_df_index) }}"
+                  <a href="{{ url_for('rdv.consult_rdv', row_id=r['_row_id']) }}"
                      class="btn btn-sm btn-success me-1" title="Consultation" data-bs-toggle="tooltip">
                     <i class="fas fa-stethoscope" style="color: #FFFFFF;"></i>
                   </a>
-                  <a href="{{ url_for('rdv.edit_rdv', index=r.original_df_index) }}"
+                  <a href="{{ url_for('rdv.edit_rdv', row_id=r['_row_id']) }}"
                      class="btn btn-sm btn-warning me-1" title="Modifier" data-bs-toggle="tooltip">
                     <i class="fas fa-pen" style="color: #FFFFFF;"></i>
                   </a>
                   <button class="btn btn-sm btn-danger me-1 delete-rdv-btn"
-                          data-index="{{ r.original_df_index }}"
+                          data-row-id="{{ r['_row_id'] }}"
                           title="Supprimer" data-bs-toggle="tooltip">
                     <i class="fas fa-trash" style="color: #FFFFFF;"></i> {# MODIFIÉ: Icône de poubelle blanche #}
                   </button>
@@ -2214,7 +2196,7 @@ document.getElementById('patient_id').addEventListener('change',function(){
   document.querySelectorAll('.delete-rdv-btn').forEach(button => {
     button.addEventListener('click', function(e) {
       e.preventDefault();
-      const indexToDelete = this.dataset.index;
+      const rowIdToDelete = this.dataset.rowId;
       
       // Récupérer les informations du patient pour le message de confirmation
       // Assurez-vous que les cellules du tableau sont dans le bon ordre ou utilisez des data-attributs plus spécifiques
@@ -2225,7 +2207,7 @@ document.getElementById('patient_id').addEventListener('change',function(){
       const rdvHeure = row.children[9].textContent;      // Colonne Heure
       
       const message = `Voulez-vous vraiment supprimer le rendez-vous de ${patientNom} ${patientPrenom} le ${rdvDate} à ${rdvHeure} ?`;
-      const confirmUrl = `/rdv/delete/${indexToDelete}`; // L'URL pour la route de suppression
+      const confirmUrl = `/rdv/delete/${rowIdToDelete}`; // L'URL pour la route de suppression
 
       Swal.fire({
         title: 'Êtes-vous sûr ?',
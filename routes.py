@@ -2,6 +2,7 @@
 from __future__ import annotations
 
 import os
+import logging
 import pandas as pd
 import uuid
 from datetime import datetime
@@ -11,16 +12,22 @@ from pathlib import Path
 # Dépendances internes
 import utils
 import theme
+import storage
+import timing
 from templates import (
     main_template,
     settings_template,
     alert_template,
 )
 from flask import (
-    request, render_template_string, redirect, url_for,
+    request, redirect, url_for,
     send_file, flash, jsonify, session, current_app
 )
+from template_cache import render_template_string
 import login # Importe le module login pour accéder aux données des utilisateurs
+import logs
+
+log = logs.get_logger(__name__)
 
 # LISTS_FILE reste statique comme demandé, il ne dépend PAS de l'e-mail de l'admin.
 # Ce chemin est relatif au fichier routes.py
@@ -33,9 +40,9 @@ LISTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Liste_Med
 def _config() -> Dict:
     """Charge la configuration de l'application."""
     # utils.load_config() utilisera implicitement le chemin défini dynamiquement par le before_request in app.py
-    print(f"DEBUG (routes.py - _config): Tentative de chargement de la config depuis {utils.CONFIG_FILE}")
+    log.debug("Tentative de chargement de la config depuis %s", utils.CONFIG_FILE)
     cfg = utils.load_config()
-    print(f"DEBUG (routes.py - _config): Config chargée: {cfg.keys()}")
+    log.debug("Config chargée: %s", cfg.keys())
     return cfg
 
 # ---------------------------------------------------------------------------
@@ -45,16 +52,16 @@ def _config() -> Dict:
 def register_routes(app):
     """Attache toutes les routes à l'instance Flask passée en argument."""
 
-    print(f"DEBUG (routes.py): Enregistrement des routes Flask.")
+    log.debug("Enregistrement des routes Flask.")
 
     # ---------------------------------------------------------------------
     #  PAGE PRINCIPALE – ENREGISTREMENT CONSULTATION
     # ---------------------------------------------------------------------
     @app.route("/consultation", methods=["GET", "POST"])
     def index():
-        print(f"DEBUG (routes.py): Accès à la route /consultation (méthode: {request.method})")
+        log.debug("Accès à la route /consultation (méthode: %s)", request.method)
         config = _config() # Utilise les chemins définis dynamiquement
-        utils.load_patient_data() # Charger les données patient à chaque chargement de la page
+        utils.load_patient_data() # Annuaire patients (reconstruit seulement si les classeurs ont changé)
         theme_names = list(theme.THEMES.keys())
         # utils.background_file est déjà mis à jour par utils.init_app lors du before_request
 
@@ -68,7 +75,7 @@ def register_routes(app):
 
         if admin_email_for_path:
             utils.set_dynamic_base_dir(admin_email_for_path)
-            all_users_data = login.load_users() # Charger tous les utilisateurs pour cet admin
+            all_users_data = login.users_of_owner(admin_email_for_path, role='medecin') # Médecins de cet admin (index par propriétaire)
 
             # 1. Ajouter le nom du médecin défini par l'admin dans la config (s'il existe)
             #    et s'assurer qu'il est ajouté en premier ou qu'il ne soit pas en double avec les comptes existants
@@ -88,7 +95,7 @@ def register_routes(app):
 
             # Déterminer le nom complet de l'utilisateur connecté pour l'affichage dans le header
             if user_email:
-                user_info = all_users_data.get(user_email)
+                user_info = login.get_user(user_email)
                 if user_info:
                     logged_in_full_name = f"{user_info.get('prenom', '')} {user_info.get('nom', '')}".strip()
                     if not logged_in_full_name:
@@ -103,18 +110,18 @@ def register_routes(app):
 
         if os.path.exists(LISTS_FILE):
             try:
-                df_lists = pd.read_excel(LISTS_FILE, sheet_name=0, dtype=str).fillna('')
+                df_lists = storage.read_excel(LISTS_FILE, sheet_name=0, dtype=str).fillna('')
                 if 'Medications' in df_lists.columns:
                     base_meds = df_lists['Medications'].dropna().astype(str).tolist()
                 if 'Analyses' in df_lists.columns:
                     base_analyses = df_lists['Analyses'].dropna().astype(str).tolist()
                 if 'Radiologies' in df_lists.columns:
                     base_radios = df_lists['Radiologies'].dropna().astype(str).tolist()
-                print(f"DEBUG (routes.py - index): Listes par défaut chargées depuis {LISTS_FILE}")
+                log.debug("Listes par défaut chargées depuis %s", LISTS_FILE)
             except Exception as e:
-                print(f"ERREUR (routes.py - index): Erreur lors du chargement de {LISTS_FILE}: {e}")
+                log.error("Erreur lors du chargement de %s: %s", LISTS_FILE, e)
         else:
-            print(f"DEBUG (routes.py - index): Fichier {LISTS_FILE} non trouvé. Utilisation des listes par défaut intégrées.")
+            log.debug("Fichier %s non trouvé. Utilisation des listes par défaut intégrées.", LISTS_FILE)
 
 
         # 2️⃣ Récupérer les ajouts du menu Paramètres
@@ -126,30 +133,30 @@ def register_routes(app):
         # Utilise utils.EXCEL_FILE_PATH qui est maintenant dynamique
         consult_file = Path(utils.EXCEL_FILE_PATH)
         last_consult = {}
-        if consult_file.exists():
+        if storage.exists(consult_file):
             try:
-                df_last = pd.read_excel(consult_file, sheet_name=0, dtype=str).fillna('')
+                df_last = storage.read_excel(consult_file, sheet_name=0, dtype=str).fillna('')
                 if not df_last.empty:
                     last_consult = df_last.iloc[-1].to_dict()
-                    print(f"DEBUG (routes.py - index): Dernière consultation chargée pour affichage.")
+                    log.debug("Dernière consultation chargée pour affichage.")
             except Exception as e:
-                print(f"ERREUR (routes.py - index): Erreur lors du chargement de la dernière consultation depuis {consult_file}: {e}")
+                log.error("Erreur lors du chargement de la dernière consultation depuis %s: %s", consult_file, e)
                 last_consult = {}
         else:
-            print(f"DEBUG (routes.py - index): Fichier de consultation {consult_file} non trouvé. Aucune dernière consultation à charger.")
+            log.debug("Fichier de consultation %s non trouvé. Aucune dernière consultation à charger.", consult_file)
 
 
         # 3️⃣ Fusionner Excel + Paramètres en supprimant les doublons
         meds_options = list(dict.fromkeys(base_meds + cfg_meds))
         analyses_options = list(dict.fromkeys(base_analyses + cfg_analyses))
         radiologies_options = list(dict.fromkeys(base_radios + cfg_radios))
-        print(f"DEBUG (routes.py - index): Options fusionnées: Médicaments={len(meds_options)}, Analyses={len(analyses_options)}, Radiologies={len(radiologies_options)}")
+        log.debug("Options fusionnées: Médicaments=%s, Analyses=%s, Radiologies=%s", len(meds_options), len(analyses_options), len(radiologies_options))
 
 
         saved_medications, saved_analyses, saved_radiologies = [], [], []
 
         if request.method == "POST":
-            print(f"DEBUG (routes.py - index): Traitement de la requête POST pour la consultation.")
+            log.debug("Traitement de la requête POST pour la consultation.")
             form_data = request.form.to_dict()
             consultation_date = request.form.get("consultation_date", datetime.now().strftime("%Y-%m-%d"))
             # Récupérer les listes multi-sélectionnées
@@ -176,7 +183,7 @@ def register_routes(app):
             rest_duration = utils.extract_rest_duration(certificate_full_content)
 
             if not patient_id:
-                print(f"ATTENTION (routes.py - index): ID Patient manquant lors de la soumission.")
+                log.warning("ID Patient manquant lors de la soumission.")
                 return render_template_string(
                     alert_template,
                     alert_type="warning",
@@ -187,9 +194,9 @@ def register_routes(app):
 
             # Vérification d'unicité ID/nom (dans ConsultationData.xlsx pour cohérence)
             # Utilise utils.EXCEL_FILE_PATH qui est maintenant dynamique
-            if os.path.exists(utils.EXCEL_FILE_PATH):
+            if storage.exists(utils.EXCEL_FILE_PATH):
                 try:
-                    df_existing_consult = pd.read_excel(utils.EXCEL_FILE_PATH, sheet_name=0, dtype=str).fillna('')
+                    df_existing_consult = storage.read_excel(utils.EXCEL_FILE_PATH, sheet_name=0, dtype=str).fillna('')
                     if patient_id in df_existing_consult["patient_id"].astype(str).tolist():
                         existing_entries_for_id = df_existing_consult[df_existing_consult["patient_id"].astype(str) == patient_id]
                         if not existing_entries_for_id.empty:
@@ -206,22 +213,24 @@ def register_routes(app):
                                 most_common_full_name = existing_entries_for_id['patient_name'].mode().iloc[0]
 
                             if most_common_full_name.strip().lower() != patient_name.strip().lower():
-                                print(f"ATTENTION (routes.py - index): Conflit ID patient. ID '{patient_id}' déjà associé à '{most_common_full_name}'.")
+                                log.warning("Conflit ID patient. ID '%s' déjà associé à '%s'.", patient_id, most_common_full_name)
                                 flash(f"L'ID patient '{patient_id}' est déjà associé à '{most_common_full_name}'. Veuillez utiliser ce nom ou un autre ID.", "error")
                                 return redirect(url_for(".index"))
                 except Exception as e:
-                    print(f"ERREUR (routes.py - index): Erreur lors de la vérification d'unicité dans {utils.EXCEL_FILE_PATH}: {e}")
+                    log.error("Erreur lors de la vérification d'unicité dans %s: %s", utils.EXCEL_FILE_PATH, e)
                     # Continuer le flux pour ne pas bloquer, mais le flash message est important.
                     flash(f"Erreur interne lors de la gestion de la consultation : {e}", "error")
 
 
             # Gestion de la fusion des données existantes (mise à jour de consultation existante)
             new_entry = True
+            written_rows = []  # lignes écrites, répercutées dans l'annuaire patients
+            directory_before = utils.patient_directory_version()  # lue avant toute écriture
             df = pd.DataFrame()
             # Utilise utils.EXCEL_FILE_PATH qui est maintenant dynamique
-            if os.path.exists(utils.EXCEL_FILE_PATH):
+            if storage.exists(utils.EXCEL_FILE_PATH):
                 try:
-                    df = pd.read_excel(utils.EXCEL_FILE_PATH, sheet_name=0, dtype=str).fillna('')
+                    df = storage.read_excel(utils.EXCEL_FILE_PATH, sheet_name=0, dtype=str).fillna('')
                     df['date_obj'] = pd.to_datetime(df['consultation_date'].astype(str).str[:10], errors='coerce').dt.date
                     current_date_obj = datetime.strptime(consultation_date, "%Y-%m-%d").date()
 
@@ -231,7 +240,7 @@ def register_routes(app):
                     if not existing_entries.empty:
                         new_entry = False
                         idx = existing_entries.index[0]
-                        print(f"DEBUG (routes.py - index): Mise à jour d'une consultation existante pour ID {patient_id} à la date {consultation_date}.")
+                        log.debug("Mise à jour d'une consultation existante pour ID %s à la date %s.", patient_id, consultation_date)
 
                         def merge_items(existing, new_items_list):
                             existing_str = str(existing) if pd.notna(existing) else ''
@@ -264,17 +273,18 @@ def register_routes(app):
                             df.at[idx, 'certificate_content'] = ''
 
                         df.drop('date_obj', axis=1, inplace=True)
-                        df.to_excel(utils.EXCEL_FILE_PATH, index=False)
+                        storage.to_excel(df, utils.EXCEL_FILE_PATH)
+                        written_rows.append(df.loc[idx].to_dict())
                         flash("Consultation mise à jour avec succès", "success")
                     else:
-                        print(f"DEBUG (routes.py - index): Aucune consultation existante trouvée pour ID {patient_id} à la date {consultation_date}.")
+                        log.debug("Aucune consultation existante trouvée pour ID %s à la date %s.", patient_id, consultation_date)
                 except Exception as e:
-                    print(f"ERREUR (routes.py - index): Erreur lors de la lecture ou de la mise à jour de {utils.EXCEL_FILE_PATH}: {e}")
+                    log.error("Erreur lors de la lecture ou de la mise à jour de %s: %s", utils.EXCEL_FILE_PATH, e)
                     flash(f"Erreur interne lors de la gestion de la consultation : {e}", "error")
 
 
             if new_entry:
-                print(f"DEBUG (routes.py - index): Création d'une nouvelle consultation pour ID {patient_id}.")
+                log.debug("Création d'une nouvelle consultation pour ID %s.", patient_id)
                 new_row = {
                     "consultation_date": consultation_date,
                     "patient_id": patient_id,
@@ -303,46 +313,31 @@ def register_routes(app):
                     "Medecin_Email": user_email # Enregistre l'email du médecin connecté
                 }
 
-                required_cols_for_df = [
-                    "consultation_date", "patient_id", "patient_name", "nom", "prenom",
-                    "date_of_birth", "gender", "age", "patient_phone", "antecedents",
-                    "clinical_signs", "bp", "temperature", "heart_rate", "respiratory_rate",
-                    "diagnosis", "medications", "analyses", "radiologies",
-                    "certificate_category", "certificate_content", "rest_duration",
-                    "doctor_comment", "consultation_id", "Medecin_Email" # Ajout de Medecin_Email
-                ]
-                # S'assurer que toutes les colonnes nécessaires existent dans le DataFrame avant d'ajouter une nouvelle ligne
-                if df.empty:
-                    df = pd.DataFrame(columns=required_cols_for_df)
-                else:
-                    for col in required_cols_for_df:
-                        if col not in df.columns:
-                            df[col] = ''
-                
-                df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-
-                df.to_excel(utils.EXCEL_FILE_PATH, index=False)
+                # Ajout en O(1) dans le journal : la feuille n'est plus réécrite en entier
+                # (les colonnes manquantes sont ajoutées par storage)
+                storage.append_rows(utils.EXCEL_FILE_PATH, [new_row])
+                written_rows.append(new_row)
                 flash("Nouvelle consultation enregistrée", "success")
 
             session['prefill_suivi_patient_id'] = patient_id
             session['prefill_suivi_patient_name'] = patient_name
 
-            # Recharger les données patient après modification
-            utils.load_patient_data()
+            # Répercuter la consultation dans l'annuaire patients (sans tout relire)
+            utils.update_patient_directory(written_rows, directory_before)
             saved_medications, saved_analyses, saved_radiologies = medication_list, analyses_list, radiologies_list
 
         # 4️⃣ Lecture des données pour l'affichage (après POST ou pour GET)
         consult_path = Path(utils.EXCEL_FILE_PATH)
         df_consult = pd.DataFrame()
-        if consult_path.exists():
+        if storage.exists(consult_path):
             try:
-                df_consult = pd.read_excel(consult_path, sheet_name=0, dtype=str).fillna('')
-                print(f"DEBUG (routes.py - index): Données de consultation lues depuis {consult_path} pour l'affichage du tableau.")
+                df_consult = storage.read_excel(consult_path, sheet_name=0, dtype=str).fillna('')
+                log.debug("Données de consultation lues depuis %s pour l'affichage du tableau.", consult_path)
             except Exception as e:
-                print(f"ERREUR (routes.py - index): Erreur lors du chargement de df_consult depuis {consult_path}: {e}")
+                log.error("Erreur lors du chargement de df_consult depuis %s: %s", consult_path, e)
                 df_consult = pd.DataFrame()
         else:
-            print(f"DEBUG (routes.py - index): Fichier de consultation {consult_path} non trouvé pour l'affichage du tableau.")
+            log.debug("Fichier de consultation %s non trouvé pour l'affichage du tableau.", consult_path)
 
 
         consult_rows = df_consult.to_dict(orient="records")
@@ -362,8 +357,9 @@ def register_routes(app):
             }
             for pid in utils.patient_ids
         }
-        print(f"DEBUG (routes.py - index): patient_ids pour datalist: {utils.patient_ids[:5]}...")
-        print(f"DEBUG (routes.py - index): patient_names pour datalist: {utils.patient_names[:5]}...")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("patient_ids pour datalist: %s...", utils.patient_ids[:5])
+            log.debug("patient_names pour datalist: %s...", utils.patient_names[:5])
 
 
         prefill_suivi_patient_id = session.pop('prefill_suivi_patient_id', None)
@@ -402,10 +398,10 @@ def register_routes(app):
     # ---------------------------------------------------------------------
     @app.route("/get_last_consultation")
     def get_last_consultation():
-        print(f"DEBUG (routes.py): Accès à la route /get_last_consultation.")
+        log.debug("Accès à la route /get_last_consultation.")
         pid = request.args.get("patient_id", "").strip()
         if not pid:
-            print(f"DEBUG (routes.py - get_last_consultation): ID patient vide.")
+            log.debug("ID patient vide.")
             return jsonify({})
         
         # S'assurer que le chemin dynamique est défini pour l'utilisateur courant
@@ -413,28 +409,28 @@ def register_routes(app):
         admin_email = session.get('admin_email', 'default_admin@example.com')
         utils.set_dynamic_base_dir(admin_email)
 
-        print(f"DEBUG (routes.py - get_last_consultation): Tentative de récupération de la dernière consultation pour ID: {pid}")
+        log.debug("Tentative de récupération de la dernière consultation pour ID: %s", pid)
         # Utilise utils.EXCEL_FILE_PATH qui est maintenant dynamique
-        if os.path.exists(utils.EXCEL_FILE_PATH):
+        if storage.exists(utils.EXCEL_FILE_PATH):
             try:
-                df = pd.read_excel(utils.EXCEL_FILE_PATH, sheet_name=0, dtype=str).fillna('')
+                df = storage.read_excel(utils.EXCEL_FILE_PATH, sheet_name=0, dtype=str).fillna('')
                 df = df[df["patient_id"].astype(str) == pid]
                 if not df.empty:
                     last_consult = df.iloc[-1].to_dict()
                     last_consult.pop('certificate_content', None) # Supprime la clé si elle existe
-                    print(f"DEBUG (routes.py - get_last_consultation): Dernière consultation trouvée pour {pid}.")
+                    log.debug("Dernière consultation trouvée pour %s.", pid)
                     return jsonify(last_consult)
                 else:
-                    print(f"DEBUG (routes.py - get_last_consultation): Aucune consultation trouvée pour ID: {pid}.")
+                    log.debug("Aucune consultation trouvée pour ID: %s.", pid)
             except Exception as e:
-                print(f"ERREUR (routes.py - get_last_consultation): Erreur lors de la lecture de {utils.EXCEL_FILE_PATH}: {e}")
+                log.error("Erreur lors de la lecture de %s: %s", utils.EXCEL_FILE_PATH, e)
         else:
-            print(f"DEBUG (routes.py - get_last_consultation): Fichier {utils.EXCEL_FILE_PATH} non trouvé.")
+            log.debug("Fichier %s non trouvé.", utils.EXCEL_FILE_PATH)
         return jsonify({})
 
     @app.route("/get_consultations")
     def get_consultations():
-        print(f"DEBUG (routes.py): Accès à la route /get_consultations.")
+        log.debug("Accès à la route /get_consultations.")
         pid = request.args.get("patient_id", "").strip()
         
         # S'assurer que le chemin dynamique est défini pour l'utilisateur courant
@@ -442,11 +438,11 @@ def register_routes(app):
         admin_email = session.get('admin_email', 'default_admin@example.com')
         utils.set_dynamic_base_dir(admin_email)
 
-        print(f"DEBUG (routes.py - get_consultations): Tentative de récupération de toutes les consultations pour ID: {pid}")
+        log.debug("Tentative de récupération de toutes les consultations pour ID: %s", pid)
         # Utilise utils.EXCEL_FILE_PATH qui est maintenant dynamique
-        if os.path.exists(utils.EXCEL_FILE_PATH):
+        if storage.exists(utils.EXCEL_FILE_PATH):
             try:
-                df = pd.read_excel(utils.EXCEL_FILE_PATH, sheet_name=0, dtype=str).fillna('')
+                df = storage.read_excel(utils.EXCEL_FILE_PATH, sheet_name=0, dtype=str).fillna('')
                 df = df[df["patient_id"].astype(str) == pid]
 
                 # --- DÉBUT DE LA CORRECTION ---
@@ -466,20 +462,20 @@ def register_routes(app):
 
                 if 'certificate_content' in df.columns:
                     df = df.drop(columns=['certificate_content'])
-                print(f"DEBUG (routes.py - get_consultations): {len(df)} consultations trouvées pour {pid}.")
+                log.debug("%s consultations trouvées pour %s.", len(df), pid)
                 return df.to_json(orient="records", force_ascii=False)
             except Exception as e:
-                print(f"ERREUR (routes.py - get_consultations): Erreur lors de la lecture de {utils.EXCEL_FILE_PATH}: {e}")
+                log.error("Erreur lors de la lecture de %s: %s", utils.EXCEL_FILE_PATH, e)
         else:
-            print(f"DEBUG (routes.py - get_consultations): Fichier {utils.EXCEL_FILE_PATH} non trouvé.")
+            log.debug("Fichier %s non trouvé.", utils.EXCEL_FILE_PATH)
         return "[]"
 
     @app.route("/delete_consultation", methods=["POST"])
     def delete_consultation():
-        print(f"DEBUG (routes.py): Accès à la route /delete_consultation (méthode: POST).")
+        log.debug("Accès à la route /delete_consultation (méthode: POST).")
         cid = request.form.get("consultation_id", "").strip()
         if cid:
-            print(f"DEBUG (routes.py - delete_consultation): Tentative de suppression de la consultation avec ID: {cid}")
+            log.debug("Tentative de suppression de la consultation avec ID: %s", cid)
             try:
                 # S'assurer que le chemin dynamique est défini pour l'utilisateur courant
                 # avant de charger les données.
@@ -487,20 +483,21 @@ def register_routes(app):
                 utils.set_dynamic_base_dir(admin_email)
 
                 # Utilise utils.EXCEL_FILE_PATH qui est maintenant dynamique
-                df = pd.read_excel(utils.EXCEL_FILE_PATH, sheet_name=0, dtype=str).fillna('')
+                df = storage.read_excel(utils.EXCEL_FILE_PATH, sheet_name=0, dtype=str).fillna('')
                 original_rows = len(df)
                 df = df[df["consultation_id"] != cid]
                 if len(df) < original_rows:
-                    df.to_excel(utils.EXCEL_FILE_PATH, index=False)
-                    print(f"DEBUG (routes.py - delete_consultation): Consultation {cid} supprimée avec succès.")
+                    storage.to_excel(df, utils.EXCEL_FILE_PATH)
+                    utils.invalidate_patient_directory()  # le patient peut disparaître de l'annuaire
+                    log.debug("Consultation %s supprimée avec succès.", cid)
                     return "OK", 200
                 else:
-                    print(f"ATTENTION (routes.py - delete_consultation): Consultation {cid} non trouvée pour suppression.")
+                    log.warning("Consultation %s non trouvée pour suppression.", cid)
                     return "Not Found", 404
             except Exception as e:
-                print(f"ERREUR (routes.py - delete_consultation): Erreur lors de la suppression de la consultation {cid} dans {utils.EXCEL_FILE_PATH}: {e}")
+                log.error("Erreur lors de la suppression de la consultation %s dans %s: %s", cid, utils.EXCEL_FILE_PATH, e)
                 return str(e), 500
-        print(f"ATTENTION (routes.py - delete_consultation): Paramètres manquants pour la suppression.")
+        log.warning("Paramètres manquants pour la suppression.")
         return "Missing parameters", 400
 
     # ---------------------------------------------------------------------
@@ -508,7 +505,7 @@ def register_routes(app):
     # ---------------------------------------------------------------------
     @app.route("/generate_pdf_route")
     def generate_pdf_route():
-        print(f"DEBUG (routes.py): Accès à la route /generate_pdf_route.")
+        log.debug("Accès à la route /generate_pdf_route.")
         form_data = {
             k: request.args.get(k, "") for k in [
                 "doctor_name", "patient_name", "patient_age", "date_of_birth", "gender",
@@ -538,20 +535,20 @@ def register_routes(app):
         # Utilise utils.PDF_FOLDER qui est maintenant dynamique
         pdf_filename = f"Ordonnance_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf"
         pdf_path = os.path.join(utils.PDF_FOLDER, pdf_filename)
-        print(f"DEBUG (routes.py - generate_pdf_route): Génération du PDF vers {pdf_path}")
+        log.debug("Génération du PDF vers %s", pdf_path)
         try:
             utils.generate_pdf_file(pdf_path, form_data, medications, analyses, radiologies)
-            print(f"DEBUG (routes.py - generate_pdf_route): PDF généré avec succès.")
+            log.debug("PDF généré avec succès.")
             return send_file(pdf_path, as_attachment=True, download_name=os.path.basename(pdf_path))
         except Exception as e:
-            print(f"ERREUR (routes.py - generate_pdf_route): Erreur lors de la génération du PDF : {e}")
+            log.error("Erreur lors de la génération du PDF : %s", e)
             flash(f"Erreur lors de la génération du PDF : {e}", "error")
             return redirect(url_for(".index"))
 
 
     @app.route("/generate_history_pdf")
     def generate_history_pdf():
-        print(f"DEBUG (routes.py): Accès à la route /generate_history_pdf.")
+        log.debug("Accès à la route /generate_history_pdf.")
         pid   = request.args.get("patient_id_filter", "").strip()
         pname = request.args.get("patient_name_filter", "").strip()
 
@@ -560,34 +557,34 @@ def register_routes(app):
         admin_email = session.get('admin_email', 'default_admin@example.com')
         utils.set_dynamic_base_dir(admin_email)
 
-        if not os.path.exists(utils.EXCEL_FILE_PATH):
-            print(f"ATTENTION (routes.py - generate_history_pdf): Fichier de données Excel non trouvé : {utils.EXCEL_FILE_PATH}")
+        if not storage.exists(utils.EXCEL_FILE_PATH):
+            log.warning("Fichier de données Excel non trouvé : %s", utils.EXCEL_FILE_PATH)
             flash("Aucune donnée de consultation.", "warning")
             return redirect(url_for(".index"))
 
         df = pd.DataFrame()
         try:
-            df = pd.read_excel(utils.EXCEL_FILE_PATH, sheet_name=0, dtype=str).fillna('')
-            print(f"DEBUG (routes.py - generate_history_pdf): Données lues depuis {utils.EXCEL_FILE_PATH}.")
+            df = storage.read_excel(utils.EXCEL_FILE_PATH, sheet_name=0, dtype=str).fillna('')
+            log.debug("Données lues depuis %s.", utils.EXCEL_FILE_PATH)
         except Exception as e:
-            print(f"ERREUR (routes.py - generate_history_pdf): Erreur lors de la lecture de {utils.EXCEL_FILE_PATH} pour l'historique : {e}")
+            log.error("Erreur lors de la lecture de %s pour l'historique : %s", utils.EXCEL_FILE_PATH, e)
             flash(f"Erreur lors de la lecture des données pour l'historique : {e}", "error")
             return redirect(url_for(".index"))
 
         df_filtered = pd.DataFrame()
         if pid:
             df_filtered = df[df["patient_id"].astype(str) == pid]
-            print(f"DEBUG (routes.py - generate_history_pdf): Filtrage par ID patient '{pid}'.")
+            log.debug("Filtrage par ID patient '%s'.", pid)
         elif pname:
             df_filtered = df[df["patient_name"].astype(str).str.contains(pname, case=False, na=False)]
-            print(f"DEBUG (routes.py - generate_history_pdf): Filtrage par nom patient '{pname}'.")
+            log.debug("Filtrage par nom patient '%s'.", pname)
         else:
-            print(f"ATTENTION (routes.py - generate_history_pdf): ID ou nom de patient manquant pour l'historique.")
+            log.warning("ID ou nom de patient manquant pour l'historique.")
             flash("Sélectionnez l'ID ou le nom du patient.", "warning")
             return redirect(url_for(".index"))
 
         if df_filtered.empty:
-            print(f"DEBUG (routes.py - generate_history_pdf): Aucune consultation trouvée après filtrage.")
+            log.debug("Aucune consultation trouvée après filtrage.")
             flash("Aucune consultation trouvée pour ce patient.", "info")
             return redirect(url_for(".index"))
         
@@ -596,13 +593,13 @@ def register_routes(app):
 
         pdf_filename = f"Historique_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf"
         pdf_path = os.path.join(utils.PDF_FOLDER, pdf_filename)
-        print(f"DEBUG (routes.py - generate_history_pdf): Génération du PDF d'historique vers {pdf_path}")
+        log.debug("Génération du PDF d'historique vers %s", pdf_path)
         try:
             utils.generate_history_pdf_file(pdf_path, df_filtered)
-            print(f"DEBUG (routes.py - generate_history_pdf): PDF d'historique généré avec succès.")
+            log.debug("PDF d'historique généré avec succès.")
             return send_file(pdf_path, as_attachment=True, download_name=os.path.basename(pdf_path))
         except Exception as e:
-            print(f"ERREUR (routes.py - generate_history_pdf): Erreur lors de la génération du PDF d'historique : {e}")
+            log.error("Erreur lors de la génération du PDF d'historique : %s", e)
             flash(f"Erreur lors de la génération du PDF d'historique : {e}", "error")
             return redirect(url_for(".index"))
 
@@ -612,19 +609,23 @@ def register_routes(app):
     # ---------------------------------------------------------------------
     @app.route("/import_excel", methods=["POST"])
     def import_excel():
-        print(f"DEBUG (routes.py): Accès à la route /import_excel (méthode: POST).")
+        log.debug("Accès à la route /import_excel (méthode: POST).")
         if "excel_file" not in request.files or request.files["excel_file"].filename == "":
-            print(f"ATTENTION (routes.py - import_excel): Aucun fichier sélectionné pour l'importation Excel.")
+            log.warning("Aucun fichier sélectionné pour l'importation Excel.")
             return jsonify({"status": "warning", "message": "Aucun fichier sélectionné."})
         f = request.files["excel_file"]
         filename = utils.secure_filename(f.filename)
         file_path = os.path.join(utils.EXCEL_FOLDER, filename)
-        print(f"DEBUG (routes.py - import_excel): Tentative de sauvegarde du fichier Excel vers {file_path}")
+        log.debug("Tentative de sauvegarde du fichier Excel vers %s", file_path)
         try:
             f.save(file_path)
-            print(f"DEBUG (routes.py - import_excel): Fichier Excel '{filename}' sauvegardé avec succès.")
+            log.debug("Fichier Excel '%s' sauvegardé avec succès.", filename)
+            # Les classeurs gérés en base (ConsultationData.xlsx, DonneesRDV.xlsx, ...) remplacent les données SQLite
+            if storage.is_managed(file_path):
+                storage.import_excel(file_path)
             # Tenter de lire le fichier importé et de mettre à jour les listes
-            df_imported = pd.read_excel(file_path, dtype=str).fillna('')
+            with timing.phase("excel"):
+                df_imported = pd.read_excel(file_path, dtype=str).fillna('')
             df_imported.columns = [c.lower() for c in df_imported.columns]
 
             cfg = _config()
@@ -645,36 +646,36 @@ def register_routes(app):
                 "radiologies_options": sorted(list(current_radios)),
             })
             utils.save_config(cfg)
-            print(f"DEBUG (routes.py - import_excel): Listes de médicaments/analyses/radiologies mises à jour.")
+            log.debug("Listes de médicaments/analyses/radiologies mises à jour.")
 
             # Si le fichier importé est info_Base_patient.xlsx ou ConsultationData.xlsx,
             # forcer un rechargement complet des données patient
             if filename == "info_Base_patient.xlsx" or filename == "ConsultationData.xlsx":
                 utils.load_patient_data()
-                print(f"DEBUG (routes.py - import_excel): Données patient rechargées suite à l'import de {filename}.")
+                log.debug("Données patient rechargées suite à l'import de %s.", filename)
 
             return jsonify({"status": "success", "message": "Import réussi."})
         except Exception as e:
-            print(f"ERREUR (routes.py - import_excel): Erreur lors de l'importation du fichier Excel {filename}: {e}")
+            log.error("Erreur lors de l'importation du fichier Excel %s: %s", filename, e)
             return jsonify({"status": "error", "message": f"Erreur : {e}"})
 
     @app.route("/import_background", methods=["POST"])
     def import_background():
-        print(f"DEBUG (routes.py): Accès à la route /import_background (méthode: POST).")
+        log.debug("Accès à la route /import_background (méthode: POST).")
         if "background_file" not in request.files or request.files["background_file"].filename == "":
-            print(f"ATTENTION (routes.py - import_background): Aucun fichier sélectionné pour l'arrière-plan.")
+            log.warning("Aucun fichier sélectionné pour l'arrière-plan.")
             return jsonify({"status": "warning", "message": "Aucun fichier sélectionné."})
         f = request.files["background_file"]
         filename = utils.secure_filename(f.filename)
         path = os.path.join(utils.BACKGROUND_FOLDER, filename)
-        print(f"DEBUG (routes.py - import_background): Tentative de sauvegarde du fichier d'arrière-plan vers {path}")
+        log.debug("Tentative de sauvegarde du fichier d'arrière-plan vers %s", path)
         try:
             f.save(path)
-            print(f"DEBUG (routes.py - import_background): Fichier d'arrière-plan '{filename}' sauvegardé avec succès.")
+            log.debug("Fichier d'arrière-plan '%s' sauvegardé avec succès.", filename)
             ext = os.path.splitext(filename)[1].lower()
             if ext not in (".png", ".jpg", ".jpeg", ".gif", ".bmp", ".pdf"):
                 os.remove(path) # Supprimer le fichier non supporté
-                print(f"ATTENTION (routes.py - import_background): Format de fichier non supporté pour l'arrière-plan : {ext}")
+                log.warning("Format de fichier non supporté pour l'arrière-plan : %s", ext)
                 return jsonify({"status": "warning", "message": "Format non supporté (seuls PNG, JPG, JPEG, GIF, BMP, PDF sont acceptés)."})
             
             # Stocker UNIQUEMENT le nom du fichier dans la configuration
@@ -685,10 +686,10 @@ def register_routes(app):
             # Mettre à jour la variable globale dans utils pour un effet immédiat
             utils.init_app(current_app) # Recharge la config et met à jour utils.background_file
             
-            print(f"DEBUG (routes.py - import_background): Chemin de l'arrière-plan mis à jour dans la configuration et utils.background_file.")
+            log.debug("Chemin de l'arrière-plan mis à jour dans la configuration et utils.background_file.")
             return jsonify({"status": "success", "message": f"Arrière plan importé : {filename}"})
         except Exception as e:
-            print(f"ERREUR (routes.py - import_background): Erreur lors de l'importation de l'arrière-plan {filename}: {e}")
+            log.error("Erreur lors de l'importation de l'arrière-plan %s: %s", filename, e)
             return jsonify({"status": "error", "message": f"Erreur : {e}"})
 
     # ---------------------------------------------------------------------
@@ -696,11 +697,11 @@ def register_routes(app):
     # ---------------------------------------------------------------------
     @app.route("/update_comment", methods=["POST"])
     def update_comment():
-        print(f"DEBUG (routes.py): Accès à la route /update_comment (méthode: POST).")
+        log.debug("Accès à la route /update_comment (méthode: POST).")
         pid = request.form.get("suivi_patient_id", "").strip()
         new_comment = request.form.get("new_doctor_comment", "").strip()
         if not pid:
-            print(f"ATTENTION (routes.py - update_comment): ID patient manquant pour la mise à jour du commentaire.")
+            log.warning("ID patient manquant pour la mise à jour du commentaire.")
             flash("Veuillez entrer l'ID du patient.", "warning")
             return redirect(url_for(".index"))
         
@@ -709,27 +710,28 @@ def register_routes(app):
         admin_email = session.get('admin_email', 'default_admin@example.com')
         utils.set_dynamic_base_dir(admin_email)
 
-        print(f"DEBUG (routes.py - update_comment): Tentative de mise à jour du commentaire pour ID: {pid}")
-        if os.path.exists(utils.EXCEL_FILE_PATH):
+        log.debug("Tentative de mise à jour du commentaire pour ID: %s", pid)
+        if storage.exists(utils.EXCEL_FILE_PATH):
             try:
-                df = pd.read_excel(utils.EXCEL_FILE_PATH, sheet_name=0, dtype=str).fillna('')
+                df = storage.read_excel(utils.EXCEL_FILE_PATH, sheet_name=0, dtype=str).fillna('')
                 if 'doctor_comment' not in df.columns:
                     df['doctor_comment'] = '' # Ajouter la colonne si elle n'existe pas
                 
                 # S'assurer que le patient existe avant de tenter la mise à jour
                 if any(df["patient_id"].astype(str) == pid):
                     df.loc[df["patient_id"].astype(str) == pid, "doctor_comment"] = new_comment
-                    df.to_excel(utils.EXCEL_FILE_PATH, index=False)
-                    print(f"DEBUG (routes.py - update_comment): Commentaire mis à jour pour ID: {pid}.")
+                    storage.to_excel(df, utils.EXCEL_FILE_PATH)
+                    utils.invalidate_patient_directory()
+                    log.debug("Commentaire mis à jour pour ID: %s.", pid)
                     flash("Commentaire mis à jour.", "success")
                 else:
-                    print(f"ATTENTION (routes.py - update_comment): Patient avec ID {pid} non trouvé pour la mise à jour du commentaire.")
+                    log.warning("Patient avec ID %s non trouvé pour la mise à jour du commentaire.", pid)
                     flash("Patient non trouvé.", "error")
             except Exception as e:
-                print(f"ERREUR (routes.py - update_comment): Erreur lors de la mise à jour du commentaire dans {utils.EXCEL_FILE_PATH}: {e}")
+                log.error("Erreur lors de la mise à jour du commentaire dans %s: %s", utils.EXCEL_FILE_PATH, e)
                 flash("Erreur interne lors de la mise à jour du commentaire.", "error")
         else:
-            print(f"ATTENTION (routes.py - update_comment): Fichier de données Excel non trouvé : {utils.EXCEL_FILE_PATH}.")
+            log.warning("Fichier de données Excel non trouvé : %s.", utils.EXCEL_FILE_PATH)
             flash("Fichier de données non trouvé.", "error")
         return redirect(url_for(".index"))
 
@@ -739,7 +741,7 @@ def register_routes(app):
 
     @app.route("/settings", methods=["GET", "POST"])
     def settings():
-        print(f"DEBUG (routes.py): Accès à la route /settings (méthode: {request.method}).")
+        log.debug("Accès à la route /settings (méthode: %s).", request.method)
         
         # S'assurer que le chemin dynamique est défini pour l'utilisateur courant
         admin_email = session.get('admin_email', 'default_admin@example.com')
@@ -749,7 +751,7 @@ def register_routes(app):
         theme_names = list(theme.THEMES.keys())
 
         if request.method == "POST":
-            print(f"DEBUG (routes.py - settings): Traitement de la requête POST pour les paramètres.")
+            log.debug("Traitement de la requête POST pour les paramètres.")
             cfg.update({
                 "nom_clinique":         request.form.get("nom_clinique", ""),
                 "cabinet":              request.form.get("cabinet", ""), # Assurez-vous que c'est bien 'cabinet' si utilisé
@@ -772,7 +774,7 @@ def register_routes(app):
                 [item.strip() for item in request.form.get("liste_radiologies","").splitlines() if item.strip()]
                 if request.form.get("liste_radiologies","") else utils.default_radiologies_options
             )
-            print(f"DEBUG (routes.py - settings): Options des listes mises à jour à partir du formulaire.")
+            log.debug("Options des listes mises à jour à partir du formulaire.")
 
             utils.save_config(cfg)
             session["theme"] = cfg["theme"]
@@ -782,13 +784,13 @@ def register_routes(app):
             utils.init_app(current_app) # Important pour mettre à jour app.config
             # current_app.config["background_file_path"] est déjà mis à jour via utils.init_app
             # utils.background_file est déjà mis à jour via utils.init_app
-            print(f"DEBUG (routes.py - settings): Configuration sauvegardée et utils.background_file mis à jour.")
+            log.debug("Configuration sauvegardée et utils.background_file mis à jour.")
 
 
             utils.load_patient_data() # Recharger les données patient au cas où des imports aient eu lieu
 
             if request.accept_mimetypes.accept_json:
-                print(f"DEBUG (routes.py - settings): Réponse JSON pour les paramètres.")
+                log.debug("Réponse JSON pour les paramètres.")
                 return jsonify({
                     "nom_clinique":         cfg.get("nom_clinique"),
                     "cabinet":              cfg.get("cabinet"),
@@ -803,10 +805,10 @@ def register_routes(app):
                     "theme_names":          theme_names,
                     "theme_vars":           theme.current_theme(),
                 })
-            print(f"DEBUG (routes.py - settings): Réponse succès pour les paramètres (non JSON).")
+            log.debug("Réponse succès pour les paramètres (non JSON).")
             return jsonify({"status": "success"})
 
-        print(f"DEBUG (routes.py - settings): Rendu du template des paramètres.")
+        log.debug("Rendu du template des paramètres.")
         return render_template_string(
             settings_template,
             config=cfg,
@@ -819,12 +821,12 @@ def register_routes(app):
     # ---------------------------------------------------------------------
     @app.route("/download_app")
     def download_app():
-        print(f"DEBUG (routes.py): Accès à la route /download_app.")
+        log.debug("Accès à la route /download_app.")
         # Cette route utilise utils.application_path, qui est statique pour le chemin de l'exécutable
         file_path = os.path.join(utils.application_path, "EasyMedicalink.rar")
         if os.path.exists(file_path):
-            print(f"DEBUG (routes.py - download_app): Fichier de téléchargement trouvé : {file_path}")
+            log.debug("Fichier de téléchargement trouvé : %s", file_path)
             return send_file(file_path, as_attachment=True, download_name="EasyMedicalink.rar")
-        print(f"ATTENTION (routes.py - download_app): Fichier de téléchargement non trouvé : {file_path}")
+        log.warning("Fichier de téléchargement non trouvé : %s", file_path)
         flash("Le fichier n'existe pas.", "error")
         return redirect(url_for(".index"))
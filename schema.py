@@ -0,0 +1,119 @@
+# schema.py
+# ---------------------------------------------------------------------------
+#  Résolution mémorisée des colonnes logiques -> colonnes physiques
+# ---------------------------------------------------------------------------
+#  Les classeurs nomment une même information de plusieurs façons
+#  ('patient_id', 'ID Patient', 'Patient ID'…). statistique._find_column et
+#  utils._normalize_dataframe_columns comparaient à chaque appel toutes les
+#  colonnes à toutes les variantes (O(colonnes × clés) opérations sur des
+#  chaînes), des dizaines de fois par affichage et sur les mêmes en-têtes.
+#  Le résultat ne dépend que de l'en-tête du classeur et des variantes
+#  cherchées : il est calculé une fois par (en-tête, variantes) puis servi
+#  depuis un cache LRU borné, commun à tous les tenants.
+#  L'en-tête d'un DataFrame (tuple des colonnes) est lui-même mémorisé par
+#  objet Index, tant que celui-ci existe : les appels répétés sur un même
+#  frame ne reparcourent pas ses colonnes.
+#  normalized() renomme sans copier les données (vue sur les mêmes colonnes).
+# ---------------------------------------------------------------------------
+
+import os
+import weakref
+from functools import lru_cache
+from typing import Optional
+
+import pandas as pd
+
+# Nombre de résolutions (en-tête, variantes) mémorisées
+CACHE_SIZE = int(os.environ.get("EASYMEDICALINK_SCHEMA_CACHE", "4096"))
+
+_headers: dict = {}     # id(Index) -> (référence faible, en-tête), retiré quand l'Index disparaît
+
+
+def _header(columns) -> tuple:
+    """En-tête hashable d'un Index pandas (mémorisé par objet) ou d'une séquence de noms."""
+    if not isinstance(columns, pd.Index):
+        return tuple(columns)
+    key = id(columns)
+    entry = _headers.get(key)
+    if entry is not None and entry[0]() is columns:
+        return entry[1]
+    header = tuple(columns.tolist())
+    _headers[key] = (weakref.ref(columns, lambda _ref: _headers.pop(key, None)), header)
+    return header
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _find(columns: tuple, keys: tuple) -> Optional[str]:
+    columns_lower = {col.lower(): col for col in columns}
+    keys_lower = [key.lower() for key in keys]
+    # Correspondance exacte (insensible à la casse), dans l'ordre des clés
+    for key in keys_lower:
+        if key in columns_lower:
+            return columns_lower[key]
+    # Puis correspondance partielle, dans l'ordre des colonnes
+    for col_lower, original_col in columns_lower.items():
+        for key in keys_lower:
+            if key in col_lower:
+                return original_col
+    return None
+
+
+def find_column(columns, keys) -> Optional[str]:
+    """
+    Colonne de `columns` correspondant à l'une des variantes `keys` : d'abord égalité
+    insensible à la casse (ordre des clés), puis inclusion (ordre des colonnes). None sinon.
+    """
+    return _find(_header(columns), tuple(keys))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _renames(columns: tuple, mapping: tuple) -> tuple:
+    columns_lower = {col.lower().strip(): col for col in columns}
+    rename_map = {}
+    found = set()
+    for internal_name, possible_names in mapping:
+        for name in possible_names:
+            if name.lower() in columns_lower:
+                rename_map[columns_lower[name.lower()]] = internal_name
+                found.add(internal_name)
+                break  # Passe au nom interne suivant dès qu'une correspondance est trouvée
+    return tuple(rename_map.items()), frozenset(found)
+
+
+def mapping_key(mapping: dict) -> tuple:
+    """Forme hashable d'un mappage {nom interne: [variantes]}, à calculer une fois."""
+    return tuple((internal_name, tuple(names)) for internal_name, names in mapping.items())
+
+
+def resolve(columns, mapping: tuple) -> tuple:
+    """
+    ({colonne physique: nom interne}, noms internes trouvés) pour un en-tête et un
+    mappage (mapping_key) : pour chaque nom interne, la première variante présente.
+    """
+    renames, found = _renames(_header(columns), mapping)
+    return dict(renames), found
+
+
+def normalized(df: pd.DataFrame, rename_map: dict) -> pd.DataFrame:
+    """`df` avec ses colonnes renommées, sans copie des données."""
+    if not rename_map:
+        return df
+    view = df.copy(deep=False)
+    view.columns = [rename_map.get(col, col) for col in df.columns]
+    return view
+
+
+def cache_stats() -> dict:
+    """Compteurs des deux caches (pour le monitoring)."""
+    stats = {}
+    for name, fn in (("find_column", _find), ("resolve", _renames)):
+        info = fn.cache_info()
+        lookups = info.hits + info.misses
+        stats[name] = {**info._asdict(), "hit_ratio": round(info.hits / lookups, 4) if lookups else 0.0}
+    return stats
+
+
+def clear_cache():
+    _headers.clear()
+    _find.cache_clear()
+    _renames.cache_clear()
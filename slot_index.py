@@ -0,0 +1,272 @@
+# slot_index.py
+# ---------------------------------------------------------------------------
+#  Index en mémoire des créneaux réservés (DonneesRDV.xlsx)
+# ---------------------------------------------------------------------------
+#  (Date, Medecin_Email) -> liste triée des heures réservées, par tenant.
+#  Les endpoints de réservation (rdv.get_reserved_slots,
+#  patient_rdv.get_reserved_slots_patient) n'ont plus à relire et filtrer le
+#  classeur : l'index est construit une fois, puis tenu à jour par les
+#  écritures faites ici. Une écriture faite ailleurs (import Excel, autre
+#  worker) change storage.dataset_version et provoque une reconstruction.
+#
+#  Chaque écriture note, dans sa transaction, la version du classeur avant et
+#  après elle (storage.write_versions). L'index n'est corrigé sur place que
+#  s'il reflétait exactement la version "avant" ; sinon (écriture manquée,
+#  ou index déjà reconstruit par une autre requête après l'écriture) il est
+#  laissé à refresh(), qui le reconstruit si sa version n'est plus la bonne.
+#
+#  reserve() est le seul chemin de création d'un RDV : vérification et ajout
+#  sont atomiques (storage.append_row_unique), sans réécrire la feuille.
+#  move() et release() modifient / suppriment un RDV par son identifiant stable
+#  (storage.ROW_ID_COLUMN), sans relire le classeur.
+#
+#  busy_bitmap / free_bitmap projettent un jour sur la grille de
+#  utils.generate_time_slots : bit i = créneau grid[i].
+# ---------------------------------------------------------------------------
+
+import bisect
+import calendar
+import os
+import threading
+from typing import Optional
+
+import pandas as pd
+
+import storage
+
+
+class _SlotIndex:
+    """Heures réservées d'un classeur DonneesRDV, indexées par (date, médecin)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.RLock()
+        self.signature = None
+        self._slots: dict = {}   # (date, medecin_email) -> liste triée des heures (doublons conservés)
+
+    @staticmethod
+    def _keys(df: pd.DataFrame):
+        if df is None or df.empty or "Date" not in df.columns or "Heure" not in df.columns:
+            return []
+        medecins = df["Medecin_Email"] if "Medecin_Email" in df.columns else pd.Series("", index=df.index)
+        return zip(df["Date"].fillna("").astype(str).str.strip(),
+                   medecins.fillna("").astype(str).str.strip(),
+                   df["Heure"].fillna("").astype(str).str.strip())
+
+    def _load(self, df: pd.DataFrame):
+        slots = {}
+        for day, medecin, heure in self._keys(df):
+            if day and heure:
+                slots.setdefault((day, medecin), []).append(heure)
+        for times in slots.values():
+            times.sort()
+        self._slots = slots
+
+    def rebuild(self):
+        """Reconstruit l'index depuis le classeur."""
+        with self.lock:
+            # Version lue avant les lignes : une écriture intercalée laisse l'index
+            # en retard sur sa version, et le prochain refresh() le reconstruit
+            version = storage.dataset_version(self.path)
+            df = (storage.read_excel(self.path, dtype=str).fillna('')
+                  if storage.exists(self.path) else pd.DataFrame())
+            self._load(df)
+            self.signature = version
+
+    def refresh(self):
+        with self.lock:
+            if self.signature is None or self.signature != storage.dataset_version(self.path):
+                self.rebuild()
+
+    def _follows(self, versions: dict) -> bool:
+        """
+        Vrai si l'index reflète exactement le classeur juste avant l'écriture décrite par
+        `versions` (storage.write_versions) : il peut alors être corrigé sur place.
+        """
+        return self.signature is not None and "apres" in versions and self.signature == versions.get("avant")
+
+    def invalidate(self):
+        with self.lock:
+            self.signature = None
+
+    def add(self, rows: pd.DataFrame, versions: dict):
+        """Intègre des lignes qui viennent d'être ajoutées au classeur."""
+        with self.lock:
+            if not self._follows(versions):
+                return
+            for day, medecin, heure in self._keys(rows):
+                if day and heure:
+                    bisect.insort(self._slots.setdefault((day, medecin), []), heure)
+            self.signature = versions["apres"]
+
+    def move(self, old: tuple, new: tuple, count: int, versions: dict):
+        """Déplace `count` réservations (date, médecin, heure) après une mise à jour en place."""
+        with self.lock:
+            if not self._follows(versions):
+                return
+            for _ in range(count):
+                times = self._slots.get(old[:2], [])
+                i = bisect.bisect_left(times, old[2])
+                if i < len(times) and times[i] == old[2]:
+                    del times[i]
+                bisect.insort(self._slots.setdefault(new[:2], []), new[2])
+            self.signature = versions["apres"]
+
+    def remove(self, rows: pd.DataFrame, versions: dict):
+        """Retire de l'index des lignes qui viennent d'être supprimées du classeur."""
+        with self.lock:
+            if not self._follows(versions):
+                return
+            for day, medecin, heure in self._keys(rows):
+                times = self._slots.get((day, medecin), [])
+                i = bisect.bisect_left(times, heure)
+                if i < len(times) and times[i] == heure:
+                    del times[i]
+            self.signature = versions["apres"]
+
+    def reserved(self, day: str, medecin_email: str) -> list:
+        with self.lock:
+            return list(self._slots.get((day, medecin_email), ()))
+
+    def is_reserved(self, day: str, medecin_email: str, heure: str) -> bool:
+        with self.lock:
+            times = self._slots.get((day, medecin_email), ())
+            i = bisect.bisect_left(times, heure)
+            return i < len(times) and times[i] == heure
+
+
+_indexes: dict = {}          # chemin absolu de DonneesRDV -> _SlotIndex
+_indexes_lock = threading.Lock()
+
+
+def _index_for(path) -> Optional[_SlotIndex]:
+    if path is None:
+        return None
+    key = os.path.abspath(os.fspath(path))
+    index = _indexes.get(key)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.setdefault(key, _SlotIndex(key))
+    return index
+
+
+def reserved_slots(path, day: str, medecin_email: str) -> list:
+    """Heures réservées (triées) pour ce médecin à cette date."""
+    index = _index_for(path)
+    if index is None:
+        return []
+    index.refresh()
+    return index.reserved(day, medecin_email)
+
+
+def is_reserved(path, day: str, medecin_email: str, heure: str) -> bool:
+    index = _index_for(path)
+    if index is None:
+        return False
+    index.refresh()
+    return index.is_reserved(day, medecin_email, heure)
+
+
+def month_reserved(path, year: int, month: int, medecin_email: str) -> dict:
+    """{'AAAA-MM-JJ': heures réservées} pour chaque jour du mois (un accès à l'index par jour)."""
+    index = _index_for(path)
+    if index is None:
+        return {}
+    index.refresh()
+    days = calendar.monthrange(year, month)[1]
+    return {day: index.reserved(day, medecin_email)
+            for day in (f"{year:04d}-{month:02d}-{d:02d}" for d in range(1, days + 1))}
+
+
+def busy_bitmap(path, day: str, medecin_email: str, grid: list) -> int:
+    """Entier dont le bit i vaut 1 si le créneau grid[i] est réservé."""
+    taken = set(reserved_slots(path, day, medecin_email))
+    bits = 0
+    for i, heure in enumerate(grid):
+        if heure in taken:
+            bits |= 1 << i
+    return bits
+
+
+def free_bitmap(path, day: str, medecin_email: str, grid: list) -> int:
+    """Complément de busy_bitmap sur la grille : bit i = créneau grid[i] libre."""
+    return ~busy_bitmap(path, day, medecin_email, grid) & ((1 << len(grid)) - 1)
+
+
+def bitmap_string(bits: int, size: int) -> str:
+    """'0101…' dans l'ordre de la grille (caractère i = bit i), pour le JSON."""
+    return "".join("1" if bits >> i & 1 else "0" for i in range(size))
+
+
+# Un créneau = (médecin, date, heure) : clé de la réservation atomique
+SLOT_KEY = ("Medecin_Email", "Date", "Heure")
+
+
+def reserve(path, row: dict) -> bool:
+    """
+    Réserve un créneau de façon atomique (compare-and-set sur SLOT_KEY) en ajoutant
+    la ligne RDV. Retourne False, sans rien écrire, si le créneau est déjà pris —
+    y compris par une réservation concurrente d'un autre thread ou worker.
+    """
+    index = _index_for(path)
+    # Rejet rapide, sans verrou d'écriture, si l'index connaît déjà ce créneau
+    if index is not None and is_reserved(path, row.get("Date", ""), row.get("Medecin_Email", ""), row.get("Heure", "")):
+        return False
+    with storage.write_versions() as versions:
+        if not storage.append_row_unique(path, row, SLOT_KEY):
+            return False
+    if index is not None:
+        index.add(pd.DataFrame([row]), versions)
+    return True
+
+
+def move(path, current: dict, values: dict) -> Optional[int]:
+    """
+    Modifie en place le RDV `current` (ligne lue avec son identifiant stable, à défaut
+    son ID patient) avec `values`. Le créneau actuel fait partie de la condition : si le
+    RDV a été déplacé entre-temps, rien n'est écrit. Si le créneau change, le nouveau est réservé atomiquement :
+    retourne None s'il est déjà pris, sinon le nombre de lignes modifiées (0 si le RDV
+    n'existe plus ou a changé).
+    """
+    key = (storage.ROW_ID_COLUMN,) if current.get(storage.ROW_ID_COLUMN, "") != "" else ("ID",)
+    match = {c: current.get(c, "") for c in key + SLOT_KEY}
+    with storage.write_versions() as versions:
+        changed = storage.update_rows(path, match, values, unique_columns=SLOT_KEY)
+    if changed:
+        index = _index_for(path)
+        if index is not None:
+            old = (match["Date"], match["Medecin_Email"], match["Heure"])
+            new = tuple(values.get(c, match[c]) for c in ("Date", "Medecin_Email", "Heure"))
+            index.move(old, new, changed, versions)
+    return changed
+
+
+def release(path, row_id: int) -> Optional[dict]:
+    """
+    Supprime le RDV d'identifiant `row_id` et libère son créneau.
+    Retourne la ligne supprimée (valeurs texte), ou None si elle n'existait plus :
+    deux requêtes concurrentes ne peuvent pas libérer le même RDV.
+    """
+    with storage.write_versions() as versions:
+        rows = storage.delete_rows(path, [row_id], dtype=str)
+    if rows.empty:
+        return None
+    rows = rows.fillna("")
+    index = _index_for(path)
+    if index is not None:
+        index.remove(rows, versions)
+    return rows.iloc[0].to_dict()
+
+
+def on_sheet_saved(path, df: pd.DataFrame):
+    """À appeler après une réécriture complète de DonneesRDV : reconstruction à la prochaine lecture."""
+    index = _index_for(path)
+    if index is not None:
+        index.invalidate()
+
+
+def on_rows_appended(path, rows: pd.DataFrame):
+    """À appeler après un ajout journalisé dans DonneesRDV : reconstruction à la prochaine lecture."""
+    index = _index_for(path)
+    if index is not None:
+        index.invalidate()
@@ -2,9 +2,11 @@ import os
 import io
 import re
 import locale
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
 from datetime import datetime
-from functools import lru_cache
 from typing import Optional, Union
 
 import pandas as pd
@@ -13,44 +15,82 @@ matplotlib.use('Agg') # Utiliser le backend 'Agg' pour le tracé non interactif
 import matplotlib.pyplot as plt
 
 from flask import (
-    Blueprint, request, render_template_string,
+    Blueprint, request,
     redirect, url_for, flash, session, jsonify, abort
 )
+from template_cache import render_template_string
 
 import utils
 import theme
 import login
+import storage
+import stats_rollup
+import date_parser
+import schema
+import logs
 
 statistique_bp = Blueprint("statistique", __name__, url_prefix="/statistique")
 
-# Configurer la journalisation pour un meilleur suivi des erreurs
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Journal du module (niveau et échantillonnage réglés dans logs.py)
+log = logs.get_logger(__name__)
 
 # Définir la locale pour le formatage des dates (par exemple, les noms de mois en français)
 try:
     locale.setlocale(locale.LC_TIME, 'fr_FR.UTF-8')
 except locale.Error:
-    logging.warning("Impossible de définir la locale 'fr_FR.UTF-8', tentative de la locale par défaut.")
+    log.warning("Impossible de définir la locale 'fr_FR.UTF-8', tentative de la locale par défaut.")
     try:
         locale.setlocale(locale.LC_TIME, '') # Revenir à la locale système par défaut
     except locale.Error:
-        logging.error("Impossible de définir une locale système.")
+        log.error("Impossible de définir une locale système.")
 
 # Définir diverses palettes de couleurs pour les graphiques (utilisées en JS, mais définies ici pour la cohérence).
 PIE_CHART_COLORS_1_HEX = ["#FF6384", "#36A2EB", "#FFCE56", "#4BC0C0", "#9966FF", "#FF9F40", "#C9CBCF", "#6A8CFF", "#FF8C4A", "#A1F200"]
 PIE_CHART_COLORS_2_HEX = ["#FF9800", "#673AB7", "#009688", "#CDDC39", "#795548", "#607D8B", "#F44336", "#2196F3", "#00BCD4", "#E91E63"]
 
 
-@lru_cache(maxsize=1)
-def load_cached_data():
-    """Charge tous les fichiers Excel du dossier spécifié et les met en cache."""
-    return _load_all_excels(utils.EXCEL_FOLDER)
+def load_cached_data() -> stats_rollup.Snapshot:
+    """
+    Agrégats statistiques du tenant courant (stats_rollup.snapshot) : servis depuis la
+    mémoire tant qu'aucune écriture n'a modifié sa base ou ses classeurs.
+    """
+    return stats_rollup.snapshot(utils.EXCEL_FOLDER, _SOURCES)
+
+
+@statistique_bp.after_app_request
+def _warm_stats_after_write(response):
+    """Après une écriture réussie, précharge en arrière-plan les agrégats du tenant."""
+    if request.method != "GET" and response.status_code < 400:
+        tenant = utils.current_tenant()
+        if tenant is not None:
+            stats_rollup.warm(tenant.excel_folder, _SOURCES)
+    return response
+
+def _requested_period() -> tuple:
+    """
+    (start_str, end_str) de la requête, 'AAAA-MM-JJ' ou '' ; du 1er janvier à
+    aujourd'hui si aucune date n'est fournie. ValueError si une date est mal formée.
+    """
+    start_str = request.args.get("start_date")
+    end_str = request.args.get("end_date")
+
+    # Si aucune date n'est fournie, appliquer le filtre par défaut
+    if not start_str and not end_str:
+        today = datetime.now().date()
+        return datetime(today.year, 1, 1).strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d')
+
+    # Sinon, utiliser les dates fournies par l'utilisateur
+    for value in (start_str, end_str):
+        if value:
+            datetime.strptime(value, "%Y-%m-%d")
+    return start_str or "", end_str or ""
 
 @statistique_bp.route("/", methods=["GET"])
 def stats_home():
     """
     Route principale pour le tableau de bord des statistiques.
-    Charge, traite et filtre les données, calcule les KPI et prépare les données des graphiques.
+    Rend la page avec les KPI de la période demandée ; chaque graphique sélectionné
+    charge ensuite ses données depuis chart_data.
     """
     # 1. Vérification d'autorisation
     role = session.get("role")
@@ -65,388 +105,49 @@ def stats_home():
         admin_email_from_session = session.get('admin_email', 'default_admin@example.com')
         utils.set_dynamic_base_dir(admin_email_from_session)
         
-        all_users_data = login.load_users()
-        user_info = all_users_data.get(user_email)
+        user_info = login.get_user(user_email)
         if user_info:
             logged_in_full_name = f"{user_info.get('prenom', '')} {user_info.get('nom', '')}".strip()
             if not logged_in_full_name:
                 logged_in_full_name = None
 
-    # 2. Chargement des données
-    df_map = _load_all_excels(utils.EXCEL_FOLDER)
-
-    # Extraction des DataFrames
-    df_consult_raw = df_map.get("ConsultationData.xlsx", pd.DataFrame())
-    factures_data_loaded = df_map.get("factures.xlsx", pd.DataFrame())
-    if isinstance(factures_data_loaded, dict):
-        # Si le fichier a plusieurs feuilles, prenez la feuille nommée 'Factures' ou la première
-        df_facture_raw = factures_data_loaded.get("Factures", next(iter(factures_data_loaded.values()), pd.DataFrame()))
-    else:
-        # Sinon, utilisez le DataFrame directement
-        df_facture_raw = factures_data_loaded
-    df_rdv_raw = df_map.get("DonneesRDV.xlsx", pd.DataFrame())
-    compta_data = df_map.get("Comptabilite.xlsx", {})
-    df_comptabilite_recettes_raw = compta_data.get("Recettes", pd.DataFrame())
-    df_comptabilite_depenses_raw = compta_data.get("Depenses", pd.DataFrame())
-    df_comptabilite_salaires_raw = compta_data.get("Salaires", pd.DataFrame())
-    df_comptabilite_tiers_payants_raw = compta_data.get("TiersPayants", pd.DataFrame())
-    pharmacie_data_loaded = df_map.get("Pharmacie.xlsx", pd.DataFrame())
-    
-    if isinstance(pharmacie_data_loaded, dict):
-        df_pharmacie_inventory_raw = pharmacie_data_loaded.get("Inventaire", pd.DataFrame())
-        df_pharmacie_movements_raw = pharmacie_data_loaded.get("Mouvements", pd.DataFrame())
-    else:
-        df_pharmacie_inventory_raw = pharmacie_data_loaded
-        df_pharmacie_movements_raw = pd.DataFrame()
-
-    # 3. Récupérer et définir les filtres de date (AVEC PÉRIODE PAR DÉFAUT)
-    start_str = request.args.get("start_date")
-    end_str = request.args.get("end_date")
-    start_dt, end_dt = None, None
+    # 2. Récupérer et définir les filtres de date (AVEC PÉRIODE PAR DÉFAUT)
+    try:
+        start_str, end_str = _requested_period()
+    except ValueError:
+        flash("Format de date invalide, utilisez YYYY-MM-DD.", "warning")
+        return redirect(url_for(".stats_home"))
 
-    # Si aucune date n'est fournie, appliquer le filtre par défaut
-    if not start_str and not end_str:
-        today = datetime.now().date()
-        start_dt = datetime(today.year, 1, 1)
-        end_dt = datetime.now().replace(hour=23, minute=59, second=59)
-        start_str = start_dt.strftime('%Y-%m-%d')
-        end_str = end_dt.strftime('%Y-%m-%d')
-    else:
-        # Sinon, utiliser les dates fournies par l'utilisateur
-        try:
-            if start_str:
-                start_dt = datetime.strptime(start_str, "%Y-%m-%d")
-            if end_str:
-                end_dt = datetime.strptime(end_str, "%Y-%m-%d")
-                end_dt = end_dt.replace(hour=23, minute=59, second=59)
-        except ValueError:
-            flash("Format de date invalide, utilisez YYYY-MM-DD.", "warning")
-            return redirect(url_for(".stats_home"))
-
-    doctor_filter_email = "" 
     selected_charts_param = request.args.getlist('selected_charts')
     no_charts_selected_indicator = request.args.get('no_charts_selected')
 
     if no_charts_selected_indicator == 'true':
         selected_charts = []
-    elif not selected_charts_param and (start_str or end_str): # If dates are set, but no charts, keep selection
-        selected_charts = [
-            "consultChart", "caChart", "genderChart", "ageChart", "salariesMonthlyChart",
-            "rdvDoctorChart", "expensesCategoryChart", "revenueTypeChart", 
-            "topProductsChart", "movementTypeChart"
-        ]
     elif not selected_charts_param:
-        selected_charts = [
-            "consultChart", "caChart", "genderChart", "ageChart", "salariesMonthlyChart",
-            "rdvDoctorChart", "expensesCategoryChart", "revenueTypeChart", 
-            "topProductsChart", "movementTypeChart"
-        ]
+        selected_charts = list(_CHART_BUILDERS)
     else:
         selected_charts = selected_charts_param
 
-    # 4. Traiter et filtrer les DataFrames
-    df_rdv_for_processing = df_rdv_raw.copy()
-    if doctor_filter_email and not df_rdv_for_processing.empty:
-        doctor_email_col = _find_column(df_rdv_for_processing, ["Medecin_Email", "Email Médecin", "Médecin"])
-        if doctor_email_col:
-            df_rdv_for_processing = df_rdv_for_processing[df_rdv_for_processing[doctor_email_col] == doctor_filter_email]
-
-    df_consult = process_consultations(df_consult_raw, start_dt, end_dt)
-    df_facture = process_factures(df_facture_raw, start_dt, end_dt)
-    df_rdv = process_rdv(df_rdv_for_processing, start_dt, end_dt)
-    df_comptabilite_recettes = process_comptabilite_recettes(df_comptabilite_recettes_raw, start_dt, end_dt)
-    df_comptabilite_depenses = process_comptabilite_depenses(df_comptabilite_depenses_raw, start_dt, end_dt)
-    df_comptabilite_salaires = _process_dataframe(df_comptabilite_salaires_raw, date_keys=["Mois_Annee"], numeric_cols={"Total_Brut": 0.0}, start_dt=start_dt, end_dt=end_dt)
-    df_comptabilite_tiers_payants = process_comptabilite_tiers_payants(df_comptabilite_tiers_payants_raw, start_dt, end_dt)
-    df_pharmacie_inventory = process_pharmacie_inventory(df_pharmacie_inventory_raw, start_dt, end_dt)
-    df_pharmacie_movements = process_pharmacie_movements(df_pharmacie_movements_raw, start_dt, end_dt)
-
-    # 5. Filtrage des patients
-    df_patient = process_patients_from_consultations(df_consult)
-
-    # 6. Vérifier la disponibilité des données
-    data_available = not (df_consult.empty and df_facture.empty and df_patient.empty and df_rdv.empty and
-                          df_comptabilite_recettes.empty and df_comptabilite_depenses.empty and
-                          df_pharmacie_inventory.empty and df_pharmacie_movements.empty and
-                          df_comptabilite_salaires.empty and df_comptabilite_tiers_payants.empty)
+    # 3. Agrégats quotidiens (en mémoire ; seules les lignes ajoutées depuis le dernier
+    #    chargement sont repliées)
+    period = _Period(load_cached_data(), start_str or None, end_str or None)
 
+    # 4. Vérifier la disponibilité des données
+    data_available = any(period.totals(source.name, "lignes")[0] for source in _SOURCES)
     if not data_available:
         flash("Aucune donnée disponible pour la période sélectionnée ou le médecin filtré.", "warning")
 
-    # 7. Calculs des KPI
-    metrics = {
-        "total_factures": len(df_facture),
-        "total_patients": df_patient[_find_column(df_patient, ["patient_id", "Patient ID", "ID Patient"])].nunique() if not df_patient.empty and _find_column(df_patient, ["patient_id", "Patient ID", "ID Patient"]) else 0,
-        "total_revenue": 0.0,
-        "total_appointments": len(df_rdv),
-        "daily_appointments": 0,
-        "total_stock_value": _total_stock_value(df_pharmacie_inventory),
-        "total_expenses": 0.0,
-        "net_profit": 0.0,
-    }
-
-    # AJOUTEZ CE BLOC À LA PLACE
-    # --- Calcul fiable des RDV du jour ---
-    date_col_rdv = _find_column(df_rdv_raw, ["date", "jour", "Date RDV", "Date Rendez-vous"])
-    daily_appointments_count = 0
-
-    if date_col_rdv and not df_rdv_raw.empty:
-        # On fait une copie temporaire pour travailler dessus
-        temp_df = df_rdv_raw.copy()
-        
-        # On convertit la colonne de date en s'assurant que les erreurs ne bloquent pas tout
-        temp_df[date_col_rdv] = pd.to_datetime(temp_df[date_col_rdv], errors='coerce')
-        
-        # On supprime les lignes où la conversion de date a échoué
-        temp_df.dropna(subset=[date_col_rdv], inplace=True)
-        
-        # On récupère la date d'aujourd'hui (sans l'heure)
-        today_date = datetime.now().date()
-        
-        # On filtre le DataFrame en comparant UNIQUEMENT la partie "date" (jour/mois/année)
-        today_s_rdv = temp_df[temp_df[date_col_rdv].dt.date == today_date]
-        
-        # Le compte final est la longueur de ce DataFrame filtré
-        daily_appointments_count = len(today_s_rdv)
-
-    metrics["daily_appointments"] = daily_appointments_count
-    # --- Fin du calcul fiable ---
-
-    total_recettes_directes = df_comptabilite_recettes[_find_column(df_comptabilite_recettes, ["Montant"])].sum() if not df_comptabilite_recettes.empty and _find_column(df_comptabilite_recettes, ["Montant"]) else 0
-    total_tiers_payants_recus = df_comptabilite_tiers_payants[df_comptabilite_tiers_payants[_find_column(df_comptabilite_tiers_payants, ["Statut"])].isin(['Réglé', 'Partiellement réglé'])][_find_column(df_comptabilite_tiers_payants, ["Montant_Recu"])].sum() if not df_comptabilite_tiers_payants.empty and _find_column(df_comptabilite_tiers_payants, ["Montant_Recu"]) and _find_column(df_comptabilite_tiers_payants, ["Statut"]) else 0
-    metrics["total_revenue"] = round(total_recettes_directes + total_tiers_payants_recus, 2)
-
-    total_depenses_directes = df_comptabilite_depenses[_find_column(df_comptabilite_depenses, ["Montant"])].sum() if not df_comptabilite_depenses.empty and _find_column(df_comptabilite_depenses, ["Montant"]) else 0
-    total_salaires_brut = df_comptabilite_salaires[_find_column(df_comptabilite_salaires, ["Total_Brut"])].sum() if not df_comptabilite_salaires.empty and _find_column(df_comptabilite_salaires, ["Total_Brut"]) else 0
-    metrics["total_expenses"] = round(total_depenses_directes + total_salaires_brut, 2)
-    metrics["net_profit"] = round(metrics["total_revenue"] - metrics["total_expenses"], 2)
-
-    # 8. Données Chart.js et analyse textuelle
-    charts = {}
-    
-    # ... (le reste de la fonction pour le calcul des graphiques reste inchangé) ...
-    if not df_consult.empty:
-        date_col = _find_column(df_consult, ["consultation_date", "date_rdv", "Date RDV", "Date", "Date Consultation"])
-        if date_col:
-            activ = (
-                df_consult
-                .dropna(subset=[date_col])
-                .groupby(df_consult[date_col].dt.to_period("M"))
-                .size()
-                .rename("count")
-                .reset_index()
-            )
-            charts["activite_labels"] = activ[date_col].dt.strftime("%Y-%m").tolist()
-            charts["activite_values"] = activ["count"].tolist()
-            if charts["activite_values"]:
-                max_consult = max(charts["activite_values"])
-                max_consult_month_idx = charts["activite_values"].index(max_consult)
-                max_consult_month = charts["activite_labels"][max_consult_month_idx]
-                charts["activite_analysis"] = f"Le mois avec le plus grand nombre de consultations est **{max_consult_month}** avec **{max_consult}** consultations."
-            else:
-                charts["activite_analysis"] = "Aucune donnée de consultation disponible pour cette période."
-        else:
-            charts["activite_labels"] = []
-            charts["activite_values"] = []
-            charts["activite_analysis"] = "Colonne de date de consultation introuvable."
-    else:
-        charts["activite_labels"] = []
-        charts["activite_values"] = []
-        charts["activite_analysis"] = "Aucune donnée de consultation disponible pour cette période."
-
-    finance_ts = _finance_timeseries(df_facture)
-    charts.update(finance_ts)
-    if charts.get("ca_values") and charts["ca_values"]:
-        max_ca = max(charts["ca_values"])
-        max_ca_month_idx = charts["ca_values"].index(max_ca)
-        max_ca_month = charts["ca_labels"][max_ca_month_idx]
-        total_ca = sum(charts["ca_values"])
-        charts["ca_analysis"] = f"Le total des recettes le plus élevé a été enregistré en **{max_ca_month}** avec **{max_ca:.2f} {utils.load_config().get('currency', 'EUR')}**. Le total des recettes pour la période est de **{total_ca:.2f} {utils.load_config().get('currency', 'EUR')}**."
-    else:
-        charts["ca_analysis"] = "Aucune donnée de total des recettes disponible pour cette période."
-
-    if not df_patient.empty:
-        sexe_col = _find_column(df_patient, ["gender", "Sexe", "Genre"])
-        patient_id_col = _find_column(df_patient, ["patient_id", "ID", "Patient ID", "ID Patient"])
-        if sexe_col and patient_id_col:
-            genre = df_patient.groupby(sexe_col)[patient_id_col].count()
-            charts["genre_labels"] = genre.index.tolist()
-            charts["genre_values"] = genre.values.tolist()
-            if charts["genre_values"] and sum(charts["genre_values"]) > 0:
-                total_patients = sum(charts["genre_values"])
-                sorted_genres = sorted(zip(charts["genre_values"], charts["genre_labels"]), reverse=True)
-                most_common_gender_count, most_common_gender = sorted_genres[0]
-                most_common_percentage = (most_common_gender_count / total_patients) * 100
-                charts["genre_analysis"] = f"Les patients sont majoritairement de sexe **{most_common_gender}** ({most_common_percentage:.1f}%), représentant {most_common_gender_count} patients."
-            else:
-                charts["genre_analysis"] = "Aucune donnée de répartition par sexe disponible."
-        else:
-            charts["genre_analysis"] = "Colonnes 'gender'/'Sexe' ou 'patient_id' introuvables dans les données patient dérivées."
-    else:
-        charts["genre_labels"] = []
-        charts["genre_values"] = []
-        charts["genre_analysis"] = "Aucune donnée de répartition par sexe disponible."
-
-    age_dist = _age_distribution(df_patient)
-    charts.update(age_dist)
-    if charts.get("age_values") and charts["age_values"]:
-        max_age_count = max(charts["age_values"])
-        max_age_group_idx = charts["age_values"].index(max_age_count)
-        max_age_group = charts["age_labels"][max_age_group_idx]
-        charts["age_analysis"] = f"La tranche d'âge la plus représentée est **{max_age_group}** avec **{max_age_count}** patients."
-    else:
-        charts["age_analysis"] = "Aucune donnée de tranche d'âge disponible pour cette période."
-
-    if not df_comptabilite_salaires.empty:
-        mois_annee_col = _find_column(df_comptabilite_salaires, ["Mois_Annee"])
-        total_brut_col = _find_column(df_comptabilite_salaires, ["Total_Brut"])
-        if mois_annee_col and total_brut_col:
-            df_salaries_processed = _process_dataframe(df_comptabilite_salaires, date_keys=[mois_annee_col], numeric_cols={total_brut_col: 0.0})
-            
-            if not df_salaries_processed.empty:
-                monthly_salaries = df_salaries_processed.groupby(df_salaries_processed[mois_annee_col].dt.to_period("M"))[total_brut_col].sum()
-
-                if not monthly_salaries.empty:
-                    all_months = pd.period_range(monthly_salaries.index.min(), monthly_salaries.index.max(), freq="M")
-                    monthly_salaries = monthly_salaries.reindex(all_months, fill_value=0)
-                
-                charts["salaries_monthly_labels"] = [p.strftime("%Y-%m") for p in monthly_salaries.index]
-                charts["salaries_monthly_values"] = monthly_salaries.round(2).tolist()
-                
-                if charts["salaries_monthly_values"] and sum(charts["salaries_monthly_values"]) > 0:
-                    max_salaries = max(charts["salaries_monthly_values"])
-                    max_salaries_month_idx = charts["salaries_monthly_values"].index(max_salaries)
-                    max_salaries_month = charts["salaries_monthly_labels"][max_salaries_month_idx]
-                    total_salaries_period = sum(charts["salaries_monthly_values"])
-                    charts["salaries_monthly_analysis"] = f"Le total des salaires le plus élevé a été enregistré en **{max_salaries_month}** avec **{max_salaries:.2f} {utils.load_config().get('currency', 'EUR')}**. Le total des salaires pour la période est de **{total_salaries_period:.2f} {utils.load_config().get('currency', 'EUR')}**."
-                else:
-                    charts["salaries_monthly_analysis"] = "Aucune donnée de salaires mensuels disponible pour cette période."
-            else:
-                charts["salaries_monthly_labels"] = []
-                charts["salaries_monthly_values"] = []
-                charts["salaries_monthly_analysis"] = "Aucune donnée de salaires mensuels disponible pour cette période."
-        else:
-            charts["salaries_monthly_labels"] = []
-            charts["salaries_monthly_values"] = []
-            charts["salaries_monthly_analysis"] = "Colonnes 'Mois_Annee' ou 'Total_Brut' des salaires introuvables."
-    else:
-        charts["salaries_monthly_labels"] = []
-        charts["salaries_monthly_values"] = []
-        charts["salaries_monthly_analysis"] = "Aucune donnée de salaires mensuels disponible pour cette période."
-
-    if not df_rdv.empty:
-        doctor_email_col = _find_column(df_rdv, ["Medecin_Email", "Email Médecin", "Médecin"])
-        if doctor_email_col:
-            rdv_doctor_counts = df_rdv[doctor_email_col].value_counts()
-            charts["rdv_doctor_labels"] = rdv_doctor_counts.index.tolist()
-            charts["rdv_doctor_values"] = rdv_doctor_counts.values.tolist()
-            if charts["rdv_doctor_values"] and sum(charts["rdv_doctor_values"]) > 0:
-                top_doctor_email = charts["rdv_doctor_labels"][0]
-                top_doctor_count = charts["rdv_doctor_values"][0]
-                charts["rdv_doctor_analysis"] = f"Le médecin avec le plus de rendez-vous est **{top_doctor_email.split('@')[0]}** avec **{top_doctor_count}** rendez-vous."
-            else:
-                charts["rdv_doctor_analysis"] = "Aucune donnée de rendez-vous par médecin disponible pour cette période."
-        else:
-            charts["rdv_doctor_analysis"] = "Colonne 'Medecin_Email' des rendez-vous introuvable."
-    else:
-        charts["rdv_doctor_labels"] = []
-        charts["rdv_doctor_values"] = []
-        charts["rdv_doctor_analysis"] = "Aucune donnée de rendez-vous par médecin disponible pour cette période."
-
-    if not df_comptabilite_depenses.empty:
-        category_col = _find_column(df_comptabilite_depenses, ["Categorie", "Catégorie Dépense"])
-        montant_col = _find_column(df_comptabilite_depenses, ["Montant", "Montant Dépense"])
-        if category_col and montant_col:
-            df_comptabilite_depenses_processed = _process_dataframe(df_comptabilite_depenses, numeric_cols={montant_col: 0.0})
-            expenses_by_category = df_comptabilite_depenses_processed.groupby(category_col)[montant_col].sum()
-            charts["expenses_category_labels"] = expenses_by_category.index.tolist()
-            charts["expenses_category_values"] = expenses_by_category.values.tolist()
-            if charts["expenses_category_values"] and sum(charts["expenses_category_values"]) > 0:
-                total_expenses_chart = sum(charts["expenses_category_values"])
-                sorted_expenses = sorted(zip(charts["expenses_category_values"], charts["expenses_category_labels"]), reverse=True)
-                largest_amount, largest_category = sorted_expenses[0]
-                largest_percentage = (largest_amount / total_expenses_chart) * 100
-                charts["expenses_category_analysis"] = f"La catégorie de dépenses la plus importante est **{largest_category}** avec **{largest_amount:.2f} {utils.load_config().get('currency', 'EUR')}** ({largest_percentage:.1f}% du total)."
-            else:
-                charts["expenses_category_analysis"] = "Aucune donnée de dépenses disponible pour cette période."
-        else:
-            charts["expenses_category_analysis"] = "Colonnes 'Catégorie' ou 'Montant' des dépenses introuvables."
-    else:
-        charts["expenses_category_labels"] = []
-        charts["expenses_category_values"] = []
-        charts["expenses_category_analysis"] = "Aucune donnée de dépenses disponible pour cette période."
-
-    if not df_comptabilite_recettes.empty:
-        type_acte_col = _find_column(df_comptabilite_recettes, ["Type_Acte", "Type Acte"])
-        montant_col = _find_column(df_comptabilite_recettes, ["Montant", "Montant Recette"])
-        if type_acte_col and montant_col:
-            df_comptabilite_recettes_processed = _process_dataframe(df_comptabilite_recettes, numeric_cols={montant_col: 0.0})
-            revenue_by_type_acte = df_comptabilite_recettes_processed.groupby(type_acte_col)[montant_col].sum()
-            charts["revenue_type_labels"] = revenue_by_type_acte.index.tolist()
-            charts["revenue_type_values"] = revenue_by_type_acte.values.tolist()
-            if charts["revenue_type_values"] and sum(charts["revenue_type_values"]) > 0:
-                total_revenue_acte = sum(charts["revenue_type_values"])
-                sorted_revenue = sorted(zip(charts["revenue_type_values"], charts["revenue_type_labels"]), reverse=True)
-                top_amount, top_type = sorted_revenue[0]
-                top_percentage = (top_amount / total_revenue_acte) * 100
-                charts["revenue_type_analysis"] = f"La source de recettes principale est **'{top_type}'** avec **{top_amount:.2f} {utils.load_config().get('currency', 'EUR')}** ({top_percentage:.1f}% du total)."
-            else:
-                charts["revenue_type_analysis"] = "Aucune donnée de recettes disponible pour cette période."
-        else:
-            charts["revenue_type_analysis"] = "Colonnes 'Type_Acte' ou 'Montant' des recettes introuvables."
-    else:
-        charts["revenue_type_labels"] = []
-        charts["revenue_type_values"] = []
-        charts["revenue_analysis"] = "Aucune donnée de recettes disponible pour cette période."
-
-    if not df_pharmacie_inventory.empty:
-        nom_col = _find_column(df_pharmacie_inventory, ["Nom", "Nom Produit"])
-        quantite_col = _find_column(df_pharmacie_inventory, ["Quantité", "Quantite Stock"])
-        if nom_col and quantite_col:
-            top_products = df_pharmacie_inventory.nlargest(10, quantite_col).set_index(nom_col)[quantite_col]
-            charts["top_products_labels"] = top_products.index.tolist()
-            charts["top_products_values"] = top_products.values.tolist()
-            if charts["top_products_values"] and sum(charts["top_products_values"]) > 0:
-                top_product_name = charts["top_products_labels"][0]
-                top_product_qty = top_products.iloc[0]
-                charts["top_products_analysis"] = f"Le produit le plus en stock est **'{top_product_name}'** avec **{top_product_qty}** unités."
-            else:
-                charts["top_products_analysis"] = "Aucune donnée de stock disponible pour les top produits."
-        else:
-            charts["top_products_analysis"] = "Colonnes 'Nom' ou 'Quantité' de l'inventaire introuvables."
-    else:
-        charts["top_products_labels"] = []
-        charts["top_products_values"] = []
-        charts["top_products_analysis"] = "Aucune donnée de stock disponible pour les top produits."
-
-    if not df_pharmacie_movements.empty:
-        type_mouvement_col = _find_column(df_pharmacie_movements, ["Type_Mouvement", "Type Mouvement"])
-        if type_mouvement_col:
-            movement_types = df_pharmacie_movements[type_mouvement_col].value_counts()
-            charts["movement_type_labels"] = movement_types.index.tolist()
-            charts["movement_type_values"] = movement_types.values.tolist()
-            if charts["movement_type_values"] and sum(charts["movement_type_values"]) > 0:
-                entry_count = movement_types.get("Entrée", 0)
-                exit_count = movement_types.get("Sortie", 0)
-                charts["movement_type_analysis"] = f"Il y a eu **{entry_count}** mouvements d'entrée et **{exit_count}** mouvements de sortie enregistrés."
-            else:
-                charts["movement_type_analysis"] = "Aucune donnée de mouvement de stock disponible."
-        else:
-            charts["movement_type_analysis"] = "Colonne 'Type_Mouvement' des mouvements de stock introuvable."
-    else:
-        charts["movement_type_labels"] = []
-        charts["movement_type_values"] = []
-        charts["movement_type_analysis"] = "Aucune donnée de mouvement de stock disponible."
+    # 5. Calculs des KPI (les graphiques sont calculés à la demande par chart_data)
+    metrics = _compute_metrics(period)
 
     unique_doctors = []
 
-    # 9. Rendre le modèle avec toutes les données calculées et l'analyse
+    # 6. Rendre le modèle
     return render_template_string(
         _TEMPLATE,
         config=utils.load_config(),
         theme_vars=theme.current_theme(),
         metrics=metrics,
-        charts=charts,
         theme_names=list(theme.THEMES.keys()),
         currency=utils.load_config().get("currency", "EUR"),
         start_date=start_str,
@@ -459,46 +160,97 @@ def stats_home():
         selected_charts=selected_charts
     )
 
-def _load_excel_safe(path: str) -> Union[pd.DataFrame, dict]:
+# ---------------------------------------------------------------------------
+#  Données d'un graphique (chargées par la page après son affichage)
+# ---------------------------------------------------------------------------
+# Nombre de graphiques calculés conservés en mémoire (toutes périodes et tenants confondus)
+CHART_CACHE_SIZE = int(os.environ.get("EASYMEDICALINK_STATS_CHART_CACHE", "256"))
+
+_chart_cache: "OrderedDict[str, dict]" = OrderedDict()   # ETag -> données du graphique
+_chart_cache_lock = threading.Lock()
+
+def _chart_etag(snapshot: stats_rollup.Snapshot, chart_id: str, start: str, end: str) -> str:
+    """Identifie un graphique calculé : change dès qu'une écriture modifie les agrégats du tenant."""
+    currency = utils.load_config().get("currency", "EUR")   # reprise dans les analyses
+    key = repr((snapshot.key, chart_id, start, end, currency))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+@statistique_bp.route("/chart/<chart_id>", methods=["GET"])
+def chart_data(chart_id):
     """
-    Charge en toute sécurité un fichier Excel dans un DataFrame ou un dictionnaire de DataFrames
-    s'il a plusieurs feuilles. Gère les erreurs de fichier introuvable et de corruption.
-    Retourne un DataFrame vide ou un dictionnaire vide si le chargement échoue.
+    Séries et analyse d'un seul graphique sur la période demandée (mêmes paramètres
+    start_date / end_date que stats_home). Chaque graphique est mis en cache
+    indépendamment, côté serveur et côté navigateur (ETag, revalidé à chaque affichage).
     """
-    if not os.path.exists(path):
-        logging.warning(f"Fichier non trouvé: {path}")
-        return pd.DataFrame()
-
+    if session.get("role") not in ["admin", "medecin"]:
+        return jsonify({"error": "Accès réservé aux administrateurs et médecins."}), 403
+    build = _CHART_BUILDERS.get(chart_id)
+    if build is None:
+        return jsonify({"error": f"Graphique inconnu : {chart_id}"}), 404
+    if session.get('email'):
+        utils.set_dynamic_base_dir(session.get('admin_email', 'default_admin@example.com'))
     try:
-        xls = pd.ExcelFile(path)
-        if len(xls.sheet_names) > 1:
-            loaded_data = {sheet_name: pd.read_excel(xls, sheet_name=sheet_name, dtype=str).fillna("") for sheet_name in xls.sheet_names}
-            logging.info(f"Fichier Excel '{os.path.basename(path)}' avec plusieurs feuilles chargé avec succès.")
-            return loaded_data
-        else:
-            df = pd.read_excel(xls, dtype=str).fillna("")
-            logging.info(f"Fichier Excel '{os.path.basename(path)}' chargé avec succès.")
-            return df
-    except Exception as e:
-        logging.error(f"Erreur inattendue lors du chargement du fichier Excel '{path}': {e}")
+        start_str, end_str = _requested_period()
+    except ValueError:
+        return jsonify({"error": "Format de date invalide, utilisez YYYY-MM-DD."}), 400
+
+    snapshot = load_cached_data()
+    etag = _chart_etag(snapshot, chart_id, start_str, end_str)
+    if request.if_none_match.contains(etag):
+        data = {}   # le navigateur a déjà cette version : réponse 304 sans calcul
+    else:
+        with _chart_cache_lock:
+            data = _chart_cache.get(etag)
+            if data is not None:
+                _chart_cache.move_to_end(etag)
+        if data is None:
+            data = build(_Period(snapshot, start_str or None, end_str or None))
+            with _chart_cache_lock:
+                _chart_cache[etag] = data
+                while len(_chart_cache) > CHART_CACHE_SIZE:
+                    _chart_cache.popitem(last=False)
+
+    response = jsonify(data)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
+
+def _workbook_frames(path: str, sheets) -> Union[pd.DataFrame, dict]:
+    """
+    Résultat de storage.read_workbooks pour un classeur : un DataFrame, ou un dictionnaire
+    de DataFrames s'il a plusieurs feuilles. Un DataFrame vide si la lecture a échoué.
+    """
+    if isinstance(sheets, FileNotFoundError):
+        log.warning("Fichier non trouvé: %s", path)
+        return pd.DataFrame()
+    if isinstance(sheets, Exception):
+        log.error("Erreur inattendue lors du chargement du fichier Excel '%s': %s", path, sheets)
         return pd.DataFrame()
+    if len(sheets) > 1:
+        loaded_data = {sheet_name: df.fillna("") for sheet_name, df in sheets.items()}
+        log.debug("Fichier Excel '%s' avec plusieurs feuilles chargé avec succès.", os.path.basename(path))
+        return loaded_data
+    df = next(iter(sheets.values()), pd.DataFrame()).fillna("")
+    log.debug("Fichier Excel '%s' chargé avec succès.", os.path.basename(path))
+    return df
 
 def _load_all_excels(folder: str) -> dict:
     """
     Charge tous les fichiers .xlsx/.xls du dossier spécifié.
     Retourne un dictionnaire où les clés sont les noms de fichiers et les valeurs sont des DataFrames
     (ou des dictionnaires de DataFrames pour les fichiers à plusieurs feuilles).
+    Les classeurs sont lus en parallèle (storage.read_workbooks), chacun une seule fois.
     """
-    df_map = {}
     if not os.path.isdir(folder):
-        logging.warning(f"Dossier Excel non trouvé: {folder}")
-        return df_map
-    for fname in os.listdir(folder):
-        if not fname.lower().endswith((".xlsx", ".xls")) or fname.startswith("~$"):
-            continue
-        full_path = os.path.join(folder, fname)
-        df_map[fname] = _load_excel_safe(full_path)
-    return df_map
+        log.warning("Dossier Excel non trouvé: %s", folder)
+        return {}
+    fnames = [fname for fname in os.listdir(folder)
+              if fname.lower().endswith((".xlsx", ".xls")) and not fname.startswith("~$")]
+    # Jeux de données présents uniquement en base (jamais exportés en .xlsx)
+    fnames += [fname for fname in storage.managed_files(folder) if fname not in fnames]
+    paths = {fname: os.path.join(folder, fname) for fname in fnames}
+    workbooks = storage.read_workbooks(paths.values(), dtype=str)
+    return {fname: _workbook_frames(path, workbooks[path]) for fname, path in paths.items()}
 
 def _find_column(df: pd.DataFrame, keys: list[str]) -> Optional[str]:
     """
@@ -508,97 +260,54 @@ def _find_column(df: pd.DataFrame, keys: list[str]) -> Optional[str]:
     """
     if df.empty:
         return None
-
-    df_columns_lower = {col.lower(): col for col in df.columns}
-
-    for key in keys:
-        if key.lower() in df_columns_lower:
-            return df_columns_lower[key.lower()]
-
-    for col_lower, original_col in df_columns_lower.items():
-        for key in keys:
-            if key.lower() in col_lower:
-                return original_col
-    return None
+    # Résolution mémorisée par (en-tête, clés) : les mêmes en-têtes reviennent à chaque affichage
+    return schema.find_column(df.columns, keys)
 
 def _process_dataframe(df: pd.DataFrame, date_keys: Optional[list[str]] = None,
                        numeric_cols: Optional[dict] = None, start_dt: Optional[datetime] = None,
-                       end_dt: Optional[datetime] = None) -> pd.DataFrame:
+                       end_dt: Optional[datetime] = None, source: Optional[str] = None) -> pd.DataFrame:
     """
     Fonction générique pour traiter les DataFrames : normaliser les colonnes de date, convertir les numériques,
     gérer les valeurs manquantes et filtrer par plage de dates.
+    `source` (classeur/feuille) permet de mémoriser les formats de date détectés pour cette colonne.
     Retourne un DataFrame traité, qui peut être vide si l'entrée est vide ou si le filtrage ne produit aucune ligne.
     """
     if df.empty:
-        print(f"DEBUG _process_dataframe: DataFrame d'entrée vide. Retourne un DataFrame vide.")
+        log.debug("DataFrame d'entrée vide. Retourne un DataFrame vide.")
         return pd.DataFrame()
 
     processed_df = df.copy()
-    print(f"DEBUG _process_dataframe: Début du traitement pour un DataFrame avec {len(processed_df)} lignes.")
-    print(f"DEBUG _process_dataframe: Colonnes du DataFrame: {processed_df.columns.tolist()}")
+    log.debug("Début du traitement pour un DataFrame avec %s lignes.", len(processed_df))
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Colonnes du DataFrame: %s", processed_df.columns.tolist())
 
     # Traitement de la colonne de date
     date_col = None
     if date_keys:
         date_col = _find_column(processed_df, date_keys)
         if date_col:
-            print(f"DEBUG _process_dataframe: Colonne de date trouvée: '{date_col}'.")
+            log.debug("Colonne de date trouvée: '%s'.", date_col)
             
-            # Convert to string and strip whitespace
-            date_strings = processed_df[date_col].astype(str).str.strip()
-
-            # Attempt parsing with multiple common formats
-            parsed_dates = pd.Series(pd.NaT, index=date_strings.index)
-            
-            # List of common date formats to try
-            common_formats = [
-                '%Y-%m-%d %H:%M:%S', # YYYY-MM-DD HH:MM:SS
-                '%Y-%m-%d %H:%M',   # YYYY-MM-DD HH:MM
-                '%Y-%m-%d',         # YYYY-MM-DD
-                '%d/%m/%Y %H:%M:%S', # DD/MM/YYYY HH:MM:SS
-                '%d/%m/%Y %H:%M',   # DD/MM/YYYY HH:MM
-                '%d/%m/%Y',         # DD/MM/YYYY
-                '%d-%m-%Y %H:%M:%S', # DD-MM-YYYY HH:MM:SS
-                '%d-%m-%Y %H:%M',   # DD-MM-Y HH:MM
-                '%d-%m-%Y',         # DD-MM-YYYY
-                '%Y/%m/%d %H:%M:%S', # YYYY/MM/DD HH:MM:SS
-                '%Y/%m/%d %H:%M',   # YYYY/MM/DD HH:MM
-                '%Y/%m/%d',         # YYYY/MM/DD
-                '%Y-%m',            # YYYY-MM (for month-year only, e.g., salaries)
-                '%m/%Y',            # MM/YYYY
-            ]
-
-            for fmt in common_formats:
-                unparsed_mask = parsed_dates.isna()
-                if not unparsed_mask.any(): # All dates parsed, break loop
-                    break
-                parsed_dates[unparsed_mask] = pd.to_datetime(date_strings[unparsed_mask], format=fmt, errors='coerce')
-                
-            # Fallback for any remaining unparsed dates (e.g., if dayfirst is truly needed or a very odd format)
-            unparsed_mask = parsed_dates.isna()
-            if unparsed_mask.any():
-                print(f"DEBUG _process_dataframe: {unparsed_mask.sum()} dates non parsées avec formats explicites. Tentative d'inférence avec dayfirst=True.")
-                parsed_dates[unparsed_mask] = pd.to_datetime(date_strings[unparsed_mask], errors='coerce', dayfirst=True) # Try inference with dayfirst
-
-            processed_df[date_col] = parsed_dates
+            # Formats détectés une fois par (classeur, colonne), conversion des seules valeurs distinctes
+            processed_df[date_col] = date_parser.parse_dates(processed_df[date_col], (source, date_col) if source else None)
             
             # Supprimer les lignes où la conversion de date a échoué (NaT - Not a Time)
             initial_rows = len(processed_df)
             processed_df = processed_df.dropna(subset=[date_col])
             if len(processed_df) < initial_rows:
-                print(f"DEBUG _process_dataframe: {initial_rows - len(processed_df)} lignes supprimées en raison de dates invalides après toutes les tentatives de parsage.")
+                log.debug("%s lignes supprimées en raison de dates invalides après toutes les tentatives de parsage.", initial_rows - len(processed_df))
 
             mask = pd.Series([True] * len(processed_df), index=processed_df.index)
             if start_dt:
-                print(f"DEBUG _process_dataframe: Application du filtre de date de début: {start_dt}.")
+                log.debug("Application du filtre de date de début: %s.", start_dt)
                 mask &= (processed_df[date_col] >= start_dt)
             if end_dt:
-                print(f"DEBUG _process_dataframe: Application du filtre de date de fin: {end_dt}.")
+                log.debug("Application du filtre de date de fin: %s.", end_dt)
                 mask &= (processed_df[date_col] <= end_dt)
             processed_df = processed_df[mask]
-            print(f"DEBUG _process_dataframe: Après filtrage par date, {len(processed_df)} lignes restantes.")
+            log.debug("Après filtrage par date, %s lignes restantes.", len(processed_df))
         else:
-            logging.warning(f"Aucune colonne de date trouvée pour le DataFrame. Clés recherchées: {date_keys}. Le filtrage par date ne sera pas appliqué.")
+            log.warning("Aucune colonne de date trouvée pour le DataFrame. Clés recherchées: %s. Le filtrage par date ne sera pas appliqué.", date_keys)
             pass 
 
     # Traitement des colonnes numériques
@@ -606,65 +315,84 @@ def _process_dataframe(df: pd.DataFrame, date_keys: Optional[list[str]] = None,
         for col_name, fill_value in numeric_cols.items():
             found_col = _find_column(processed_df, [col_name])
             if found_col:
-                print(f"DEBUG _process_dataframe: Traitement de la colonne numérique: '{found_col}'.")
+                log.debug("Traitement de la colonne numérique: '%s'.", found_col)
                 processed_df[found_col] = (
                     processed_df[found_col].astype(str)
                     .str.replace(r"[^\d,.\-]", "", regex=True)
                     .str.replace(",", ".", regex=False)
                 )
                 converted_series = pd.to_numeric(processed_df[found_col], errors="coerce")
-                nan_count = converted_series.isna().sum()
-                if nan_count > 0:
-                    print(f"DEBUG _process_dataframe: {nan_count} valeurs non numériques trouvées dans '{found_col}' et converties en NaN.")
-                
+                debug = log.isEnabledFor(logging.DEBUG)   # comptages et sommes uniquement pour le journal
+                if debug:
+                    nan_count = converted_series.isna().sum()
+                    if nan_count > 0:
+                        log.debug("%s valeurs non numériques trouvées dans '%s' et converties en NaN.", nan_count, found_col)
+
                 processed_df[found_col] = converted_series.fillna(fill_value)
-                print(f"DEBUG _process_dataframe: Colonne '{found_col}' convertie. Dtype: {processed_df[found_col].dtype}. Somme: {processed_df[found_col].sum()}.")
+                if debug:
+                    log.debug("Colonne '%s' convertie. Dtype: %s. Somme: %s.", found_col, processed_df[found_col].dtype, processed_df[found_col].sum())
             else:
-                logging.warning(f"Colonne numérique '{col_name}' non trouvée dans le DataFrame. Elle ne sera pas traitée.")
+                log.warning("Colonne numérique '%s' non trouvée dans le DataFrame. Elle ne sera pas traitée.", col_name)
 
-    print(f"DEBUG _process_dataframe: Fin du traitement. DataFrame résultant a {len(processed_df)} lignes.")
+    log.debug("Fin du traitement. DataFrame résultant a %s lignes.", len(processed_df))
     return processed_df
 
+# Colonnes de date de chaque source (traitement et agrégats quotidiens)
+CONSULT_DATE_KEYS = ["consultation_date", "date_rdv", "Date RDV", "Date", "Date Consultation"]
+FACTURE_DATE_KEYS = ["date", "jour", "day", "Date Facture"]
+RDV_DATE_KEYS = ["date", "jour", "Date RDV", "Date Rendez-vous"]
+RECETTE_DATE_KEYS = ["Date", "Date Recette"]
+DEPENSE_DATE_KEYS = ["Date", "Date Dépense"]
+SALAIRE_DATE_KEYS = ["Mois_Annee"]
+TIERS_PAYANT_DATE_KEYS = ["Date_Reglement", "Date Reglement"]
+INVENTAIRE_DATE_KEYS = ["Date_Enregistrement", "Date Enregistrement", "Date d'enregistrement"]
+MOUVEMENT_DATE_KEYS = ["Date", "Date Mouvement", "Date Transaction"]
+
 # Fonctions de traitement spécifiques utilisant l'aide générique _process_dataframe
 def process_consultations(df, start_dt=None, end_dt=None):
-    return _process_dataframe(df, date_keys=["consultation_date", "date_rdv", "Date RDV", "Date", "Date Consultation"],
-                              start_dt=start_dt, end_dt=end_dt)
+    return _process_dataframe(df, date_keys=CONSULT_DATE_KEYS,
+                              start_dt=start_dt, end_dt=end_dt, source="ConsultationData.xlsx")
 
 def process_factures(df, start_dt=None, end_dt=None):
-    return _process_dataframe(df, date_keys=["date", "jour", "day", "Date Facture"],
+    return _process_dataframe(df, date_keys=FACTURE_DATE_KEYS,
                               numeric_cols={"Montant": 0.0, "Sous-total": 0.0, "TVA": 0.0, "Total TTC": 0.0},
-                              start_dt=start_dt, end_dt=end_dt)
+                              start_dt=start_dt, end_dt=end_dt, source="factures.xlsx")
 
 def process_rdv(df, start_dt=None, end_dt=None):
-    return _process_dataframe(df, date_keys=["date", "jour", "Date RDV", "Date Rendez-vous"],
-                              start_dt=start_dt, end_dt=end_dt)
+    return _process_dataframe(df, date_keys=RDV_DATE_KEYS,
+                              start_dt=start_dt, end_dt=end_dt, source="DonneesRDV.xlsx")
 
 def process_comptabilite_recettes(df, start_dt=None, end_dt=None):
-    return _process_dataframe(df, date_keys=["Date", "Date Recette"],
+    return _process_dataframe(df, date_keys=RECETTE_DATE_KEYS,
                               numeric_cols={"Montant": 0.0},
-                              start_dt=start_dt, end_dt=end_dt)
+                              start_dt=start_dt, end_dt=end_dt, source="Comptabilite.xlsx/Recettes")
 
 def process_comptabilite_depenses(df, start_dt=None, end_dt=None):
-    return _process_dataframe(df, date_keys=["Date", "Date Dépense"],
+    return _process_dataframe(df, date_keys=DEPENSE_DATE_KEYS,
                               numeric_cols={"Montant": 0.0},
-                              start_dt=start_dt, end_dt=end_dt)
+                              start_dt=start_dt, end_dt=end_dt, source="Comptabilite.xlsx/Depenses")
 
 def process_comptabilite_tiers_payants(df, start_dt=None, end_dt=None):
-    return _process_dataframe(df, date_keys=["Date_Reglement", "Date Reglement"],
+    return _process_dataframe(df, date_keys=TIERS_PAYANT_DATE_KEYS,
                               numeric_cols={"Montant_Attendu": 0.0, "Montant_Recu": 0.0},
-                              start_dt=start_dt, end_dt=end_dt)
+                              start_dt=start_dt, end_dt=end_dt, source="Comptabilite.xlsx/TiersPayants")
 
 def process_pharmacie_inventory(df, start_dt=None, end_dt=None):
-    print(f"DEBUG process_pharmacie_inventory: Chargement de l'inventaire brut pour traitement.")
+    log.debug("Chargement de l'inventaire brut pour traitement.")
     return _process_dataframe(df, 
-                              date_keys=["Date_Enregistrement", "Date Enregistrement", "Date d'enregistrement"],
+                              date_keys=INVENTAIRE_DATE_KEYS,
                               numeric_cols={"Quantité": 0, "Prix_Vente": 0.0, "Prix_Achat": 0.0, "Seuil_Alerte": 0},
-                              start_dt=start_dt, end_dt=end_dt) # Passed start_dt and end_dt
+                              start_dt=start_dt, end_dt=end_dt, source="Pharmacie.xlsx/Inventaire")
+
+def process_comptabilite_salaires(df, start_dt=None, end_dt=None):
+    return _process_dataframe(df, date_keys=SALAIRE_DATE_KEYS,
+                              numeric_cols={"Total_Brut": 0.0},
+                              start_dt=start_dt, end_dt=end_dt, source="Comptabilite.xlsx/Salaires")
 
 def process_pharmacie_movements(df, start_dt=None, end_dt=None):
-    return _process_dataframe(df, date_keys=["Date", "Date Mouvement", "Date Transaction"],
+    return _process_dataframe(df, date_keys=MOUVEMENT_DATE_KEYS,
                               numeric_cols={"Quantité": 0},
-                              start_dt=start_dt, end_dt=end_dt)
+                              start_dt=start_dt, end_dt=end_dt, source="Pharmacie.xlsx/Mouvements")
 
 def process_patients_from_consultations(df_consult: pd.DataFrame) -> pd.DataFrame:
     """
@@ -679,7 +407,7 @@ def process_patients_from_consultations(df_consult: pd.DataFrame) -> pd.DataFram
     sexe_col = _find_column(df_consult, ["gender", "Sexe", "Genre"])
 
     if not patient_id_col:
-        logging.warning("Colonne 'patient_id' introuvable dans le DataFrame des consultations pour extraire les patients.")
+        log.warning("Colonne 'patient_id' introuvable dans le DataFrame des consultations pour extraire les patients.")
         return pd.DataFrame()
 
     columns_to_select = [patient_id_col]
@@ -693,257 +421,21 @@ def process_patients_from_consultations(df_consult: pd.DataFrame) -> pd.DataFram
     unique_patients_df = patient_demographics.drop_duplicates(subset=[patient_id_col], keep='first')
 
     if date_naissance_col and date_naissance_col in unique_patients_df.columns:
-        # LOGIQUE DE PARSING DE DATE AMÉLIORÉE ET HARMONISÉE
-        date_strings_patient = unique_patients_df[date_naissance_col].astype(str).str.strip()
-        parsed_dates_patient = pd.Series(pd.NaT, index=date_strings_patient.index)
-        
-        # Utilisation de la liste de formats complète, identique à _process_dataframe
-        common_formats = [
-            '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d',
-            '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y',
-            '%d-%m-%Y %H:%M:%S', '%d-%m-%Y %H:%M', '%d-%m-%Y',
-            '%Y/%m/%d %H:%M:%S', '%Y/%m/%d %H:%M', '%Y/%m/%d',
-            '%Y-%m', '%m/%Y',
-        ]
-        
-        for fmt in common_formats:
-            unparsed_mask_patient = parsed_dates_patient.isna()
-            if not unparsed_mask_patient.any():
-                break
-            parsed_dates_patient[unparsed_mask_patient] = pd.to_datetime(date_strings_patient[unparsed_mask_patient], format=fmt, errors='coerce')
-        
-        # Fallback pour les formats non reconnus
-        if parsed_dates_patient.isna().any():
-            parsed_dates_patient[parsed_dates_patient.isna()] = pd.to_datetime(date_strings_patient[parsed_dates_patient.isna()], errors='coerce', dayfirst=True)
-
-        unique_patients_df[date_naissance_col] = parsed_dates_patient
+        # Même conversion que _process_dataframe (formats mémorisés pour cette colonne)
+        unique_patients_df[date_naissance_col] = date_parser.parse_dates(
+            unique_patients_df[date_naissance_col], ("ConsultationData.xlsx", date_naissance_col)
+        )
         unique_patients_df = unique_patients_df.dropna(subset=[date_naissance_col])
     else:
-        logging.warning("Colonne 'DateNaissance' non trouvée dans le DataFrame patient dérivé des consultations.")
+        log.warning("Colonne 'DateNaissance' non trouvée dans le DataFrame patient dérivé des consultations.")
 
     return unique_patients_df
 
-def _total_revenue(df_facture: pd.DataFrame) -> float:
-    """Calcule le chiffre d'affaires total à partir des factures (Sous-total + TVA)."""
-    if df_facture.empty:
-        return 0.0
-
-    sous_total_col = _find_column(df_facture, ["Sous-total", "HT", "subtotal", "Montant HT"])
-    tva_col = _find_column(df_facture, ["TVA", "tax", "vat", "Montant TVA"])
-    total_ttc_col = _find_column(df_facture, ["Total TTC", "Total"])
-
-    if total_ttc_col:
-        df_processed = _process_dataframe(df_facture, numeric_cols={total_ttc_col: 0.0})
-        if not df_processed.empty:
-            return round(df_processed[total_ttc_col].sum(), 2)
-
-    if not sous_total_col or not tva_col:
-        logging.warning("Colonnes 'Sous-total' ou 'TVA' introuvables pour le calcul du chiffre d'affaires.")
-        return 0.0
-
-    df_processed = _process_dataframe(df_facture, numeric_cols={sous_total_col: 0.0, tva_col: 0.0})
-
-    if df_processed.empty:
-        return 0.0
-
-    ttc_calculated = df_processed[sous_total_col] + df_processed[tva_col]
-    return round(ttc_calculated.sum(), 2)
-
-def _total_stock_value(df_pharmacie_inventory: pd.DataFrame) -> float:
-    """Calcule la valeur totale du stock (Quantité * Prix d'achat)."""
-    print(f"DEBUG _total_stock_value: Début du calcul de la valeur du stock.")
-    if df_pharmacie_inventory.empty:
-        print("DEBUG _total_stock_value: DataFrame d'inventaire vide. Retourne 0.0.")
-        return 0.0
-
-    quantite_col = _find_column(df_pharmacie_inventory, ["Quantité", "Quantite Stock"])
-    prix_achat_col = _find_column(df_pharmacie_inventory, ["Prix_Achat", "Prix Achat", "Prix Unitaire Achat"])
-
-    if not quantite_col or not prix_achat_col:
-        logging.warning(f"Colonnes 'Quantité' ('{quantite_col}') ou 'Prix_Achat' ('{prix_achat_col}') introuvables pour le calcul de la valeur du stock.")
-        print("DEBUG _total_stock_value: Colonnes requises manquantes. Retourne 0.0.")
-        return 0.0
-
-    df_inventory_processed = df_pharmacie_inventory
-    print(f"DEBUG _total_stock_value: DataFrame d'inventaire traité. Lignes: {len(df_inventory_processed)}.")
-    print(f"DEBUG _total_stock_value: Colonnes 'Quantité' (dtype: {df_inventory_processed[quantite_col].dtype}) et 'Prix_Achat' (dtype: {df_inventory_processed[prix_achat_col].dtype}).")
-    print(f"DEBUG _total_stock_value: Premières valeurs de Quantité: {df_inventory_processed[quantite_col].head().tolist()}")
-    print(f"DEBUG _total_stock_value: Premières valeurs de Prix_Achat: {df_inventory_processed[prix_achat_col].head().tolist()}")
-
-
-    if df_inventory_processed.empty:
-        print("DEBUG _total_stock_value: DataFrame d'inventaire traité est vide. Retourne 0.0.")
-        return 0.0
-
-    calculated_value = (df_inventory_processed[quantite_col] * df_inventory_processed[prix_achat_col]).sum()
-    final_value = round(calculated_value, 2)
-    print(f"DEBUG _total_stock_value: Valeur calculée brute: {calculated_value}. Valeur finale arrondie: {final_value}.")
-    return final_value
-
-def _conversion_rdv_consultation(df_rdv: pd.DataFrame, df_consult: pd.DataFrame) -> str:
-    """
-    Calcule le taux de conversion des rendez-vous (RDV) en consultations.
-    Suppose la colonne 'Statut' dans df_rdv et 'patient_id' dans les deux.
-    """
-    if df_rdv.empty or df_consult.empty:
-        return "0.00%"
-
-    rdv_patient_id_col = _find_column(df_rdv, ["patient_id", "Patient ID", "ID Patient"])
-    consult_patient_id_col = _find_column(df_consult, ["patient_id", "Patient ID", "ID Patient"])
-    rdv_status_col = _find_column(df_rdv, ["Statut", "Status RDV"])
-
-    if not rdv_patient_id_col or not consult_patient_id_col or not rdv_status_col:
-        logging.warning("Colonnes nécessaires pour le taux de conversion RDV -> Consultation introuvables.")
-        return "N/A"
-
-    confirmed_rdv_patients = df_rdv[df_rdv[rdv_status_col].isin(["Confirmé", "Terminé", "Effectué"])][rdv_patient_id_col].nunique()
-
-    consulted_patients = df_consult[consult_patient_id_col].nunique()
-
-    if confirmed_rdv_patients == 0:
-        return "0.00%"
-    
-    conversion_rate = (consulted_patients / confirmed_rdv_patients) * 100
-    return f"{conversion_rate:.2f}%"
-
-def _top_sold_products(df_pharmacie_movements: pd.DataFrame) -> dict:
-    """
-    Identifie les 3 produits les plus vendus/utilisés en fonction des mouvements de 'Sortie'.
-    Retourne un dictionnaire avec le nom du produit et la quantité.
-    """
-    if df_pharmacie_movements.empty:
-        return {"name": "N/A", "quantity": 0}
-
-    product_name_col = _find_column(df_pharmacie_movements, ["Nom_Produit", "Produit", "Nom Produit"])
-    type_mouvement_col = _find_column(df_pharmacie_movements, ["Type_Mouvement", "Type Mouvement"])
-    quantite_col = _find_column(df_pharmacie_movements, ["Quantité", "Quantite Mouvement"])
-
-    if not product_name_col or not type_mouvement_col or not quantite_col:
-        logging.warning("Colonnes nécessaires pour les produits les plus vendus introuvables.")
-        return {"name": "N/A", "quantity": 0}
-
-    df_movements_processed = _process_dataframe(df_pharmacie_movements, numeric_cols={quantite_col: 0})
-    
-    sales_df = df_movements_processed[df_movements_processed[type_mouvement_col] == "Sortie"]
-
-    if sales_df.empty:
-        return {"name": "Aucun produit vendu", "quantity": 0}
-
-    product_sales = sales_df.groupby(product_name_col)[quantite_col].sum().nlargest(3)
-
-    if product_sales.empty:
-        return {"name": "Aucun produit vendu", "quantity": 0}
-
-    top_product_name = product_sales.index[0]
-    top_product_quantity = product_sales.iloc[0]
-
-    return {"name": top_product_name, "quantity": int(top_product_quantity)}
-
-def _net_profit(df_recettes: pd.DataFrame, df_depenses: pd.DataFrame, df_salaires: pd.DataFrame, df_tiers_payants: pd.DataFrame) -> float:
-    """
-    Calcule le bénéfice net : Recettes + Tiers Payants Reçus - (Dépenses + Salaires).
-    """
-    total_recettes = 0.0
-    montant_recette_col = _find_column(df_recettes, ["Montant", "Montant Recette"])
-    if not df_recettes.empty and montant_recette_col:
-        df_recettes_processed = _process_dataframe(df_recettes, numeric_cols={montant_recette_col: 0.0})
-        total_recettes = df_recettes_processed[montant_recette_col].sum()
-    else:
-        logging.warning("Colonne 'Montant' des recettes introuvable ou DataFrame vide pour le calcul du bénéfice net.")
-
-    total_tiers_payants_recus = 0.0
-    montant_recu_tp_col = _find_column(df_tiers_payants, ["Montant_Recu", "Montant Recu"])
-    statut_tp_col = _find_column(df_tiers_payants, ["Statut"])
-    if not df_tiers_payants.empty and montant_recu_tp_col and statut_tp_col:
-        df_tp_processed = _process_dataframe(df_tiers_payants, numeric_cols={montant_recu_tp_col: 0.0})
-        total_tiers_payants_recus = df_tp_processed[
-            df_tp_processed[statut_tp_col].isin(['Réglé', 'Partiellement réglé'])
-        ][montant_recu_tp_col].sum()
-    else:
-        logging.warning("Colonnes 'Montant_Recu' ou 'Statut' des tiers payants introuvables ou DataFrame vide pour le calcul du bénéfice net.")
-
-    total_depenses = 0.0
-    montant_depense_col = _find_column(df_depenses, ["Montant", "Montant Dépense"])
-    if not df_depenses.empty and montant_depense_col:
-        df_depenses_processed = _process_dataframe(df_depenses, numeric_cols={montant_depense_col: 0.0})
-        total_depenses = df_depenses_processed[montant_depense_col].sum()
-    else:
-        logging.warning("Colonne 'Montant' des dépenses introuvable ou DataFrame vide pour le calcul du bénéfice net.")
-
-    total_salaires = 0.0
-    montant_salaire_col = _find_column(df_salaires, ["Total_Brut"]) 
-    if not df_salaires.empty and montant_salaire_col:
-        df_salaires_processed = _process_dataframe(df_salaires, numeric_cols={montant_salaire_col: 0.0})
-        total_salaires = df_salaires_processed[montant_salaire_col].sum()
-    else:
-        logging.warning("Colonne 'Total_Brut' des salaires introuvable ou DataFrame vide pour le calcul du bénéfice net.")
-
-    total_revenues = total_recettes + total_tiers_payants_recus
-    total_expenses = total_depenses + total_salaires
-
-    net_profit = total_revenues - total_expenses
-    return round(net_profit, 2)
-
-def _finance_timeseries(df_facture: pd.DataFrame) -> dict:
-    """
-    Prépare les données pour le graphique de série chronologique des revenus mensuels.
-    Calcule le total TTC à partir des colonnes 'Sous-total' et 'TVA'.
-    """
-    if df_facture.empty:
-        return {"ca_labels": [], "ca_values": []}
-
-    date_col = _find_column(df_facture, ["date", "jour", "day", "Date Facture"])
-    sous_total_col = _find_column(df_facture, ["Sous-total", "HT", "subtotal", "Montant HT"])
-    tva_col = _find_column(df_facture, ["TVA", "tax", "vat", "Montant TVA"])
-    total_ttc_col = _find_column(df_facture, ["Total TTC", "Total"])
-
-    df_processed = df_facture.copy()
-
-    if total_ttc_col:
-        df_processed = _process_dataframe(df_facture, date_keys=[date_col], numeric_cols={total_ttc_col: 0.0})
-        if not df_processed.empty:
-            df_processed['calculated_total_ttc'] = df_processed[total_ttc_col]
-        else:
-            logging.warning("La colonne 'Total TTC' est vide ou invalide après traitement.")
-            return {"ca_labels": [], "ca_values": []}
-    elif date_col and sous_total_col and tva_col:
-        df_processed = _process_dataframe(df_facture, date_keys=[date_col], numeric_cols={sous_total_col: 0.0, tva_col: 0.0})
-        if not df_processed.empty:
-            df_processed['calculated_total_ttc'] = df_processed[sous_total_col] + df_processed[tva_col]
-        else:
-            logging.warning("Les colonnes 'Sous-total' ou 'TVA' sont vides ou invalides après traitement.")
-            return {"ca_labels": [], "ca_values": []}
-    else:
-        logging.warning("Colonnes nécessaires pour la série temporelle financière introuvables.")
-        return {"ca_labels": [], "ca_values": []}
-
-    if df_processed.empty:
-        return {"ca_labels": [], "ca_values": []}
-
-    df_processed = df_processed.dropna(subset=[date_col, 'calculated_total_ttc'])
-    if df_processed.empty:
-        return {"ca_labels": [], "ca_values": []}
-
-    df_processed["period"] = df_processed[date_col].dt.to_period("M")
-
-    ca = df_processed.groupby("period")['calculated_total_ttc'].sum()
-
-    if not ca.empty:
-        all_months = pd.period_range(ca.index.min(), ca.index.max(), freq="M")
-        ca = ca.reindex(all_months, fill_value=0)
-    else:
-        return {"ca_labels": [], "ca_values": []}
-
-    labels = [p.strftime("%Y-%m") for p in ca.index]
-    values = ca.round(2).tolist()
-
-    return {"ca_labels": labels, "ca_values": values}
-
 def _age_distribution(df_patient: pd.DataFrame) -> dict:
     """Calcule la distribution d'âge des patients en tranches prédéfinies."""
     date_naissance_col = _find_column(df_patient, ["date_of_birth", "DateNaissance", "Date de Naissance", "DOB"])
     if not date_naissance_col:
-        logging.warning("Colonne 'date_of_birth'/'DateNaissance' introuvable pour la distribution par âge dans le DataFrame patient dérivé.")
+        log.warning("Colonne 'date_of_birth'/'DateNaissance' introuvable pour la distribution par âge dans le DataFrame patient dérivé.")
         return {"age_labels": [], "age_values": []}
 
     if not pd.api.types.is_datetime64_any_dtype(df_patient[date_naissance_col]):
@@ -971,6 +463,335 @@ def _age_distribution(df_patient: pd.DataFrame) -> dict:
     return {"age_labels": grp.index.tolist(), "age_values": grp.values.tolist()}
 
 
+# ---------------------------------------------------------------------------
+#  Agrégats quotidiens (stats_rollup) : repli des sources
+# ---------------------------------------------------------------------------
+# Chaque fonction reçoit les nouvelles lignes d'une feuille (texte, index =
+# identifiants de ligne), les traite avec les mêmes process_* que l'affichage
+# et retourne (agrégats quotidiens, entités ou None). La dimension "lignes"
+# compte les lignes datées de chaque source.
+def _days(df: pd.DataFrame, date_keys: list) -> Optional[pd.Series]:
+    """Jour 'AAAA-MM-JJ' de chaque ligne traitée, ou None sans colonne de date exploitable."""
+    date_col = _find_column(df, date_keys)
+    if not date_col:
+        return None
+    return pd.to_datetime(df[date_col], errors="coerce").dt.strftime("%Y-%m-%d")
+
+def _numeric_column(df: pd.DataFrame, keys: list) -> Optional[pd.Series]:
+    """Colonne numérique nettoyée comme par _process_dataframe, ou None si elle est absente."""
+    col = _find_column(df, keys)
+    if not col:
+        return None
+    return _process_dataframe(df[[col]], numeric_cols={col: 0.0})[col]
+
+def _fold_consultations(rows: pd.DataFrame):
+    df = process_consultations(rows)
+    days = _days(df, CONSULT_DATE_KEYS)
+    if days is None:
+        return None, None
+    entities = None
+    patient_id_col = _find_column(df, ["patient_id", "Patient ID", "ID Patient"])
+    if patient_id_col:
+        # Attributs repris par process_patients_from_consultations à l'affichage
+        columns = [patient_id_col] + [c for c in (
+            _find_column(df, ["date_of_birth", "DateNaissance", "Date de Naissance", "DOB"]),
+            _find_column(df, ["gender", "Sexe", "Genre"]),
+        ) if c]
+        entities = pd.DataFrame({
+            "entite": df[patient_id_col].astype(str),
+            "jour": days,
+            "seq": df.index,
+            "attributs": df[columns].to_dict(orient="records"),
+        }, index=df.index).drop_duplicates(subset=["entite", "jour"], keep="first")
+    return stats_rollup.daily("lignes", days), entities
+
+def _fold_factures(rows: pd.DataFrame):
+    df = process_factures(rows)
+    days = _days(df, FACTURE_DATE_KEYS)
+    if days is None:
+        return None, None
+    parts = [stats_rollup.daily("lignes", days)]
+    # Chiffre d'affaires : Total TTC, sinon Sous-total + TVA
+    ttc = _numeric_column(df, ["Total TTC", "Total"])
+    if ttc is None:
+        sous_total = _numeric_column(df, ["Sous-total", "HT", "subtotal", "Montant HT"])
+        tva = _numeric_column(df, ["TVA", "tax", "vat", "Montant TVA"])
+        if sous_total is not None and tva is not None:
+            ttc = sous_total + tva
+    if ttc is not None:
+        parts.append(stats_rollup.daily("ca", days, valeurs=ttc))
+    return pd.concat(parts, ignore_index=True), None
+
+def _fold_rdv(rows: pd.DataFrame):
+    df = process_rdv(rows)
+    days = _days(df, RDV_DATE_KEYS)
+    if days is None:
+        return None, None
+    parts = [stats_rollup.daily("lignes", days)]
+    doctor_email_col = _find_column(df, ["Medecin_Email", "Email Médecin", "Médecin"])
+    if doctor_email_col:
+        parts.append(stats_rollup.daily("medecin", days, cles=df[doctor_email_col]))
+    return pd.concat(parts, ignore_index=True), None
+
+def _fold_recettes(rows: pd.DataFrame):
+    df = process_comptabilite_recettes(rows)
+    days = _days(df, RECETTE_DATE_KEYS)
+    if days is None:
+        return None, None
+    montant = _numeric_column(df, ["Montant", "Montant Recette"])
+    parts = [stats_rollup.daily("lignes", days, valeurs=montant)]
+    type_acte_col = _find_column(df, ["Type_Acte", "Type Acte"])
+    if type_acte_col and montant is not None:
+        parts.append(stats_rollup.daily("type_acte", days, cles=df[type_acte_col], valeurs=montant))
+    return pd.concat(parts, ignore_index=True), None
+
+def _fold_depenses(rows: pd.DataFrame):
+    df = process_comptabilite_depenses(rows)
+    days = _days(df, DEPENSE_DATE_KEYS)
+    if days is None:
+        return None, None
+    montant = _numeric_column(df, ["Montant", "Montant Dépense"])
+    parts = [stats_rollup.daily("lignes", days, valeurs=montant)]
+    category_col = _find_column(df, ["Categorie", "Catégorie Dépense"])
+    if category_col and montant is not None:
+        parts.append(stats_rollup.daily("categorie", days, cles=df[category_col], valeurs=montant))
+    return pd.concat(parts, ignore_index=True), None
+
+def _fold_salaires(rows: pd.DataFrame):
+    df = process_comptabilite_salaires(rows)
+    days = _days(df, SALAIRE_DATE_KEYS)
+    if days is None:
+        return None, None
+    return stats_rollup.daily("lignes", days, valeurs=_numeric_column(df, ["Total_Brut"])), None
+
+def _fold_tiers_payants(rows: pd.DataFrame):
+    df = process_comptabilite_tiers_payants(rows)
+    days = _days(df, TIERS_PAYANT_DATE_KEYS)
+    if days is None:
+        return None, None
+    parts = [stats_rollup.daily("lignes", days)]
+    montant_recu = _numeric_column(df, ["Montant_Recu", "Montant Recu"])
+    statut_col = _find_column(df, ["Statut"])
+    if montant_recu is not None and statut_col:
+        regles = df[statut_col].isin(['Réglé', 'Partiellement réglé'])
+        parts.append(stats_rollup.daily("recu", days[regles], valeurs=montant_recu[regles]))
+    return pd.concat(parts, ignore_index=True), None
+
+def _fold_inventaire(rows: pd.DataFrame):
+    df = process_pharmacie_inventory(rows)
+    days = _days(df, INVENTAIRE_DATE_KEYS)
+    if days is None:
+        return None, None
+    parts = [stats_rollup.daily("lignes", days)]
+    nom_col = _find_column(df, ["Nom", "Nom Produit"])
+    quantite = _numeric_column(df, ["Quantité", "Quantite Stock"])
+    prix_achat = _numeric_column(df, ["Prix_Achat", "Prix Achat", "Prix Unitaire Achat"])
+    if nom_col and quantite is not None:
+        parts.append(stats_rollup.daily("produit", days, cles=df[nom_col], valeurs=quantite))
+    if quantite is not None and prix_achat is not None:
+        parts.append(stats_rollup.daily("valeur_stock", days, valeurs=quantite * prix_achat))
+    return pd.concat(parts, ignore_index=True), None
+
+def _fold_mouvements(rows: pd.DataFrame):
+    df = process_pharmacie_movements(rows)
+    days = _days(df, MOUVEMENT_DATE_KEYS)
+    if days is None:
+        return None, None
+    parts = [stats_rollup.daily("lignes", days)]
+    type_mouvement_col = _find_column(df, ["Type_Mouvement", "Type Mouvement"])
+    if type_mouvement_col:
+        parts.append(stats_rollup.daily("type", days, cles=df[type_mouvement_col]))
+    return pd.concat(parts, ignore_index=True), None
+
+_SOURCES = [
+    stats_rollup.Source("consultations", "ConsultationData.xlsx", None, _fold_consultations),
+    stats_rollup.Source("factures", "factures.xlsx", None, _fold_factures),
+    stats_rollup.Source("rdv", "DonneesRDV.xlsx", None, _fold_rdv),
+    stats_rollup.Source("recettes", "Comptabilite.xlsx", "Recettes", _fold_recettes),
+    stats_rollup.Source("depenses", "Comptabilite.xlsx", "Depenses", _fold_depenses),
+    stats_rollup.Source("salaires", "Comptabilite.xlsx", "Salaires", _fold_salaires),
+    stats_rollup.Source("tiers_payants", "Comptabilite.xlsx", "TiersPayants", _fold_tiers_payants),
+    stats_rollup.Source("inventaire", "Pharmacie.xlsx", "Inventaire", _fold_inventaire),
+    stats_rollup.Source("mouvements", "Pharmacie.xlsx", "Mouvements", _fold_mouvements),
+]
+
+
+# ---------------------------------------------------------------------------
+#  Agrégats quotidiens : KPI et graphiques d'une période
+# ---------------------------------------------------------------------------
+class _Period(stats_rollup.Window):
+    """Période affichée ; les patients uniques ne sont reconstitués qu'une fois."""
+
+    _patients = None
+
+    def patients(self) -> pd.DataFrame:
+        """Équivalent de process_patients_from_consultations sur les consultations de la période."""
+        if self._patients is None:
+            self._patients = process_patients_from_consultations(
+                pd.DataFrame(self.first_entities("consultations"))
+            )
+        return self._patients
+
+def _monthly(frame: pd.DataFrame, column: str, fill_gaps: bool = False) -> tuple:
+    """(libellés 'AAAA-MM', valeurs) d'un by_month ; fill_gaps ajoute les mois vides à 0."""
+    series = frame.set_index("mois")[column]
+    if fill_gaps and not series.empty:
+        months = pd.period_range(series.index.min(), series.index.max(), freq="M").strftime("%Y-%m")
+        series = series.reindex(months, fill_value=0)
+    return series.index.tolist(), series.tolist()
+
+def _quantity(value):
+    """Quantité agrégée (réel SQLite) affichée comme un entier si elle l'est."""
+    return int(value) if float(value).is_integer() else value
+
+def _compute_metrics(period: _Period) -> dict:
+    patients = period.patients()
+    patient_id_col = _find_column(patients, ["patient_id", "Patient ID", "ID Patient"])
+    total_revenue = period.totals("recettes", "lignes")[1] + period.totals("tiers_payants", "recu")[1]
+    total_expenses = period.totals("depenses", "lignes")[1] + period.totals("salaires", "lignes")[1]
+    metrics = {
+        "total_factures": period.totals("factures", "lignes")[0],
+        "total_patients": patients[patient_id_col].nunique() if patient_id_col else 0,
+        "total_revenue": round(total_revenue, 2),
+        "total_appointments": period.totals("rdv", "lignes")[0],
+        # RDV du jour, indépendamment de la période affichée
+        "daily_appointments": period.totals("rdv", "lignes", jour=datetime.now().strftime("%Y-%m-%d"))[0],
+        "total_stock_value": round(period.totals("inventaire", "valeur_stock")[1], 2),
+        "total_expenses": round(total_expenses, 2),
+    }
+    metrics["net_profit"] = round(metrics["total_revenue"] - metrics["total_expenses"], 2)
+    return metrics
+
+def _chart_activite(period: _Period) -> dict:
+    labels, values = _monthly(period.by_month("consultations", "lignes"), "nombre")
+    if values:
+        max_consult = max(values)
+        max_consult_month = labels[values.index(max_consult)]
+        analysis = f"Le mois avec le plus grand nombre de consultations est **{max_consult_month}** avec **{max_consult}** consultations."
+    else:
+        analysis = "Aucune donnée de consultation disponible pour cette période."
+    return {"activite_labels": labels, "activite_values": values, "activite_analysis": analysis}
+
+def _chart_ca(period: _Period) -> dict:
+    labels, values = _monthly(period.by_month("factures", "ca"), "total", fill_gaps=True)
+    values = [round(v, 2) for v in values]
+    if values:
+        currency = utils.load_config().get('currency', 'EUR')
+        max_ca = max(values)
+        max_ca_month = labels[values.index(max_ca)]
+        total_ca = sum(values)
+        analysis = f"Le total des recettes le plus élevé a été enregistré en **{max_ca_month}** avec **{max_ca:.2f} {currency}**. Le total des recettes pour la période est de **{total_ca:.2f} {currency}**."
+    else:
+        analysis = "Aucune donnée de total des recettes disponible pour cette période."
+    return {"ca_labels": labels, "ca_values": values, "ca_analysis": analysis}
+
+def _chart_genre(period: _Period) -> dict:
+    df_patient = period.patients()
+    chart = {"genre_labels": [], "genre_values": [],
+             "genre_analysis": "Aucune donnée de répartition par sexe disponible."}
+    sexe_col = _find_column(df_patient, ["gender", "Sexe", "Genre"])
+    patient_id_col = _find_column(df_patient, ["patient_id", "ID", "Patient ID", "ID Patient"])
+    if sexe_col and patient_id_col:
+        genre = df_patient.groupby(sexe_col)[patient_id_col].count()
+        chart["genre_labels"] = genre.index.tolist()
+        chart["genre_values"] = genre.values.tolist()
+        if chart["genre_values"] and sum(chart["genre_values"]) > 0:
+            total_patients = sum(chart["genre_values"])
+            most_common_gender_count, most_common_gender = sorted(zip(chart["genre_values"], chart["genre_labels"]), reverse=True)[0]
+            most_common_percentage = (most_common_gender_count / total_patients) * 100
+            chart["genre_analysis"] = f"Les patients sont majoritairement de sexe **{most_common_gender}** ({most_common_percentage:.1f}%), représentant {most_common_gender_count} patients."
+    return chart
+
+def _chart_age(period: _Period) -> dict:
+    chart = _age_distribution(period.patients())
+    if chart.get("age_values"):
+        max_age_count = max(chart["age_values"])
+        max_age_group = chart["age_labels"][chart["age_values"].index(max_age_count)]
+        chart["age_analysis"] = f"La tranche d'âge la plus représentée est **{max_age_group}** avec **{max_age_count}** patients."
+    else:
+        chart["age_analysis"] = "Aucune donnée de tranche d'âge disponible pour cette période."
+    return chart
+
+def _chart_salaires(period: _Period) -> dict:
+    labels, values = _monthly(period.by_month("salaires", "lignes"), "total", fill_gaps=True)
+    values = [round(v, 2) for v in values]
+    if values and sum(values) > 0:
+        currency = utils.load_config().get('currency', 'EUR')
+        max_salaries = max(values)
+        max_salaries_month = labels[values.index(max_salaries)]
+        total_salaries_period = sum(values)
+        analysis = f"Le total des salaires le plus élevé a été enregistré en **{max_salaries_month}** avec **{max_salaries:.2f} {currency}**. Le total des salaires pour la période est de **{total_salaries_period:.2f} {currency}**."
+    else:
+        analysis = "Aucune donnée de salaires mensuels disponible pour cette période."
+    return {"salaries_monthly_labels": labels, "salaries_monthly_values": values,
+            "salaries_monthly_analysis": analysis}
+
+def _chart_rdv_medecin(period: _Period) -> dict:
+    counts = period.by_key("rdv", "medecin").sort_values(["nombre", "cle"], ascending=[False, True])
+    labels, values = counts["cle"].tolist(), counts["nombre"].tolist()
+    if values and sum(values) > 0:
+        analysis = f"Le médecin avec le plus de rendez-vous est **{labels[0].split('@')[0]}** avec **{values[0]}** rendez-vous."
+    else:
+        analysis = "Aucune donnée de rendez-vous par médecin disponible pour cette période."
+    return {"rdv_doctor_labels": labels, "rdv_doctor_values": values, "rdv_doctor_analysis": analysis}
+
+def _chart_depenses_categorie(period: _Period) -> dict:
+    totals = period.by_key("depenses", "categorie")
+    labels, values = totals["cle"].tolist(), totals["total"].tolist()
+    if values and sum(values) > 0:
+        largest_amount, largest_category = sorted(zip(values, labels), reverse=True)[0]
+        largest_percentage = (largest_amount / sum(values)) * 100
+        analysis = f"La catégorie de dépenses la plus importante est **{largest_category}** avec **{largest_amount:.2f} {utils.load_config().get('currency', 'EUR')}** ({largest_percentage:.1f}% du total)."
+    else:
+        analysis = "Aucune donnée de dépenses disponible pour cette période."
+    return {"expenses_category_labels": labels, "expenses_category_values": values,
+            "expenses_category_analysis": analysis}
+
+def _chart_recettes_type(period: _Period) -> dict:
+    totals = period.by_key("recettes", "type_acte")
+    labels, values = totals["cle"].tolist(), totals["total"].tolist()
+    if values and sum(values) > 0:
+        top_amount, top_type = sorted(zip(values, labels), reverse=True)[0]
+        top_percentage = (top_amount / sum(values)) * 100
+        analysis = f"La source de recettes principale est **'{top_type}'** avec **{top_amount:.2f} {utils.load_config().get('currency', 'EUR')}** ({top_percentage:.1f}% du total)."
+    else:
+        analysis = "Aucune donnée de recettes disponible pour cette période."
+    return {"revenue_type_labels": labels, "revenue_type_values": values, "revenue_type_analysis": analysis}
+
+def _chart_top_produits(period: _Period) -> dict:
+    top = period.by_key("inventaire", "produit").sort_values(["total", "cle"], ascending=[False, True]).head(10)
+    labels, values = top["cle"].tolist(), [_quantity(v) for v in top["total"]]
+    if values and sum(values) > 0:
+        analysis = f"Le produit le plus en stock est **'{labels[0]}'** avec **{values[0]}** unités."
+    else:
+        analysis = "Aucune donnée de stock disponible pour les top produits."
+    return {"top_products_labels": labels, "top_products_values": values, "top_products_analysis": analysis}
+
+def _chart_mouvements_type(period: _Period) -> dict:
+    counts = period.by_key("mouvements", "type").sort_values(["nombre", "cle"], ascending=[False, True])
+    labels, values = counts["cle"].tolist(), counts["nombre"].tolist()
+    if values and sum(values) > 0:
+        by_type = dict(zip(labels, values))
+        analysis = f"Il y a eu **{by_type.get('Entrée', 0)}** mouvements d'entrée et **{by_type.get('Sortie', 0)}** mouvements de sortie enregistrés."
+    else:
+        analysis = "Aucune donnée de mouvement de stock disponible."
+    return {"movement_type_labels": labels, "movement_type_values": values, "movement_type_analysis": analysis}
+
+# Identifiant du graphique dans la page -> calcul de ses données et de son analyse
+_CHART_BUILDERS = {
+    "consultChart": _chart_activite,
+    "caChart": _chart_ca,
+    "genderChart": _chart_genre,
+    "ageChart": _chart_age,
+    "salariesMonthlyChart": _chart_salaires,
+    "rdvDoctorChart": _chart_rdv_medecin,
+    "expensesCategoryChart": _chart_depenses_categorie,
+    "revenueTypeChart": _chart_recettes_type,
+    "topProductsChart": _chart_top_produits,
+    "movementTypeChart": _chart_mouvements_type,
+}
+
+
 _TEMPLATE = r"""
 <!DOCTYPE html>
 <html lang="fr">
@@ -1485,7 +1306,7 @@ _TEMPLATE = r"""
             <div class="card-body">
               <canvas id="consultChart"></canvas>
               <div class="chart-analysis">
-                <p>{{ charts.activite_analysis | safe }}</p>
+                <p class="text-muted">Chargement…</p>
               </div>
             </div>
           </div>
@@ -1496,7 +1317,7 @@ _TEMPLATE = r"""
             <div class="card-body">
               <canvas id="caChart"></canvas>
               <div class="chart-analysis">
-                <p>{{ charts.ca_analysis | safe }}</p>
+                <p class="text-muted">Chargement…</p>
               </div>
             </div>
           </div>
@@ -1507,7 +1328,7 @@ _TEMPLATE = r"""
             <div class="card-body">
               <canvas id="genderChart"></canvas>
               <div class="chart-analysis">
-                <p>{{ charts.genre_analysis | safe }}</p>
+                <p class="text-muted">Chargement…</p>
               </div>
             </div>
           </div>
@@ -1518,7 +1339,7 @@ _TEMPLATE = r"""
             <div class="card-body">
               <canvas id="ageChart"></canvas>
               <div class="chart-analysis">
-                <p>{{ charts.age_analysis | safe }}</p>
+                <p class="text-muted">Chargement…</p>
               </div>
             </div>
           </div>
@@ -1529,7 +1350,7 @@ _TEMPLATE = r"""
                 <div class="card-body">
                   <canvas id="salariesMonthlyChart"></canvas>
                   <div class="chart-analysis">
-                    <p>{{ charts.salaries_monthly_analysis | safe }}</p>
+                    <p class="text-muted">Chargement…</p>
                   </div>
                 </div>
             </div>
@@ -1540,7 +1361,7 @@ _TEMPLATE = r"""
                 <div class="card-body">
                   <canvas id="rdvDoctorChart"></canvas>
                   <div class="chart-analysis">
-                    <p>{{ charts.rdv_doctor_analysis | safe }}</p>
+                    <p class="text-muted">Chargement…</p>
                   </div>
                 </div>
             </div>
@@ -1551,7 +1372,7 @@ _TEMPLATE = r"""
                 <div class="card-body">
                   <canvas id="expensesCategoryChart"></canvas>
                   <div class="chart-analysis">
-                    <p>{{ charts.expenses_category_analysis | safe }}</p>
+                    <p class="text-muted">Chargement…</p>
                   </div>
                 </div>
             </div>
@@ -1562,7 +1383,7 @@ _TEMPLATE = r"""
                 <div class="card-body">
                   <canvas id="revenueTypeChart"></canvas>
                   <div class="chart-analysis">
-                    <p>{{ charts.revenue_type_analysis | safe }}</p>
+                    <p class="text-muted">Chargement…</p>
                   </div>
                 </div>
             </div>
@@ -1573,7 +1394,7 @@ _TEMPLATE = r"""
                 <div class="card-body">
                   <canvas id="topProductsChart"></canvas>
                   <div class="chart-analysis">
-                    <p>{{ charts.top_products_analysis | safe }}</p>
+                    <p class="text-muted">Chargement…</p>
                   </div>
                 </div>
             </div>
@@ -1584,7 +1405,7 @@ _TEMPLATE = r"""
                 <div class="card-body">
                   <canvas id="movementTypeChart"></canvas>
                   <div class="chart-analysis">
-                    <p>{{ charts.movement_type_analysis | safe }}</p>
+                    <p class="text-muted">Chargement…</p>
                   </div>
                 </div>
             </div>
@@ -1606,7 +1427,8 @@ _TEMPLATE = r"""
 <script src="https://cdn.jsdelivr.net/npm/chartjs-plugin-datalabels@2.2.0"></script>
 <script src="https://cdn.jsdelivr.net/npm/sweetalert2@11"></script>
 <script>
-const CHARTS={{ charts|tojson }};
+const CHART_URL = "{{ url_for('statistique.chart_data', chart_id='__chart__') }}";
+const PERIOD = new URLSearchParams({ start_date: {{ start_date|tojson }}, end_date: {{ end_date|tojson }} });
 const CURRENCY = "{{ currency | safe }}";
 const SELECTED_CHARTS = {{ selected_charts|tojson }};
 
@@ -1829,18 +1651,38 @@ function createChart(ctx, type, labels, data, backgroundColor, options = {}, dat
 }
 
 
+// Données d'un graphique (séries + analyse), calculées à la demande par le serveur
+function loadChart(config, container) {
+    const analysis = container.querySelector('.chart-analysis p');
+    fetch(CHART_URL.replace('__chart__', config.id) + '?' + PERIOD.toString(), { credentials: 'same-origin' })
+        .then(response => {
+            if (!response.ok) { throw new Error(response.status); }
+            return response.json();
+        })
+        .then(data => {
+            const ctx = document.getElementById(config.id).getContext('2d');
+            createChart(ctx, config.type, data[config.data + '_labels'], data[config.data + '_values'], config.color, config.options, config.label);
+            analysis.classList.remove('text-muted');
+            analysis.textContent = data[config.data + '_analysis'];
+        })
+        .catch(() => {
+            analysis.textContent = "Impossible de charger ce graphique.";
+        });
+}
+
+
 document.addEventListener('DOMContentLoaded', function() {
     const chartConfigs = [
-        { id: 'consultChart', type: 'bar', labels: CHARTS.activite_labels, values: CHARTS.activite_values, color: BAR_CHART_COLOR_1, label: 'Consultations' },
-        { id: 'caChart', type: 'bar', labels: CHARTS.ca_labels, values: CHARTS.ca_values, color: BAR_CHART_COLOR_2, options: { scales: { y: { ticks: { callback: (value) => new Intl.NumberFormat('fr-FR', { style: 'currency', currency: CURRENCY, minimumFractionDigits: 0, maximumFractionDigits: 0 }).format(value) } } } }, label: 'Total Recettes' },
-        { id: 'genderChart', type: 'doughnut', labels: CHARTS.genre_labels, values: CHARTS.genre_values, color: PIE_CHART_COLORS_1, label: 'Patients' },
-        { id: 'ageChart', type: 'bar', labels: CHARTS.age_labels, values: CHARTS.age_values, color: BAR_CHART_COLOR_1, label: 'Patients' },
-        { id: 'salariesMonthlyChart', type: 'bar', labels: CHARTS.salaries_monthly_labels, values: CHARTS.salaries_monthly_values, color: BAR_CHART_COLOR_2, options: { scales: { y: { ticks: { callback: (value) => new Intl.NumberFormat('fr-FR', { style: 'currency', currency: CURRENCY, minimumFractionDigits: 0, maximumFractionDigits: 0 }).format(value) } } } }, label: 'Salaires' },
-        { id: 'rdvDoctorChart', type: 'bar', labels: CHARTS.rdv_doctor_labels, values: CHARTS.rdv_doctor_values, color: BAR_CHART_COLOR_1, label: 'Rendez-vous' },
-        { id: 'expensesCategoryChart', type: 'doughnut', labels: CHARTS.expenses_category_labels, values: CHARTS.expenses_category_values, color: PIE_CHART_COLORS_2, label: 'Dépenses' },
-        { id: 'revenueTypeChart', type: 'doughnut', labels: CHARTS.revenue_type_labels, values: CHARTS.revenue_type_values, color: PIE_CHART_COLORS_1, label: 'Recettes' },
-        { id: 'topProductsChart', type: 'bar', labels: CHARTS.top_products_labels, values: CHARTS.top_products_values, color: BAR_CHART_COLOR_2, options: { indexAxis: 'y', scales: { x: { ticks: { color: 'var(--text-color-light)' }, grid: { color: 'rgba(var(--text-color-rgb), 0.1)' } }, y: { ticks: { color: 'var(--text-color-light)' }, grid: { display: false } } } }, label: 'Quantité en stock' },
-        { id: 'movementTypeChart', type: 'bar', labels: CHARTS.movement_type_labels, values: CHARTS.movement_type_values, color: BAR_CHART_COLOR_1, label: 'Mouvements' }
+        { id: 'consultChart', type: 'bar', data: 'activite', color: BAR_CHART_COLOR_1, label: 'Consultations' },
+        { id: 'caChart', type: 'bar', data: 'ca', color: BAR_CHART_COLOR_2, options: { scales: { y: { ticks: { callback: (value) => new Intl.NumberFormat('fr-FR', { style: 'currency', currency: CURRENCY, minimumFractionDigits: 0, maximumFractionDigits: 0 }).format(value) } } } }, label: 'Total Recettes' },
+        { id: 'genderChart', type: 'doughnut', data: 'genre', color: PIE_CHART_COLORS_1, label: 'Patients' },
+        { id: 'ageChart', type: 'bar', data: 'age', color: BAR_CHART_COLOR_1, label: 'Patients' },
+        { id: 'salariesMonthlyChart', type: 'bar', data: 'salaries_monthly', color: BAR_CHART_COLOR_2, options: { scales: { y: { ticks: { callback: (value) => new Intl.NumberFormat('fr-FR', { style: 'currency', currency: CURRENCY, minimumFractionDigits: 0, maximumFractionDigits: 0 }).format(value) } } } }, label: 'Salaires' },
+        { id: 'rdvDoctorChart', type: 'bar', data: 'rdv_doctor', color: BAR_CHART_COLOR_1, label: 'Rendez-vous' },
+        { id: 'expensesCategoryChart', type: 'doughnut', data: 'expenses_category', color: PIE_CHART_COLORS_2, label: 'Dépenses' },
+        { id: 'revenueTypeChart', type: 'doughnut', data: 'revenue_type', color: PIE_CHART_COLORS_1, label: 'Recettes' },
+        { id: 'topProductsChart', type: 'bar', data: 'top_products', color: BAR_CHART_COLOR_2, options: { indexAxis: 'y', scales: { x: { ticks: { color: 'var(--text-color-light)' }, grid: { color: 'rgba(var(--text-color-rgb), 0.1)' } }, y: { ticks: { color: 'var(--text-color-light)' }, grid: { display: false } } } }, label: 'Quantité en stock' },
+        { id: 'movementTypeChart', type: 'bar', data: 'movement_type', color: BAR_CHART_COLOR_1, label: 'Mouvements' }
     ];
 
     chartConfigs.forEach(config => {
@@ -1848,8 +1690,7 @@ document.addEventListener('DOMContentLoaded', function() {
         if (container) {
             if (SELECTED_CHARTS.includes(config.id)) {
                 container.classList.remove('d-none');
-                const ctx = document.getElementById(config.id).getContext('2d');
-                createChart(ctx, config.type, config.labels, config.values, config.color, config.options, config.label);
+                loadChart(config, container);
             } else {
                 container.classList.add('d-none');
             }
@@ -0,0 +1,390 @@
+# stats_rollup.py
+# ---------------------------------------------------------------------------
+#  Agrégats quotidiens matérialisés pour le tableau de bord statistique
+# ---------------------------------------------------------------------------
+#  stats_home relisait et re-parsait tous les classeurs du tenant à chaque
+#  affichage. Ici chaque source (une feuille) est repliée une fois en totaux
+#  par (dimension, jour, clé), rangés dans la base SQLite du tenant à côté des
+#  données. L'affichage lit ces agrégats depuis un instantané en mémoire (voir
+#  « Lecture ») et ne fait plus que filtrer la période.
+#
+#  Mise à jour incrémentale : _stats_state retient, par source, la révision de
+#  la feuille (storage.read_rows_since) et le dernier identifiant de ligne
+#  replié. Un ajout (RDV, consultation, recette…) ne replie que les nouvelles
+#  lignes ; une modification ou une suppression change la révision et seule
+#  cette source est recalculée.
+#
+#  _stats_entities garde, par entité (patient) et par jour, la première ligne
+#  vue (seq = identifiant de ligne) : les indicateurs « patients uniques » d'une
+#  période se déduisent sans relire les consultations.
+#
+#  Les sources et leurs fonctions de repli sont déclarées par statistique.py.
+# ---------------------------------------------------------------------------
+
+import json
+import os
+import threading
+import time
+from typing import Callable, NamedTuple, Optional
+
+import pandas as pd
+
+import logs
+import metrics
+import storage
+
+log = logs.get_logger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS _stats_daily (
+    source      TEXT NOT NULL,
+    dimension   TEXT NOT NULL,
+    jour        TEXT NOT NULL,          -- 'AAAA-MM-JJ'
+    cle         TEXT NOT NULL,
+    nombre      INTEGER NOT NULL,
+    total       REAL NOT NULL,
+    PRIMARY KEY (source, dimension, jour, cle)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS _stats_entities (
+    source      TEXT NOT NULL,
+    entite      TEXT NOT NULL,
+    jour        TEXT NOT NULL,
+    seq         INTEGER NOT NULL,       -- identifiant de la première ligne du jour
+    attributs   TEXT NOT NULL,          -- {colonne: valeur} de cette ligne, JSON
+    PRIMARY KEY (source, entite, jour)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS _stats_entities_jour ON _stats_entities(source, jour);
+CREATE TABLE IF NOT EXISTS _stats_state (
+    source      TEXT PRIMARY KEY,
+    revision    TEXT NOT NULL,
+    dernier_id  INTEGER NOT NULL
+);
+"""
+
+DAILY_COLUMNS = ["dimension", "jour", "cle", "nombre", "total"]
+ENTITY_COLUMNS = ["entite", "jour", "seq", "attributs"]
+
+
+class Source(NamedTuple):
+    """Feuille repliée en agrégats quotidiens."""
+    name: str                   # identifiant dans les tables d'agrégats
+    filename: str               # classeur du dossier Excel
+    sheet: Optional[str]        # feuille (None : la première)
+    fold: Callable              # nouvelles lignes (texte, index = identifiants) -> (agrégats, entités ou None)
+    version: int = 1            # à incrémenter quand `fold` change : force un recalcul
+
+
+def daily(dimension: str, jours: pd.Series, cles=None, valeurs=None) -> pd.DataFrame:
+    """Agrège des lignes en (dimension, jour, clé) -> nombre de lignes, somme des valeurs."""
+    frame = pd.DataFrame({
+        "jour": jours,
+        "cle": "" if cles is None else cles.fillna("").astype(str),
+        "total": 0.0 if valeurs is None else pd.to_numeric(valeurs, errors="coerce").fillna(0.0),
+    })
+    frame = frame.dropna(subset=["jour"])
+    if frame.empty:
+        return pd.DataFrame(columns=DAILY_COLUMNS)
+    out = frame.groupby(["jour", "cle"]).agg(nombre=("total", "size"), total=("total", "sum")).reset_index()
+    out.insert(0, "dimension", dimension)
+    return out[DAILY_COLUMNS]
+
+
+# ---------------------------------------------------------------------------
+#  Mise à jour
+# ---------------------------------------------------------------------------
+_initialized_dbs = set()
+_locks: dict = {}               # dossier Excel -> verrou (un seul repli à la fois par tenant et processus)
+_locks_lock = threading.Lock()
+
+
+def _connect(folder: str):
+    conn = storage.connect(folder)
+    if folder not in _initialized_dbs:
+        conn.executescript(_SCHEMA)
+        _initialized_dbs.add(folder)
+    return conn
+
+
+def _lock_for(folder: str) -> threading.Lock:
+    lock = _locks.get(folder)
+    if lock is None:
+        with _locks_lock:
+            lock = _locks.setdefault(folder, threading.Lock())
+    return lock
+
+
+def _state(conn, source: Source):
+    row = conn.execute("SELECT revision, dernier_id FROM _stats_state WHERE source=?", (source.name,)).fetchone()
+    return (row[0], row[1]) if row else None
+
+
+def _refresh_source(conn, folder: str, source: Source):
+    path = os.path.join(folder, source.filename)
+    state = _state(conn, source)
+    if not storage.exists(path):
+        rows, revision = None, None
+    else:
+        after = state[1] if state else 0
+        rows, revision = storage.read_rows_since(path, after, sheet_name=source.sheet, dtype=str)
+    token = None if revision is None else json.dumps([source.version, revision])
+    if state is None and token is None:
+        return
+    rebuild = state is None or state[0] != token
+    if rebuild and state is not None and state[1] and token is not None:
+        # Lignes existantes modifiées ou supprimées : tout relire
+        rows, revision = storage.read_rows_since(path, 0, sheet_name=source.sheet, dtype=str)
+        token = None if revision is None else json.dumps([source.version, revision])
+    if not rebuild and rows.empty:
+        return
+
+    if rows is None or rows.empty:
+        aggregates, entities, last_id = None, None, 0
+    else:
+        rows = rows.set_index(storage.ROW_ID_COLUMN).fillna("")
+        last_id = int(rows.index.max())
+        aggregates, entities = source.fold(rows)
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Un autre worker a pu replier ces lignes entre-temps : ne rien compter deux fois
+        if _state(conn, source) != state:
+            conn.rollback()
+            return
+        if rebuild:
+            conn.execute("DELETE FROM _stats_daily WHERE source=?", (source.name,))
+            conn.execute("DELETE FROM _stats_entities WHERE source=?", (source.name,))
+        if aggregates is not None and not aggregates.empty:
+            conn.executemany(
+                "INSERT INTO _stats_daily(source, dimension, jour, cle, nombre, total) VALUES (?,?,?,?,?,?) "
+                "ON CONFLICT(source, dimension, jour, cle) DO UPDATE SET "
+                "nombre = nombre + excluded.nombre, total = total + excluded.total",
+                [(source.name, d, j, c, int(n), float(t))
+                 for d, j, c, n, t in aggregates[DAILY_COLUMNS].itertuples(index=False)],
+            )
+        if entities is not None and not entities.empty:
+            # Lignes repliées par identifiant croissant : la première vue d'un jour reste
+            conn.executemany(
+                "INSERT INTO _stats_entities(source, entite, jour, seq, attributs) VALUES (?,?,?,?,?) "
+                "ON CONFLICT(source, entite, jour) DO NOTHING",
+                [(source.name, str(e), j, int(s), json.dumps(a, ensure_ascii=False, default=str))
+                 for e, j, s, a in entities[ENTITY_COLUMNS].itertuples(index=False)],
+            )
+        if token is None:
+            conn.execute("DELETE FROM _stats_state WHERE source=?", (source.name,))
+        else:
+            conn.execute(
+                "INSERT INTO _stats_state(source, revision, dernier_id) VALUES (?,?,?) "
+                "ON CONFLICT(source) DO UPDATE SET revision=excluded.revision, dernier_id=excluded.dernier_id",
+                (source.name, token, last_id),
+            )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    log.debug("Agrégats '%s' %s (%s lignes)", source.name, "recalculés" if rebuild else "complétés",
+              0 if rows is None else len(rows))
+
+
+def refresh(folder: str, sources):
+    """Replie dans les agrégats les lignes ajoutées depuis le dernier appel (recalcul si nécessaire)."""
+    with _lock_for(folder):
+        conn = _connect(folder)
+        try:
+            for source in sources:
+                try:
+                    _refresh_source(conn, folder, source)
+                except Exception as e:
+                    # Une source illisible ne doit pas bloquer les autres indicateurs
+                    log.error("Mise à jour des agrégats '%s' impossible : %s", source.name, e)
+        finally:
+            conn.close()
+
+
+def reset(folder: str):
+    """Supprime tous les agrégats du tenant (recalculés au prochain refresh)."""
+    with _lock_for(folder):
+        conn = _connect(folder)
+        try:
+            with conn:
+                for table in ("_stats_daily", "_stats_entities", "_stats_state"):
+                    conn.execute(f"DELETE FROM {table}")
+        finally:
+            conn.close()
+    _snapshots.invalidate((os.path.abspath(os.fspath(folder)),))
+
+
+# ---------------------------------------------------------------------------
+#  Lecture : instantané en mémoire, par tenant
+# ---------------------------------------------------------------------------
+# Les agrégats d'un tenant sont chargés une fois en mémoire, puis toutes les
+# périodes demandées (filtres de dates) sont calculées sans accès à la base.
+# L'instantané est valide tant que la signature (mtime, taille) de la base du
+# tenant, de son WAL et des classeurs sources n'a pas changé : toute écriture,
+# d'où qu'elle vienne (autre worker, import), la modifie.
+# Budget mémoire en Mo, ajustable par EASYMEDICALINK_STATS_CACHE_MB.
+CACHE_MAX_BYTES = int(os.environ.get("EASYMEDICALINK_STATS_CACHE_MB", "64")) * 1024 * 1024
+# Délai de regroupement des écritures avant un préchargement en arrière-plan (secondes)
+WARM_DELAY = float(os.environ.get("EASYMEDICALINK_STATS_WARM_DELAY", "2"))
+
+_snapshots = storage.FrameCache(CACHE_MAX_BYTES)   # (dossier, signature) -> instantané
+
+
+def _stat(path: str) -> tuple:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return (0, 0)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def signature(folder: str, sources) -> tuple:
+    """(mtime, taille) de la base du tenant, de son WAL et des classeurs sources."""
+    db_path = os.path.join(os.path.dirname(os.fspath(folder)), "database.db")
+    files = [db_path, db_path + "-wal"]
+    files += sorted({os.path.join(folder, source.filename) for source in sources})
+    return tuple(_stat(f) for f in files)
+
+
+def _load(folder: str) -> dict:
+    """Instantané des agrégats : {("daily", source, dimension) | ("entities", source): DataFrame}."""
+    conn = _connect(folder)
+    try:
+        conn.execute("BEGIN")
+        daily = pd.read_sql_query(
+            "SELECT source, dimension, jour, cle, nombre, total FROM _stats_daily ORDER BY source, dimension, jour",
+            conn,
+        )
+        entities = pd.read_sql_query(
+            "SELECT source, entite, jour, seq, attributs FROM _stats_entities ORDER BY source, seq", conn
+        )
+    finally:
+        conn.close()
+    data = {}
+    for (source, dimension), frame in daily.groupby(["source", "dimension"], sort=False):
+        data[("daily", source, dimension)] = frame.drop(columns=["source", "dimension"]).reset_index(drop=True)
+    for source, frame in entities.groupby("source", sort=False):
+        data[("entities", source)] = frame.drop(columns=["source"]).reset_index(drop=True)
+    return data
+
+
+class Snapshot(NamedTuple):
+    """Agrégats d'un tenant chargés en mémoire."""
+    key: tuple                  # (dossier, signature) : change à chaque écriture du tenant
+    data: dict                  # voir _load
+
+
+def snapshot(folder: str, sources) -> Snapshot:
+    """
+    Agrégats à jour du tenant : depuis le cache si rien n'a été écrit depuis le dernier
+    chargement, sinon après refresh() et rechargement.
+    """
+    folder = os.path.abspath(os.fspath(folder))
+    key = (folder, signature(folder, sources))
+    data = _snapshots.get(key)
+    if data is not None:
+        return Snapshot(key, data)
+    refresh(folder, sources)
+    # Signature relevée après nos propres écritures et avant la lecture : une écriture
+    # concurrente rend au pire l'instantané plus récent que sa clé, jamais plus ancien.
+    key = (folder, signature(folder, sources))
+    data = _load(folder)
+    _snapshots.invalidate((folder,))
+    _snapshots.put(key, data)
+    return Snapshot(key, data)
+
+
+def cache_stats() -> dict:
+    """Compteurs du cache d'instantanés (pour le monitoring)."""
+    return _snapshots.stats()
+
+
+def clear_cache():
+    _snapshots.clear()
+
+
+# Préchargement en arrière-plan : après une écriture, l'instantané du tenant est
+# reconstruit hors requête ; le prochain affichage le trouve en cache.
+_warm_pending: dict = {}        # dossier -> sources
+_warm_lock = threading.Lock()
+_warm_event = threading.Event()
+_warm_thread = None
+
+
+def _warm_loop():
+    while True:
+        _warm_event.wait()
+        # Regroupe les écritures rapprochées (saisie d'une consultation, d'une facture…)
+        time.sleep(WARM_DELAY)
+        _warm_event.clear()
+        with _warm_lock:
+            pending = list(_warm_pending.items())
+            _warm_pending.clear()
+        for folder, sources in pending:
+            try:
+                with metrics.job("stats_warm"):
+                    snapshot(folder, sources)
+            except Exception as e:
+                log.error("Préchargement des statistiques de %s impossible : %s", folder, e)
+
+
+def warm(folder: str, sources):
+    """Planifie la mise à jour et le chargement des agrégats du tenant en arrière-plan."""
+    global _warm_thread
+    with _warm_lock:
+        _warm_pending[os.path.abspath(os.fspath(folder))] = sources
+        if _warm_thread is None or not _warm_thread.is_alive():
+            _warm_thread = threading.Thread(target=_warm_loop, name="stats-warm", daemon=True)
+            _warm_thread.start()
+    _warm_event.set()
+
+
+class Window:
+    """Agrégats d'un instantané sur une période de jours 'AAAA-MM-JJ' incluse (bornes None : non bornée)."""
+
+    def __init__(self, snapshot: Snapshot, start: Optional[str] = None, end: Optional[str] = None):
+        self.data = snapshot.data
+        self.start = start
+        self.end = end
+
+    def _in_period(self, frame: pd.DataFrame) -> pd.DataFrame:
+        if self.start:
+            frame = frame[frame["jour"] >= self.start]
+        if self.end:
+            frame = frame[frame["jour"] <= self.end]
+        return frame
+
+    def _daily(self, source: str, dimension: str) -> pd.DataFrame:
+        frame = self.data.get(("daily", source, dimension))
+        if frame is None:
+            return pd.DataFrame(columns=["jour", "cle", "nombre", "total"])
+        return self._in_period(frame)
+
+    def totals(self, source: str, dimension: str, jour: Optional[str] = None):
+        """(nombre de lignes, somme) sur la période, ou sur le seul `jour` s'il est donné."""
+        if jour is not None:
+            frame = self.data.get(("daily", source, dimension))
+            frame = frame[frame["jour"] == jour] if frame is not None else pd.DataFrame(columns=["nombre", "total"])
+        else:
+            frame = self._daily(source, dimension)
+        return int(frame["nombre"].sum()), float(frame["total"].sum())
+
+    def by_key(self, source: str, dimension: str) -> pd.DataFrame:
+        """Colonnes cle, nombre, total : une ligne par clé, triée par clé."""
+        frame = self._daily(source, dimension)
+        out = frame.groupby("cle", sort=True)[["nombre", "total"]].sum().reset_index()
+        return out.astype({"nombre": "int64", "total": "float64"})
+
+    def by_month(self, source: str, dimension: str) -> pd.DataFrame:
+        """Colonnes mois ('AAAA-MM'), nombre, total : mois ayant au moins une ligne, triés."""
+        frame = self._daily(source, dimension)
+        out = frame.groupby(frame["jour"].str[:7].rename("mois"), sort=True)[["nombre", "total"]].sum().reset_index()
+        return out.astype({"nombre": "int64", "total": "float64"})
+
+    def first_entities(self, source: str) -> list:
+        """Attributs de la première ligne de chaque entité sur la période, dans l'ordre d'apparition."""
+        frame = self.data.get(("entities", source))
+        if frame is None:
+            return []
+        # Instantané trié par seq : la première occurrence est la première ligne vue
+        frame = self._in_period(frame).drop_duplicates(subset=["entite"], keep="first")
+        return [json.loads(a) for a in frame["attributs"]]
@@ -0,0 +1,1422 @@
+# storage.py
+# ---------------------------------------------------------------------------
+#  Moteur de stockage SQLite par administrateur (un fichier par tenant)
+#  Les classeurs historiques (ConsultationData.xlsx, DonneesRDV.xlsx, ...)
+#  ne servent plus qu'à l'import et à l'export : les lectures/écritures
+#  courantes passent par <DYNAMIC_BASE_DIR>/database.db (utils.SQLITE_DB_PATH).
+#
+#  Les modules continuent de manipuler les chemins Excel habituels : les
+#  fonctions read_excel / to_excel / exists ci-dessous remplacent directement
+#  pd.read_excel / DataFrame.to_excel / os.path.exists pour ces fichiers.
+#  Tout autre chemin est délégué à pandas. Toutes les lectures passent par
+#  un cache mémoire commun (section 6). Lectures et écritures sont comptées
+#  (nombre, octets) par tenant dans metrics.
+# ---------------------------------------------------------------------------
+
+import os
+import re
+import json
+import math
+import sqlite3
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, time
+from typing import Optional, Union
+
+import pandas as pd
+
+import logs
+import metrics
+import timing
+
+log = logs.get_logger(__name__)
+
+# ---------------------------------------------------------------------------
+#  1. Jeux de données gérés
+# ---------------------------------------------------------------------------
+# Nom du classeur -> table de base, feuilles multiples ou non, colonnes indexées.
+# Pour un classeur à plusieurs feuilles, chaque feuille a sa propre table
+# "<table>_<feuille>" ; les index sont créés sur les colonnes présentes.
+DATASETS = {
+    "ConsultationData.xlsx": {
+        "table": "consultations",
+        "multi_sheet": False,
+        "indexes": [("patient_id",), ("consultation_date",), ("consultation_id",), ("Medecin_Email",)],
+    },
+    "DonneesRDV.xlsx": {
+        "table": "rendez_vous",
+        "multi_sheet": False,
+        "indexes": [("Date", "Medecin_Email"), ("ID",)],
+    },
+    "factures.xlsx": {
+        "table": "factures",
+        "multi_sheet": False,
+        "indexes": [("Numero",), ("Date",), ("Patient_ID",)],
+    },
+    "Comptabilite.xlsx": {
+        "table": "comptabilite",
+        "multi_sheet": True,
+        "indexes": [("Date",), ("Mois_Annee",), ("ID_Facture_Liee",)],
+    },
+    "Pharmacie.xlsx": {
+        "table": "pharmacie",
+        "multi_sheet": True,
+        "indexes": [("Code_Produit",), ("Date",)],
+    },
+    "Biologie.xlsx": {
+        "table": "biologie",
+        "multi_sheet": False,
+        "indexes": [("ID_Patient",), ("Date",)],
+    },
+    "Radiologie.xlsx": {
+        "table": "radiologie",
+        "multi_sheet": False,
+        "indexes": [("ID_Patient",), ("Date",)],
+    },
+}
+
+# Colonne technique : clé primaire SQLite, identifiant stable d'une ligne.
+# Attribué à l'ajout (y compris dans le journal), conservé par la compaction et
+# par les réécritures qui le renvoient ; jamais réutilisé (AUTOINCREMENT).
+# Exposé dans les DataFrames seulement sur demande (read_excel(row_ids=True)).
+ROW_ID_COLUMN = "_row_id"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS _datasets (
+    fichier     TEXT PRIMARY KEY,
+    importe_le  TEXT
+);
+CREATE TABLE IF NOT EXISTS _sheets (
+    table_name  TEXT PRIMARY KEY,
+    fichier     TEXT NOT NULL,
+    feuille     TEXT NOT NULL,
+    position    INTEGER NOT NULL,
+    colonnes    TEXT NOT NULL,
+    version     INTEGER NOT NULL DEFAULT 0,
+    revision    INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix__sheets_fichier ON _sheets(fichier, position);
+CREATE TABLE IF NOT EXISTS _journal (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name  TEXT NOT NULL,
+    ligne       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix__journal_table ON _journal(table_name, id);
+"""
+
+_initialized_dbs = set()
+_init_lock = threading.Lock()
+
+
+# ---------------------------------------------------------------------------
+#  2. Résolution chemin Excel -> base SQLite
+# ---------------------------------------------------------------------------
+def _dataset_of(path) -> Optional[dict]:
+    """Retourne la définition du jeu de données si le chemin est géré par SQLite."""
+    if not isinstance(path, (str, os.PathLike)):
+        return None  # pd.ExcelFile, BytesIO, FileStorage... : laissés à pandas
+    path = os.fspath(path)
+    parent = os.path.dirname(path)
+    # Seuls les classeurs placés dans <DYNAMIC_BASE_DIR>/Excel sont concernés
+    if os.path.basename(parent) != "Excel":
+        return None
+    return DATASETS.get(os.path.basename(path))
+
+
+def is_managed(path) -> bool:
+    """Indique si ce classeur est stocké dans la base SQLite du tenant."""
+    return _dataset_of(path) is not None
+
+
+def db_path_for(path) -> str:
+    """Chemin de la base SQLite du tenant propriétaire du classeur."""
+    excel_folder = os.path.dirname(os.fspath(path))
+    return os.path.join(os.path.dirname(excel_folder), "database.db")
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, timeout=30)
+    if db_path not in _initialized_dbs:
+        with _init_lock:
+            if db_path not in _initialized_dbs:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+                _migrate_schema(conn)
+                _initialized_dbs.add(db_path)
+                # Journal laissé par un processus précédent : à compacter
+                pending = conn.execute("SELECT COUNT(*) FROM _journal").fetchone()[0]
+                if pending:
+                    _assign_journal_row_ids(conn)
+                    _schedule_compaction(db_path, pending)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _migrate_schema(conn: sqlite3.Connection):
+    """Colonnes ajoutées à _sheets après la création des premières bases."""
+    present = {row[1] for row in conn.execute("PRAGMA table_info(_sheets)")}
+    if "revision" not in present:
+        conn.execute("ALTER TABLE _sheets ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+        conn.commit()
+
+
+def connect(excel_folder: str) -> sqlite3.Connection:
+    """
+    Connexion à la base SQLite du tenant dont `excel_folder` est le dossier Excel
+    (schéma initialisé). Pour les tables dérivées (agrégats) qui vivent à côté des données.
+    """
+    return _connect(os.path.join(os.path.dirname(os.fspath(excel_folder)), "database.db"))
+
+
+def _quote(identifier: str) -> str:
+    return '"' + str(identifier).replace('"', '""') + '"'
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^0-9a-zA-Z]+", "_", str(text)).strip("_").lower() or "feuille"
+
+
+# ---------------------------------------------------------------------------
+#  3. Conversion des valeurs (mêmes conventions qu'un aller-retour Excel)
+# ---------------------------------------------------------------------------
+def _to_sql_value(value):
+    """Convertit une cellule pandas en valeur SQLite (None pour une cellule vide)."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return value if value != "" else None
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None
+        # Excel ne distingue pas 5 et 5.0 : on garde l'entier, comme openpyxl
+        return int(value) if value.is_integer() and abs(value) < 2 ** 53 else value
+    if hasattr(value, "item") and not isinstance(value, (pd.Timestamp, datetime)):
+        return _to_sql_value(value.item())  # scalaires numpy
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    if isinstance(value, (pd.Timestamp, datetime)):
+        return str(pd.Timestamp(value))
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    return str(value)
+
+
+def _column_values(series: pd.Series) -> list:
+    """Valeurs d'une colonne prêtes pour l'insertion, avec chemin rapide pour le texte pur."""
+    if series.dtype == object and pd.api.types.infer_dtype(series, skipna=False) == "string":
+        return [v if v != "" else None for v in series.tolist()]
+    return [_to_sql_value(v) for v in series.tolist()]
+
+
+def _frame_rows(df: pd.DataFrame) -> list:
+    columns = [_column_values(df.iloc[:, i]) for i in range(df.shape[1])]
+    return list(zip(*columns)) if columns else [() for _ in range(len(df))]
+
+
+def _apply_dtype(df: pd.DataFrame, dtype) -> pd.DataFrame:
+    """Reproduit l'option dtype de pd.read_excel (str global ou par colonne)."""
+    if dtype is None:
+        return df.infer_objects()
+    if dtype in (str, "str", object, "object"):
+        targets = list(df.columns)
+    elif isinstance(dtype, dict):
+        targets = [c for c, t in dtype.items() if c in df.columns and t in (str, "str", object, "object")]
+    else:
+        return df.astype(dtype)
+    for col in targets:
+        s = df[col]
+        if pd.api.types.infer_dtype(s, skipna=True) in ("string", "empty"):
+            continue
+        df[col] = s.where(s.isna(), s.astype(str))
+    if isinstance(dtype, dict):
+        others = [c for c in df.columns if c not in targets]
+        if others:
+            df[others] = df[others].infer_objects()
+    return df
+
+
+# ---------------------------------------------------------------------------
+#  4. Métadonnées des feuilles
+# ---------------------------------------------------------------------------
+def _sheets_meta(conn: sqlite3.Connection, fichier: str) -> list:
+    """Liste ordonnée (table, feuille, colonnes, version) des feuilles d'un classeur."""
+    rows = conn.execute(
+        "SELECT table_name, feuille, colonnes, version FROM _sheets WHERE fichier=? ORDER BY position",
+        (fichier,),
+    ).fetchall()
+    return [(t, f, json.loads(c), v) for t, f, c, v in rows]
+
+
+def _dataset_exists(conn: sqlite3.Connection, fichier: str) -> bool:
+    return conn.execute("SELECT 1 FROM _datasets WHERE fichier=?", (fichier,)).fetchone() is not None
+
+
+def _table_for_sheet(conn, fichier: str, spec: dict, feuille: str) -> str:
+    """Retourne (en la déclarant au besoin) la table physique d'une feuille."""
+    meta = _sheets_meta(conn, fichier)
+    for table, name, _cols, _v in meta:
+        if name == feuille or not spec["multi_sheet"]:
+            return table
+    table = spec["table"] if not spec["multi_sheet"] else f"{spec['table']}_{_slug(feuille)}"
+    existing = {t for t, *_ in meta}
+    base, n = table, 2
+    while existing and table in existing:
+        table, n = f"{base}_{n}", n + 1
+    conn.execute(
+        "INSERT INTO _sheets(table_name, fichier, feuille, position, colonnes) VALUES (?,?,?,?,?)",
+        (table, fichier, feuille, len(meta), "[]"),
+    )
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {_quote(table)} ({ROW_ID_COLUMN} INTEGER PRIMARY KEY AUTOINCREMENT)")
+    return table
+
+
+def _reserve_row_ids(conn, table: str, count: int) -> range:
+    """
+    Réserve `count` identifiants dans la séquence AUTOINCREMENT de la table
+    (transaction courante), pour des lignes qui passent d'abord par le journal.
+    """
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name=?", (table,)).fetchone()
+    if row is None:
+        start = conn.execute(f"SELECT COALESCE(MAX({ROW_ID_COLUMN}), 0) FROM {_quote(table)}").fetchone()[0]
+        conn.execute("INSERT INTO sqlite_sequence(name, seq) VALUES (?, ?)", (table, start + count))
+    else:
+        start = row[0]
+        conn.execute("UPDATE sqlite_sequence SET seq=? WHERE name=?", (start + count, table))
+    return range(start + 1, start + count + 1)
+
+
+def _assign_journal_row_ids(conn):
+    """Attribue un identifiant aux lignes journalisées avant l'existence de _row_id."""
+    rows = conn.execute(
+        "SELECT id, table_name FROM _journal WHERE json_extract(ligne, ?) IS NULL ORDER BY id",
+        (_json_path(ROW_ID_COLUMN),),
+    ).fetchall()
+    if not rows:
+        return
+    with conn:
+        by_table = {}
+        for journal_id, table in rows:
+            by_table.setdefault(table, []).append(journal_id)
+        for table, journal_ids in by_table.items():
+            ids = _reserve_row_ids(conn, table, len(journal_ids))
+            conn.executemany(
+                "UPDATE _journal SET ligne=json_set(ligne, ?, ?) WHERE id=?",
+                [(_json_path(ROW_ID_COLUMN), row_id, journal_id) for row_id, journal_id in zip(ids, journal_ids)],
+            )
+
+
+def _json_path(column: str) -> str:
+    return '$."' + str(column).replace('"', '""') + '"'
+
+
+def _target_sheet(conn, fichier: str, spec: dict, sheet_name: Optional[str]):
+    """(table, colonnes) de la feuille visée (la première si sheet_name est None), ou None."""
+    for table, feuille, columns, _v in _sheets_meta(conn, fichier):
+        if sheet_name is None or feuille == sheet_name or not spec["multi_sheet"]:
+            return table, columns
+    return None
+
+
+def _ensure_columns(conn, table: str, spec: dict, columns: list):
+    """Ajoute les colonnes manquantes à la table et crée les index déclarés."""
+    present = {row[1] for row in conn.execute(f"PRAGMA table_info({_quote(table)})")}
+    for col in columns:
+        if col not in present:
+            # Pas d'affinité déclarée : SQLite conserve le type Python d'origine
+            conn.execute(f"ALTER TABLE {_quote(table)} ADD COLUMN {_quote(col)}")
+            present.add(col)
+    for index_cols in spec["indexes"]:
+        if all(c in present for c in index_cols):
+            name = f"ix_{table}_{'_'.join(_slug(c) for c in index_cols)}"
+            cols_sql = ", ".join(_quote(c) for c in index_cols)
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {_quote(name)} ON {_quote(table)} ({cols_sql})")
+
+
+def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    df.columns = [str(c) for c in df.columns]
+    if ROW_ID_COLUMN in df.columns:
+        df = df.drop(columns=[ROW_ID_COLUMN])
+    return df
+
+
+def _frame_row_ids(df: pd.DataFrame) -> Optional[list]:
+    """Identifiants portés par un DataFrame lu avec row_ids=True (None si absents)."""
+    if ROW_ID_COLUMN not in df.columns:
+        return None
+    ids, seen = [], set()
+    for value in pd.to_numeric(df[ROW_ID_COLUMN], errors="coerce").tolist():
+        # Ligne ajoutée par concaténation (NaN) ou dupliquée : nouvel identifiant
+        if value != value or value in seen:
+            ids.append(None)
+        else:
+            seen.add(value)
+            ids.append(int(value))
+    return ids
+
+
+def _replace_sheet(conn, fichier: str, spec: dict, feuille: str, df: pd.DataFrame):
+    """
+    Remplace intégralement le contenu d'une feuille (dans la transaction courante).
+    Les lignes qui portent leur _row_id le conservent ; les autres en reçoivent un neuf.
+    """
+    row_ids = _frame_row_ids(df)
+    df = _normalize_columns(df)
+    table = _table_for_sheet(conn, fichier, spec, feuille)
+    columns = list(df.columns)
+    _ensure_columns(conn, table, spec, columns)
+    conn.execute(f"DELETE FROM {_quote(table)}")
+    # La feuille réécrite contient déjà les lignes du journal (lues via read_excel)
+    conn.execute("DELETE FROM _journal WHERE table_name=?", (table,))
+    if columns and len(df):
+        cols_sql = ", ".join(_quote(c) for c in [ROW_ID_COLUMN] + columns)
+        placeholders = ", ".join("?" for _ in range(len(columns) + 1))
+        rows = _frame_rows(df)
+        conn.executemany(
+            f"INSERT INTO {_quote(table)} ({cols_sql}) VALUES ({placeholders})",
+            [(row_id,) + row for row_id, row in zip(row_ids or [None] * len(rows), rows)],
+        )
+    conn.execute(
+        "UPDATE _sheets SET colonnes=?, version=version+1, revision=revision+1 WHERE table_name=?",
+        (json.dumps(columns, ensure_ascii=False), table),
+    )
+    if not spec["multi_sheet"]:
+        conn.execute("UPDATE _sheets SET feuille=? WHERE table_name=?", (feuille, table))
+    return table
+
+
+def _mark_dataset(conn, fichier: str):
+    conn.execute(
+        "INSERT OR IGNORE INTO _datasets(fichier, importe_le) VALUES (?, ?)",
+        (fichier, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+    )
+
+
+# ---------------------------------------------------------------------------
+#  5. Import / export Excel
+# ---------------------------------------------------------------------------
+def _import_sheets(conn, path: str, spec: dict, source: str):
+    sheets = pd.read_excel(source, sheet_name=None)
+    if not spec["multi_sheet"] and sheets:
+        first = next(iter(sheets))
+        sheets = {first: sheets[first]}
+    with conn:
+        tables = [_replace_sheet(conn, os.path.basename(path), spec, feuille, df) for feuille, df in sheets.items()]
+        _mark_dataset(conn, os.path.basename(path))
+    _forget_tables(db_path_for(path), tables)
+    log.debug("%s importé dans %s (%s feuille(s)).", os.path.basename(source), db_path_for(path), len(sheets))
+
+
+def _ensure_imported(conn, path: str, spec: dict) -> bool:
+    """Importe le classeur historique au premier accès. Retourne True si le jeu existe."""
+    fichier = os.path.basename(path)
+    if _dataset_exists(conn, fichier):
+        return True
+    if os.path.exists(path):
+        _import_sheets(conn, path, spec, path)
+        return True
+    return False
+
+
+@timing.timed("excel")
+def import_excel(path, source=None) -> bool:
+    """
+    (Ré)importe un classeur Excel dans la base du tenant, en remplaçant les feuilles
+    existantes. `source` permet d'importer un fichier déposé ailleurs que `path`.
+    """
+    spec = _dataset_of(path)
+    if spec is None:
+        return False
+    path = os.fspath(path)
+    conn = _connect(db_path_for(path))
+    try:
+        _import_sheets(conn, path, spec, os.fspath(source) if source else path)
+        return True
+    finally:
+        conn.close()
+
+
+def export_excel(path, dest=None) -> str:
+    """
+    Matérialise le jeu de données en classeur Excel (toutes les feuilles).
+    Écrit par défaut à l'emplacement historique `path` ; `dest` peut être un
+    chemin ou un flux (BytesIO) pour un téléchargement.
+    """
+    sheets = read_excel(path, sheet_name=None)
+    target = dest if dest is not None else os.fspath(path)
+    with pd.ExcelWriter(target, engine="openpyxl") as writer:
+        if not sheets:
+            pd.DataFrame().to_excel(writer, index=False)
+        for feuille, df in sheets.items():
+            df.to_excel(writer, sheet_name=str(feuille)[:31], index=False)
+    return target
+
+
+# ---------------------------------------------------------------------------
+#  6. Cache mémoire des DataFrames (partagé par tous les tenants du processus)
+# ---------------------------------------------------------------------------
+# Une lecture coûte ~100x plus qu'un stat() : tant que la source n'a pas changé,
+# on renvoie une copie du DataFrame déjà parsé.
+#   - jeu géré      : clé (base, table, version de la feuille, dtype)
+#   - autre classeur : clé (chemin, mtime, taille, feuille, dtype, options)
+# Budget mémoire en Mo, ajustable par la variable d'environnement EASYMEDICALINK_CACHE_MB.
+CACHE_MAX_BYTES = int(os.environ.get("EASYMEDICALINK_CACHE_MB", "256")) * 1024 * 1024
+
+
+def _frame_bytes(value) -> int:
+    if isinstance(value, dict):
+        return sum(_frame_bytes(df) for df in value.values())
+    return int(value.memory_usage(index=True, deep=True).sum())
+
+
+def _record_io(kind: str, path, nbytes: int):
+    """Compte une lecture ou une écriture pour le tenant propriétaire de `path` (classeur ou base)."""
+    folder = os.path.dirname(os.fspath(path))
+    if os.path.basename(folder) == "Excel":
+        tenant = os.path.basename(os.path.dirname(folder))
+    elif os.path.basename(path) == "database.db":
+        tenant = os.path.basename(folder)
+    else:
+        tenant = "<hors tenant>"
+    metrics.record_io(kind, nbytes, tenant)
+
+
+def _copy_frame(value):
+    if isinstance(value, dict):
+        return {k: df.copy() for k, df in value.items()}
+    return value.copy()
+
+
+class FrameCache:
+    """
+    Cache LRU borné en octets (DataFrames ou dict de DataFrames), avec compteurs
+    hits/misses/évictions. Aussi utilisé par stats_rollup pour les agrégats.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # clé -> (DataFrame ou dict, taille en octets)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, key):
+        """(valeur, taille en octets) ou None ; compté comme get."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def get(self, key):
+        entry = self.lookup(key)
+        return None if entry is None else entry[0]
+
+    def put(self, key, value) -> int:
+        """Met `value` en cache et retourne sa taille en octets."""
+        size = _frame_bytes(value)
+        if size > self.max_bytes:
+            return size  # trop volumineux : jamais mis en cache
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _key, (_value, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+        return size
+
+    def invalidate(self, prefix: tuple):
+        """Retire les entrées dont la clé commence par `prefix` (source réécrite)."""
+        with self._lock:
+            for key in [k for k in self._entries if k[:len(prefix)] == prefix]:
+                self._bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_cache = FrameCache(CACHE_MAX_BYTES)
+
+
+def cache_stats() -> dict:
+    """Compteurs du cache de DataFrames (pour le monitoring)."""
+    return _cache.stats()
+
+
+def clear_cache():
+    _cache.clear()
+
+
+def _cache_token(value):
+    """Représentation hashable d'une option de lecture (dtype, sheet_name, kwargs)."""
+    if isinstance(value, dict):
+        return tuple(sorted((str(k), _cache_token(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_cache_token(v) for v in value)
+    if isinstance(value, type):
+        return value.__name__
+    return repr(value)
+
+
+def _forget_tables(db_path: str, tables):
+    for table in tables:
+        _cache.invalidate(("db", db_path, table))
+
+
+def _forget_file(path):
+    if isinstance(path, (str, os.PathLike)):
+        _cache.invalidate(("xlsx", os.path.abspath(os.fspath(path))))
+
+
+def _read_workbook_cached(path, sheet_name, dtype, kwargs):
+    """pd.read_excel avec cache invalidé par (mtime, taille) du fichier."""
+    if not isinstance(path, (str, os.PathLike)):
+        return pd.read_excel(path, sheet_name=sheet_name, dtype=dtype, **kwargs)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return pd.read_excel(path, sheet_name=sheet_name, dtype=dtype, **kwargs)
+    key = ("xlsx", os.path.abspath(os.fspath(path)), st.st_mtime_ns, st.st_size,
+           _cache_token(sheet_name), _cache_token(dtype), _cache_token(kwargs))
+    entry = _cache.lookup(key)
+    if entry is None:
+        cached = pd.read_excel(path, sheet_name=sheet_name, dtype=dtype, **kwargs)
+        _forget_file(path)  # les versions précédentes du fichier sont obsolètes
+        size = _cache.put(key, cached)
+    else:
+        cached, size = entry
+    _record_io("read", path, size)
+    return _copy_frame(cached)
+
+
+# ---------------------------------------------------------------------------
+#  7. Journal d'ajout (append-only) et compaction en arrière-plan
+# ---------------------------------------------------------------------------
+# Ajouter une consultation, un RDV ou un mouvement ne réécrit plus la feuille :
+# la ligne est insérée en O(1) dans _journal, puis un thread de fond la verse
+# dans la table principale par lots. Les lectures fusionnent les deux.
+JOURNAL_COMPACT_ROWS = 200      # lignes en attente déclenchant une compaction immédiate
+JOURNAL_COMPACT_DELAY = 30      # sinon, compaction au plus tard après N secondes
+
+_compaction_pending = {}        # base -> nombre de lignes journalisées non compactées
+_compaction_lock = threading.Lock()
+_compaction_event = threading.Event()
+_compaction_thread = None
+
+
+def _journal_frame(conn, table: str, columns: list, dtype) -> Optional[pd.DataFrame]:
+    rows = conn.execute("SELECT ligne FROM _journal WHERE table_name=? ORDER BY id", (table,)).fetchall()
+    if not rows:
+        return None
+    data = [json.loads(r[0]) for r in rows]
+    df = _apply_dtype(pd.DataFrame(data, columns=columns, dtype=object), dtype)
+    df[ROW_ID_COLUMN] = pd.array([d.get(ROW_ID_COLUMN) for d in data], dtype="Int64")
+    return df
+
+
+def _compact_table(conn, table: str) -> int:
+    """Verse les lignes journalisées dans la table principale (transaction courante)."""
+    rows = conn.execute("SELECT id, ligne FROM _journal WHERE table_name=? ORDER BY id", (table,)).fetchall()
+    if not rows:
+        return 0
+    columns = json.loads(conn.execute("SELECT colonnes FROM _sheets WHERE table_name=?", (table,)).fetchone()[0])
+    with conn:
+        if columns:
+            cols_sql = ", ".join(_quote(c) for c in columns)
+            placeholders = ", ".join("?" for _ in columns)
+            cols_sql = f"{ROW_ID_COLUMN}, {cols_sql}"
+            placeholders += ", ?"
+            values = []
+            for _id, ligne in rows:
+                data = json.loads(ligne)
+                values.append((data.get(ROW_ID_COLUMN),) + tuple(data.get(c) for c in columns))
+            conn.executemany(f"INSERT INTO {_quote(table)} ({cols_sql}) VALUES ({placeholders})", values)
+        # Les lignes ajoutées entre-temps (id supérieur) restent dans le journal
+        conn.execute("DELETE FROM _journal WHERE table_name=? AND id<=?", (table, rows[-1][0]))
+        conn.execute("UPDATE _sheets SET version=version+1 WHERE table_name=?", (table,))
+    return len(rows)
+
+
+def compact_database(db_path: str) -> int:
+    """Compacte tout le journal d'une base tenant. Retourne le nombre de lignes versées."""
+    conn = _connect(db_path)
+    try:
+        tables = [r[0] for r in conn.execute("SELECT DISTINCT table_name FROM _journal")]
+        total = sum(_compact_table(conn, table) for table in tables)
+        _forget_tables(db_path, tables)
+        return total
+    finally:
+        conn.close()
+
+
+def compact(path) -> int:
+    """Compacte immédiatement le journal de la base propriétaire de ce classeur."""
+    if not is_managed(path):
+        return 0
+    return compact_database(db_path_for(path))
+
+
+def _compaction_loop():
+    while True:
+        _compaction_event.wait(JOURNAL_COMPACT_DELAY)
+        _compaction_event.clear()
+        with _compaction_lock:
+            pending = list(_compaction_pending)
+            _compaction_pending.clear()
+        for db_path in pending:
+            try:
+                with metrics.job("journal_compaction"):
+                    n = compact_database(db_path)
+                log.debug("Compaction du journal de %s : %s ligne(s).", db_path, n)
+            except Exception as e:
+                log.error("Compaction du journal de %s impossible : %s", db_path, e)
+                with _compaction_lock:
+                    _compaction_pending.setdefault(db_path, 1)
+
+
+def _schedule_compaction(db_path: str, rows: int):
+    global _compaction_thread
+    with _compaction_lock:
+        _compaction_pending[db_path] = _compaction_pending.get(db_path, 0) + rows
+        if _compaction_thread is None or not _compaction_thread.is_alive():
+            _compaction_thread = threading.Thread(target=_compaction_loop, name="storage-compaction", daemon=True)
+            _compaction_thread.start()
+        if _compaction_pending[db_path] >= JOURNAL_COMPACT_ROWS:
+            _compaction_event.set()
+
+
+def _journal_append(conn, fichier: str, spec: dict, sheet_name: Optional[str], df: pd.DataFrame) -> str:
+    """Insère les lignes de `df` dans le journal (transaction courante). Retourne la table."""
+    if sheet_name is None:
+        meta = _sheets_meta(conn, fichier)
+        sheet_name = meta[0][1] if meta else "Sheet1"
+    table = _table_for_sheet(conn, fichier, spec, sheet_name)
+    columns = json.loads(conn.execute("SELECT colonnes FROM _sheets WHERE table_name=?", (table,)).fetchone()[0])
+    new_columns = [c for c in df.columns if c not in columns]
+    if new_columns:
+        # Nouvelle colonne : la forme de la feuille change, on invalide sa version
+        columns += new_columns
+        _ensure_columns(conn, table, spec, columns)
+        conn.execute(
+            "UPDATE _sheets SET colonnes=?, version=version+1 WHERE table_name=?",
+            (json.dumps(columns, ensure_ascii=False), table),
+        )
+    rows = _frame_rows(df)
+    lignes = [
+        (table, json.dumps({**dict(zip(df.columns, values)), ROW_ID_COLUMN: row_id}, ensure_ascii=False))
+        for row_id, values in zip(_reserve_row_ids(conn, table, len(rows)), rows)
+    ]
+    conn.executemany("INSERT INTO _journal(table_name, ligne) VALUES (?, ?)", lignes)
+    _mark_dataset(conn, fichier)
+    return table
+
+
+def append_rows(path, rows, sheet_name: Optional[str] = None):
+    """
+    Ajoute des lignes (DataFrame ou liste de dict) à une feuille sans la réécrire.
+    Hors jeux gérés : lecture + concaténation + écriture classiques.
+    """
+    df = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(list(rows))
+    spec = _dataset_of(path)
+    if spec is None:
+        existing = read_excel(path, sheet_name=sheet_name or 0) if os.path.exists(path) else pd.DataFrame()
+        return to_excel(pd.concat([existing, df], ignore_index=True), path, sheet_name=sheet_name)
+    if df.empty:
+        return
+    df = _normalize_columns(df)
+    path = os.fspath(path)
+    db_path = db_path_for(path)
+    _record_io("write", db_path, _frame_bytes(df))
+    conn = _connect(db_path)
+    try:
+        _ensure_imported(conn, path, spec)
+        with conn:
+            _journal_append(conn, os.path.basename(path), spec, sheet_name, df)
+    finally:
+        conn.close()
+    _schedule_compaction(db_path, len(df))
+
+
+_unmanaged_write_lock = threading.Lock()
+
+
+def append_row_unique(path, row: dict, key_columns, sheet_name: Optional[str] = None) -> bool:
+    """
+    Compare-and-set : ajoute `row` seulement si aucune ligne de la feuille (table
+    principale ou journal) n'a les mêmes valeurs sur `key_columns`.
+    La vérification et l'insertion se font sous le verrou d'écriture SQLite
+    (BEGIN IMMEDIATE), donc de façon atomique entre threads et entre processus.
+    Retourne False en cas de conflit, sans rien écrire.
+    """
+    df = _normalize_columns(pd.DataFrame([row]))
+    key_columns = [str(c) for c in key_columns]
+    keys = [_to_sql_value(row.get(c)) for c in key_columns]
+    spec = _dataset_of(path)
+    if spec is None:
+        # Classeur hors base : verrou du processus seulement
+        with _unmanaged_write_lock:
+            existing = read_excel(path, sheet_name=sheet_name or 0, dtype=str) if os.path.exists(path) else pd.DataFrame()
+            if not existing.empty and all(c in existing.columns for c in key_columns):
+                mask = pd.Series(True, index=existing.index)
+                for col, value in zip(key_columns, keys):
+                    mask &= existing[col].fillna("").astype(str) == ("" if value is None else str(value))
+                if mask.any():
+                    return False
+            to_excel(pd.concat([existing, df], ignore_index=True), path, sheet_name=sheet_name)
+            return True
+    path = os.fspath(path)
+    db_path = db_path_for(path)
+    conn = _connect(db_path)
+    try:
+        _ensure_imported(conn, path, spec)
+        fichier = os.path.basename(path)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _note_version(conn, fichier, "avant")
+            meta = _sheets_meta(conn, fichier)
+            targets = [(t, c) for t, f, c, _v in meta if sheet_name is None or f == sheet_name or not spec["multi_sheet"]][:1]
+            for table, columns in targets:
+                if all(c in columns for c in key_columns):
+                    where = " AND ".join(f"{_quote(c)} IS ?" for c in key_columns)
+                    if conn.execute(f"SELECT 1 FROM {_quote(table)} WHERE {where} LIMIT 1", keys).fetchone():
+                        conn.rollback()
+                        return False
+                where = " AND ".join(
+                    "json_extract(ligne, ?) IS ?" for _c in key_columns
+                )
+                params = [table]
+                for col, value in zip(key_columns, keys):
+                    params += [_json_path(col), value]
+                if conn.execute(f"SELECT 1 FROM _journal WHERE table_name=? AND {where} LIMIT 1", params).fetchone():
+                    conn.rollback()
+                    return False
+            _journal_append(conn, fichier, spec, sheet_name, df)
+            _note_version(conn, fichier, "apres")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    finally:
+        conn.close()
+    _record_io("write", db_path, _frame_bytes(df))
+    _schedule_compaction(db_path, 1)
+    return True
+
+
+def _as_text(value) -> Optional[str]:
+    """Valeur telle que relue avec dtype=str (None pour une cellule vide)."""
+    value = _to_sql_value(value)
+    return None if value is None else str(value)
+
+
+def update_rows(path, match: dict, values: dict, sheet_name: Optional[str] = None,
+                unique_columns=None) -> Optional[int]:
+    """
+    Met à jour en place les lignes dont les colonnes valent `match` (table principale
+    et journal), sans relire ni réécrire la feuille. Retourne le nombre de lignes modifiées.
+    `match` peut contenir ROW_ID_COLUMN : la ligne est alors trouvée par sa clé primaire.
+    Avec `unique_columns`, refuse (retourne None, rien n'est écrit) si une autre ligne
+    porte déjà les valeurs visées sur ces colonnes : vérification et mise à jour se font
+    sous le verrou d'écriture SQLite, comme append_row_unique.
+    """
+    spec = _dataset_of(path)
+    if spec is None:
+        with _unmanaged_write_lock:
+            if not os.path.exists(path):
+                return 0
+            df = read_excel(path, sheet_name=sheet_name or 0, dtype=str, row_ids=True)
+            df = df.astype({ROW_ID_COLUMN: str}).fillna("")
+            mask = pd.Series(True, index=df.index)
+            for col, value in match.items():
+                mask &= (df[col].astype(str) == str(value)) if col in df.columns else False
+            if unique_columns:
+                target = {c: str(values.get(c, match.get(c, ""))) for c in unique_columns}
+                other = ~mask
+                for col, value in target.items():
+                    other &= (df[col].astype(str) == value) if col in df.columns else False
+                if other.any():
+                    return None
+            for col, value in values.items():
+                df.loc[mask, col] = value
+            to_excel(df.drop(columns=[ROW_ID_COLUMN]), path, sheet_name=sheet_name)
+            return int(mask.sum())
+    path = os.fspath(path)
+    db_path = db_path_for(path)
+    conn = _connect(db_path)
+    changed = 0
+    match_cols = [str(c) for c in match]
+    # Comparaison textuelle : les lignes sont lues en dtype=str, alors qu'un classeur
+    # importé peut contenir des nombres (ID 12 stocké en entier)
+    match_params = [_as_text(v) for v in match.values()]
+    # La clé primaire se compare telle quelle (index de la table) ; les autres
+    # colonnes en texte
+    where_match = " AND ".join(
+        f"{ROW_ID_COLUMN} IS ?" if c == ROW_ID_COLUMN else f"CAST({_quote(c)} AS TEXT) IS ?" for c in match_cols
+    )
+    where_params = [int(v) if c == ROW_ID_COLUMN else p
+                    for c, v, p in zip(match_cols, match.values(), match_params)]
+    try:
+        if not _ensure_imported(conn, path, spec):
+            return 0
+        fichier = os.path.basename(path)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _note_version(conn, fichier, "avant")
+            tables = []
+            for table, feuille, columns, _v in _sheets_meta(conn, fichier):
+                if sheet_name is not None and feuille != sheet_name and spec["multi_sheet"]:
+                    continue
+                if not all(c in columns for c in match_cols if c != ROW_ID_COLUMN):
+                    continue
+                journal = conn.execute("SELECT id, ligne FROM _journal WHERE table_name=?", (table,)).fetchall()
+                journal = [(journal_id, json.loads(ligne)) for journal_id, ligne in journal]
+
+                def _matches(data):
+                    return all(_as_text(data.get(c)) == v for c, v in zip(match_cols, match_params))
+
+                if unique_columns:
+                    target = [_as_text(values[c] if c in values else match.get(c)) for c in unique_columns]
+                    where_target = " AND ".join(f"CAST({_quote(c)} AS TEXT) IS ?" for c in unique_columns)
+                    if all(c in columns for c in unique_columns) and conn.execute(
+                        f"SELECT 1 FROM {_quote(table)} WHERE {where_target} AND NOT ({where_match}) LIMIT 1",
+                        target + where_params,
+                    ).fetchone():
+                        conn.rollback()
+                        return None
+                    if any(all(_as_text(data.get(c)) == v for c, v in zip(unique_columns, target)) and not _matches(data)
+                           for _id, data in journal):
+                        conn.rollback()
+                        return None
+
+                missing = [c for c in values if c not in columns]
+                if missing:
+                    # Nouvelle colonne : la forme de la feuille change, on invalide sa version
+                    columns = columns + missing
+                    _ensure_columns(conn, table, spec, columns)
+                    conn.execute("UPDATE _sheets SET colonnes=?, version=version+1 WHERE table_name=?",
+                                 (json.dumps(columns, ensure_ascii=False), table))
+                sets = ", ".join(f"{_quote(c)}=?" for c in values)
+                table_changed = conn.execute(
+                    f"UPDATE {_quote(table)} SET {sets} WHERE {where_match}",
+                    [_to_sql_value(v) for v in values.values()] + where_params,
+                ).rowcount
+                for journal_id, data in journal:
+                    if _matches(data):
+                        data.update({c: _to_sql_value(v) for c, v in values.items()})
+                        conn.execute("UPDATE _journal SET ligne=? WHERE id=?", (json.dumps(data, ensure_ascii=False), journal_id))
+                        table_changed += 1
+                # Aucune ligne modifiée : cache et agrégats de la feuille restent valides
+                if table_changed:
+                    conn.execute("UPDATE _sheets SET version=version+1, revision=revision+1 WHERE table_name=?", (table,))
+                if table_changed or missing:
+                    tables.append(table)
+                changed += table_changed
+            _note_version(conn, fichier, "apres")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        _forget_tables(db_path, tables)
+    finally:
+        conn.close()
+    if changed:
+        _record_io("write", db_path, changed * sum(len(str(v)) for v in values.values()))
+    return changed
+
+
+def _row_frame(rows: list, columns: list, dtype) -> pd.DataFrame:
+    """Lignes brutes [(row_id, {colonne: valeur})] -> DataFrame avec ROW_ID_COLUMN."""
+    df = _apply_dtype(pd.DataFrame([data for _id, data in rows], columns=columns, dtype=object), dtype)
+    df[ROW_ID_COLUMN] = pd.array([row_id for row_id, _data in rows], dtype="Int64")
+    return df
+
+
+def _fetch_rows(conn, table: str, columns: list, row_ids: list) -> list:
+    """[(row_id, {colonne: valeur})] des lignes demandées, table principale puis journal."""
+    placeholders = ", ".join("?" for _ in row_ids)
+    cols_sql = "".join(f", {_quote(c)}" for c in columns)
+    found = [
+        (r[0], dict(zip(columns, r[1:])))
+        for r in conn.execute(
+            f"SELECT {ROW_ID_COLUMN}{cols_sql} FROM {_quote(table)} WHERE {ROW_ID_COLUMN} IN ({placeholders})",
+            row_ids,
+        )
+    ]
+    for (ligne,) in conn.execute(
+        f"SELECT ligne FROM _journal WHERE table_name=? AND json_extract(ligne, ?) IN ({placeholders})",
+        [table, _json_path(ROW_ID_COLUMN)] + row_ids,
+    ):
+        data = json.loads(ligne)
+        found.append((data.get(ROW_ID_COLUMN), {c: data.get(c) for c in columns}))
+    return found
+
+
+def read_row(path, row_id: int, sheet_name: Optional[str] = None, dtype=None) -> Optional[dict]:
+    """
+    Lit une seule ligne par son identifiant (clé primaire), sans charger la feuille.
+    Retourne {colonne: valeur} avec ROW_ID_COLUMN, ou None si la ligne n'existe plus.
+    """
+    row_id = int(row_id)
+    spec = _dataset_of(path)
+    if spec is None:
+        if not os.path.exists(path):
+            return None
+        df = read_excel(path, sheet_name=sheet_name or 0, dtype=dtype, row_ids=True)
+        df = df[df[ROW_ID_COLUMN] == row_id]
+        return df.iloc[0].to_dict() if len(df) else None
+    path = os.fspath(path)
+    conn = _connect(db_path_for(path))
+    try:
+        if not _ensure_imported(conn, path, spec):
+            return None
+        conn.execute("BEGIN")
+        target = _target_sheet(conn, os.path.basename(path), spec, sheet_name)
+        if target is None:
+            return None
+        table, columns = target
+        rows = _fetch_rows(conn, table, columns, [row_id])
+        if not rows:
+            return None
+        return _row_frame(rows[:1], columns, dtype).iloc[0].to_dict()
+    finally:
+        conn.close()
+
+
+def delete_rows(path, row_ids, sheet_name: Optional[str] = None, dtype=None) -> pd.DataFrame:
+    """
+    Supprime des lignes par identifiant, sans relire ni réécrire la feuille.
+    Retourne les lignes effectivement supprimées (DataFrame avec ROW_ID_COLUMN, vide si
+    elles n'existaient plus) : lecture et suppression se font dans la même transaction.
+    """
+    row_ids = [int(i) for i in row_ids]
+    spec = _dataset_of(path)
+    if spec is None:
+        with _unmanaged_write_lock:
+            if not row_ids or not os.path.exists(path):
+                return pd.DataFrame()
+            df = read_excel(path, sheet_name=sheet_name or 0, dtype=dtype, row_ids=True)
+            mask = df[ROW_ID_COLUMN].isin(row_ids)
+            if mask.any():
+                to_excel(df[~mask].drop(columns=[ROW_ID_COLUMN]), path, sheet_name=sheet_name)
+            return df[mask].reset_index(drop=True)
+    path = os.fspath(path)
+    db_path = db_path_for(path)
+    conn = _connect(db_path)
+    try:
+        if not row_ids or not _ensure_imported(conn, path, spec):
+            return pd.DataFrame()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _note_version(conn, os.path.basename(path), "avant")
+            target = _target_sheet(conn, os.path.basename(path), spec, sheet_name)
+            if target is None:
+                conn.rollback()
+                return pd.DataFrame()
+            table, columns = target
+            rows = _fetch_rows(conn, table, columns, row_ids)
+            if rows:
+                placeholders = ", ".join("?" for _ in row_ids)
+                conn.execute(f"DELETE FROM {_quote(table)} WHERE {ROW_ID_COLUMN} IN ({placeholders})", row_ids)
+                conn.execute(
+                    f"DELETE FROM _journal WHERE table_name=? AND json_extract(ligne, ?) IN ({placeholders})",
+                    [table, _json_path(ROW_ID_COLUMN)] + row_ids,
+                )
+                conn.execute("UPDATE _sheets SET version=version+1, revision=revision+1 WHERE table_name=?", (table,))
+            _note_version(conn, os.path.basename(path), "apres")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        if rows:
+            _forget_tables(db_path, [table])
+            _record_io("write", db_path, 0)
+        return _row_frame(rows, columns, dtype)
+    finally:
+        conn.close()
+
+
+@timing.timed("excel")
+def read_rows_since(path, after_row_id: int = 0, sheet_name: Optional[str] = None, dtype=None):
+    """
+    Lignes d'identifiant > after_row_id (table principale puis journal, par identifiant
+    croissant) et révision de la feuille, lues dans le même instantané.
+    La révision change quand des lignes existantes sont réécrites, modifiées ou
+    supprimées, pas lors d'un ajout ni d'une compaction : tant qu'elle est inchangée,
+    les lignes déjà lues le sont toujours à l'identique. Retourne (DataFrame avec
+    ROW_ID_COLUMN, révision), ou (None, None) si la feuille n'existe pas.
+    Hors jeux gérés : numéros de ligne, et (mtime, taille) comme révision.
+    """
+    after_row_id = int(after_row_id or 0)
+    spec = _dataset_of(path)
+    if spec is None:
+        revision = dataset_version(path)
+        if revision is None:
+            return None, None
+        df = read_excel(path, sheet_name=sheet_name or 0, dtype=dtype, row_ids=True)
+        return df[df[ROW_ID_COLUMN] > after_row_id].reset_index(drop=True), revision
+    path = os.fspath(path)
+    conn = _connect(db_path_for(path))
+    try:
+        if not _ensure_imported(conn, path, spec):
+            return None, None
+        conn.execute("BEGIN")
+        target = _target_sheet(conn, os.path.basename(path), spec, sheet_name)
+        if target is None:
+            return None, None
+        table, columns = target
+        revision = conn.execute("SELECT revision FROM _sheets WHERE table_name=?", (table,)).fetchone()[0]
+        cols_sql = "".join(f", {_quote(c)}" for c in columns)
+        rows = [
+            (r[0], dict(zip(columns, r[1:])))
+            for r in conn.execute(
+                f"SELECT {ROW_ID_COLUMN}{cols_sql} FROM {_quote(table)} WHERE {ROW_ID_COLUMN} > ? "
+                f"ORDER BY {ROW_ID_COLUMN}",
+                (after_row_id,),
+            )
+        ]
+        journal = []
+        for (ligne,) in conn.execute(
+            "SELECT ligne FROM _journal WHERE table_name=? AND json_extract(ligne, ?) > ? ORDER BY id",
+            (table, _json_path(ROW_ID_COLUMN), after_row_id),
+        ):
+            data = json.loads(ligne)
+            journal.append((data.get(ROW_ID_COLUMN), {c: data.get(c) for c in columns}))
+        rows.extend(sorted(journal, key=lambda r: r[0]))
+        df = _row_frame(rows, columns, dtype)
+        _record_io("read", path, _frame_bytes(df))
+        return df, revision
+    finally:
+        conn.close()
+
+
+# ---------------------------------------------------------------------------
+#  8. API compatible pandas
+# ---------------------------------------------------------------------------
+def exists(path) -> bool:
+    """Équivalent de os.path.exists pour un classeur géré (base ou fichier historique)."""
+    spec = _dataset_of(path)
+    if spec is None:
+        return os.path.exists(path)
+    path = os.fspath(path)
+    conn = _connect(db_path_for(path))
+    try:
+        return _ensure_imported(conn, path, spec)
+    finally:
+        conn.close()
+
+
+def dataset_version(path):
+    """
+    Jeton qui change à chaque écriture du classeur (réécriture, ajout journalisé,
+    import) : (versions des feuilles, dernier id du journal). Hors jeux gérés,
+    (mtime, taille) du fichier. None si le classeur n'existe pas.
+    """
+    spec = _dataset_of(path)
+    if spec is None:
+        try:
+            st = os.stat(path)
+        except (OSError, TypeError):
+            return None
+        return (st.st_mtime_ns, st.st_size)
+    path = os.fspath(path)
+    conn = _connect(db_path_for(path))
+    try:
+        if not _ensure_imported(conn, path, spec):
+            return None
+        conn.execute("BEGIN")
+        return _dataset_version(conn, os.path.basename(path))
+    finally:
+        conn.close()
+
+
+def _dataset_version(conn, fichier: str) -> tuple:
+    meta = _sheets_meta(conn, fichier)
+    tables = [t for t, _f, _c, _v in meta]
+    last_id = 0
+    if tables:
+        placeholders = ", ".join("?" for _ in tables)
+        last_id = conn.execute(
+            f"SELECT COALESCE(MAX(id), 0) FROM _journal WHERE table_name IN ({placeholders})", tables
+        ).fetchone()[0]
+    return (tuple(v for _t, _f, _c, v in meta), last_id)
+
+
+# Versions (dataset_version) encadrant les écritures d'un bloc write_versions()
+_write_versions: contextvars.ContextVar = contextvars.ContextVar("write_versions", default=None)
+
+
+@contextmanager
+def write_versions():
+    """
+    Bloc dont l'écriture (append_row_unique, update_rows ou delete_rows) note dans le
+    dict produit les versions du classeur juste avant ("avant") et juste après ("apres")
+    elle. Les deux sont lues dans sa transaction, sous le verrou d'écriture : aucune
+    autre écriture, d'un autre thread ou worker, ne peut s'intercaler. Un index tenu à
+    jour par l'appelant (slot_index) sait ainsi s'il a manqué une écriture.
+    """
+    versions = {}
+    token = _write_versions.set(versions)
+    try:
+        yield versions
+    finally:
+        _write_versions.reset(token)
+
+
+def _note_version(conn, fichier: str, moment: str):
+    versions = _write_versions.get()
+    if versions is not None:
+        versions[moment] = _dataset_version(conn, fichier)
+
+
+def sheet_names(path) -> list:
+    """Noms des feuilles, dans l'ordre du classeur."""
+    spec = _dataset_of(path)
+    if spec is None:
+        return pd.ExcelFile(path).sheet_names
+    path = os.fspath(path)
+    conn = _connect(db_path_for(path))
+    try:
+        if not _ensure_imported(conn, path, spec):
+            return []
+        return [f for _t, f, _c, _v in _sheets_meta(conn, os.path.basename(path))]
+    finally:
+        conn.close()
+
+
+def _read_table(conn, db_path: str, table: str, columns: list, version: int, dtype,
+                row_ids: bool = False) -> pd.DataFrame:
+    if not columns:
+        return pd.DataFrame()
+    key = ("db", db_path, table, version, _cache_token(dtype))
+    entry = _cache.lookup(key)
+    df, size = entry if entry is not None else (None, 0)
+    if df is None:
+        cols_sql = ", ".join(_quote(c) for c in columns)
+        rows = conn.execute(
+            f"SELECT {cols_sql}, {ROW_ID_COLUMN} FROM {_quote(table)} ORDER BY {ROW_ID_COLUMN}"
+        ).fetchall()
+        df = pd.DataFrame([r[:-1] for r in rows], columns=columns, dtype=object)
+        df = _apply_dtype(df, dtype)
+        # Le frame mis en cache porte toujours les identifiants : une seule entrée par version
+        df[ROW_ID_COLUMN] = pd.array([r[-1] for r in rows], dtype="Int64")
+        size = _cache.put(key, df)
+    _record_io("read", db_path, size)
+    journal = _journal_frame(conn, table, columns, dtype)
+    if journal is not None:
+        df = journal if df.empty else pd.concat([df, journal], ignore_index=True)
+    if row_ids:
+        return df.copy() if journal is None else df
+    return df.drop(columns=[ROW_ID_COLUMN])
+
+
+@timing.timed("excel")
+def read_excel(path, sheet_name: Union[int, str, None] = 0, dtype=None, row_ids: bool = False, **kwargs):
+    """
+    Remplaçant de pd.read_excel : lit le jeu de données depuis SQLite s'il est géré,
+    sinon délègue à pandas. `sheet_name=None` retourne un dict {feuille: DataFrame}.
+    Avec `row_ids=True`, chaque frame a une colonne ROW_ID_COLUMN (identifiant stable
+    de la ligne, à passer à read_row / update_rows / delete_rows ; hors jeux gérés,
+    simple numéro de ligne).
+    Lève FileNotFoundError si le jeu n'existe ni en base ni en Excel.
+    """
+    spec = _dataset_of(path)
+    if spec is None:
+        result = _read_workbook_cached(path, sheet_name, dtype, kwargs)
+        if row_ids:
+            for df in (result.values() if isinstance(result, dict) else [result]):
+                df[ROW_ID_COLUMN] = pd.array(range(1, len(df) + 1), dtype="Int64")
+        return result
+    path = os.fspath(path)
+    db_path = db_path_for(path)
+    conn = _connect(db_path)
+    try:
+        if not _ensure_imported(conn, path, spec):
+            raise FileNotFoundError(path)
+        # Instantané unique : table principale et journal lus de façon cohérente
+        # même si une compaction se termine pendant la lecture
+        conn.execute("BEGIN")
+        meta = _sheets_meta(conn, os.path.basename(path))
+        if sheet_name is None:
+            return {f: _read_table(conn, db_path, t, c, v, dtype, row_ids) for t, f, c, v in meta}
+        if isinstance(sheet_name, int):
+            if sheet_name >= len(meta):
+                if not meta and sheet_name == 0:
+                    return pd.DataFrame()
+                raise ValueError(f"Feuille n°{sheet_name} introuvable dans {os.path.basename(path)}")
+            table, _f, columns, version = meta[sheet_name]
+            return _read_table(conn, db_path, table, columns, version, dtype, row_ids)
+        for table, feuille, columns, version in meta:
+            if feuille == sheet_name:
+                return _read_table(conn, db_path, table, columns, version, dtype, row_ids)
+        if not spec["multi_sheet"] and meta:
+            table, _f, columns, version = meta[0]
+            return _read_table(conn, db_path, table, columns, version, dtype, row_ids)
+        raise ValueError(f"Worksheet named '{sheet_name}' not found")
+    finally:
+        conn.close()
+
+
+def to_excel(df: pd.DataFrame, path, sheet_name: Optional[str] = None, index: bool = False, **kwargs):
+    """
+    Remplaçant de DataFrame.to_excel(path, index=False) : remplace la feuille en base
+    sans toucher aux autres feuilles du classeur. Délègue à pandas hors jeux gérés.
+    """
+    spec = _dataset_of(path)
+    _record_io("write", path, _frame_bytes(df))
+    if spec is None:
+        _forget_file(path)
+        return df.to_excel(path, sheet_name=sheet_name or "Sheet1", index=index, **kwargs)
+    path = os.fspath(path)
+    if index:
+        df = df.reset_index()
+    db_path = db_path_for(path)
+    conn = _connect(db_path)
+    try:
+        _ensure_imported(conn, path, spec)
+        fichier = os.path.basename(path)
+        if sheet_name is None:
+            meta = _sheets_meta(conn, fichier)
+            sheet_name = meta[0][1] if meta else "Sheet1"
+        with conn:
+            table = _replace_sheet(conn, fichier, spec, sheet_name, df)
+            _mark_dataset(conn, fichier)
+        _forget_tables(db_path, [table])
+    finally:
+        conn.close()
+
+
+def write_sheets(path, sheets: dict):
+    """Écrit plusieurs feuilles d'un classeur en une seule transaction."""
+    spec = _dataset_of(path)
+    _record_io("write", path, _frame_bytes(sheets))
+    if spec is None:
+        _forget_file(path)
+        with pd.ExcelWriter(path, engine="openpyxl") as writer:
+            for feuille, df in sheets.items():
+                df.to_excel(writer, sheet_name=feuille, index=False)
+        return
+    path = os.fspath(path)
+    db_path = db_path_for(path)
+    conn = _connect(db_path)
+    try:
+        _ensure_imported(conn, path, spec)
+        fichier = os.path.basename(path)
+        with conn:
+            tables = [_replace_sheet(conn, fichier, spec, feuille, df) for feuille, df in sheets.items()]
+            _mark_dataset(conn, fichier)
+        _forget_tables(db_path, tables)
+    finally:
+        conn.close()
+
+
+def create(path, sheets: dict):
+    """
+    Déclare un jeu de données vide avec ses en-têtes {feuille: [colonnes]} s'il
+    n'existe pas encore, et ajoute les feuilles manquantes sinon.
+    Remplace l'initialisation des classeurs vides via openpyxl.
+    """
+    spec = _dataset_of(path)
+    if spec is None:
+        if not os.path.exists(path):
+            write_sheets(path, {f: pd.DataFrame(columns=c) for f, c in sheets.items()})
+        return
+    path = os.fspath(path)
+    conn = _connect(db_path_for(path))
+    try:
+        existed = _ensure_imported(conn, path, spec)
+        fichier = os.path.basename(path)
+        present = [f for _t, f, _c, _v in _sheets_meta(conn, fichier)]
+        with conn:
+            for feuille, columns in sheets.items():
+                if existed and (feuille in present or (present and not spec["multi_sheet"])):
+                    continue
+                _replace_sheet(conn, fichier, spec, feuille, pd.DataFrame(columns=columns))
+            _mark_dataset(conn, fichier)
+    finally:
+        conn.close()
+
+
+def managed_files(excel_folder: str) -> list:
+    """Noms des classeurs gérés présents pour ce tenant (en base ou en Excel)."""
+    return [name for name in DATASETS if exists(os.path.join(excel_folder, name))]
+
+
+# ---------------------------------------------------------------------------
+#  9. Lecture groupée de classeurs (pool borné)
+# ---------------------------------------------------------------------------
+# read_workbooks lit plusieurs classeurs en parallèle dans un pool de threads
+# partagé par toutes les requêtes du processus, chacun une seule fois pour
+# toutes ses feuilles (sheet_name=None) et via le cache de la section 6.
+# Pas de pool de processus : sous spawn/forkserver chaque worker réimporterait
+# le module principal (app.py crée l'application et lance le planificateur de
+# sauvegardes), et fork n'est pas sûr dans un serveur multi-thread. Les jeux
+# gérés, les plus volumineux, sont lus depuis SQLite qui relâche le GIL.
+LOAD_THREADS = int(os.environ.get("EASYMEDICALINK_LOAD_THREADS", str(min(8, (os.cpu_count() or 1) + 4))))
+
+_load_pool = None
+_load_pool_lock = threading.Lock()
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _load_pool
+    with _load_pool_lock:
+        if _load_pool is None:
+            _load_pool = ThreadPoolExecutor(max_workers=max(1, LOAD_THREADS), thread_name_prefix="storage-load")
+        return _load_pool
+
+
+def _read_all_sheets(path, dtype, row_ids):
+    try:
+        return read_excel(path, sheet_name=None, dtype=dtype, row_ids=row_ids)
+    except Exception as e:
+        return e
+
+
+@timing.timed("excel")
+def read_workbooks(paths, dtype=None, row_ids: bool = False) -> dict:
+    """
+    {chemin: {feuille: DataFrame}} pour chaque classeur de `paths`, lus en parallèle
+    (même résultat que read_excel(chemin, sheet_name=None)). Un classeur illisible ou
+    introuvable a pour valeur l'exception levée, sans interrompre les autres lectures.
+    """
+    paths = list(dict.fromkeys(paths))
+    if len(paths) <= 1:
+        return {path: _read_all_sheets(path, dtype, row_ids) for path in paths}
+    # Chaque lecture s'exécute dans le contexte (tenant) de l'appelant
+    futures = [_pool().submit(contextvars.copy_context().run, _read_all_sheets, path, dtype, row_ids)
+               for path in paths]
+    return {path: future.result() for path, future in zip(paths, futures)}
@@ -0,0 +1,94 @@
+# template_cache.py
+# ---------------------------------------------------------------------------
+#  Registre des templates Jinja inline (pages écrites en chaînes Python)
+# ---------------------------------------------------------------------------
+#  flask.render_template_string relexe et recompile la source à chaque requête.
+#  Ici chaque source est enregistrée une fois sous un nom dérivé de son empreinte
+#  et servie par un loader Jinja : le Template compilé reste dans le cache de
+#  l'environnement de l'application et, si EASYMEDICALINK_TEMPLATE_CACHE désigne
+#  un dossier, son bytecode y est persisté pour que les nouveaux workers
+#  (gunicorn) n'aient pas à recompiler.
+#
+#  Usage : remplacer `from flask import render_template_string` par
+#  `from template_cache import render_template_string` (même signature).
+# ---------------------------------------------------------------------------
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from flask import render_template
+from jinja2 import BaseLoader, ChoiceLoader, FileSystemBytecodeCache, TemplateNotFound
+
+import logs
+import timing
+
+log = logs.get_logger(__name__)
+
+# Nombre maximal de sources inline gardées en mémoire (les pages construites
+# dynamiquement produisent une source par variante : on borne le registre).
+MAX_SOURCES = int(os.environ.get("EASYMEDICALINK_TEMPLATE_SOURCES", "512"))
+# Dossier du cache de bytecode sur disque (désactivé si vide)
+BYTECODE_CACHE_DIR = os.environ.get("EASYMEDICALINK_TEMPLATE_CACHE", "")
+
+
+class _InlineTemplateLoader(BaseLoader):
+    """Loader Jinja servant les sources inline enregistrées, indexées par empreinte."""
+
+    def __init__(self, max_sources: int):
+        self._sources: "OrderedDict[str, str]" = OrderedDict()
+        self._max_sources = max_sources
+        self._lock = threading.Lock()
+
+    def register(self, source: str) -> str:
+        # Suffixe .html : Flask n'active l'autoescape que pour ces extensions
+        name = "inline/" + hashlib.sha1(source.encode("utf-8")).hexdigest() + ".html"
+        with self._lock:
+            if name in self._sources:
+                self._sources.move_to_end(name)
+            else:
+                self._sources[name] = source
+                while len(self._sources) > self._max_sources:
+                    self._sources.popitem(last=False)
+        return name
+
+    def get_source(self, environment, template):
+        source = self._sources.get(template)
+        if source is None:
+            raise TemplateNotFound(template)
+        # Le nom est l'empreinte de la source : le template est toujours à jour
+        return source, None, lambda: True
+
+
+_loader = _InlineTemplateLoader(MAX_SOURCES)
+
+
+def init_app(app, bytecode_cache_dir: Optional[str] = None):
+    """Branche le registre sur l'environnement Jinja de l'application."""
+    env = app.jinja_env
+    env.loader = ChoiceLoader([_loader, env.loader])
+
+    directory = bytecode_cache_dir or BYTECODE_CACHE_DIR
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        env.bytecode_cache = FileSystemBytecodeCache(directory)
+        log.debug("Cache de bytecode Jinja activé dans %s", directory)
+
+
+def preload(app, *sources: str):
+    """Compile des templates au démarrage (évite le coût à la première requête)."""
+    for source in sources:
+        try:
+            app.jinja_env.get_template(_loader.register(source))
+        except Exception as e:
+            # Une page invalide ne doit pas empêcher le démarrage : l'erreur
+            # réapparaîtra au rendu, comme avec render_template_string.
+            log.error("Précompilation d'un template impossible : %s", e)
+
+
+def render_template_string(source: str, **context) -> str:
+    """Équivalent de flask.render_template_string, avec le Template compilé mis en cache."""
+    with timing.phase("render"):
+        return render_template(_loader.register(source), **context)
@@ -0,0 +1,195 @@
+# timing.py
+# ---------------------------------------------------------------------------
+#  Chronométrage par phase des requêtes (en-tête Server-Timing)
+# ---------------------------------------------------------------------------
+#  Chaque requête est découpée en phases :
+#    tenant    résolution du tenant (utils.set_dynamic_base_dir)
+#    auth      vérification du compte et de la licence
+#    excel     lecture des classeurs (storage.read_excel, read_workbooks…)
+#    render    rendu des templates (template_cache.render_template_string)
+#    pdf       génération des PDF (FPDF / ReportLab)
+#    dataframe le reste de la requête : traitement des DataFrames et logique
+#              de la vue (durée totale moins les phases ci-dessus)
+#  Le détail est renvoyé dans l'en-tête Server-Timing (visible dans l'onglet
+#  Réseau du navigateur), conservé par endpoint sur les dernières requêtes
+#  (histogramme glissant, voir histograms()) et cumulé dans metrics.
+#
+#  Les phases s'imbriquent : seul le temps propre d'une phase lui est compté
+#  (une lecture Excel pendant un PDF compte en « excel », pas en « pdf »).
+#  Dans les threads de storage.read_workbooks, le contexte copié porte la
+#  phase de l'appelant, qui couvre déjà la durée réelle : rien n'y est compté.
+#
+#  Usage : `with timing.phase("excel"): ...` ou `@timing.timed("pdf")`.
+#  Hors requête (tâches planifiées, scripts), les phases ne coûtent rien.
+# ---------------------------------------------------------------------------
+
+import functools
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import g, has_request_context, request
+
+import metrics
+
+# En-tête Server-Timing sur les réponses (0 pour ne pas l'exposer aux clients)
+SERVER_TIMING = os.environ.get("EASYMEDICALINK_SERVER_TIMING", "1") != "0"
+# Nombre de requêtes conservées par endpoint pour l'histogramme
+WINDOW = int(os.environ.get("EASYMEDICALINK_TIMING_WINDOW", "500"))
+# Bornes supérieures des classes de l'histogramme (ms)
+BUCKETS_MS = metrics.LATENCY_BUCKETS_MS
+
+PHASES = {
+    "tenant": "Tenant",
+    "auth": "Compte et licence",
+    "excel": "Lecture des classeurs",
+    "dataframe": "Traitement (DataFrames)",
+    "render": "Rendu du template",
+    "pdf": "Génération PDF",
+}
+
+
+class _Frame:
+    __slots__ = ("thread", "children")
+
+    def __init__(self):
+        self.thread = threading.get_ident()
+        self.children = 0.0     # durée des phases imbriquées (s)
+
+
+_stack: ContextVar = ContextVar("timing_stack", default=())
+
+_samples: dict = {}             # endpoint -> deque des dernières mesures {phase: ms}
+_samples_lock = threading.Lock()
+
+
+# ---------------------------------------------------------------------------
+# Mesure des phases
+# ---------------------------------------------------------------------------
+@contextmanager
+def phase(name: str):
+    """Compte la durée propre du bloc dans la phase `name` de la requête courante."""
+    if not has_request_context():
+        yield
+        return
+    stack = _stack.get()
+    if stack and stack[-1].thread != threading.get_ident():
+        yield                   # thread de travail : l'appelant chronomètre déjà
+        return
+    frame = _Frame()
+    token = _stack.set(stack + (frame,))
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _stack.reset(token)
+        if stack:
+            stack[-1].children += elapsed
+        own = elapsed - frame.children
+        timings = g.setdefault("_timings", {})
+        timings[name] = timings.get(name, 0.0) + own
+        metrics.observe("phase_ms", own * 1000, phase=name)
+
+
+def timed(name: str):
+    """Décorateur : chaque appel de la fonction est compté dans la phase `name`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ---------------------------------------------------------------------------
+# Intégration Flask
+# ---------------------------------------------------------------------------
+def init_app(app):
+    """À appeler avant les autres before_request pour que le total couvre toute la requête."""
+
+    @app.before_request
+    def start_request_timer():
+        g._timing_start = time.perf_counter()
+        g._timings = {}
+
+    @app.after_request
+    def add_server_timing(response):
+        start = g.get("_timing_start")
+        if start is None:
+            return response
+        total = (time.perf_counter() - start) * 1000
+        measured = {name: seconds * 1000 for name, seconds in g.get("_timings", {}).items()}
+        measured["dataframe"] = max(total - sum(measured.values()), 0.0)
+        measured["total"] = total
+        _record(request.endpoint or "<aucun>", measured)
+        from utils import current_tenant    # import local : utils importe timing
+        tenant = current_tenant()
+        metrics.observe_request(measured, response.status_code,
+                                os.path.basename(tenant.base_dir) if tenant else "<aucun>")
+        if SERVER_TIMING:
+            response.headers["Server-Timing"] = server_timing_header(measured)
+        return response
+
+
+def server_timing_header(measured: dict) -> str:
+    """Valeur de l'en-tête Server-Timing pour des durées en ms."""
+    parts = []
+    for name, desc in PHASES.items():
+        if name in measured:
+            parts.append(f'{name};dur={measured[name]:.1f};desc="{desc}"')
+    parts.append(f"total;dur={measured['total']:.1f}")
+    return ", ".join(parts)
+
+
+# ---------------------------------------------------------------------------
+# Histogramme glissant par endpoint
+# ---------------------------------------------------------------------------
+def _record(endpoint: str, measured: dict):
+    with _samples_lock:
+        samples = _samples.get(endpoint)
+        if samples is None:
+            samples = _samples[endpoint] = deque(maxlen=WINDOW)
+        samples.append(measured)
+
+
+def _percentile(values: list, p: float) -> float:
+    """Percentile (plus proche rang) d'une liste triée."""
+    index = max(math.ceil(p / 100 * len(values)) - 1, 0)
+    return values[index]
+
+
+def histograms() -> dict:
+    """
+    Par endpoint, sur les WINDOW dernières requêtes : nombre de requêtes, répartition
+    de la durée totale par classe (BUCKETS_MS) et, par phase, moyenne / p50 / p95 / max (ms).
+    """
+    with _samples_lock:
+        snapshot = {endpoint: list(samples) for endpoint, samples in _samples.items()}
+    result = {}
+    for endpoint, samples in snapshot.items():
+        buckets = dict.fromkeys([f"<={b}" for b in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}"], 0)
+        for sample in samples:
+            bound = next((b for b in BUCKETS_MS if sample["total"] <= b), None)
+            buckets[f"<={bound}" if bound is not None else f">{BUCKETS_MS[-1]}"] += 1
+        phases = {}
+        for name in list(PHASES) + ["total"]:
+            values = sorted(sample.get(name, 0.0) for sample in samples)
+            phases[name] = {
+                "mean": round(sum(values) / len(values), 2),
+                "p50": round(_percentile(values, 50), 2),
+                "p95": round(_percentile(values, 95), 2),
+                "max": round(values[-1], 2),
+            }
+        result[endpoint] = {"count": len(samples), "buckets": buckets, "phases": phases}
+    return result
+
+
+def reset():
+    with _samples_lock:
+        _samples.clear()
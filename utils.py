@@ -8,6 +8,9 @@
 import os, sys, platform, json, uuid, hashlib, re, copy, base64, io, subprocess, socket, requests
 from datetime import datetime, date, timedelta
 from typing import Optional
+from contextvars import ContextVar
+import threading
+import bisect
 import pandas as pd
 from werkzeug.utils import secure_filename # Importation ajoutée pour être explicite
 
@@ -24,6 +27,12 @@ from PyPDF2 import PdfReader, PdfWriter
 from PIL import Image, ImageDraw
 from textwrap import dedent
 from pathlib import Path # Importation de Path
+import storage
+import schema
+import timing
+import logs
+
+log = logs.get_logger(__name__)
 
 # Importations pour le QR code
 import qrcode
@@ -46,95 +55,167 @@ else:
 # Variable globale pour stocker le répertoire de base de l'application sous forme de Path
 BASE_APP_DIR: Path = Path(application_path)
 
-# Variable globale pour stocker le répertoire de données dynamique pour l'administrateur
-DYNAMIC_BASE_DIR: Optional[str] = None
-# Variable globale pour stocker l'e-mail de l'administrateur (non-sanitizé)
-ADMIN_EMAIL: Optional[str] = None
-
-# Ces chemins seront définis dynamiquement en fonction de ADMIN_EMAIL
-EXCEL_FOLDER: Optional[str] = None
-EXCEL_FILE_PATH: Optional[str] = None
-CONSULT_FILE_PATH: Optional[str] = None
-PDF_FOLDER: Optional[str] = None
-CONFIG_FOLDER: Optional[str] = None
-BACKGROUND_FOLDER: Optional[str] = None
-CONFIG_FILE: Optional[str] = None
-STORAGE_CONFIG_FILE: Optional[str] = None
-PATIENT_BASE_FILE: Optional[str] = None
-SQLITE_DB_PATH: Optional[str] = None
-
 # Ce fichier reste statique selon vos exigences
 LISTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Liste_Medications_Analyses_Radiologies.xlsx')
 
-def set_dynamic_base_dir(admin_email: str):
-    """
-    Définit les chemins de répertoires dynamiques basés sur l'e-mail de l'administrateur.
-    Ceci est appelé au début de chaque requête par le before_request de Flask.
-    """
-    global DYNAMIC_BASE_DIR, ADMIN_EMAIL
-    global EXCEL_FOLDER, EXCEL_FILE_PATH, CONSULT_FILE_PATH, PDF_FOLDER, CONFIG_FOLDER, BACKGROUND_FOLDER
-    global CONFIG_FILE, STORAGE_CONFIG_FILE, PATIENT_BASE_FILE, SQLITE_DB_PATH
-
-    # Conserver l'e-mail original pour ADMIN_EMAIL
-    ADMIN_EMAIL = admin_email
-    
-    # Sanitiser l'e-mail pour l'utiliser comme nom de dossier
+# ─── Contexte tenant lié à la requête ─────────────────────────────────────
+# Les chemins propres à un administrateur ne sont plus des variables globales
+# du module : chaque requête lie son propre TenantContext via une ContextVar,
+# ce qui évite qu'une requête concurrente d'un autre tenant écrase les chemins.
+def tenant_base_dir(admin_email: str) -> str:
+    """Répertoire de données d'un administrateur (e-mail sanitizé en nom de dossier)."""
     sanitized_admin_folder_name = admin_email.lower().replace('@', '_at_').replace('.', '_dot_')
+    return os.path.join(application_path, "MEDICALINK_DATA", sanitized_admin_folder_name)
+
+
+class TenantContext:
+    """Chemins et données en mémoire propres à un administrateur (tenant)."""
+
+    def __init__(self, admin_email: str):
+        # Conserver l'e-mail original (non-sanitizé)
+        self.admin_email = admin_email
+
+        self.base_dir          = tenant_base_dir(admin_email)
+        self.excel_folder      = os.path.join(self.base_dir, "Excel")
+        self.excel_file_path   = os.path.join(self.excel_folder, "ConsultationData.xlsx")
+        self.consult_file_path = self.excel_file_path
+        self.pdf_folder        = os.path.join(self.base_dir, "PDF")
+        self.config_folder     = os.path.join(self.base_dir, "Config")
+        self.background_folder = os.path.join(self.base_dir, "Background")
+        self.sqlite_db_path    = os.path.join(self.base_dir, "database.db")
+
+        self.config_file         = os.path.join(self.config_folder, "config.json")
+        self.storage_config_file = os.path.join(self.config_folder, "storage_config.json")
+        self.patient_base_file   = os.path.join(self.excel_folder, "info_Base_patient.xlsx")
+
+        # Fichier d'arrière-plan des PDF (mis à jour par init_app)
+        self.background_file: Optional[str] = None
+
+        # Annuaire patients (rempli par load_patient_data)
+        self.patient_ids: list = []
+        self.patient_names: list = []
+        self.patient_id_to_name: dict = {}
+        self.patient_name_to_id: dict = {}
+        self.patient_id_to_age: dict = {}
+        self.patient_id_to_phone: dict = {}
+        self.patient_id_to_antecedents: dict = {}
+        self.patient_id_to_dob: dict = {}
+        self.patient_id_to_gender: dict = {}
+        self.patient_id_to_nom: dict = {}
+        self.patient_id_to_prenom: dict = {}
+        # Annuaire incrémental qui tient à jour les structures ci-dessus
+        self.patient_directory: Optional["PatientDirectory"] = None
+
+    def ensure_dirs(self):
+        for _dir in (self.base_dir, self.excel_folder, self.pdf_folder, self.config_folder, self.background_folder):
+            os.makedirs(_dir, exist_ok=True)
+
+
+_current_tenant: ContextVar[Optional[TenantContext]] = ContextVar("easymedicalink_tenant", default=None)
+# Un contexte par administrateur, réutilisé d'une requête à l'autre
+_tenants: dict = {}
+_tenants_lock = threading.Lock()
+
+# Correspondance entre les anciens noms globaux du module et les attributs du contexte
+_TENANT_ATTRIBUTES = {
+    "ADMIN_EMAIL": "admin_email",
+    "DYNAMIC_BASE_DIR": "base_dir",
+    "EXCEL_FOLDER": "excel_folder",
+    "EXCEL_FILE_PATH": "excel_file_path",
+    "CONSULT_FILE_PATH": "consult_file_path",
+    "PDF_FOLDER": "pdf_folder",
+    "CONFIG_FOLDER": "config_folder",
+    "BACKGROUND_FOLDER": "background_folder",
+    "CONFIG_FILE": "config_file",
+    "STORAGE_CONFIG_FILE": "storage_config_file",
+    "PATIENT_BASE_FILE": "patient_base_file",
+    "SQLITE_DB_PATH": "sqlite_db_path",
+    "background_file": "background_file",
+    "patient_ids": "patient_ids",
+    "patient_names": "patient_names",
+    "patient_id_to_name": "patient_id_to_name",
+    "patient_name_to_id": "patient_name_to_id",
+    "patient_id_to_age": "patient_id_to_age",
+    "patient_id_to_phone": "patient_id_to_phone",
+    "patient_id_to_antecedents": "patient_id_to_antecedents",
+    "patient_id_to_dob": "patient_id_to_dob",
+    "patient_id_to_gender": "patient_id_to_gender",
+    "patient_id_to_nom": "patient_id_to_nom",
+    "patient_id_to_prenom": "patient_id_to_prenom",
+}
+_EMPTY_TENANT_LISTS = {"patient_ids", "patient_names"}
 
-    # Construire le chemin du répertoire de données dynamique
-    DYNAMIC_BASE_DIR = os.path.join(application_path, "MEDICALINK_DATA", sanitized_admin_folder_name)
-    os.makedirs(DYNAMIC_BASE_DIR, exist_ok=True)
-
-    EXCEL_FOLDER      = os.path.join(DYNAMIC_BASE_DIR, "Excel")
-    EXCEL_FILE_PATH = os.path.join(EXCEL_FOLDER, "ConsultationData.xlsx")
-    CONSULT_FILE_PATH = EXCEL_FILE_PATH
-    PDF_FOLDER        = os.path.join(DYNAMIC_BASE_DIR, "PDF")
-    CONFIG_FOLDER     = os.path.join(DYNAMIC_BASE_DIR, "Config")
-    BACKGROUND_FOLDER = os.path.join(DYNAMIC_BASE_DIR, "Background")
-    SQLITE_DB_PATH = os.path.join(DYNAMIC_BASE_DIR, "database.db") # Nouveau chemin pour la DB SQLite
-
-    for _dir in (DYNAMIC_BASE_DIR, EXCEL_FOLDER, PDF_FOLDER, CONFIG_FOLDER, BACKGROUND_FOLDER):
-        os.makedirs(_dir, exist_ok=True)
-
-    CONFIG_FILE         = os.path.join(CONFIG_FOLDER, "config.json")
-    STORAGE_CONFIG_FILE = os.path.join(CONFIG_FOLDER, "storage_config.json")
-    PATIENT_BASE_FILE = os.path.join(EXCEL_FOLDER, "info_Base_patient.xlsx")
-    
-    print(f"DEBUG: Répertoire de base dynamique défini à : {DYNAMIC_BASE_DIR}")
-    print(f"DEBUG: Chemin de la DB SQLite défini à : {SQLITE_DB_PATH}")
 
+@timing.timed("tenant")
+def set_dynamic_base_dir(admin_email: str) -> TenantContext:
+    """
+    Lie le contexte de l'administrateur à la requête (ou au thread) courant(e).
+    Ceci est appelé au début de chaque requête par le before_request de Flask.
+    Les chemins ne sont calculés (et les dossiers créés) qu'une fois par administrateur.
+    """
+    ctx = _tenants.get(admin_email)
+    if ctx is None:
+        with _tenants_lock:
+            ctx = _tenants.get(admin_email)
+            if ctx is None:
+                ctx = TenantContext(admin_email)
+                ctx.ensure_dirs()
+                _tenants[admin_email] = ctx
+                log.debug("Répertoire de base dynamique défini à : %s", ctx.base_dir)
+                log.debug("Chemin de la DB SQLite défini à : %s", ctx.sqlite_db_path)
+    _current_tenant.set(ctx)
+    return ctx
+
+
+def current_tenant() -> Optional[TenantContext]:
+    """Retourne le contexte tenant lié à la requête courante (ou None)."""
+    return _current_tenant.get()
+
+
+def clear_tenant():
+    """Délie le contexte tenant (appelé en fin de requête)."""
+    _current_tenant.set(None)
+
+
+def __getattr__(name: str):
+    # Compatibilité : utils.EXCEL_FOLDER, utils.patient_ids, ... sont résolus
+    # à partir du contexte tenant de la requête courante.
+    attr = _TENANT_ATTRIBUTES.get(name)
+    if attr is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    ctx = _current_tenant.get()
+    if ctx is None:
+        if name in _EMPTY_TENANT_LISTS:
+            return []
+        return {} if name.startswith("patient_") else None
+    return getattr(ctx, attr)
 
-# Les variables suivantes dépendent maintenant de l'appel à set_dynamic_base_dir.
-# Elles sont initialisées à None et seront définies lorsqu'un administrateur se connectera ou sera identifié.
 
 LOCAL_IP = socket.gethostbyname(socket.gethostname())
 
-background_file: Optional[str] = None # Cette variable globale doit être mise à jour
-
 def init_app(app):
     """Initialisation de l'application Flask avec les valeurs du fichier de configuration."""
-    global background_file # Déclarer global pour la modifier
-
-    # S'assurer que set_dynamic_base_dir a été appelé et que DYNAMIC_BASE_DIR est défini
-    if ADMIN_EMAIL is None:
-        # Fallback ou erreur si ADMIN_EMAIL n'est pas défini avant init_app
-        print("AVERTISSEMENT: ADMIN_EMAIL non défini. Utilisation d'une valeur par défaut pour l'initialisation.")
-        set_dynamic_base_dir("default_admin@example.com") # Ou lever une erreur
+    # S'assurer que set_dynamic_base_dir a été appelé pour cette requête
+    ctx = current_tenant()
+    if ctx is None:
+        # Fallback ou erreur si aucun administrateur n'est lié avant init_app
+        log.warning("ADMIN_EMAIL non défini. Utilisation d'une valeur par défaut pour l'initialisation.")
+        ctx = set_dynamic_base_dir("default_admin@example.com") # Ou lever une erreur
 
     config = load_config()
     app.config.update(config)
 
-    # Lors du chargement de la configuration, mettre à jour le chemin global background_file
+    # Lors du chargement de la configuration, mettre à jour le background_file du tenant
     # Si le chemin dans la configuration est relatif, le rendre absolu en le joignant avec BACKGROUND_FOLDER
     configured_bg_path = config.get("background_file_path")
-    if configured_bg_path and BACKGROUND_FOLDER:
-        background_file = os.path.join(BACKGROUND_FOLDER, configured_bg_path)
+    background_file = None # Aucun arrière-plan configuré
+    if configured_bg_path:
+        background_file = os.path.join(ctx.background_folder, configured_bg_path)
         if not os.path.exists(background_file):
-            print(f"AVERTISSEMENT: Fichier d'arrière-plan configuré introuvable à {background_file}. Réinitialisation à None.")
+            log.warning("Fichier d'arrière-plan configuré introuvable à %s. Réinitialisation à None.", background_file)
             background_file = None # Au cas où le fichier configuré n'existerait plus
-    else:
-        background_file = None # Aucun arrière-plan configuré ou BACKGROUND_FOLDER non défini encore
-    print(f"DEBUG (utils.py - init_app): Global background_file défini à : {background_file}")
+    ctx.background_file = background_file
+    log.debug("background_file du tenant défini à : %s", background_file)
 
 
 # ---------------------------------------------------------------------------
@@ -142,22 +223,24 @@ def init_app(app):
 # ---------------------------------------------------------------------------
 def load_config() -> dict:
     """Charge la configuration de l'application depuis le fichier CONFIG_FILE."""
-    if CONFIG_FILE is None:
+    ctx = current_tenant()
+    if ctx is None:
         # Cela signifie que set_dynamic_base_dir n'a pas été appelé. Gérer en conséquence.
-        print("ERREUR: Le chemin CONFIG_FILE n'est pas défini. Impossible de charger la configuration.")
+        log.error("Le chemin CONFIG_FILE n'est pas défini. Impossible de charger la configuration.")
         return {}
     try:
-        with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+        with open(ctx.config_file, "r", encoding="utf-8") as f:
             return json.load(f)
     except FileNotFoundError:
         return {}
 
 def save_config(cfg: dict):
     """Sauvegarde la configuration de l'application dans le fichier CONFIG_FILE."""
-    if CONFIG_FILE is None:
-        print("ERREUR: Le chemin CONFIG_FILE n'est pas défini. Impossible de sauvegarder la configuration.")
+    ctx = current_tenant()
+    if ctx is None:
+        log.error("Le chemin CONFIG_FILE n'est pas défini. Impossible de sauvegarder la configuration.")
         return
-    with open(CONFIG_FILE, "w", encoding="utf-8") as f:
+    with open(ctx.config_file, "w", encoding="utf-8") as f:
         json.dump(cfg, f, ensure_ascii=False, indent=2)
 
 def extract_rest_duration(text: str) -> str:
@@ -283,7 +366,7 @@ def generate_time_slots(start_time_str: str = "08:00", end_time_str: str = "17:4
         if interval_minutes <= 0:
             raise ValueError("L'intervalle doit être un nombre positif.")
     except ValueError as e:
-        print(f"AVERTISSEMENT: Format d'heure ou intervalle invalide pour les créneaux horaires, retour aux valeurs par défaut. Erreur: {e}")
+        log.warning("Format d'heure ou intervalle invalide pour les créneaux horaires, retour aux valeurs par défaut. Erreur: %s", e)
         start = datetime.strptime("08:00", "%H:%M")
         end = datetime.strptime("17:45", "%H:%M")
         interval_minutes = 15
@@ -319,23 +402,12 @@ def calculate_order_number(time_str: str, start_time_str: str = "08:00", interva
 
         return (delta_minutes // interval_minutes) + 1
     except ValueError as e:
-        print(f"AVERTISSEMENT: Erreur lors du calcul du numéro d'ordre pour {time_str}. Erreur: {e}")
+        log.warning("Erreur lors du calcul du numéro d'ordre pour %s. Erreur: %s", time_str, e)
         return "N/A"
 
 # ---------------------------------------------------------------------------
 # 5. Gestion des patients (Excel)
 # ---------------------------------------------------------------------------
-patient_ids, patient_names = [], []
-patient_id_to_name = {} # Nom Complet
-patient_name_to_id = {} # Nom Complet -> ID
-patient_id_to_age = {}
-patient_id_to_phone = {}
-patient_id_to_antecedents = {}
-patient_id_to_dob = {}
-patient_id_to_gender = {}
-patient_id_to_nom = {}    # Nom de famille
-patient_id_to_prenom = {} # Prénom
-
 # NOUVEAU : Mappage flexible des colonnes pour gérer différents formats Excel
 FLEXIBLE_COLUMN_MAPPING = {
     'patient_id': ['ID', 'id', 'ID Patient', 'Patient ID', 'patient_id'],
@@ -348,6 +420,7 @@ FLEXIBLE_COLUMN_MAPPING = {
     'patient_phone': ['Téléphone', 'Phone', 'patient_phone', 'Tel'],
     'antecedents': ['Antécédents', 'Antecedents', 'antecedents', 'Medical History']
 }
+_FLEXIBLE_MAPPING_KEY = schema.mapping_key(FLEXIBLE_COLUMN_MAPPING)
 
 def _normalize_dataframe_columns(df: pd.DataFrame) -> pd.DataFrame:
     """
@@ -357,26 +430,13 @@ def _normalize_dataframe_columns(df: pd.DataFrame) -> pd.DataFrame:
     if df.empty:
         return df
 
-    # Crée une correspondance insensible à la casse des colonnes actuelles
-    df_columns_lower = {col.lower().strip(): col for col in df.columns}
-    
-    rename_map = {}
-    found_internal_names = set()
-
-    for internal_name, possible_names in FLEXIBLE_COLUMN_MAPPING.items():
-        for name in possible_names:
-            if name.lower() in df_columns_lower:
-                original_col_name = df_columns_lower[name.lower()]
-                rename_map[original_col_name] = internal_name
-                found_internal_names.add(internal_name)
-                break # Passe au nom interne suivant dès qu'une correspondance est trouvée
-    
-    if rename_map:
-        df = df.rename(columns=rename_map)
+    # Correspondance calculée une fois par en-tête (schema.resolve), renommage sans copie
+    rename_map, found_internal_names = schema.resolve(df.columns, _FLEXIBLE_MAPPING_KEY)
+    df = schema.normalized(df, rename_map)
 
     # Si 'nom' et 'prenom' n'ont pas été trouvés, mais 'patient_name' oui, on le divise.
     if 'nom' not in found_internal_names and 'prenom' not in found_internal_names and 'patient_name' in found_internal_names:
-        print("DEBUG: Division de la colonne 'patient_name' en 'nom' et 'prenom'.")
+        log.debug("Division de la colonne 'patient_name' en 'nom' et 'prenom'.")
         # S'assure que la colonne existe avant de tenter la division
         if 'patient_name' in df.columns:
             # Utilise .get(1) avec une valeur par défaut de '' pour éviter les erreurs sur les noms sans espaces
@@ -387,121 +447,226 @@ def _normalize_dataframe_columns(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def load_patient_data():
-    """
-    Charge et fusionne les données des patients depuis 'info_Base_patient.xlsx'
-    et 'ConsultationData.xlsx' dans des variables globales.
-    Utilise une approche flexible pour la reconnaissance des colonnes.
-    """
-    global patient_ids, patient_names
-    global patient_id_to_name, patient_name_to_id
-    global patient_id_to_age, patient_id_to_phone, patient_id_to_antecedents
-    global patient_id_to_dob, patient_id_to_gender
-    global patient_id_to_nom, patient_id_to_prenom
-
-    if EXCEL_FOLDER is None:
-        print("ERREUR: Le répertoire de base dynamique n'est pas défini. Appeler set_dynamic_base_dir en premier.")
-        return
-
-    # Réinitialisation des variables globales
-    patient_ids.clear(); patient_names.clear()
-    patient_id_to_name.clear(); patient_name_to_id.clear()
-    patient_id_to_age.clear(); patient_id_to_phone.clear(); patient_id_to_antecedents.clear()
-    patient_id_to_dob.clear(); patient_id_to_gender.clear()
-    patient_id_to_nom.clear(); patient_id_to_prenom.clear()
-    print("DEBUG: Toutes les données patient globales ont été réinitialisées.")
-
-    # Fusionner les dataframes de base et de consultation pour un traitement unifié
-    all_patient_df = pd.DataFrame()
-    
-    # 1. Chargement des données de base patients (info_Base_patient.xlsx)
-    if os.path.exists(PATIENT_BASE_FILE):
-        try:
-            df_base = pd.read_excel(PATIENT_BASE_FILE, sheet_name=0, dtype=str).fillna('')
-            df_base_normalized = _normalize_dataframe_columns(df_base)
-            all_patient_df = pd.concat([all_patient_df, df_base_normalized], ignore_index=True)
-            print(f"DEBUG: Données de {PATIENT_BASE_FILE} normalisées et ajoutées.")
-        except Exception as e:
-            print(f"ERREUR: Erreur de chargement de {PATIENT_BASE_FILE}: {e}")
+# Champs de l'annuaire : attribut du contexte -> colonne normalisée
+_DIRECTORY_FIELDS = {
+    "patient_id_to_nom": "nom",
+    "patient_id_to_prenom": "prenom",
+    "patient_id_to_age": "age",
+    "patient_id_to_phone": "patient_phone",
+    "patient_id_to_antecedents": "antecedents",
+    "patient_id_to_dob": "date_of_birth",
+    "patient_id_to_gender": "gender",
+}
+_MAP_ATTRIBUTES = list(_DIRECTORY_FIELDS) + ["patient_id_to_name", "patient_name_to_id"]
 
-    # 2. Chargement des données de suivi (ConsultationData.xlsx)
-    if os.path.exists(CONSULT_FILE_PATH):
-        try:
-            df_consult = pd.read_excel(CONSULT_FILE_PATH, sheet_name=0, dtype=str).fillna('')
-            df_consult_normalized = _normalize_dataframe_columns(df_consult)
-            all_patient_df = pd.concat([all_patient_df, df_consult_normalized], ignore_index=True)
-            print(f"DEBUG: Données de {CONSULT_FILE_PATH} normalisées et ajoutées.")
-        except Exception as e:
-            print(f"ERREUR: Erreur de chargement de {CONSULT_FILE_PATH}: {e}")
 
-    if all_patient_df.empty or 'patient_id' not in all_patient_df.columns:
-        print("AVERTISSEMENT: Aucune donnée patient ou colonne 'patient_id' trouvée. Les listes de patients seront vides.")
-        return
+class PatientDirectory:
+    """
+    Annuaire patients d'un tenant (info_Base_patient.xlsx + ConsultationData.xlsx).
+    Construit une fois, puis tenu à jour ligne par ligne à chaque écriture via
+    update_patient_directory. Pour chaque ID, la ligne la plus récente (date de
+    consultation) l'emporte ; les fiches sans date ne remplacent pas une consultation.
+    Une écriture faite hors de ces points d'entrée (autre module, autre worker)
+    change la version des classeurs et déclenche une reconstruction complète ;
+    update() ne corrige l'annuaire sur place que s'il était à jour juste avant
+    l'écriture (version lue par l'appelant avant d'écrire).
+    """
 
-    # Nettoyer les IDs et supprimer les doublons, en gardant la dernière entrée pour chaque patient
-    all_patient_df['patient_id'] = all_patient_df['patient_id'].astype(str).str.strip()
-    all_patient_df = all_patient_df.dropna(subset=['patient_id'])
-    all_patient_df = all_patient_df[all_patient_df['patient_id'] != '']
-    
-    # S'il y a une date de consultation, l'utiliser pour trier et garder la plus récente.
-    if 'consultation_date' in all_patient_df.columns:
-        all_patient_df['consultation_date_obj'] = pd.to_datetime(all_patient_df['consultation_date'].astype(str).str[:10], errors='coerce')
-        all_patient_df = all_patient_df.sort_values(by='consultation_date_obj', ascending=False)
-
-    # Garder la dernière information pour chaque ID patient. drop_duplicates garde la première occurrence,
-    # et comme on a trié par date décroissante, c'est la plus récente.
-    latest_patient_data = all_patient_df.drop_duplicates(subset=['patient_id'], keep='first')
-    
-    print(f"DEBUG: Traitement de {len(latest_patient_data)} entrées patient uniques.")
-
-    # 3. Population des dictionnaires globaux depuis le DataFrame unifié et nettoyé
-    for _, row in latest_patient_data.iterrows():
+    def __init__(self, ctx: "TenantContext"):
+        self.ctx = ctx
+        self.lock = threading.RLock()
+        self.signature = None          # versions des deux classeurs au dernier état connu
+        self._ranks: dict = {}         # pid -> date de la ligne retenue (None pour une fiche)
+        self._name_pids: dict = {}     # nom complet -> {pid}
+
+    def _sources_signature(self):
+        return (storage.dataset_version(self.ctx.patient_base_file),
+                storage.dataset_version(self.ctx.consult_file_path))
+
+    def _rows(self, df: pd.DataFrame) -> list:
+        """Lignes normalisées (dict) avec leur rang de date, prêtes pour _upsert."""
+        df = _normalize_dataframe_columns(df.fillna('').astype(str))
+        if df.empty or 'patient_id' not in df.columns:
+            return []
+        df['patient_id'] = df['patient_id'].astype(str).str.strip()
+        df = df[df['patient_id'] != '']
+        if 'consultation_date' in df.columns:
+            ranks = pd.to_datetime(df['consultation_date'].astype(str).str[:10], errors='coerce')
+            df = df.assign(_rank=ranks.astype(object).where(ranks.notna(), None))
+        else:
+            df = df.assign(_rank=None)
+        return df.to_dict(orient='records')
+
+    def _maps(self) -> dict:
+        return {attr: getattr(self.ctx, attr) for attr in _MAP_ATTRIBUTES}
+
+    def _upsert(self, row: dict, maps: dict) -> bool:
+        """Applique une ligne si elle est au moins aussi récente que celle retenue."""
         pid = row['patient_id']
-        
-        # S'assurer que les colonnes 'nom' et 'prenom' existent
+        rank = row.get('_rank')
+        if pid in self._ranks:
+            current = self._ranks[pid]
+            if rank is None and current is not None:
+                return False
+            if rank is not None and current is not None and rank < current:
+                return False
+        self._ranks[pid] = rank
+
         nom = str(row.get('nom', '')).strip()
         prenom = str(row.get('prenom', '')).strip()
-        
-        # Construire le nom complet à partir de 'nom' et 'prenom' si possible
-        full_name_from_parts = f"{nom} {prenom}".strip()
-        
-        # Utiliser 'patient_name' comme fallback si le nom construit est vide
-        full_name = full_name_from_parts or str(row.get('patient_name', '')).strip()
-
-        # Mettre à jour les dictionnaires
-        patient_id_to_nom[pid] = nom
-        patient_id_to_prenom[pid] = prenom
-        patient_id_to_name[pid] = full_name
-        
-        # Peupler les autres champs, en utilisant get() pour éviter les KeyError
-        patient_id_to_age[pid] = str(row.get('age', '')).strip()
-        patient_id_to_phone[pid] = str(row.get('patient_phone', '')).strip()
-        patient_id_to_antecedents[pid] = str(row.get('antecedents', '')).strip()
-        patient_id_to_dob[pid] = str(row.get('date_of_birth', '')).strip()
-        patient_id_to_gender[pid] = str(row.get('gender', '')).strip()
-
-        # Remplir les listes pour les datalists du frontend
-        if pid not in patient_ids:
-            patient_ids.append(pid)
-        if full_name and full_name not in patient_names:
-            patient_names.append(full_name)
+        full_name = f"{nom} {prenom}".strip() or str(row.get('patient_name', '')).strip()
+        for attr, column in _DIRECTORY_FIELDS.items():
+            maps[attr][pid] = str(row.get(column, '')).strip()
+
+        previous = maps["patient_id_to_name"].get(pid)
+        maps["patient_id_to_name"][pid] = full_name
+        if previous and previous != full_name:
+            owners = self._name_pids.get(previous, set())
+            owners.discard(pid)
+            if owners:
+                maps["patient_name_to_id"][previous] = next(iter(owners))
+            else:
+                self._name_pids.pop(previous, None)
+                maps["patient_name_to_id"].pop(previous, None)
         if full_name:
-            patient_name_to_id[full_name] = pid
+            self._name_pids.setdefault(full_name, set()).add(pid)
+            maps["patient_name_to_id"][full_name] = pid
+        return True
+
+    def rebuild(self):
+        """Reconstruction complète depuis les deux classeurs."""
+        with self.lock:
+            signature = self._sources_signature()
+            ctx = self.ctx
+            self._ranks, self._name_pids = {}, {}
+            maps = {attr: {} for attr in _MAP_ATTRIBUTES}
+
+            rows = []
+            for path, reader in ((ctx.patient_base_file, os.path.exists), (ctx.consult_file_path, storage.exists)):
+                if not reader(path):
+                    continue
+                try:
+                    rows.extend(self._rows(storage.read_excel(path, sheet_name=0, dtype=str)))
+                    log.debug("Données de %s normalisées et ajoutées.", path)
+                except Exception as e:
+                    log.error("Erreur de chargement de %s: %s", path, e)
+            for row in rows:
+                self._upsert(row, maps)
+
+            # Publication d'un bloc : une requête concurrente ne voit jamais un annuaire à moitié rempli
+            for attr, values in maps.items():
+                setattr(ctx, attr, values)
+            ctx.patient_ids = sorted(self._ranks, key=str.lower)
+            ctx.patient_names = sorted(self._name_pids, key=str.lower)
+            self.signature = signature
+            log.debug("Annuaire patients reconstruit. %s IDs et %s noms chargés.", len(ctx.patient_ids), len(ctx.patient_names))
+
+    def refresh(self):
+        """Reconstruit l'annuaire seulement si un classeur a changé depuis le dernier état connu."""
+        with self.lock:
+            if self.signature is None or self.signature != self._sources_signature():
+                self.rebuild()
+
+    def update(self, rows, before=None):
+        """
+        Intègre des lignes qui viennent d'être écrites (fiche patient ou consultation).
+        `before` : versions des classeurs lues avant l'écriture (patient_directory_version).
+        Si l'annuaire n'en était pas là (écriture non signalée entre-temps), corriger
+        seulement ces lignes le laisserait faux : il est reconstruit au prochain accès.
+        """
+        with self.lock:
+            if self.signature is None or before is None or before != self.signature:
+                self.signature = None
+                return
+            frame = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(list(rows))
+            if frame.empty:
+                return
+            ctx = self.ctx
+            known_ids, known_names = set(self._ranks), set(self._name_pids)
+            maps = self._maps()
+            for row in self._rows(frame):
+                self._upsert(row, maps)
+            # Listes triées des datalists : copie + insertion (les lecteurs gardent l'ancienne liste)
+            if set(self._ranks) != known_ids:
+                ids = list(ctx.patient_ids)
+                for pid in set(self._ranks) - known_ids:
+                    bisect.insort(ids, pid, key=str.lower)
+                ctx.patient_ids = ids
+            if set(self._name_pids) != known_names:
+                names = [n for n in ctx.patient_names if n in self._name_pids]
+                for name in set(self._name_pids) - known_names:
+                    bisect.insort(names, name, key=str.lower)
+                ctx.patient_names = names
+            self.signature = self._sources_signature()
+
+    def invalidate(self):
+        with self.lock:
+            self.signature = None
+
+
+def _patient_directory() -> Optional[PatientDirectory]:
+    ctx = current_tenant()
+    if ctx is None:
+        log.error("Le répertoire de base dynamique n'est pas défini. Appeler set_dynamic_base_dir en premier.")
+        return None
+    if ctx.patient_directory is None:
+        with _tenants_lock:
+            if ctx.patient_directory is None:
+                ctx.patient_directory = PatientDirectory(ctx)
+    return ctx.patient_directory
+
+
+def load_patient_data():
+    """
+    Met à disposition l'annuaire des patients du tenant courant (patient_ids,
+    patient_id_to_name, ...), fusion de 'info_Base_patient.xlsx' et 'ConsultationData.xlsx'.
+    L'annuaire n'est reconstruit que si l'un des classeurs a changé depuis
+    la dernière lecture ou mise à jour.
+    """
+    directory = _patient_directory()
+    if directory is not None:
+        directory.refresh()
+
+
+def patient_directory_version():
+    """
+    Versions des classeurs de l'annuaire, à lire AVANT une écriture de fiches patients
+    ou de consultations puis à passer à update_patient_directory.
+    """
+    directory = _patient_directory()
+    return directory._sources_signature() if directory is not None else None
+
+
+def update_patient_directory(rows, before=None):
+    """
+    À appeler après l'écriture de fiches patients ou de consultations
+    (liste de dict ou DataFrame, colonnes telles qu'écrites dans le classeur),
+    avec `before` = patient_directory_version() lu avant l'écriture. Sans `before`,
+    l'annuaire est reconstruit au prochain accès.
+    """
+    directory = _patient_directory()
+    if directory is not None:
+        directory.update(rows, before)
 
-    # Tri final des listes
-    patient_ids = sorted(list(set(patient_ids)), key=str.lower)
-    patient_names = sorted(list(set(patient_names)), key=str.lower)
 
-    print(f"DEBUG: Chargement des données patient terminé. {len(patient_ids)} IDs et {len(patient_names)} noms chargés.")
-    print(f"DEBUG: patient_ids finaux chargés: {patient_ids[:5] if patient_ids else 'Vide'}...")
-    print(f"DEBUG: patient_names finaux chargés: {patient_names[:5] if patient_names else 'Vide'}...")
+def invalidate_patient_directory():
+    """Force la reconstruction de l'annuaire (suppression, changement d'ID, import)."""
+    directory = _patient_directory()
+    if directory is not None:
+        directory.invalidate()
 
 
 # ---------------------------------------------------------------------------
 # 6. PDF : arrière plan, génération & fusion
 # ---------------------------------------------------------------------------
+def _background_file() -> Optional[str]:
+    """Fichier d'arrière-plan du tenant courant."""
+    ctx = current_tenant()
+    return ctx.background_file if ctx else None
+
 def apply_background(pdf_canvas, width, height):
     """Applique une image d'arrière-plan au canvas PDF."""
+    background_file = _background_file()
     if background_file and os.path.exists(background_file):
         if background_file.lower().endswith(('.png','.jpg','.jpeg','.gif','.bmp')):
             try:
@@ -509,8 +674,10 @@ def apply_background(pdf_canvas, width, height):
             except Exception:
                 pass
 
+@timing.timed("pdf")
 def merge_with_background_pdf(foreground_path: str):
     """Fusionne un PDF de premier plan avec un PDF d'arrière-plan."""
+    background_file = _background_file()
     if not (background_file and os.path.exists(background_file) and background_file.lower().endswith('.pdf')):
         return
     bg_reader = PdfReader(background_file)
@@ -524,9 +691,11 @@ def merge_with_background_pdf(foreground_path: str):
     with open(foreground_path, "wb") as f:
         writer.write(f)
 
+@timing.timed("pdf")
 def generate_pdf_file(save_path: str, form_data: dict,
                       medication_list: list, analyses_list: list, radiologies_list: list):
     """Génère un PDF de consultation + ordonnance + certificat."""
+    background_file = _background_file()
     # Récupération des champs
     doctor_name   = form_data.get("doctor_name","").strip()
     patient_name  = form_data.get("patient_name","").strip()
@@ -819,6 +988,7 @@ def generate_pdf_file(save_path: str, form_data: dict,
         
 def add_background_platypus(canvas_obj, doc):
     """Ajoute une image ou un PDF d'arrière-plan à chaque page ReportLab."""
+    background_file = _background_file()
     bg = background_file if background_file and os.path.exists(background_file) else None
     if bg and bg.lower().endswith(('.png','.jpg','.jpeg','.gif','.bmp')):
         try:
@@ -826,8 +996,10 @@ def add_background_platypus(canvas_obj, doc):
         except Exception:
             pass
 
+@timing.timed("pdf")
 def generate_history_pdf_file(pdf_path: str, df_filtered: pd.DataFrame):
     """Génère un PDF d’historique de consultations."""
+    background_file = _background_file()
     doc = SimpleDocTemplate(pdf_path, pagesize=A5,
                             rightMargin=56.7, leftMargin=56.7,
                             topMargin=130, bottomMargin=56.7)